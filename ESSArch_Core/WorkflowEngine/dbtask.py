@@ -33,6 +33,7 @@ from tenacity import Retrying, stop_after_delay, wait_random_exponential
 
 from ESSArch_Core.essxml.Generator.xmlGenerator import parseContent
 from ESSArch_Core.ip.models import EventIP, InformationPackage
+from ESSArch_Core.log.dbhandler import buffer_events
 from ESSArch_Core.profiles.utils import fill_specification_data
 from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
 from ESSArch_Core.WorkflowEngine.util import get_result
@@ -132,11 +133,15 @@ class DBTask(Task):
                     t.hidden = True
                     t.save()
                 else:
-                    r = self._run_task(*args, **kwargs)
+                    # events are written before the lock is released, for
+                    # the next task of the IP to see them
+                    with buffer_events():
+                        r = self._run_task(*args, **kwargs)
             logger.info('{} released lock for IP {}'.format(self.task_id, str(ip.pk)))
             return r
 
-        return self._run_task(*args, **kwargs)
+        with buffer_events():
+            return self._run_task(*args, **kwargs)
 
     def _run_task(self, *args, **kwargs):
         if self.step is not None:
@@ -252,11 +257,11 @@ class DBTask(Task):
             self.update_state(task_id=self.task_id, state=celery_states.SUCCESS)
             self.backend.store_result(self.task_id, retval, celery_states.SUCCESS)
 
-    def set_progress(self, progress, total=None):
+    def set_progress(self, progress, total=None, **extra):
         if not self.track:
             return
 
-        self.update_state(meta={'current': progress, 'total': total})
+        self.update_state(meta={'current': progress, 'total': total, **extra})
 
     def parse_params(self, *params):
         return tuple([parseContent(param, self.extra_data) for param in params])
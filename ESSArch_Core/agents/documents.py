@@ -31,6 +31,9 @@ class AgentDocument(DocumentBase):
     start_date = Date()
     end_date = Date()
 
+    index_select_related = ('task',)
+    index_prefetch_related = ('names',)
+
     @classmethod
     def get_model(cls):
         return Agent
@@ -47,7 +50,7 @@ class AgentDocument(DocumentBase):
             id=str(obj.pk),
             task_id=task_id,
             names=[
-                AgentNameDocument.from_obj(name) for name in obj.names.iterator()
+                AgentNameDocument.from_obj(name) for name in obj.names.all()
             ],
             start_date=obj.start_date,
             end_date=obj.end_date,
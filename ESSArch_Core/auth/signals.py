@@ -35,7 +35,10 @@ from ESSArch_Core.auth.models import (
 from ESSArch_Core.auth.saml.mapping import (
     get_backend as get_saml_mapping_backend,
 )
-from ESSArch_Core.auth.util import get_organization_groups
+from ESSArch_Core.auth.util import (
+    get_organization_groups,
+    invalidate_acl_tokens,
+)
 
 User = get_user_model()
 logger = logging.getLogger('essarch.auth')
@@ -126,6 +129,9 @@ def group_pre_save(sender, instance, *args, **kwargs):
 
 @receiver(post_save, sender=Group)
 def group_post_save(sender, instance, created, *args, **kwargs):
+    # the organization hierarchy might have changed
+    invalidate_acl_tokens()
+
     if created:
         logger.info(f"Created group '{instance.name}'")
     else:
@@ -134,6 +140,8 @@ def group_post_save(sender, instance, created, *args, **kwargs):
 
 @receiver(post_delete, sender=Group)
 def group_post_delete(sender, instance, *args, **kwargs):
+    invalidate_acl_tokens()
+
     try:
         if hasattr(instance, 'django_group'):
             instance.django_group.delete()
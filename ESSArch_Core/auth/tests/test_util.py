@@ -1,15 +1,22 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.test import TestCase
 from groups_manager.utils import get_permission_name
 from guardian.shortcuts import assign_perm
 
 from ESSArch_Core.auth.models import Group, GroupMemberRole, GroupType
 from ESSArch_Core.auth.util import (
+    PRIVATE_ACL_TOKEN,
+    PUBLIC_ACL_TOKEN,
+    get_object_acl_tokens,
     get_objects_for_user,
+    get_organization_acl_token,
+    get_user_acl_tokens,
     get_user_groups,
     get_user_roles,
+    memoize_object_acl_tokens,
 )
 from ESSArch_Core.ip.models import InformationPackage
 
@@ -290,3 +297,99 @@ class GetObjectsForUserTests(TestCase):
 
         qs = InformationPackage.objects.all()
         self.assertEqual(get_objects_for_user(self.user, qs, ['view_informationpackage']).get(), ip)
+
+
+class GetObjectAclTokensTests(TestCase):
+    def setUp(self):
+        self.org_group_type = GroupType.objects.create(label='organization')
+        self.user = User.objects.create(username="user")
+
+    def test_object_without_any_permissions(self):
+        ip = InformationPackage.objects.create()
+        self.assertEqual(get_object_acl_tokens(ip), [PUBLIC_ACL_TOKEN])
+
+    def test_object_in_organizations(self):
+        ip = InformationPackage.objects.create()
+        group1 = Group.objects.create(name='group1', group_type=self.org_group_type)
+        group2 = Group.objects.create(name='group2', group_type=self.org_group_type)
+        group1.add_object(ip)
+        group2.add_object(ip)
+
+        self.assertCountEqual(
+            get_object_acl_tokens(ip),
+            [get_organization_acl_token(group1.pk), get_organization_acl_token(group2.pk)],
+        )
+
+    def test_object_with_object_permissions_only(self):
+        ip = InformationPackage.objects.create()
+
+        perm_name = get_permission_name('view_informationpackage', ip)
+        assign_perm(perm_name, self.user, ip)
+
+        self.assertEqual(get_object_acl_tokens(ip), [PRIVATE_ACL_TOKEN])
+
+    def test_memoized(self):
+        ip = InformationPackage.objects.create()
+        other_ip = InformationPackage.objects.create()
+        group = Group.objects.create(name='group', group_type=self.org_group_type)
+        group.add_object(ip)
+        ContentType.objects.get_for_model(ip)
+
+        with memoize_object_acl_tokens():
+            with self.assertNumQueries(1):
+                self.assertEqual(get_object_acl_tokens(ip), [get_organization_acl_token(group.pk)])
+                with memoize_object_acl_tokens():
+                    self.assertEqual(get_object_acl_tokens(ip), [get_organization_acl_token(group.pk)])
+            with self.assertNumQueries(3):
+                self.assertEqual(get_object_acl_tokens(other_ip), [PUBLIC_ACL_TOKEN])
+
+        with self.assertNumQueries(1):
+            get_object_acl_tokens(ip)
+
+
+class GetUserAclTokensTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.org_group_type = GroupType.objects.create(label='organization')
+        self.user = User.objects.create(username="user")
+        self.member = self.user.essauth_member
+
+    def test_superuser(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertIsNone(get_user_acl_tokens(self.user))
+
+    def test_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(get_user_acl_tokens(self.user), [])
+
+    def test_without_organization(self):
+        self.assertEqual(get_user_acl_tokens(self.user), [PUBLIC_ACL_TOKEN])
+
+    def test_organization_and_descendants(self):
+        parent = Group.objects.create(name='parent', group_type=self.org_group_type)
+        child = Group.objects.create(name='child', parent=parent, group_type=self.org_group_type)
+        other = Group.objects.create(name='other', group_type=self.org_group_type)
+        parent.add_member(self.member)
+        self.user.user_profile.current_organization = parent
+        self.user.user_profile.save()
+
+        tokens = get_user_acl_tokens(self.user)
+        self.assertCountEqual(tokens, [
+            PUBLIC_ACL_TOKEN, get_organization_acl_token(parent.pk), get_organization_acl_token(child.pk),
+        ])
+        self.assertNotIn(get_organization_acl_token(other.pk), tokens)
+
+    def test_cached_until_organization_changed(self):
+        org = Group.objects.create(name='org', group_type=self.org_group_type)
+        org.add_member(self.member)
+        self.user.user_profile.current_organization = org
+        self.user.user_profile.save()
+
+        tokens = get_user_acl_tokens(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_acl_tokens(self.user), tokens)
+
+        child = Group.objects.create(name='child', parent=org, group_type=self.org_group_type)
+        self.assertIn(get_organization_acl_token(child.pk), get_user_acl_tokens(self.user))
@@ -1,6 +1,11 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.db import connection
 from django.db.models import CharField, F, Min, Q, UUIDField, Value
 from django.db.models.functions import Cast, Replace
@@ -17,6 +22,17 @@ from ESSArch_Core.auth.models import (
 User = get_user_model()
 ORGANIZATION_TYPE = 'organization'
 
+# ACL token of objects without any organization or object permissions, which
+# are available to everyone
+PUBLIC_ACL_TOKEN = 'public'
+# ACL token of objects that only have object permissions, which is not given
+# to any user. Every indexed object has at least one token, documents
+# without tokens were indexed before the tokens were added
+PRIVATE_ACL_TOKEN = 'private'
+ACL_CACHE_VERSION_KEY = 'acl_tokens_version'
+
+_acl_tokens_local = threading.local()
+
 
 def get_organization_groups(user):
     """
@@ -183,3 +199,108 @@ def get_objects_for_user(user, klass, perms=None, include_no_auth_objs=True):
         Q(cleaned_id__in=group_ids.values('cleaned_pk')) |
         Q(cleaned_id__in=user_ids.values('cleaned_pk'))
     )) | ids_with_no_auth
+
+
+def get_organization_acl_token(group_id):
+    return 'organization:{}'.format(group_id)
+
+
+@contextmanager
+def memoize_object_acl_tokens():
+    """
+    Memoizes the ACL tokens of each object in the current thread until the
+    outermost block is left, e.g. while creating a batch of documents where
+    many documents belong to the same archive or IP
+    """
+
+    outermost = getattr(_acl_tokens_local, 'tokens', None) is None
+    if outermost:
+        _acl_tokens_local.tokens = {}
+    try:
+        yield
+    finally:
+        if outermost:
+            _acl_tokens_local.tokens = None
+
+
+def get_object_acl_tokens(obj):
+    """
+    Returns the ACL tokens of obj, used for filtering search results the same
+    way as get_objects_for_user without permissions:
+
+    * the organizations obj belongs to
+    * PUBLIC_ACL_TOKEN if no organization or object permissions are set for
+      obj
+    * PRIVATE_ACL_TOKEN if obj only has object permissions, it is then only
+      available to superusers
+    """
+
+    ctype = ContentType.objects.get_for_model(obj)
+
+    memo = getattr(_acl_tokens_local, 'tokens', None)
+    if memo is None:
+        return _get_object_acl_tokens(ctype, obj)
+
+    key = (ctype.pk, obj.pk)
+    if key not in memo:
+        memo[key] = _get_object_acl_tokens(ctype, obj)
+    return list(memo[key])
+
+
+def _get_object_acl_tokens(ctype, obj):
+    object_ids = {str(obj.pk)}
+    if isinstance(obj._meta.pk, UUIDField):
+        object_ids.add(obj.pk.hex)
+
+    group_ids = GroupGenericObjects.objects.filter(
+        content_type=ctype, object_id__in=object_ids,
+    ).values_list('group_id', flat=True).distinct()
+    tokens = sorted(get_organization_acl_token(group_id) for group_id in group_ids)
+    if tokens:
+        return tokens
+
+    if GroupObjectPermission.objects.filter(content_type=ctype, object_pk__in=object_ids).exists():
+        return [PRIVATE_ACL_TOKEN]
+
+    if UserObjectPermission.objects.filter(content_type=ctype, object_pk__in=object_ids).exists():
+        return [PRIVATE_ACL_TOKEN]
+
+    return [PUBLIC_ACL_TOKEN]
+
+
+def get_user_acl_tokens(user):
+    """
+    Returns the ACL tokens of the objects available to user without any
+    specific permissions, or None if all objects are available to user
+
+    The tokens are cached for SEARCH_ACL_CACHE_TIMEOUT seconds and when the
+    organization hierarchy changes, see invalidate_acl_tokens
+    """
+
+    if user.is_superuser:
+        return None
+
+    if not user.is_active or user.is_anonymous:
+        return []
+
+    org = user.user_profile.current_organization
+    if org is None:
+        return [PUBLIC_ACL_TOKEN]
+
+    version = cache.get_or_set(ACL_CACHE_VERSION_KEY, 0, None)
+    cache_key = 'acl_tokens_{}_{}'.format(version, org.pk)
+    tokens = cache.get(cache_key)
+    if tokens is None:
+        group_ids = org.get_descendants(include_self=True).values_list('pk', flat=True)
+        tokens = [PUBLIC_ACL_TOKEN] + [get_organization_acl_token(group_id) for group_id in group_ids]
+        cache.set(cache_key, tokens, getattr(settings, 'SEARCH_ACL_CACHE_TIMEOUT', 300))
+
+    return tokens
+
+
+def invalidate_acl_tokens():
+    try:
+        cache.incr(ACL_CACHE_VERSION_KEY)
+    except ValueError:
+        # not cached
+        pass
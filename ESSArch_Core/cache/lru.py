@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread safe, process wide LRU cache
+
+    Args:
+        maxsize: The maximum number of entries, or a callable returning it
+            (e.g. reading a setting). Nothing is cached if it is 0 or less
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # reentrant, to allow callers to combine operations atomically
+        self.lock = threading.RLock()
+        self._entries = OrderedDict()
+
+    def get_maxsize(self):
+        if callable(self.maxsize):
+            return self.maxsize()
+        return self.maxsize
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def set(self, key, value):
+        maxsize = self.get_maxsize()
+        if maxsize <= 0:
+            return
+
+        with self.lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
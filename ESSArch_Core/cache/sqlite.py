@@ -0,0 +1,33 @@
+import os
+import sqlite3
+import threading
+
+
+class LocalSQLiteDatabase:
+    """
+    A local SQLite database, connected to once per thread and process since
+    SQLite connections can neither be shared between threads nor between
+    processes
+
+    The statements in ``schema`` are executed on each new connection and
+    should be idempotent, e.g. ``CREATE TABLE IF NOT EXISTS``.
+    """
+
+    schema = ()
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _get_connection(self):
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in self.schema:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
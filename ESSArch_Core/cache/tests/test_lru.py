@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase
+
+from ESSArch_Core.cache.lru import LRUCache
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_get_and_set(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', 0), 0)
+
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_callable_maxsize(self):
+        maxsize = 1
+        cache = LRUCache(lambda: maxsize)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(len(cache), 1)
+
+        maxsize = 0
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('c'))
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
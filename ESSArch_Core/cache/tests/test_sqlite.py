@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ESSArch_Core.cache.sqlite import LocalSQLiteDatabase
+
+
+class Database(LocalSQLiteDatabase):
+    schema = ('CREATE TABLE IF NOT EXISTS foo (bar TEXT)',)
+
+
+class LocalSQLiteDatabaseTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.db = Database(os.path.join(self.datadir, 'nested', 'db.sqlite'))
+
+    def test_schema_is_created(self):
+        with self.db._get_connection() as conn:
+            conn.execute("INSERT INTO foo VALUES ('baz')")
+
+        conn = Database(self.db.path)._get_connection()
+        self.assertEqual(conn.execute('SELECT bar FROM foo').fetchall(), [('baz',)])
+
+    def test_connection_per_thread(self):
+        conn = self.db._get_connection()
+        self.assertIs(self.db._get_connection(), conn)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.db._get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_connection_per_process(self):
+        conn = self.db._get_connection()
+
+        with mock.patch('ESSArch_Core.cache.sqlite.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(self.db._get_connection(), conn)
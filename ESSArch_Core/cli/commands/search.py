@@ -37,6 +37,7 @@ def clear(indexes):
 @click.option('-i', '--index', 'indexes', type=str, multiple=True, help='Specify which index to update. \
                     (agent, archive, component, directory, document, information_package, structure_unit)')
 @click.option('-b', '--batch-size', 'batch_size', type=int, help='Number of items to index at once.')
+@click.option('-w', '--workers', 'workers', type=int, help='Number of threads sending batches to Elasticsearch.')
 @click.option('-r', '--remove-stale', 'remove_stale', is_flag=True, default=False, help='Remove objects from the index \
                                                                            that are no longer in the database.')
 @click.option('--do-not-delete-old-index', 'do_not_delete_old', is_flag=True, default=False, help='Skip to clear old index. \
@@ -44,7 +45,7 @@ def clear(indexes):
 @click.option('--index-file-content', 'index_file_content', is_flag=True, default=False, help='Rebuild index from files \
                                                                     for document index (File) "field - attachment".')
 @initialize
-def rebuild(indexes, batch_size, remove_stale, do_not_delete_old, index_file_content):
+def rebuild(indexes, batch_size, workers, remove_stale, do_not_delete_old, index_file_content):
     """Rebuild indices
     """
 
@@ -55,9 +56,9 @@ def rebuild(indexes, batch_size, remove_stale, do_not_delete_old, index_file_con
             click.secho('Clear old index {}... '.format(index._index._name), nl=False)
             clear_index(index)
             click.secho('done', fg='green')
-        click.secho('Rebuilding {}... '.format(index._index._name), nl=False)
-        index_documents(index, batch_size, remove_stale, index_file_content)
-        click.secho('done', fg='green')
+        click.secho('Rebuilding {}... '.format(index._index._name))
+        progress = index_documents(index, batch_size, remove_stale, index_file_content, workers=workers)
+        click.secho('\ndone ({} documents in {:.1f}s)'.format(progress.indexed, progress.elapsed), fg='green')
 
 
 @click.command()
@@ -83,5 +84,11 @@ def clear_index(index):
     index.clear_index()
 
 
-def index_documents(index, batch_size, remove_stale, index_file_content=False):
-    index.index_documents(batch_size, remove_stale, index_file_content)
+def print_progress(progress):
+    click.echo('\r{}/{} ({:.0f} documents/s)'.format(progress.processed, progress.total, progress.rate), nl=False)
+
+
+def index_documents(index, batch_size, remove_stale, index_file_content=False, workers=None):
+    return index.index_documents(
+        batch_size, remove_stale, index_file_content, workers=workers, progress_callback=print_progress,
+    )
@@ -23,6 +23,11 @@
 """
 
 from celery import Celery
+from celery.signals import (
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
 
 # set the default Django settings module for the 'celery' program.
 app = Celery('ESSArch_Core', task_cls='ESSArch_Core.WorkflowEngine.dbtask:DBTask')
@@ -30,3 +35,20 @@ app = Celery('ESSArch_Core', task_cls='ESSArch_Core.WorkflowEngine.dbtask:DBTask
 # Using a string here means the worker will not have to
 # pickle the object when using Windows.
 app.config_from_object('django.conf:settings', namespace='CELERY')
+
+
+@worker_process_init.connect
+def preload_format_identification(**kwargs):
+    # Load the PRONOM signatures once per worker process instead of on the
+    # first identification in each task
+    from ESSArch_Core.fixity.format import get_fido
+    get_fido()
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def flush_buffered_events(**kwargs):
+    # write the events buffered by the worker before it exits, child
+    # processes exit without running the atexit handlers of logging
+    from ESSArch_Core.log.dbhandler import flush_events
+    flush_events()
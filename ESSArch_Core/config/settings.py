@@ -286,13 +286,129 @@ ELASTICSEARCH_INDEXES = {
 
 ELASTICSEARCH_BATCH_SIZE = 1000
 
+# Number of threads sending batches to Elasticsearch when (re)indexing and
+# the number of batches per thread that may be waiting to be sent before
+# reading more objects from the database
+ELASTICSEARCH_INDEX_WORKERS = int(os.environ.get('ESSARCH_ELASTICSEARCH_INDEX_WORKERS', 1))
+ELASTICSEARCH_INDEX_QUEUE_SIZE = 2
+
+# Number of threads identifying the formats of files when indexing the files
+# of archived packages
+ELASTICSEARCH_INGEST_FORMAT_WORKERS = int(os.environ.get('ESSARCH_ELASTICSEARCH_INGEST_FORMAT_WORKERS', 1))
+
+# Files up to ELASTICSEARCH_ATTACHMENT_MAX_SIZE bytes are sent to the
+# ingest_attachment pipeline to index their content. Only the beginning of
+# larger text files is indexed, and larger files of other formats are indexed
+# without their content. ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS limits the
+# number of characters extracted from each file, -1 for no limit
+ELASTICSEARCH_ATTACHMENT_MAX_SIZE = int(os.environ.get('ESSARCH_ELASTICSEARCH_ATTACHMENT_MAX_SIZE', 50 * 1024 * 1024))
+ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS = int(os.environ.get('ESSARCH_ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS', -1))
+
+# Number of seconds the ACL tokens (organizations) used for filtering search
+# results are cached per organization. The cache is also cleared when an
+# organization is changed
+SEARCH_ACL_CACHE_TIMEOUT = int(os.environ.get('ESSARCH_SEARCH_ACL_CACHE_TIMEOUT', 300))
+
+# Maximum number of search results exported as PDF, the whole report is
+# rendered in memory. Larger results can be exported as CSV
+SEARCH_PDF_EXPORT_MAX_HITS = int(os.environ.get('ESSARCH_SEARCH_PDF_EXPORT_MAX_HITS', 1000))
+
+# File characterisation (checksum, encryption and format identification)
+# when generating content metadata. Set workers to a value above 1 to
+# characterise files concurrently using either 'thread' or 'process' workers
+PARSE_FILES_WORKERS = int(os.environ.get('ESSARCH_PARSE_FILES_WORKERS', 1))
+PARSE_FILES_EXECUTOR = os.environ.get('ESSARCH_PARSE_FILES_EXECUTOR', 'thread')
+
+# Path to a local SQLite database used to cache calculated checksums. Cached
+# checksums are reused as long as the device, inode, size, mtime and ctime of
+# the file are unchanged. Disabled if None
+CHECKSUM_CACHE_PATH = os.environ.get('ESSARCH_CHECKSUM_CACHE_PATH', None)
+
+# Number of threads hashing files during diff-check validation
+DIFF_CHECK_WORKERS = int(os.environ.get('ESSARCH_DIFF_CHECK_WORKERS', 1))
+
+# Number of identified file formats to keep in memory per process, keyed by
+# path and stat data. 0 disables the cache
+FORMAT_IDENTIFICATION_CACHE_SIZE = 10000
+
+# Number of compiled XML schemas to keep in memory per process, keyed by
+# location and content hash. 0 disables the cache
+XML_SCHEMA_CACHE_SIZE = 32
+
+# Directory where schemas imported from http(s) by XML schemas are cached
+# when validating XML files. Schemas are downloaded for each compilation
+# if None
+XML_SCHEMA_CACHE_DIR = os.environ.get('ESSARCH_XML_SCHEMA_CACHE_DIR', None)
+
+# Write generated XML files one element at a time instead of creating the
+# whole tree in memory first, keeps memory usage flat regardless of the
+# number of files in the package
+XML_GENERATOR_STREAM = False
+
 # Storage
 
 ESSARCH_TAPE_IDENTIFICATION_BACKEND = 'base'
 TARFILE_FORMAT = tarfile.GNU_FORMAT
 
+# Number of chunks uploaded concurrently when copying a file to a remote
+# server, and how long (in seconds) the last acknowledged offset of an
+# interrupted upload is kept so that a new attempt can resume from it
+REMOTE_COPY_CHUNKS_IN_FLIGHT = int(os.environ.get('ESSARCH_REMOTE_COPY_CHUNKS_IN_FLIGHT', 4))
+REMOTE_COPY_RESUME_TIMEOUT = 24 * 60 * 60
+
+# Algorithm of the checksum calculated while receiving files uploaded in
+# chunks with their offsets
+UPLOAD_CHECKSUM_ALGORITHM = 'SHA-256'
+
+# Interval (in seconds) at which a background thread in each web worker
+# refreshes the index of parsed submit descriptions in the reception,
+# keeping listing fast when packages are added. Disabled if None
+RECEPTION_INDEX_POLL_INTERVAL = os.environ.get('ESSARCH_RECEPTION_INDEX_POLL_INTERVAL', None)
+if RECEPTION_INDEX_POLL_INTERVAL is not None:
+    RECEPTION_INDEX_POLL_INTERVAL = float(RECEPTION_INDEX_POLL_INTERVAL)
+
+# Number of indexes of tar and zip containers kept in memory in each
+# process. Members stored uncompressed are read directly from the container
+# using the offsets in the index
+CONTAINER_INDEX_CACHE_SIZE = int(os.environ.get('ESSARCH_CONTAINER_INDEX_CACHE_SIZE', 16))
+
+# Path to a local SQLite database used to store indexes of tar and zip
+# containers between processes. Indexes are reused as long as the device,
+# inode, size, mtime and ctime of the container are unchanged. Disabled if None
+CONTAINER_INDEX_PATH = os.environ.get('ESSARCH_CONTAINER_INDEX_PATH', None)
+
+# Number of seconds the total size and number of files of each directory are
+# cached when listing directory sizes. The totals are also cleared when files
+# are uploaded, copied or extracted into the directory or removed from it
+DIRECTORY_SIZE_CACHE_TIMEOUT = int(os.environ.get('ESSARCH_DIRECTORY_SIZE_CACHE_TIMEOUT', 3600))
+
+# Number of files copied concurrently when copying directories
+COPY_DIR_WORKERS = int(os.environ.get('ESSARCH_COPY_DIR_WORKERS', 1))
+
+# Number of objects transferred concurrently to and from S3 when writing and
+# reading packages that are not stored in containers
+S3_OBJECT_WORKERS = int(os.environ.get('ESSARCH_S3_OBJECT_WORKERS', 4))
+
+# Size of each part in multipart transfers to and from S3, objects larger
+# than this are transferred in parts
+S3_MULTIPART_CHUNK_SIZE = int(os.environ.get('ESSARCH_S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024))
+
+# Number of parts of each object transferred concurrently to and from S3
+S3_MULTIPART_CONCURRENCY = int(os.environ.get('ESSARCH_S3_MULTIPART_CONCURRENCY', 8))
+
 # Logging
 LOGGING_DIR = os.path.join(ESSARCH_DIR, 'log')
+
+# Events logged while running tasks are buffered and written in bulk when
+# EVENT_BUFFER_SIZE events have been buffered, when the oldest has been
+# buffered for EVENT_BUFFER_MAX_AGE seconds and when the task ends. Set the
+# size to 0 to write each event when logged. Events that can't be written are
+# stored in EVENT_BUFFER_OVERFLOW_DIR, if set, until the next write. Stored
+# events that can't be written while the database is available are renamed
+# with the suffix .failed
+EVENT_BUFFER_SIZE = int(os.environ.get('ESSARCH_EVENT_BUFFER_SIZE', 500))
+EVENT_BUFFER_MAX_AGE = int(os.environ.get('ESSARCH_EVENT_BUFFER_MAX_AGE', 5))
+EVENT_BUFFER_OVERFLOW_DIR = os.environ.get('ESSARCH_EVENT_BUFFER_OVERFLOW_DIR', None)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import unittest
+
+from django.test import tag
+
+from ESSArch_Core.essxml.Generator.xmlGenerator import XMLElement
+
+BENCHMARK_FILES = os.environ.get('ESSARCH_GENERATOR_BENCHMARK_FILES')
+BENCHMARK_MIN_RATE = os.environ.get('ESSARCH_GENERATOR_BENCHMARK_MIN_RATE')
+
+
+@tag('benchmark')
+@unittest.skipUnless(BENCHMARK_FILES, 'ESSARCH_GENERATOR_BENCHMARK_FILES is not set')
+class ContentRenderingBenchmark(unittest.TestCase):
+    """
+    Creates file elements with django template content, attributes and
+    conditions and reports how many elements are created per second, to be
+    compared when changing how they are rendered.
+
+    Skipped unless the number of files is set with
+    ESSARCH_GENERATOR_BENCHMARK_FILES. Fails if fewer elements than
+    ESSARCH_GENERATOR_BENCHMARK_MIN_RATE are created per second, if set.
+    Run with:
+
+        ESSARCH_GENERATOR_BENCHMARK_FILES=500 \\
+            python manage.py test --tag=benchmark ESSArch_Core.essxml.Generator
+    """
+
+    specification = {
+        '-name': 'mets',
+        '-children': [
+            {
+                '-name': 'fileSec',
+                '-children': [
+                    {
+                        '-name': 'file',
+                        '-containsFiles': True,
+                        '-if': '{% if FSIZE %}True{% else %}False{% endif %}',
+                        '-attr': [
+                            {'-name': 'ID', '#content': 'ID{{FID}}'},
+                            {'-name': 'SIZE', '#content': '{{FSIZE}}'},
+                            {'-name': 'MIMETYPE', '#content': '{{FMimetype}}'},
+                            {'-name': 'CHECKSUM', '#content': '{{FChecksum}}'},
+                            {'-name': 'CREATED', '#content': '{{FCreated}}'},
+                            {'-name': 'OWNER', '#content': '{{_IP_CREATOR}}'},
+                        ],
+                        '-children': [
+                            {
+                                '-name': 'FLocat',
+                                '-attr': [
+                                    {'-name': 'href', '#content': 'file:///{{href}}'},
+                                    {'-name': 'LOCTYPE', '#content': [{'text': 'URL'}]},
+                                    {'-name': 'OBJID', '#content': [{'var': 'ip.objid'}]},
+                                ],
+                            },
+                        ],
+                    },
+                ],
+            },
+        ],
+    }
+
+    def test_elements_per_second(self):
+        info = {
+            '_IP_CREATOR': 'creator',
+            'ip': {'objid': 'objid', 'agents': [{'name': str(i)} for i in range(100)]},
+        }
+        files = [
+            {
+                'FID': str(i), 'FSIZE': str(i + 1), 'FMimetype': 'text/plain', 'FChecksum': 'a' * 64,
+                'FCreated': '2019-01-01T00:00:00+00:00', 'href': 'content/file{}.txt'.format(i),
+            }
+            for i in range(int(BENCHMARK_FILES))
+        ]
+
+        element = XMLElement(self.specification)
+        start_time = time.perf_counter()
+        root = element.createLXMLElement(info, files=files)
+        time_elapsed = time.perf_counter() - start_time
+
+        # each file element has a FLocat child
+        self.assertEqual(len(root.findall('.//file')), int(BENCHMARK_FILES))
+        self.assertEqual(len(root.findall('.//FLocat')), int(BENCHMARK_FILES))
+
+        elements = sum(1 for _ in root.iter())
+        rate = elements / time_elapsed
+        sys.stderr.write('\nCreated {} elements in {:.3f} sec ({:.0f} elements/s)\n'.format(
+            elements, time_elapsed, rate,
+        ))
+
+        if BENCHMARK_MIN_RATE:
+            self.assertGreaterEqual(rate, float(BENCHMARK_MIN_RATE))
@@ -33,12 +33,16 @@ from collections import OrderedDict
 from os import walk
 from unittest import mock
 
+from django.template import Template, TemplateSyntaxError
 from django.test import TestCase
 from django.utils import dateparse, timezone
 from lxml import etree
 
 from ESSArch_Core.essxml.Generator.xmlGenerator import (
+    ContentTemplate,
+    XMLElement,
     XMLGenerator,
+    find_files_in_path_not_in_external_dirs,
     parseContent,
 )
 from ESSArch_Core.util import make_unicode, normalize_path
@@ -2765,3 +2769,311 @@ class ParseContentTestCase(unittest.TestCase):
         info = {"foo": foo}
         contentobj = parse_content_django("{{foo}}", info)
         self.assertEqual(contentobj, "åäö")
+
+
+class ContentTemplateTestCase(unittest.TestCase):
+    def test_render_multiple_times(self):
+        template = ContentTemplate("hello {{foo}}")
+        self.assertEqual(template.render({'foo': 'world'}), 'hello world')
+        self.assertEqual(template.render({'foo': 'there'}), 'hello there')
+
+    def test_render_without_content(self):
+        self.assertIsNone(ContentTemplate(None).render({}))
+        self.assertIsNone(ContentTemplate('').render({}))
+
+    def test_data_is_not_modified(self):
+        info = {'foo': 'åäö'.encode('utf-8')}
+        self.assertEqual(ContentTemplate("{{foo}}").render(info), 'åäö')
+        self.assertEqual(info, {'foo': 'åäö'.encode('utf-8')})
+
+    def test_nested_leading_underscore(self):
+        template = ContentTemplate("{{_foo.bar}}")
+        self.assertEqual(template.render({'_foo': {'_bar': 'baz'}}), 'baz')
+
+    def test_invalid_template_fails_when_rendered(self):
+        template = ContentTemplate("{% foo %}")
+        with self.assertRaises(TemplateSyntaxError):
+            template.render({})
+
+    @mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.Template', side_effect=Template)
+    def test_templates_compiled_once_per_element(self, mock_template):
+        specification = {
+            '-name': 'root',
+            '-children': [
+                {
+                    '-name': 'file',
+                    '-containsFiles': True,
+                    '-if': '{{FTYPE}}',
+                    '-filters': {'href': '{{_FILTER}}'},
+                    '#content': '{{href}}',
+                    '-attr': [{'-name': 'size', '#content': '{{FSIZE}}'}],
+                },
+            ],
+        }
+        root = XMLElement(specification)
+        # the filter is compiled a second time without the leading underscore
+        self.assertEqual(mock_template.call_count, 5)
+
+        files = [{'href': 'file{}.txt'.format(i), 'FSIZE': str(i), 'FTYPE': 'txt'} for i in range(10)]
+        el = root.createLXMLElement({'_FILTER': r'\.txt$'}, files=files)
+
+        self.assertEqual(len(el), 10)
+        self.assertEqual(el[3].text, 'file3.txt')
+        self.assertEqual(el[3].get('size'), '3')
+        self.assertEqual(mock_template.call_count, 5)
+
+    def test_foreach_does_not_copy_data(self):
+        specification = {
+            '-name': 'root',
+            '-children': [
+                {
+                    '-name': 'item',
+                    '-foreach': 'items',
+                    '#content': [{'var': 'name'}, {'text': ' '}, {'var': 'shared.value'}],
+                },
+            ],
+        }
+        info = {'items': [{'name': 'a'}, {'name': 'b'}], 'shared': {'value': 'x'}}
+
+        with mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.copy.deepcopy') as mock_deepcopy:
+            el = XMLElement(specification).createLXMLElement(info)
+
+        mock_deepcopy.assert_not_called()
+        self.assertEqual([child.text for child in el], ['a x', 'b x'])
+
+
+class GenerateXMLStreamTestCase(GenerateXMLTestCase):
+    """
+    Runs the generation tests with files streamed to disk
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.generator = XMLGenerator(stream=True)
+
+
+class ExternalStreamTestCase(ExternalTestCase):
+    """
+    Runs the external tests with files streamed to disk
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.generator = XMLGenerator(stream=True)
+
+
+class StreamTestCase(TestCase):
+    def setUp(self):
+        self.bd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.bd)
+
+        self.datadir = os.path.join(self.bd, "datafiles")
+        os.makedirs(os.path.join(self.datadir, "a", "b"))
+        for i in range(10):
+            with open(os.path.join(self.datadir, "a" if i % 2 else "a/b", "file%s.txt" % i), 'w') as f:
+                f.write(str(i))
+
+        self.specification = {
+            '-name': 'mets',
+            '-namespace': 'mets',
+            '-nsmap': {
+                'mets': 'http://www.loc.gov/METS/',
+                'xlink': 'http://www.w3.org/1999/xlink',
+            },
+            '-attr': [{'-name': 'OBJID', '#content': [{'text': 'foo'}]}],
+            '-children': [
+                {
+                    '-name': 'metsHdr',
+                    '-namespace': 'mets',
+                    '-children': [{'-name': 'agent', '-namespace': 'mets', '#content': [{'text': 'bar'}]}],
+                },
+                {
+                    '-name': 'amdSec',
+                    '-namespace': 'mets',
+                    '-skipIfNoChildren': True,
+                    '-children': [{
+                        '-name': 'mdRef',
+                        '-namespace': 'mets',
+                        '-containsFiles': True,
+                        '-filters': {'href': 'no match'},
+                    }],
+                },
+                {
+                    '-name': 'fileSec',
+                    '-namespace': 'mets',
+                    '-children': [{
+                        '-name': 'fileGrp',
+                        '-namespace': 'mets',
+                        '-children': [{
+                            '-name': 'file',
+                            '-namespace': 'mets',
+                            '-containsFiles': True,
+                            '-attr': [{'-name': 'SIZE', '#content': [{'var': 'FSize'}]}],
+                            '-children': [
+                                {
+                                    '-name': 'FLocat',
+                                    '-namespace': 'mets',
+                                    '-attr': [{
+                                        '-name': 'href',
+                                        '-namespace': 'xlink',
+                                        '#content': [{'var': 'href'}],
+                                    }],
+                                },
+                                {
+                                    '-name': 'note',
+                                    '-namespace': 'mets',
+                                    '-allowEmpty': True,
+                                },
+                            ],
+                        }],
+                    }],
+                },
+            ],
+        }
+
+    def generate(self, stream, data=None):
+        fname = os.path.join(self.bd, "stream.xml" if stream else "memory.xml")
+        XMLGenerator(stream=stream).generate(
+            {fname: {'spec': self.specification, 'data': data or {}}}, folderToParse=self.datadir,
+        )
+        return fname
+
+    def test_same_result_as_in_memory(self):
+        with open(self.generate(stream=False), 'rb') as f:
+            in_memory = f.read()
+
+        with mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.XMLElement.createLXMLElement',
+                        side_effect=XMLElement.createLXMLElement, autospec=True) as mock_create:
+            with open(self.generate(stream=True), 'rb') as f:
+                streamed = f.read()
+
+        created = [c.args[0].name for c in mock_create.call_args_list]
+        self.assertNotIn('mets', created)
+        self.assertNotIn('fileSec', created)
+        self.assertEqual(created.count('file'), 10)
+
+        self.assertEqual(
+            etree.tostring(etree.fromstring(streamed), method='c14n'),
+            etree.tostring(etree.fromstring(in_memory), method='c14n'),
+        )
+        self.assertNotIn(b'amdSec', streamed)
+        self.assertEqual(streamed.count(b'xmlns:mets'), 1)
+
+    def test_cdata(self):
+        file_grp = self.specification['-children'][2]['-children'][0]
+        file_grp['-CDATAContent'] = 'grp_cdata'
+        file_grp['-children'][0]['-children'][1]['-CDATAContent'] = 'note_cdata'
+        data = {'grp_cdata': '<grp>&</grp>', 'note_cdata': '<note>&</note>'}
+
+        with open(self.generate(stream=True, data=data), 'rb') as f:
+            streamed = f.read()
+
+        self.assertEqual(streamed.count(b'<![CDATA[<grp>&</grp>]]>'), 1)
+        self.assertEqual(streamed.count(b'<![CDATA[<note>&</note>]]>'), 10)
+
+        root = etree.fromstring(streamed)
+        self.assertEqual(root.find('.//{*}fileGrp').text, '<grp>&</grp>')
+        self.assertEqual(
+            [note.text for note in root.iterfind('.//{*}note')],
+            ['<note>&</note>'] * 10,
+        )
+
+    def test_remove_partial_file_on_failure(self):
+        with mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.XMLElement.stream', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.generate(stream=True)
+
+        self.assertFalse(os.path.exists(os.path.join(self.bd, 'stream.xml')))
+
+    def test_open_failure_is_not_hidden(self):
+        fname = os.path.join(self.bd, 'stream.xml')
+        root = XMLElement(self.specification)
+
+        with mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.open', side_effect=PermissionError,
+                        create=True):
+            with self.assertRaises(PermissionError):
+                XMLGenerator(stream=True).write_stream(fname, root, {}, folderToParse=self.datadir)
+
+    def test_fallback_to_in_memory(self):
+        file_el = self.specification['-children'][2]['-children'][0]['-children'][0]
+        file_el['-ignoreExisting'] = ['SIZE']
+
+        root = XMLElement(self.specification)
+        self.assertTrue(root.streamed)
+        self.assertFalse(root.can_stream())
+
+        with mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.XMLElement.stream') as mock_stream:
+            fname = self.generate(stream=True)
+
+        mock_stream.assert_not_called()
+        # all files have the same size
+        tree = etree.parse(fname)
+        self.assertEqual(len(tree.findall('.//{*}file')), 1)
+
+
+class FindFilesTestCase(TestCase):
+    def setUp(self):
+        self.bd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.bd)
+
+        for path in ['a.txt', 'b/b.txt', 'ext/1/c.txt', 'ext/2/d/e.txt', 'extra/f.txt']:
+            path = os.path.join(self.bd, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(path)
+
+        self.fid = XMLGenerator().fid
+
+    def find_files(self, external, **kwargs):
+        files = find_files_in_path_not_in_external_dirs(
+            self.fid, self.bd, [(e,) for e in external], 'MD5', **kwargs
+        )
+        return sorted(f['href'] for f in files)
+
+    def test_external_dirs_are_excluded(self):
+        self.assertEqual(self.find_files(['ext']), ['a.txt', 'b/b.txt', 'extra/f.txt'])
+        self.assertEqual(self.find_files(['ext/2/', 'b']), ['a.txt', 'ext/1/c.txt', 'extra/f.txt'])
+        self.assertEqual(self.find_files(['.']), [])
+
+    def test_external_dirs_are_not_walked(self):
+        visited = []
+
+        def tracking_walk(path):
+            for root, dirnames, filenames in walk(path):
+                visited.append(os.path.relpath(root, self.bd))
+                yield root, dirnames, filenames
+
+        with mock.patch('ESSArch_Core.essxml.Generator.xmlGenerator.walk', side_effect=tracking_walk):
+            self.find_files(['ext/2'])
+
+        self.assertCountEqual(visited, ['.', 'b', 'ext', 'ext/1', 'extra'])
+
+    def test_exclude(self):
+        self.assertEqual(self.find_files(['ext'], exclude={'a.txt', 'b/b.txt'}), ['extra/f.txt'])
+
+    @mock.patch('ESSArch_Core.essxml.util.parse_file')
+    def test_parsed_files_are_not_parsed_again(self, mock_parse_file):
+        mock_parse_file.side_effect = lambda filepath, fid, relpath, **kwargs: {'href': relpath}
+        specification = {
+            '-name': 'root',
+            '-children': [
+                {
+                    '-name': 'file',
+                    '-containsFiles': True,
+                    '-attr': [{'-name': 'href', '#content': [{'var': 'href'}]}],
+                },
+            ],
+        }
+        fname = os.path.join(self.bd, 'out.xml')
+
+        XMLGenerator().generate(
+            {fname: {'spec': specification}}, folderToParse=self.bd, parsed_files=[{'href': 'a.txt'}],
+        )
+
+        parsed = [c.args[2] for c in mock_parse_file.call_args_list]
+        self.assertCountEqual(parsed, ['b/b.txt', 'ext/1/c.txt', 'ext/2/d/e.txt', 'extra/f.txt'])
+
+        hrefs = [el.get('href') for el in etree.parse(fname).getroot()]
+        self.assertEqual(sorted(hrefs), ['a.txt', 'b/b.txt', 'ext/1/c.txt', 'ext/2/d/e.txt', 'extra/f.txt'])
@@ -28,67 +28,74 @@ import logging
 import os
 import re
 import uuid
+from collections import ChainMap, Counter
+from collections.abc import Mapping
+from functools import lru_cache
 from os import walk
 
+from django.conf import settings
 from django.template import Context, Template, TemplateSyntaxError
 from django.utils import timezone
 from lxml import etree
 from natsort import natsorted
 
-from ESSArch_Core.essxml.util import parse_file
+from ESSArch_Core.essxml.util import parse_file, parse_files_concurrently
 from ESSArch_Core.fixity.format import FormatIdentifier
 from ESSArch_Core.util import (
     get_elements_without_namespace,
-    in_directory,
     make_unicode,
     nested_lookup,
     normalize_path,
+    win_to_posix,
 )
 
 logger = logging.getLogger('essarch.essxml.generator')
 leading_underscore_tag_re = re.compile(r'%s *_(.*?(?=\}))%s' % (re.escape('{{'), re.escape('}}')))
 
 
-def parse_content_django(content, info=None, unicode_error=False, syntax_error=False):
-    info_copy = {**info}
-    for k, v in info_copy.items():
-        if (isinstance(v, (str, bytes))):
-            info[k] = make_unicode(v)
+class _TemplateData(Mapping):
+    """
+    Read-only view of the data that a django template is rendered with.
+    Byte strings at the top level are decoded and, if strip_underscores is
+    set, leading underscores are removed from the keys at all levels.
+    """
 
-    c = Context(info)
-    try:
-        t = Template(content)
-    except TemplateSyntaxError:
-        if syntax_error:
-            raise
+    def __init__(self, data, strip_underscores=False, decode=True):
+        self._data = data
+        self._strip_underscores = strip_underscores
+        self._decode = decode
 
-        def remove_underscore_prefix(d):
-            new = {}
-            for k, v in d.items():
-                if isinstance(v, dict):
-                    v = remove_underscore_prefix(v)
-                if k.startswith('_'):
-                    new[k[1:]] = v
-                else:
-                    new[k] = v
-            return new
-        new_data = remove_underscore_prefix(info)
-        regcontent = leading_underscore_tag_re.sub(r'{{\1}}', content)
-        return parse_content_django(regcontent, info=new_data, syntax_error=True)
+    def _get_key(self, key):
+        if self._strip_underscores and isinstance(key, str) and '_' + key in self._data:
+            return '_' + key
+        return key
 
-    return t.render(c)
+    def __getitem__(self, key):
+        val = self._data[self._get_key(key)]
 
+        if self._decode and isinstance(val, bytes):
+            return make_unicode(val)
 
-def parseContent(content, info=None):
-    if not content:
-        return None
+        if self._strip_underscores and isinstance(val, Mapping):
+            return _TemplateData(val, strip_underscores=True, decode=False)
 
-    if info is None:
-        info = {}
+        return val
 
-    if isinstance(content, str):
-        return parse_content_django(content, info=info)
+    def __contains__(self, key):
+        return self._get_key(key) in self._data
+
+    def __iter__(self):
+        for key in self._data:
+            if self._strip_underscores and isinstance(key, str) and key.startswith('_'):
+                yield key[1:]
+            else:
+                yield key
+
+    def __len__(self):
+        return len(self._data)
 
+
+def _render_parts(content, info):
     def get_nested_val(dct, key):
         for k in key.split('.'):
             try:
@@ -104,7 +111,7 @@ def parseContent(content, info=None):
         elif 'var' in c:
             var = c['var']
             if '.' in var:
-                val = get_nested_val(copy.deepcopy(info), var)
+                val = get_nested_val(info, var)
             else:
                 val = info.get(var) or info.get(var.split('__')[0])
 
@@ -135,6 +142,84 @@ def parseContent(content, info=None):
     return ''.join(arr)
 
 
+class ContentTemplate:
+    """
+    Content of an element, attribute or condition, compiled once and then
+    rendered for each set of data.
+
+    Args:
+        content: Either a django template string or a list of parts, example:
+            [
+                {
+                    'var': 'foo.bar'
+                },
+                {
+                    'text': 'baz'
+                }
+            ]
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self._template = None
+        self._strip_underscores = False
+        self._error = None
+
+        if content and isinstance(content, str):
+            try:
+                self._template = Template(content)
+            except TemplateSyntaxError:
+                # django does not allow variables starting with underscores,
+                # try again without them
+                self._strip_underscores = True
+                try:
+                    self._template = Template(leading_underscore_tag_re.sub(r'{{\1}}', content))
+                except TemplateSyntaxError as e:
+                    # raised when rendered to fail at the same point as
+                    # before the template was compiled in advance
+                    self._error = e
+
+    def render(self, info=None):
+        if not self.content:
+            return None
+
+        if info is None:
+            info = {}
+
+        if self._error is not None:
+            raise self._error
+
+        if self._template is None:
+            return _render_parts(self.content, info)
+
+        return self._template.render(Context(_TemplateData(info, strip_underscores=self._strip_underscores)))
+
+
+@lru_cache(maxsize=256)
+def get_content_template(content):
+    return ContentTemplate(content)
+
+
+def parse_content_django(content, info=None):
+    if info is None:
+        info = {}
+
+    return get_content_template(content).render(info) or ''
+
+
+def parseContent(content, info=None):
+    if not content:
+        return None
+
+    if isinstance(content, str):
+        return get_content_template(content).render(info)
+
+    if info is None:
+        info = {}
+
+    return _render_parts(content, info)
+
+
 def findElementWithoutNamespace(tree, el_name):
     root = tree.getroot()
     rootWithoutNS = etree.QName(root).localname
@@ -191,9 +276,14 @@ class XMLElement:
         self.condition = template.get('-if', None)
         self.requiredParameters = template.get('-requiredParameters', [])
         self.children = []
+
+        self._content = ContentTemplate(self.content)
+        self._condition = ContentTemplate(self.condition) if self.condition is not None else None
+        self._file_filters = {key: ContentTemplate(f) for key, f in self.fileFilters.items()}
         self.el = None
         self.parent = None
         self.parent_pos = 0
+        self._tag_counts = Counter()
 
         self._fid = fid
 
@@ -201,6 +291,10 @@ class XMLElement:
             child_el = XMLElement(child)
             self.children.append(child_el)
 
+        # elements with file elements somewhere below them are written one
+        # child at a time when streaming
+        self.streamed = not self.containsFiles and any(c.containsFiles or c.streamed for c in self.children)
+
     @ property
     def fid(self):
         if self._fid is not None:
@@ -253,7 +347,7 @@ class XMLElement:
         return external_elements
 
     def parse(self, info):
-        return parseContent(self.content, info)
+        return self._content.render(info)
 
     def contentIsEmpty(self, info=None):
         if info is None:
@@ -268,7 +362,7 @@ class XMLElement:
         if getattr(self.el, 'text', None) is not None and len(self.el.text):
             return False
 
-        if parseContent(self.content, info):
+        if self.parse(info):
             return False
 
         if self.nestedXMLContent:
@@ -336,6 +430,25 @@ class XMLElement:
 
         return id
 
+    def can_stream(self):
+        """
+        Checks if the element can be written using stream. Elements that
+        depend on the elements already created can't be streamed since they
+        are no longer available in memory.
+        """
+
+        if self.enable_FILEGROUPID:
+            return False
+
+        for child in self.children:
+            if self.streamed and (child.replace_existing is not None or child.ignore_existing):
+                return False
+
+            if not child.can_stream():
+                return False
+
+        return True
+
     def get_existing_elements(self, new_el, attrs):
         # Get elements that have the same name as new_el and where the attributes
         # in attrs have the same value as new_el
@@ -372,28 +485,27 @@ class XMLElement:
                 return
 
         self.el.append(new.el)
+        self._tag_counts[new.el.tag] += 1
 
-    def createLXMLElement(self, info, nsmap=None, files=None, folderToParse='', parent=None, algorithm=None):
-        if nsmap is None:
-            nsmap = {}
-
-        if files is None:
-            files = []
-
+    def _set_parent(self, parent):
         self.parent = parent
         if parent is not None and self.name is not None:
-            siblings_same_name = len(parent.el.findall(self.name))
-            self.parent_pos = siblings_same_name
+            self.parent_pos = parent._tag_counts[self.name]
         else:
             self.parent_pos = 0
 
-        full_nsmap = nsmap.copy()
-        full_nsmap.update(self.nsmap)
+        self._tag_counts = Counter()
+
+    def _create_empty_element(self, info, nsmap):
+        """
+        Creates the element without any children, returns None if the
+        element should not be created
+        """
 
         if self.namespace:
-            self.el = etree.Element("{{{}}}{}".format(full_nsmap[self.namespace], self.name), nsmap=full_nsmap)
+            self.el = etree.Element("{{{}}}{}".format(nsmap[self.namespace], self.name), nsmap=nsmap)
         else:
-            self.el = etree.Element("{}".format(self.name), nsmap=full_nsmap)
+            self.el = etree.Element("{}".format(self.name), nsmap=nsmap)
 
         self.el.text = self.parse(info)
 
@@ -401,13 +513,13 @@ class XMLElement:
             if info.get(req_param) is None or info.get(req_param, '') == '':
                 return None
 
-        if self.condition is not None:
-            condition = parseContent(self.condition, info)
+        if self._condition is not None:
+            condition = self._condition.render(info)
             if condition == 'False':
                 return None
 
         for attr in self.attr:
-            name, content, required = attr.parse(info, nsmap=full_nsmap)
+            name, content, required = attr.parse(info, nsmap=nsmap)
 
             if required and not content:
                 raise ValueError(
@@ -418,6 +530,14 @@ class XMLElement:
             elif content or attr.allow_empty:
                 self.el.set(name, content)
 
+        return self.el
+
+    def _iter_children(self, info, files, folderToParse):
+        """
+        Yields each child together with the data to create it with, in
+        document order. External children are yielded with None as data.
+        """
+
         for child_idx, child in enumerate(self.children):
             child.parent = self
             child.parent_pos = child_idx
@@ -425,24 +545,15 @@ class XMLElement:
                 for fileinfo in files:
                     include = True
 
-                    for key, file_filter_raw in child.fileFilters.items():
-                        file_filter = parseContent(file_filter_raw, info)
+                    for key, file_filter_template in child._file_filters.items():
+                        file_filter = file_filter_template.render(info)
                         if not re.search(file_filter, fileinfo.get(key, '')):
                             include = False
 
                     if include:
                         full_info = info.copy()
                         full_info.update(fileinfo)
-                        child_el = child.createLXMLElement(
-                            full_info,
-                            full_nsmap,
-                            files=files,
-                            folderToParse=folderToParse,
-                            parent=self,
-                            algorithm=algorithm,
-                        )
-                        if child_el is not None:
-                            self.add_element(child)
+                        yield child, full_info
 
             elif child.foreach is not None:
                 try:
@@ -460,20 +571,9 @@ class XMLElement:
                     iterator = enumerate(foreach_el)
 
                 for idx, v in iterator:
-                    child_info = copy.deepcopy(info)
-                    child_info.update(v)
-                    child_info['{foreach}__key'.format(foreach=child.foreach)] = idx
-
-                    child_el = child.createLXMLElement(
-                        child_info,
-                        full_nsmap,
-                        files=files,
-                        folderToParse=folderToParse,
-                        parent=self,
-                        algorithm=algorithm,
-                    )
-                    if child_el is not None:
-                        self.add_element(child)
+                    # layered on top of the data instead of copying it
+                    child_info = ChainMap({'{foreach}__key'.format(foreach=child.foreach): idx}, v, info)
+                    yield child, child_info
 
             elif child.foreachdir is not None:
                 foreachdir_root = os.path.join(folderToParse, child.foreachdir)
@@ -487,24 +587,10 @@ class XMLElement:
                         child_info['_DIR'] = foreach_dir
                         if child.enable_FILEGROUPID:
                             child_info['_FILEGROUPID'] = self.get_FILEGROUPID(child, child_info)
-
-                        child_el = child.createLXMLElement(
-                            child_info,
-                            full_nsmap,
-                            files=files,
-                            folderToParse=folderToParse,
-                            parent=self,
-                            algorithm=algorithm,
-                        )
-                        if child_el is not None:
-                            self.add_element(child)
+                        yield child, child_info
 
             elif child.external is not None:
-                external_elements = self.createExternalElement(info, nsmap=full_nsmap, files=files,
-                                                               folderToParse=folderToParse, algorithm=algorithm,
-                                                               external=child.external)
-                for external_element in external_elements:
-                    self.add_element(external_element)
+                yield child, None
 
             else:
                 if child.enable_FILEGROUPID:
@@ -512,23 +598,77 @@ class XMLElement:
                     child_info['_FILEGROUPID'] = self.get_FILEGROUPID(child, child_info)
                 else:
                     child_info = info
-                child_el = child.createLXMLElement(
-                    child_info,
-                    full_nsmap,
-                    files=files,
-                    folderToParse=folderToParse,
-                    parent=self,
-                    algorithm=algorithm,
-                )
-                if child_el is not None:
-                    self.add_element(child)
+                yield child, child_info
+
+    def _get_nested_xml(self, info):
+        # we encode the XML to get around LXML limitation with XML strings
+        # containing encoding information.
+        #
+        # See:
+        # https://stackoverflow.com/questions/15830421/xml-unicode-strings-with-encoding-declaration-are-not-supported
+        try:
+            nested_xml = info[self.nestedXMLContent].decode().encode('utf-8')
+        except (UnicodeDecodeError, AttributeError):
+            nested_xml = bytes(bytearray(info[self.nestedXMLContent], encoding='utf-8'))
+        parser = etree.XMLParser(remove_blank_text=True)
+        return etree.fromstring(nested_xml, parser=parser)
+
+    def _is_skipped(self, info):
+        """
+        Checks if the created element should be skipped because it is empty
+        """
+
+        is_empty = self.isEmpty(info)
+        if is_empty and self.required:
+            raise ValueError("Missing value for required element '%s'" % (self.get_path()))
+
+        if is_empty and not self.allowEmpty:
+            return True
+
+        if len(self.el) == 0 and self.skipIfNoChildren:
+            return True
+
+        if self.contentIsEmpty(info) and self.hideEmptyContent:
+            return True
+
+        return False
+
+    def createLXMLElement(self, info, nsmap=None, files=None, folderToParse='', parent=None, algorithm=None):
+        if nsmap is None:
+            nsmap = {}
+
+        if files is None:
+            files = []
+
+        self._set_parent(parent)
+
+        full_nsmap = nsmap.copy()
+        full_nsmap.update(self.nsmap)
+
+        if self._create_empty_element(info, full_nsmap) is None:
+            return None
+
+        for child, child_info in self._iter_children(info, files, folderToParse):
+            if child_info is None:
+                external_elements = self.createExternalElement(info, nsmap=full_nsmap, files=files,
+                                                               folderToParse=folderToParse, algorithm=algorithm,
+                                                               external=child.external)
+                for external_element in external_elements:
+                    self.add_element(external_element)
+                continue
+
+            child_el = child.createLXMLElement(
+                child_info,
+                full_nsmap,
+                files=files,
+                folderToParse=folderToParse,
+                parent=self,
+                algorithm=algorithm,
+            )
+            if child_el is not None:
+                self.add_element(child)
 
         if self.nestedXMLContent:
-            # we encode the XML to get around LXML limitation with XML strings
-            # containing encoding information.
-            #
-            # See:
-            # https://stackoverflow.com/questions/15830421/xml-unicode-strings-with-encoding-declaration-are-not-supported
             if self.nestedXMLContent not in info:
                 logger.warning(
                     "Nested XML '{}' not found in data and will not be created".format(self.nestedXMLContent)
@@ -536,19 +676,9 @@ class XMLElement:
                 if not self.allowEmpty:
                     return None
             else:
-                try:
-                    nested_xml = info[self.nestedXMLContent].decode().encode('utf-8')
-                except (UnicodeDecodeError, AttributeError):
-                    nested_xml = bytes(bytearray(info[self.nestedXMLContent], encoding='utf-8'))
-                parser = etree.XMLParser(remove_blank_text=True)
-                self.el.append(etree.fromstring(nested_xml, parser=parser))
+                self.el.append(self._get_nested_xml(info))
 
         if self.CDATAContent:
-            # we encode the XML to get around LXML limitation with XML strings
-            # containing encoding information.
-            #
-            # See:
-            # https://stackoverflow.com/questions/15830421/xml-unicode-strings-with-encoding-declaration-are-not-supported
             if self.CDATAContent not in info:
                 logger.warning(
                     "CDATA '{}' not found in data and will not be created".format(self.CDATAContent)
@@ -559,20 +689,220 @@ class XMLElement:
                 nested_xml = info[self.CDATAContent]
                 self.el.text = etree.CDATA(nested_xml)
 
-        is_empty = self.isEmpty(info)
-        if is_empty and self.required:
-            raise ValueError("Missing value for required element '%s'" % (self.get_path()))
-
-        if is_empty and not self.allowEmpty:
+        if self._is_skipped(info):
             return None
 
-        if len(self.el) == 0 and self.skipIfNoChildren:
-            return None
+        return self.el
 
-        if self.contentIsEmpty(info) and self.hideEmptyContent:
-            return None
+    def stream(self, xf, info, nsmap=None, files=None, folderToParse='', parent=None, algorithm=None,
+               writer=None, output=None):
+        """
+        Writes the element to xf, an lxml.etree.xmlfile, one child at a time
+        instead of creating the whole tree in memory. Children without file
+        elements below them are created using createLXMLElement and written
+        as soon as they are created.
+
+        output is the UTF-8 encoded file that xf writes to, CDATA sections
+        are written directly to it by versions of lxml that can't write them
+        to xf.
+
+        Returns:
+            True if the element was written, False otherwise
+        """
+
+        if nsmap is None:
+            nsmap = {}
+
+        if files is None:
+            files = []
+
+        self._set_parent(parent)
+
+        full_nsmap = nsmap.copy()
+        full_nsmap.update(self.nsmap)
+
+        if self._create_empty_element(info, full_nsmap) is None:
+            return False
+
+        # nested XML and CDATA does not depend on the children and are
+        # checked before any children are written
+        if self.nestedXMLContent and self.nestedXMLContent not in info:
+            logger.warning("Nested XML '{}' not found in data and will not be created".format(self.nestedXMLContent))
+            if not self.allowEmpty:
+                return False
+
+        cdata = False
+        if self.CDATAContent:
+            if self.CDATAContent not in info:
+                logger.warning("CDATA '{}' not found in data and will not be created".format(self.CDATAContent))
+                if not self.allowEmpty:
+                    return False
+            else:
+                self.el.text = etree.CDATA(info[self.CDATAContent])
+                cdata = True
+
+        el_writer = _XMLFileElementWriter(xf, self.el, parent=writer, output=output, cdata=cdata)
+
+        for child, child_info in self._iter_children(info, files, folderToParse):
+            if child_info is None:
+                external_elements = self.createExternalElement(info, nsmap=full_nsmap, files=files,
+                                                               folderToParse=folderToParse, algorithm=algorithm,
+                                                               external=child.external)
+                for external_element in external_elements:
+                    el_writer.write(external_element.el)
+                    self._tag_counts[external_element.el.tag] += 1
+                continue
+
+            if child.streamed:
+                if child.stream(xf, child_info, full_nsmap, files=files, folderToParse=folderToParse,
+                                parent=self, algorithm=algorithm, writer=el_writer):
+                    self._tag_counts[child.el.tag] += 1
+                continue
+
+            child_el = child.createLXMLElement(
+                child_info,
+                full_nsmap,
+                files=files,
+                folderToParse=folderToParse,
+                parent=self,
+                algorithm=algorithm,
+            )
+            if child_el is not None:
+                el_writer.write(child_el)
+                self._tag_counts[child_el.tag] += 1
+
+                # the element is no longer needed once it has been written
+                child.el = None
+
+        if self.nestedXMLContent and self.nestedXMLContent in info:
+            el_writer.write(self._get_nested_xml(info))
+
+        if not el_writer.length and self._is_skipped(info):
+            return False
+
+        el_writer.close()
+        return True
 
-        return self.el
+
+class _XMLFileElementWriter:
+    """
+    Writes an element to an lxml.etree.xmlfile, indented as if pretty
+    printed. The start tag is not written until the first child is written
+    or the element is closed, so that elements that turn out to be empty
+    can be skipped.
+    """
+
+    indent = '  '
+
+    def __init__(self, xf, el, parent=None, output=None, cdata=False):
+        self.xf = xf
+        self.el = el
+        self.parent = parent
+        self.output = parent.output if parent is not None else output
+        self.cdata = cdata
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.declared = parent.declared if parent is not None else {}
+        self.length = 0
+        self._context = None
+
+    def open(self):
+        if self._context is not None:
+            return
+
+        if self.parent is not None:
+            self.parent._before_child()
+
+        nsmap = _get_new_namespaces(self.el, self.declared)
+        if nsmap:
+            self.declared = {**self.declared, **nsmap}
+
+        self._context = self.xf.element(self.el.tag, dict(self.el.attrib), nsmap=nsmap or None)
+        self._context.__enter__()
+        if self.el.text:
+            if self.cdata:
+                _write_cdata(self.xf, self.output, self.el.text)
+            else:
+                self.xf.write(self.el.text)
+
+    def _before_child(self):
+        self.open()
+        self.length += 1
+        if not self.el.text:
+            self.xf.write('\n' + self.indent * (self.depth + 1))
+
+    def write(self, el):
+        self._before_child()
+        _write_element(self.xf, el, self.declared, self.depth + 1, self.indent, self.output)
+
+    def close(self):
+        self.open()
+        if self.length and not self.el.text:
+            self.xf.write('\n' + self.indent * self.depth)
+        self._context.__exit__(None, None, None)
+
+
+def _get_new_namespaces(el, declared):
+    return {prefix: uri for prefix, uri in el.nsmap.items() if declared.get(prefix) != uri}
+
+
+def _has_cdata_text(el):
+    """
+    lxml returns the content of a CDATA section as ordinary text, the
+    serialized element is checked instead
+    """
+
+    xml = etree.tostring(el, with_tail=False)
+    return xml[xml.index(b'>') + 1:].startswith(b'<![CDATA[')
+
+
+def _write_cdata(xf, output, text):
+    """
+    Writes text as a CDATA section to an lxml.etree.xmlfile. Older versions
+    of lxml can't write CDATA sections to an xmlfile, the section is then
+    written directly to output, the UTF-8 encoded file written by xf
+    """
+
+    cdata = etree.CDATA(text)
+    try:
+        xf.write(cdata)
+    except TypeError:
+        xf.flush()
+        output.write(b'<![CDATA[' + text.encode('utf-8') + b']]>')
+
+
+def _write_element(xf, el, declared, depth, indent, output=None):
+    """
+    Writes an element created in memory to an lxml.etree.xmlfile without
+    repeating the namespace declarations already written by its ancestors
+    """
+
+    if not isinstance(el.tag, str):
+        # comments and processing instructions
+        xf.write(el, with_tail=False)
+        return
+
+    nsmap = _get_new_namespaces(el, declared)
+    if nsmap:
+        declared = {**declared, **nsmap}
+
+    pretty = not el.text or not el.text.strip()
+
+    with xf.element(el.tag, dict(el.attrib), nsmap=nsmap or None):
+        if el.text and not pretty:
+            if _has_cdata_text(el):
+                _write_cdata(xf, output, el.text)
+            else:
+                xf.write(el.text)
+
+        for child in el:
+            if pretty:
+                xf.write('\n' + indent * (depth + 1))
+            _write_element(xf, child, declared, depth + 1, indent, output)
+            if child.tail and not pretty:
+                xf.write(child.tail)
+
+        if pretty and len(el):
+            xf.write('\n' + indent * depth)
 
 
 class XMLAttribute:
@@ -602,6 +932,7 @@ class XMLAttribute:
         self.required = template.get('-req', False)
         self.content = template.get('#content')
         self.allow_empty = template.get('-allowEmpty', False)
+        self._content = ContentTemplate(self.content)
 
     def parse(self, info, nsmap=None):
         if nsmap is None:
@@ -612,34 +943,93 @@ class XMLAttribute:
         if self.namespace:
             name = "{%s}%s" % (nsmap.get(self.namespace), self.name)
 
-        content = parseContent(self.content, info)
+        content = self._content.render(info)
         if content is None and self.allow_empty:
             content = ""
 
         return name, content, self.required
 
 
-def find_files_in_path_not_in_external_dirs(fid, path, external, algorithm, rootdir=""):
-    files = []
-    external = [e[0] for e in external]
-    for root, _dirnames, filenames in walk(path):
-        for fname in filenames:
-            filepath = os.path.join(root, fname)
-            relpath = os.path.relpath(filepath, path)
-
-            in_external = False
-            for e in external:
-                if in_directory(relpath, e):
-                    in_external = True
-            if in_external:
-                continue
+class _DirectoryTrie:
+    """
+    Prefix tree of relative directory paths, used to check if a path is in
+    any of the directories in time proportional to the depth of the path
+    instead of the number of directories
+    """
 
-            fileinfo = parse_file(filepath, fid, relpath, algorithm=algorithm, rootdir=rootdir)
-            files.append(fileinfo)
-    return files
+    def __init__(self, directories=()):
+        self._root = {}
+        self._covers_all = False
+
+        for directory in directories:
+            self.add(directory)
+
+    @staticmethod
+    def _split(path):
+        path = os.path.normpath(win_to_posix(path).rstrip('/ ') or '.')
+        if path == '.':
+            return []
+        return win_to_posix(path).split('/')
+
+    def add(self, directory):
+        parts = self._split(directory)
+        if not parts:
+            self._covers_all = True
+            return
+
+        node = self._root
+        for part in parts:
+            node = node.setdefault(part, {})
+        node[None] = True
+
+    def __contains__(self, path):
+        if self._covers_all:
+            return True
+
+        node = self._root
+        for part in self._split(path):
+            try:
+                node = node[part]
+            except KeyError:
+                return False
+            if None in node:
+                return True
+        return False
+
+
+def find_files_in_path_not_in_external_dirs(fid, path, external, algorithm, rootdir="", workers=None,
+                                            executor=None, exclude=None):
+    """
+    Parses all files in path that are not in any of the external
+    directories or have a relative path in exclude
+    """
+
+    external = _DirectoryTrie(e[0] for e in external)
+    if exclude is None:
+        exclude = set()
 
+    def iter_files():
+        for root, dirnames, filenames in walk(path):
+            reldir = os.path.relpath(root, path)
 
-def parse_files(fid, path, external, algorithm, rootdir):
+            # don't walk into external directories
+            dirnames[:] = [d for d in dirnames if os.path.join(reldir, d) not in external]
+
+            for fname in filenames:
+                filepath = os.path.join(root, fname)
+                relpath = os.path.relpath(filepath, path)
+
+                if relpath in external or win_to_posix(relpath) in exclude:
+                    continue
+
+                yield filepath, relpath, rootdir
+
+    return list(parse_files_concurrently(
+        iter_files(), fid, algorithm=algorithm, workers=workers, executor=executor,
+    ))
+
+
+def parse_files(fid, path, external, algorithm, rootdir, workers=None, executor=None, exclude=None):
     files = []
     if os.path.isfile(path):
         relpath = os.path.basename(path)
@@ -648,14 +1038,25 @@ def parse_files(fid, path, external, algorithm, rootdir):
         files.append(file_info)
 
     elif os.path.isdir(path):
-        found_files = find_files_in_path_not_in_external_dirs(fid, path, external, algorithm, rootdir)
+        found_files = find_files_in_path_not_in_external_dirs(
+            fid, path, external, algorithm, rootdir, workers=workers, executor=executor, exclude=exclude,
+        )
         files.extend(found_files)
     return files
 
 
 class XMLGenerator:
-    def __init__(self, filepath=None, allow_unknown_file_types=False, allow_encrypted_files=False):
+    def __init__(self, filepath=None, allow_unknown_file_types=False, allow_encrypted_files=False,
+                 workers=None, executor=None, stream=None):
         self.parser = etree.XMLParser(remove_blank_text=True)
+        self.workers = workers
+        self.executor = executor
+
+        # Write the files one element at a time instead of creating the
+        # whole tree in memory first, self.tree is not available afterwards
+        if stream is None:
+            stream = getattr(settings, 'XML_GENERATOR_STREAM', False)
+        self.stream = stream
         self.fid = FormatIdentifier(
             allow_unknown_file_types=allow_unknown_file_types,
             allow_encrypted_files=allow_encrypted_files,
@@ -738,7 +1139,7 @@ class XMLGenerator:
             external_dirs_files_to_create = {}
             external = self.find_external_dirs()
             if external:
-                external_gen = XMLGenerator()
+                external_gen = XMLGenerator(workers=self.workers, executor=self.executor, stream=self.stream)
 
             for ext_dir, ext_file, ext_spec, ext_pointer, ext_data, ext_filters in external:
                 if ext_file:
@@ -793,16 +1194,17 @@ class XMLGenerator:
                         )
                         files.append(fileinfo)
 
-            for file_to_append in parse_files(self.fid, folderToParse, external, algorithm, rootdir=""):
-                file_alreay_exists = False
-                for file_in_list in files:
-                    if file_in_list['href'] == file_to_append['href']:
-                        file_alreay_exists = True
-                if not file_alreay_exists:
+            # files already in the list are neither parsed again nor added twice
+            hrefs = {f['href'] for f in files}
+            for file_to_append in parse_files(self.fid, folderToParse, external, algorithm, rootdir="",
+                                              workers=self.workers, executor=self.executor, exclude=hrefs):
+                if file_to_append['href'] not in hrefs:
+                    hrefs.add(file_to_append['href'])
                     files.append(file_to_append)
 
         for path in extra_paths_to_parse:
-            files.extend(parse_files(self.fid, path, external, algorithm, rootdir=path))
+            files.extend(parse_files(self.fid, path, external, algorithm, rootdir=path,
+                                     workers=self.workers, executor=self.executor))
 
         for idx, f in enumerate(self.toCreate):
             fname = f['file']
@@ -811,10 +1213,17 @@ class XMLGenerator:
 
             data['_XML_FILENAME'] = os.path.basename(fname)
 
-            self.tree = etree.ElementTree(
-                rootEl.createLXMLElement(data, files=files, folderToParse=folderToParse, algorithm=algorithm)
-            )
-            self.write(fname)
+            if self.stream and rootEl.streamed and rootEl.can_stream():
+                self.tree = None
+                self.write_stream(fname, rootEl, data, files=files, folderToParse=folderToParse,
+                                  algorithm=algorithm)
+            else:
+                if self.stream:
+                    logger.debug('Cannot stream {}, creating it in memory'.format(fname))
+                self.tree = etree.ElementTree(
+                    rootEl.createLXMLElement(data, files=files, folderToParse=folderToParse, algorithm=algorithm)
+                )
+                self.write(fname)
 
             if relpath:
                 relfilepath = os.path.relpath(fname, relpath)
@@ -830,6 +1239,20 @@ class XMLGenerator:
     def write(self, filepath):
         self.tree.write(filepath, pretty_print=True, xml_declaration=True, encoding='UTF-8')
 
+    def write_stream(self, filepath, root, data, files=None, folderToParse='', algorithm=None):
+        f = open(filepath, 'wb')
+        try:
+            with f:
+                with etree.xmlfile(f, encoding='UTF-8') as xf:
+                    xf.write_declaration()
+                    if not root.stream(xf, data, files=files, folderToParse=folderToParse, algorithm=algorithm,
+                                       output=f):
+                        raise ValueError('Root element {} of {} was not created'.format(root.name, filepath))
+                f.write(b'\n')
+        except BaseException:
+            os.remove(filepath)
+            raise
+
     def find_element(self, path):
         return findElementWithoutNamespace(self.tree, path)
 
@@ -37,9 +37,11 @@ from ESSArch_Core.essxml.util import (
     get_altrecordid,
     get_altrecordids,
     get_objectpath,
+    parse_files_concurrently,
     parse_reference_code,
     parse_submit_description,
 )
+from ESSArch_Core.fixity.format import FormatIdentifier
 
 
 class FindFilesTestCase(TestCase):
@@ -561,3 +563,43 @@ class ParseSubmitDescriptionTestCase(TestCase):
         self.xmlfile.close()
         ip = parse_submit_description(self.xmlfile.name)
         self.assertEqual(ip['information_class'], 123)
+
+
+class ParseFilesConcurrentlyTestCase(TestCase):
+    def setUp(self):
+        self.bd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.bd)
+
+        self.files = []
+        for i in range(20):
+            filepath = os.path.join(self.bd, '{}.txt'.format(i))
+            with open(filepath, 'w') as f:
+                f.write('foo{}'.format(i))
+            self.files.append((filepath, '{}.txt'.format(i), ''))
+
+        self.fid = FormatIdentifier()
+
+    def assert_same_result(self, serial, concurrent):
+        self.assertEqual(len(serial), len(concurrent))
+        for expected, actual in zip(serial, concurrent):
+            expected.pop('FID')
+            actual.pop('FID')
+            self.assertEqual(expected, actual)
+
+    def test_serial(self):
+        parsed = list(parse_files_concurrently(self.files, self.fid, workers=1))
+        self.assertEqual([f['href'] for f in parsed], [f[1] for f in self.files])
+
+    def test_threads_keeps_order(self):
+        serial = list(parse_files_concurrently(self.files, self.fid, workers=1))
+        concurrent = list(parse_files_concurrently(self.files, self.fid, workers=4, executor='thread'))
+        self.assert_same_result(serial, concurrent)
+
+    def test_processes_keeps_order(self):
+        serial = list(parse_files_concurrently(self.files, self.fid, workers=1))
+        concurrent = list(parse_files_concurrently(self.files, self.fid, workers=2, executor='process'))
+        self.assert_same_result(serial, concurrent)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            list(parse_files_concurrently(self.files, self.fid, workers=2, executor='foo'))
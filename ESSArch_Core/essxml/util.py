@@ -22,18 +22,27 @@
     Email - essarch@essolutions.se
 """
 
+import hashlib
 import logging
+import multiprocessing
 import os
 import pathlib
 import re
+import shutil
 import tempfile
+import threading
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
 from urllib.parse import urlparse
 
+from django.conf import settings
 from lxml import etree
 
-from ESSArch_Core.fixity import checksum
+from ESSArch_Core.cache.lru import LRUCache
+from ESSArch_Core.fixity.characterization import characterize_file
 from ESSArch_Core.util import (
+    bounded_map,
     creation_date,
     get_elements_without_namespace,
     get_value_from_path,
@@ -84,6 +93,10 @@ FILE_ELEMENTS = {
     },
 }
 
+# Large enough for any ZIP end of central directory record, see
+# FileEncryptionValidator.is_file_encrypted
+ENCRYPTION_BUFSIZE = 128 * 1024
+
 PTR_ELEMENTS = {
     "mptr": {
         "path": "@href",
@@ -477,7 +490,6 @@ def parse_file(filepath, fid, relpath=None, algorithm='SHA-256', rootdir='', pro
         'FID': str(uuid.uuid4()),
         'daotype': "borndigital",
         'href': relpath,
-        'FMimetype': fid.get_mimetype(filepath),
         'FSize': str(os.path.getsize(filepath)),
         'FUse': 'Datafile',
         'FChecksumType': algorithm,
@@ -490,19 +502,39 @@ def parse_file(filepath, fid, relpath=None, algorithm='SHA-256', rootdir='', pro
     # We only do heavy computations if their values aren't included in
     # provided_data
 
+    if 'FMimetype' not in provided_data:
+        fileinfo['FMimetype'] = fid.get_mimetype(filepath)
+
     if 'FCreated' not in provided_data:
         timestamp = creation_date(filepath)
         createdate = timestamp_to_datetime(timestamp)
         fileinfo['FCreated'] = createdate.isoformat()
 
-    if 'FChecksum' not in provided_data:
-        fileinfo['FChecksum'] = checksum.calculate_checksum(filepath, algorithm)
+    identify_format = any(
+        x not in provided_data for x in ['FFormatName', 'FFormatVersion', 'FFormatRegistryKey']
+    )
+    identify_encryption = 'FEncrypted' not in provided_data
+    compute_checksum = 'FChecksum' not in provided_data
 
-    if 'FEncrypted' not in provided_data:
-        fileinfo['FEncrypted'] = fid.identify_file_encryption(filepath)
+    characteristics = None
+    if compute_checksum or identify_format or identify_encryption:
+        # Read the file once for checksum, encryption and format
+        characteristics = characterize_file(
+            filepath,
+            algorithms=[algorithm] if compute_checksum else [],
+            bufsize=fid.fido.bufsize if identify_format else ENCRYPTION_BUFSIZE,
+        )
 
-    if any(x not in provided_data for x in ['FFormatName', 'FFormatVersion', 'FFormatRegistryKey']):
-        (format_name, format_version, format_registry_key) = fid.identify_file_format(filepath)
+    if compute_checksum:
+        fileinfo['FChecksum'] = characteristics.digests[algorithm]
+
+    if identify_encryption:
+        fileinfo['FEncrypted'] = fid.identify_file_encryption(filepath, characteristics=characteristics)
+
+    if identify_format:
+        (format_name, format_version, format_registry_key) = fid.identify_file_format(
+            filepath, characteristics=characteristics,
+        )
 
         fileinfo['FFormatName'] = format_name
         fileinfo['FFormatVersion'] = format_version
@@ -514,13 +546,134 @@ def parse_file(filepath, fid, relpath=None, algorithm='SHA-256', rootdir='', pro
     return fileinfo
 
 
-def download_imported_https_schemas(schema, dst):
+_worker_local = threading.local()
+
+
+def _get_worker_format_identifier(allow_unknown_file_types, allow_encrypted_files):
+    # Fido keeps the result of the latest identification on the
+    # FormatIdentifier instance, each worker thread (or process) therefore
+    # needs an identifier of its own
+
+    from ESSArch_Core.fixity.format import FormatIdentifier
+
+    key = (allow_unknown_file_types, allow_encrypted_files)
+    identifiers = getattr(_worker_local, 'format_identifiers', None)
+    if identifiers is None:
+        identifiers = _worker_local.format_identifiers = {}
+
+    try:
+        return identifiers[key]
+    except KeyError:
+        fid = identifiers[key] = FormatIdentifier(
+            allow_unknown_file_types=allow_unknown_file_types,
+            allow_encrypted_files=allow_encrypted_files,
+        )
+        return fid
+
+
+def _parse_file_in_worker(fid_options, filepath, relpath, algorithm, rootdir, provided_data):
+    fid = _get_worker_format_identifier(*fid_options)
+    return parse_file(filepath, fid, relpath, algorithm=algorithm, rootdir=rootdir, provided_data=provided_data)
+
+
+def parse_files_concurrently(files, fid, algorithm='SHA-256', workers=None, executor=None):
+    '''
+    Characterises files using parse_file, optionally fanning out the work
+    to a pool of threads or processes
+
+    args:
+        files: Iterable of (filepath, relpath, rootdir) tuples
+        fid: FormatIdentifier used for mimetypes and for serial parsing
+        algorithm: The checksum algorithm to use
+        workers: Number of workers, defaults to settings.PARSE_FILES_WORKERS
+        executor: 'thread' or 'process', defaults to settings.PARSE_FILES_EXECUTOR
+
+    Yields:
+        The parsed file info for each file, in the same order as files
+    '''
+
+    if workers is None:
+        workers = getattr(settings, 'PARSE_FILES_WORKERS', 1)
+
+    if executor is None:
+        executor = getattr(settings, 'PARSE_FILES_EXECUTOR', 'thread')
+
+    if workers <= 1:
+        for filepath, relpath, rootdir in files:
+            yield parse_file(filepath, fid, relpath, algorithm=algorithm, rootdir=rootdir)
+        return
+
+    if executor == 'process' and multiprocessing.current_process().daemon:
+        # Daemonic processes, e.g. celery prefork workers, are not allowed
+        # to have children
+        logger.warning('Cannot start worker processes from a daemonic process, using threads instead')
+        executor = 'thread'
+
+    if executor == 'thread':
+        executor_class = ThreadPoolExecutor
+    elif executor == 'process':
+        executor_class = ProcessPoolExecutor
+    else:
+        raise ValueError('Unknown executor "{}", use "thread" or "process"'.format(executor))
+
+    fid_options = (fid.allow_unknown_file_types, fid.allow_encrypted_files)
+
+    # Mimetypes are resolved in the calling thread as it may require
+    # database access which we don't want to do in workers
+    args_list = (
+        (fid_options, filepath, relpath, algorithm, rootdir, {'FMimetype': fid.get_mimetype(filepath)})
+        for filepath, relpath, rootdir in files
+    )
+
+    # Only keep a bounded number of files in flight to keep memory flat
+    # on large file lists
+    with executor_class(max_workers=workers) as pool:
+        yield from bounded_map(pool, _parse_file_in_worker, args_list, workers * 4)
+
+
+def _download_imported_schema(url, dst):
+    """
+    Downloads the schema at url into the persistent schema cache directory if
+    it is configured and the schema isn't already cached there, otherwise
+    into dst
+    """
+
     from ESSArch_Core.ip.utils import download_schema
+
+    cache_dir = getattr(settings, 'XML_SCHEMA_CACHE_DIR', None)
+    if not cache_dir:
+        return download_schema(dst, logger, url)
+
+    # each schema is stored in its own directory which is moved into place
+    # once the download is complete, to never expose partially downloaded
+    # schemas to other processes
+    cached_dir = os.path.join(cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+    if os.path.isdir(cached_dir):
+        cached_path = os.path.join(cached_dir, os.listdir(cached_dir)[0])
+        logger.debug('Using cached schema {} for {}'.format(cached_path, url))
+        return cached_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        filename = os.path.basename(download_schema(tmpdir, logger, url))
+        try:
+            os.rename(tmpdir, cached_dir)
+        except OSError:
+            # already downloaded by someone else
+            if not os.path.isdir(cached_dir):
+                raise
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return os.path.join(cached_dir, filename)
+
+
+def download_imported_https_schemas(schema, dst):
     for url in schema.xpath('//*[local-name()="import"]/@schemaLocation'):
-        protocol = urlparse(url)
-        if protocol == 'http':
+        if urlparse(url).scheme not in ('http', 'https'):
             continue
-        new_path = download_schema(dst, logger, url)
+        new_path = _download_imported_schema(url, dst)
         new_path = pathlib.Path(new_path)
         el = url.getparent()
         el.attrib['schemaLocation'] = new_path.as_uri()
@@ -528,18 +681,48 @@ def download_imported_https_schemas(schema, dst):
     return schema
 
 
-def validate_against_schema(xmlfile, schema=None, rootdir=None):
-    doc = etree.ElementTree(file=xmlfile)
+# compiled XML schemas keyed by the location and content hash of the schema
+xml_schema_cache = LRUCache(getattr(settings, 'XML_SCHEMA_CACHE_SIZE', 32))
+
+
+def get_xml_schema(schema=None, doc=None):
+    """
+    Returns a compiled XMLSchema, either from the schema file or from the
+    schema locations in doc if no schema file is given. Compiled schemas
+    are cached per process.
+    """
 
     if schema:
-        xmlschema = etree.parse(schema)
+        location = os.path.abspath(schema)
+        with open(schema, 'rb') as f:
+            content = f.read()
     else:
-        xmlschema = getSchemas(doc=doc)
+        location = None
+        content = etree.tostring(getSchemas(doc=doc))
+
+    key = (location, hashlib.sha256(content).hexdigest())
+    xmlschema = xml_schema_cache.get(key)
+    if xmlschema is not None:
+        return xmlschema
+
+    logger.debug('Compiling schema {}'.format(location or 'from schema locations'))
+    if schema:
+        tree = etree.parse(BytesIO(content), base_url=location)
+    else:
+        tree = etree.ElementTree(etree.fromstring(content))
 
     with tempfile.TemporaryDirectory() as tempdir:
-        xmlschema = download_imported_https_schemas(xmlschema, tempdir)
-        xmlschema = etree.XMLSchema(xmlschema)
-        xmlschema.assertValid(doc)
+        tree = download_imported_https_schemas(tree, tempdir)
+        xmlschema = etree.XMLSchema(tree)
+
+    xml_schema_cache.set(key, xmlschema)
+    return xmlschema
+
+
+def validate_against_schema(xmlfile, schema=None, rootdir=None):
+    doc = etree.ElementTree(file=xmlfile)
+    xmlschema = get_xml_schema(schema, doc=doc)
+    xmlschema.assertValid(doc)
 
     if rootdir is None:
         rootdir = os.path.split(xmlfile)[0]
@@ -40,3 +40,7 @@ class Conflict(APIException, ESSArchException):
 
 class NoFileChunksFound(ESSArchException):
     pass
+
+
+class MissingFileChunks(ESSArchException):
+    pass
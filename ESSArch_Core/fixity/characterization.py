@@ -0,0 +1,132 @@
+import logging
+import os
+import time
+
+from ESSArch_Core.fixity.checksum import (
+    calculate_checksums,
+    get_checksum_cache,
+)
+
+MB = 1024 * 1024
+
+logger = logging.getLogger('essarch.fixity.characterization')
+
+
+class FileCharacteristics:
+    """
+    The result of reading a file with :func:`characterize_file`
+
+    Attributes:
+        path: The path of the file
+        size: The number of bytes read
+        digests: A dict with the hexadecimal digest of each algorithm
+        bofbuffer: The first bytes of the file
+        eofbuffer: The last bytes of the file
+    """
+
+    def __init__(self, path, size, digests, bofbuffer=b'', eofbuffer=b''):
+        self.path = path
+        self.size = size
+        self.digests = digests
+        self.bofbuffer = bofbuffer
+        self.eofbuffer = eofbuffer
+
+    def __repr__(self):
+        return '<FileCharacteristics {} ({} bytes)>'.format(self.path, self.size)
+
+
+class _BufferCollector:
+    def __init__(self, bufsize):
+        self.bufsize = bufsize
+        self.size = 0
+        self.bofbuffer = b''
+        self.eofbuffer = b''
+
+    def __call__(self, data):
+        self.size += len(data)
+
+        if not self.bufsize:
+            return
+
+        if len(self.bofbuffer) < self.bufsize:
+            self.bofbuffer += data[:self.bufsize - len(self.bofbuffer)]
+
+        if len(data) >= self.bufsize:
+            self.eofbuffer = data[-self.bufsize:]
+        else:
+            self.eofbuffer = (self.eofbuffer + data)[-self.bufsize:]
+
+
+def _read_buffers(filename, bufsize):
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        bofbuffer = f.read(bufsize)
+        if size <= bufsize:
+            return size, bofbuffer, bofbuffer
+
+        f.seek(max(size - bufsize, len(bofbuffer)))
+        eofbuffer = f.read()
+        if len(eofbuffer) < bufsize:
+            # The buffers overlap
+            eofbuffer = bofbuffer[len(eofbuffer) - bufsize:] + eofbuffer
+        return size, bofbuffer, eofbuffer
+
+
+def characterize_file(filename, algorithms=('SHA-256',), bufsize=0, block_size=65536, use_cache=True):
+    """
+    Reads the given file once, calculating all the given checksums and
+    collecting the buffers from the beginning and end of the file used by
+    format identification and encryption detection
+
+    If all checksums are found in the checksum cache only the buffers are
+    read from the file
+
+    Args:
+        filename: The file to read
+        algorithms: The checksum algorithms to use
+        bufsize: The size of the buffers to collect from the beginning and
+            the end of the file, 0 to not collect any buffers
+        block_size: The size of each chunk read from the file
+        use_cache: Use the checksum cache, if configured
+
+    Returns:
+        A :class:`FileCharacteristics` instance
+    """
+
+    cache = get_checksum_cache() if use_cache else None
+    if cache is not None and algorithms:
+        st = os.stat(filename)
+        digests = {algorithm: cache.get(filename, algorithm, st=st) for algorithm in algorithms}
+        if None not in digests.values():
+            if bufsize:
+                size, bofbuffer, eofbuffer = _read_buffers(filename, bufsize)
+            else:
+                size, bofbuffer, eofbuffer = st.st_size, b'', b''
+
+            logger.debug("Characterized %s using cached checksums" % filename)
+            return FileCharacteristics(
+                os.fspath(filename), size, digests, bofbuffer=bofbuffer, eofbuffer=eofbuffer,
+            )
+
+    collector = _BufferCollector(bufsize)
+
+    start_time = time.perf_counter()
+    digests = calculate_checksums(
+        filename, algorithms, block_size=block_size, callback=collector, use_cache=use_cache,
+    )
+    time_elapsed = time.perf_counter() - start_time
+
+    size_mb = collector.size / MB
+    try:
+        mb_per_sec = size_mb / time_elapsed
+    except ZeroDivisionError:
+        mb_per_sec = size_mb
+
+    logger.debug(
+        "Characterized %s at %s MB/Sec (%s sec)" % (filename, mb_per_sec, time_elapsed)
+    )
+
+    return FileCharacteristics(
+        os.fspath(filename), collector.size, digests,
+        bofbuffer=collector.bofbuffer, eofbuffer=collector.eofbuffer,
+    )
@@ -1,12 +1,98 @@
 import hashlib
 import logging
 import os
+import threading
 import time
 
+from django.conf import settings
+
+from ESSArch_Core.cache.sqlite import LocalSQLiteDatabase
+
 MB = 1024 * 1024
 
 logger = logging.getLogger('essarch.fixity.checksum')
 
+# Files modified this recently are not cached since a later write within
+# the same timestamp granularity would go unnoticed
+CHECKSUM_CACHE_RACY_SECONDS = 2
+
+
+def stat_fingerprint(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+class ChecksumCache(LocalSQLiteDatabase):
+    """
+    A persistent cache of checksums stored in a local SQLite database.
+
+    Entries are keyed by the path and algorithm and are only used if the
+    device, inode, size, mtime and ctime of the file are unchanged since the
+    checksum was calculated.
+    """
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS checksum ('
+        'path TEXT NOT NULL, algorithm TEXT NOT NULL, '
+        'device INTEGER NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL, '
+        'mtime INTEGER NOT NULL, ctime INTEGER NOT NULL, digest TEXT NOT NULL, '
+        'PRIMARY KEY (path, algorithm))',
+    )
+
+    def get(self, filename, algorithm, st=None):
+        if st is None:
+            st = os.stat(filename)
+
+        path = os.path.abspath(filename)
+        row = self._get_connection().execute(
+            'SELECT device, inode, size, mtime, ctime, digest FROM checksum WHERE path = ? AND algorithm = ?',
+            (path, algorithm.upper()),
+        ).fetchone()
+
+        if row is None or tuple(row[:5]) != stat_fingerprint(st):
+            return None
+
+        return row[5]
+
+    def set(self, filename, algorithm, digest, st=None):
+        if st is None:
+            st = os.stat(filename)
+
+        if time.time() - st.st_mtime < CHECKSUM_CACHE_RACY_SECONDS:
+            return
+
+        path = os.path.abspath(filename)
+        with self._get_connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO checksum VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, algorithm.upper()) + stat_fingerprint(st) + (digest,),
+            )
+
+    def clear(self):
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM checksum')
+
+
+_checksum_caches = {}
+_checksum_caches_lock = threading.Lock()
+
+
+def get_checksum_cache():
+    """
+    Returns the checksum cache at settings.CHECKSUM_CACHE_PATH, or None if
+    no cache is configured
+    """
+
+    path = getattr(settings, 'CHECKSUM_CACHE_PATH', None)
+    if not path:
+        return None
+
+    with _checksum_caches_lock:
+        try:
+            return _checksum_caches[path]
+        except KeyError:
+            cache = _checksum_caches[path] = ChecksumCache(path)
+            return cache
+
 
 def alg_from_str(algname):
     valid = {
@@ -24,7 +110,7 @@ def alg_from_str(algname):
         raise KeyError("Algorithm %s does not exist" % algname)
 
 
-def calculate_checksum(filename, algorithm='SHA-256', block_size=65536):
+def calculate_checksum(filename, algorithm='SHA-256', block_size=65536, use_cache=True):
     """
     Calculates the checksum for the given file, one chunk at a time
 
@@ -32,6 +118,7 @@ def calculate_checksum(filename, algorithm='SHA-256', block_size=65536):
         filename: The filename to calculate checksum for
         block_size: The size of the chunk to calculate
         algorithm: The algorithm to use
+        use_cache: Use the checksum cache, if configured
 
     Returns:
         The hexadecimal digest of the checksum
@@ -39,6 +126,14 @@ def calculate_checksum(filename, algorithm='SHA-256', block_size=65536):
 
     hash_val = alg_from_str(algorithm)()
 
+    cache = get_checksum_cache() if use_cache else None
+    if cache is not None:
+        st = os.stat(filename)
+        digest = cache.get(filename, algorithm, st=st)
+        if digest is not None:
+            logger.debug("Got cached checksum for %s with %s: %s" % (filename, algorithm, digest))
+            return digest
+
     if os.name == 'nt':
         start_time = time.perf_counter()
     else:
@@ -75,4 +170,59 @@ def calculate_checksum(filename, algorithm='SHA-256', block_size=65536):
         )
     )
 
+    if cache is not None and stat_fingerprint(os.stat(filename)) == stat_fingerprint(st):
+        cache.set(filename, algorithm, digest, st=st)
+
     return digest
+
+
+def calculate_checksums(filename, algorithms=('SHA-256',), block_size=65536, callback=None, use_cache=True):
+    """
+    Calculates multiple checksums for the given file while only reading it
+    once
+
+    Args:
+        filename: The filename to calculate checksums for
+        algorithms: The algorithms to use
+        block_size: The size of the chunk to calculate
+        callback: Optional function called with each chunk read from the file
+        use_cache: Use the checksum cache, if configured. Cached checksums
+            are only used if callback is None since the file has to be read
+            anyway otherwise
+
+    Returns:
+        A dict with the hexadecimal digest of each algorithm
+    """
+
+    cache = get_checksum_cache() if use_cache else None
+    if cache is not None:
+        st = os.stat(filename)
+        if callback is None:
+            digests = {algorithm: cache.get(filename, algorithm, st=st) for algorithm in algorithms}
+            if None not in digests.values():
+                logger.debug("Got cached checksums for %s: %s" % (filename, digests))
+                return digests
+
+    hash_vals = {algorithm: alg_from_str(algorithm)() for algorithm in algorithms}
+
+    logger.debug("Calculating checksums for %s with %s ..." % (filename, ', '.join(algorithms)))
+
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if data:
+                for hash_val in hash_vals.values():
+                    hash_val.update(data)
+                if callback is not None:
+                    callback(data)
+            else:
+                break
+
+    digests = {algorithm: hash_val.hexdigest() for algorithm, hash_val in hash_vals.items()}
+    logger.info("Calculated checksums for %s: %s" % (filename, digests))
+
+    if cache is not None and stat_fingerprint(os.stat(filename)) == stat_fingerprint(st):
+        for algorithm, digest in digests.items():
+            cache.set(filename, algorithm, digest, st=st)
+
+    return digests
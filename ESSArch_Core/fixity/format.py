@@ -1,15 +1,22 @@
+import copy
 import logging
 import mimetypes
 import os
+import threading
 import time
+from xml.etree import ElementTree as ET
 
+from django.conf import settings
 from fido.fido import Fido
+from fido.package import OlePackage, ZipPackage
 
+from ESSArch_Core.cache.lru import LRUCache
 from ESSArch_Core.configuration.models import Path
 from ESSArch_Core.exceptions import (
     EncryptedFileNotAllowed,
     FileFormatNotAllowed,
 )
+from ESSArch_Core.fixity.checksum import stat_fingerprint
 from ESSArch_Core.fixity.validation.backends.encryption import (
     FileEncryptionValidator,
 )
@@ -20,9 +27,113 @@ logger = logging.getLogger('essarch.fixity.format')
 
 DEFAULT_MIMETYPE = 'application/octet-stream'
 
+# Seconds between checks for changes of the configured mimetypes file
+MIMETYPES_RECHECK_INTERVAL = 60
+
+
+def _get_mimetypes_file():
+    try:
+        return Path.objects.get(entity="mimetypes_definitionfile").value
+    except Path.DoesNotExist:
+        return None
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+class MimeTypesRegistry:
+    """
+    A process wide cache of the mimetypes database used by FormatIdentifier.
+
+    The database is loaded on first use and is reloaded when the configured
+    mimetypes file or its mtime changes. The mtime is checked on every lookup
+    while the configured path is only looked up in the database at most every
+    MIMETYPES_RECHECK_INTERVAL seconds, or directly after it is changed in
+    this process.
+    """
+
+    def __init__(self, recheck_interval=MIMETYPES_RECHECK_INTERVAL):
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+
+        # (mimetypes, (path, mtime), time of last check), replaced as a whole
+        # to allow lock free reads
+        self._state = None
+
+    def _is_fresh(self, state, now):
+        if state is None:
+            return False
+
+        _mime, (mimetypes_file, mtime), checked = state
+        if now - checked >= self.recheck_interval:
+            return False
+
+        return mimetypes_file is None or _get_mtime(mimetypes_file) == mtime
+
+    def get(self, loader):
+        now = time.monotonic()
+        state = self._state
+        if self._is_fresh(state, now):
+            return state[0]
+
+        with self._lock:
+            state = self._state
+            if self._is_fresh(state, now):
+                return state[0]
+
+            mimetypes_file = _get_mimetypes_file()
+            key = (mimetypes_file, _get_mtime(mimetypes_file))
+            if state is not None and state[1] == key:
+                mime = state[0]
+            else:
+                mime = loader(mimetypes_file)
+
+            self._state = (mime, key, now)
+            return mime
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+
+mimetypes_registry = MimeTypesRegistry()
+
+_fido_prototype = None
+_fido_prototype_lock = threading.Lock()
+
+
+def get_fido():
+    """
+    Returns a Fido instance with the PRONOM signatures loaded.
+
+    The signatures are only loaded once per process, each call returns a
+    shallow copy sharing the signatures with all other copies but with its
+    own state for the file currently being identified.
+    """
+
+    global _fido_prototype
+
+    if _fido_prototype is None:
+        with _fido_prototype_lock:
+            if _fido_prototype is None:
+                logger.debug('Initiating fido')
+                _fido_prototype = Fido()
+                logger.info('Initiated fido')
+
+    return copy.copy(_fido_prototype)
+
+
+# identified file formats keyed by the path and stat data of the file
+format_identification_cache = LRUCache(getattr(settings, 'FORMAT_IDENTIFICATION_CACHE_SIZE', 10000))
+
 
 class FormatIdentifier:
     _fido = None
+    _container_signatures = None
 
     def __init__(self, allow_unknown_file_types=False, allow_encrypted_files=False):
         self.allow_unknown_file_types = allow_unknown_file_types
@@ -31,16 +142,14 @@ class FormatIdentifier:
     @property
     def fido(self):
         if self._fido is None:
-            logger.debug('Initiating fido')
-            self._fido = Fido(handle_matches=self.handle_matches)
-            logger.info('Initiated fido')
+            fido = get_fido()
+            fido.handle_matches = self.handle_matches
+            self._fido = fido
         return self._fido
 
-    def _init_mimetypes(self):
-        try:
-            mimetypes_file = Path.objects.get(
-                entity="mimetypes_definitionfile"
-            ).value
+    @staticmethod
+    def _load_mimetypes(mimetypes_file):
+        if mimetypes_file is not None:
             if os.path.isfile(mimetypes_file):
                 logger.debug('Initiating mimetypes from %s' % mimetypes_file)
                 mime = mimetypes.MimeTypes()
@@ -53,7 +162,7 @@ class FormatIdentifier:
                 return mime
             else:
                 logger.debug('Custom mimetypes file %s does not exist' % mimetypes_file)
-        except Path.DoesNotExist:
+        else:
             logger.debug('No custom mimetypes file specified')
 
         logger.debug('Initiating default mimetypes')
@@ -63,7 +172,7 @@ class FormatIdentifier:
 
     def get_mimetype(self, fname):
         logger.debug('Getting mimetype for %s' % fname)
-        mime = self._init_mimetypes()
+        mime = mimetypes_registry.get(self._load_mimetypes)
 
         content_type, encoding = mime.guess_type(fname)
         logger.info('Guessed mimetype for %s: type: %s, encoding: %s' % (fname, content_type, encoding))
@@ -115,9 +224,17 @@ class FormatIdentifier:
         except AttributeError:
             self.format_registry_key = None
 
-    def identify_file_encryption(self, filename):
+    def identify_file_encryption(self, filename, characteristics=None):
+        kwargs = {}
+        if characteristics is not None:
+            kwargs = {
+                'bofbuffer': characteristics.bofbuffer,
+                'eofbuffer': characteristics.eofbuffer,
+                'size': characteristics.size,
+            }
+
         try:
-            encrypted = FileEncryptionValidator.is_file_encrypted(filename) or False
+            encrypted = FileEncryptionValidator.is_file_encrypted(filename, **kwargs) or False
         except Exception:
             encrypted = False
 
@@ -127,12 +244,48 @@ class FormatIdentifier:
             )
         return encrypted
 
-    def identify_file_format(self, filename):
+    def _identify_buffers(self, filename, characteristics):
+        # Same as Fido.identify_file but with the buffers already read from
+        # the file, the file is only reopened for container signatures
+
+        fido = self.fido
+        fido.current_file = filename
+        fido.current_filesize = characteristics.size
+        fido.matchtype = "signature"
+
+        start_time = time.perf_counter()
+        matches = fido.match_formats(characteristics.bofbuffer, characteristics.eofbuffer)
+        container_type = fido.container_type(matches)
+        if not fido.nocontainer and container_type in ("zip", "ole"):
+            if self._container_signatures is None:
+                self._container_signatures = ET.parse(
+                    os.path.join(os.path.abspath(fido.conf_dir), fido.containersignature_file)
+                )
+
+            if container_type == "zip":
+                container_matches = fido.match_container("ZIP", ZipPackage, filename, self._container_signatures)
+            else:
+                container_matches = fido.match_container("OLE2", OlePackage, filename, self._container_signatures)
+
+            if len(container_matches) > 0:
+                fido.handle_matches(filename, container_matches, time.perf_counter() - start_time, "container")
+                return
+
+        if len(matches) > 0 and characteristics.size > 0:
+            fido.handle_matches(filename, matches, time.perf_counter() - start_time, fido.matchtype)
+        else:
+            matches = fido.match_extensions(filename)
+            fido.handle_matches(filename, matches, time.perf_counter() - start_time, "extension")
+
+    def identify_file_format(self, filename, characteristics=None):
         """
         Identifies the format of the file using the fido library
 
         Args:
             filename: The filename to identify
+            characteristics: A FileCharacteristics instance with buffers
+                read by characterize_file using the bufsize of fido. If
+                given, the buffers are used instead of reading the file
 
         Returns:
             A tuple with the format name, version and registry key
@@ -145,7 +298,10 @@ class FormatIdentifier:
 
         logger.debug("Identifying file format of %s ..." % (filename,))
 
-        self.fido.identify_file(filename)
+        if characteristics is not None:
+            self._identify_buffers(filename, characteristics)
+        else:
+            self.fido.identify_file(filename)
 
         if os.name == 'nt':
             end_time = time.perf_counter()
@@ -169,3 +325,34 @@ class FormatIdentifier:
         )
 
         return file_format
+
+    def identify_many(self, paths, use_cache=True):
+        """
+        Identifies the format of multiple files using the same preloaded
+        fido signatures
+
+        Args:
+            paths: The files to identify
+            use_cache: Reuse earlier results for files whose path and stat
+                data are unchanged
+
+        Yields:
+            A tuple with the path and a tuple with the format name, version
+            and registry key, for each path
+        """
+
+        for path in paths:
+            key = None
+            if use_cache:
+                key = (os.path.abspath(path), stat_fingerprint(os.stat(path)), self.allow_unknown_file_types)
+                file_format = format_identification_cache.get(key)
+                if file_format is not None:
+                    yield path, file_format
+                    continue
+
+            file_format = self.identify_file_format(path)
+
+            if key is not None:
+                format_identification_cache.set(key, file_format)
+
+            yield path, file_format
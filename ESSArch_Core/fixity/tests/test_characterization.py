@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.test import SimpleTestCase
+
+from ESSArch_Core.fixity.characterization import characterize_file
+from ESSArch_Core.fixity.checksum import calculate_checksum
+from ESSArch_Core.fixity.format import FormatIdentifier
+
+
+class CharacterizeFileTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+    def create_file(self, name, content):
+        path = os.path.join(self.datadir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_multiple_digests(self):
+        path = self.create_file('foo.txt', b'foo' * 100000)
+
+        characteristics = characterize_file(path, algorithms=['SHA-256', 'MD5'])
+        self.assertEqual(characteristics.digests['SHA-256'], calculate_checksum(path, 'SHA-256'))
+        self.assertEqual(characteristics.digests['MD5'], calculate_checksum(path, 'MD5'))
+        self.assertEqual(characteristics.size, 300000)
+
+    def test_buffers_small_file(self):
+        path = self.create_file('foo.txt', b'foo')
+
+        characteristics = characterize_file(path, algorithms=[], bufsize=10)
+        self.assertEqual(characteristics.bofbuffer, b'foo')
+        self.assertEqual(characteristics.eofbuffer, b'foo')
+
+    def test_buffers_large_file(self):
+        content = os.urandom(1000)
+        path = self.create_file('foo.bin', content)
+
+        for bufsize, block_size in [(10, 7), (10, 64), (100, 100), (999, 3)]:
+            with self.subTest(bufsize=bufsize, block_size=block_size):
+                characteristics = characterize_file(path, algorithms=[], bufsize=bufsize, block_size=block_size)
+                self.assertEqual(characteristics.bofbuffer, content[:bufsize])
+                self.assertEqual(characteristics.eofbuffer, content[-bufsize:])
+
+    def test_identify_format_from_buffers(self):
+        path = self.create_file('foo.xml', b'<?xml version="1.0" encoding="UTF-8"?><root/>')
+        fid = FormatIdentifier()
+
+        characteristics = characterize_file(path, bufsize=fid.fido.bufsize)
+        self.assertEqual(
+            fid.identify_file_format(path, characteristics=characteristics),
+            fid.identify_file_format(path),
+        )
+
+    def test_identify_encryption_from_buffers(self):
+        path = os.path.join(self.datadir, 'foo.zip')
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('foo.txt', 'foo')
+        txt_path = self.create_file('foo.txt', b'foo')
+
+        fid = FormatIdentifier()
+        for p in [path, txt_path]:
+            with self.subTest(path=p):
+                characteristics = characterize_file(p, bufsize=fid.fido.bufsize)
+                self.assertFalse(fid.identify_file_encryption(p, characteristics=characteristics))
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ESSArch_Core.fixity.characterization import characterize_file
+from ESSArch_Core.fixity.checksum import (
+    calculate_checksum,
+    calculate_checksums,
+    get_checksum_cache,
+)
+
+
+class ChecksumCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.cache_path = os.path.join(self.datadir, 'cache', 'checksums.sqlite')
+        override = override_settings(CHECKSUM_CACHE_PATH=self.cache_path)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.filepath = os.path.join(self.datadir, 'foo.txt')
+        with open(self.filepath, 'w') as f:
+            f.write('foo')
+
+        # Make sure the file isn't considered to be recently modified
+        os.utime(self.filepath, (0, 0))
+
+    @override_settings(CHECKSUM_CACHE_PATH=None)
+    def test_disabled(self):
+        self.assertIsNone(get_checksum_cache())
+
+    def test_calculate_checksum_populates_cache(self):
+        digest = calculate_checksum(self.filepath, 'SHA-256')
+        self.assertEqual(get_checksum_cache().get(self.filepath, 'SHA-256'), digest)
+        self.assertIsNone(get_checksum_cache().get(self.filepath, 'MD5'))
+
+    @mock.patch('ESSArch_Core.fixity.checksum.open', create=True, side_effect=AssertionError)
+    def test_cached_checksum_does_not_read_file(self, mock_open):
+        get_checksum_cache().set(self.filepath, 'SHA-256', 'cached')
+        self.assertEqual(calculate_checksum(self.filepath, 'SHA-256'), 'cached')
+        self.assertEqual(calculate_checksums(self.filepath, ['SHA-256']), {'SHA-256': 'cached'})
+
+    def test_invalidated_when_file_changes(self):
+        calculate_checksum(self.filepath, 'SHA-256')
+
+        with open(self.filepath, 'w') as f:
+            f.write('bar')
+        os.utime(self.filepath, (0, 0))
+
+        self.assertIsNone(get_checksum_cache().get(self.filepath, 'SHA-256'))
+        self.assertEqual(
+            calculate_checksum(self.filepath, 'SHA-256'),
+            calculate_checksum(self.filepath, 'SHA-256', use_cache=False),
+        )
+
+    def test_recently_modified_file_is_not_cached(self):
+        os.utime(self.filepath)
+        calculate_checksum(self.filepath, 'SHA-256')
+        self.assertIsNone(get_checksum_cache().get(self.filepath, 'SHA-256'))
+
+    def test_characterize_file_with_cached_checksum(self):
+        get_checksum_cache().set(self.filepath, 'SHA-256', 'cached')
+
+        characteristics = characterize_file(self.filepath, algorithms=['SHA-256'], bufsize=2)
+        self.assertEqual(characteristics.digests, {'SHA-256': 'cached'})
+        self.assertEqual(characteristics.bofbuffer, b'fo')
+        self.assertEqual(characteristics.eofbuffer, b'oo')
+        self.assertEqual(characteristics.size, 3)
@@ -1,17 +1,26 @@
+import os
+import shutil
+import tempfile
 from unittest import mock
 
 from django.test import TestCase
 
 from ESSArch_Core.configuration.models import Path
 from ESSArch_Core.exceptions import FileFormatNotAllowed
-from ESSArch_Core.fixity.format import DEFAULT_MIMETYPE, FormatIdentifier
+from ESSArch_Core.fixity.format import (
+    DEFAULT_MIMETYPE,
+    FormatIdentifier,
+    MimeTypesRegistry,
+    format_identification_cache,
+    get_fido,
+)
 
 
 class FormatIdentifierMimeTypeTests(TestCase):
     @mock.patch("ESSArch_Core.fixity.format.mimetypes.MimeTypes")
     def test_default_list(self, mock_mimetypes_init):
         fid = FormatIdentifier(allow_unknown_file_types=True)
-        fid._init_mimetypes()
+        MimeTypesRegistry().get(fid._load_mimetypes)
         mock_mimetypes_init.assert_called_once_with()
 
     @mock.patch(
@@ -38,7 +47,7 @@ class FormatIdentifierMimeTypeTests(TestCase):
         mimetypes_file = Path.objects.create(
             entity="mimetypes_definitionfile", value='path/to/mime.types')
         fid = FormatIdentifier(allow_unknown_file_types=True)
-        fid._init_mimetypes()
+        MimeTypesRegistry().get(fid._load_mimetypes)
         mock_mimetypes_init.assert_called_once_with(
             mimetypes_file.value)
 
@@ -48,7 +57,7 @@ class FormatIdentifierMimeTypeTests(TestCase):
     def test_custom_list_missing_file(self, mock_mimetypes_init2, mock_mimetypes_init, isfile):
         Path.objects.create(entity="mimetypes_definitionfile", value='path/to/mime.types')
         fid = FormatIdentifier(allow_unknown_file_types=True)
-        fid._init_mimetypes()
+        MimeTypesRegistry().get(fid._load_mimetypes)
         mock_mimetypes_init.assert_not_called()
         mock_mimetypes_init2.assert_called_once_with()
 
@@ -78,3 +87,103 @@ class FormatIdentifierMimeTypeTests(TestCase):
         self.assertIsNone(fid.format_name)
         self.assertIsNone(fid.format_version)
         self.assertIsNone(fid.format_registry_key)
+
+
+class MimeTypesRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = MimeTypesRegistry()
+        self.loader = mock.Mock(side_effect=lambda path: mock.sentinel.mimetypes)
+
+    def test_loaded_once(self):
+        self.assertEqual(self.registry.get(self.loader), mock.sentinel.mimetypes)
+        self.assertEqual(self.registry.get(self.loader), mock.sentinel.mimetypes)
+        self.loader.assert_called_once_with(None)
+
+    def test_no_database_queries_when_loaded(self):
+        self.registry.get(self.loader)
+        with self.assertNumQueries(0):
+            self.registry.get(self.loader)
+
+    def test_reloaded_when_path_changes(self):
+        self.registry.get(self.loader)
+
+        Path.objects.create(entity="mimetypes_definitionfile", value='path/to/mime.types')
+        self.registry.invalidate()
+        self.registry.get(self.loader)
+
+        self.loader.assert_has_calls([mock.call(None), mock.call('path/to/mime.types')])
+
+    def test_reloaded_when_file_changes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mimetypes_file = os.path.join(tmpdir, 'mime.types')
+            with open(mimetypes_file, 'w') as f:
+                f.write('text/plain txt\n')
+            os.utime(mimetypes_file, (0, 0))
+
+            Path.objects.create(entity="mimetypes_definitionfile", value=mimetypes_file)
+            self.registry.get(self.loader)
+            self.registry.get(self.loader)
+            self.assertEqual(self.loader.call_count, 1)
+
+            os.utime(mimetypes_file, (1, 1))
+            self.registry.get(self.loader)
+            self.assertEqual(self.loader.call_count, 2)
+
+    def test_path_rechecked_after_interval(self):
+        registry = MimeTypesRegistry(recheck_interval=0)
+        registry.get(self.loader)
+
+        Path.objects.create(entity="mimetypes_definitionfile", value='path/to/mime.types')
+        registry.get(self.loader)
+        self.loader.assert_has_calls([mock.call(None), mock.call('path/to/mime.types')])
+
+    def test_invalidated_when_path_is_saved(self):
+        with mock.patch('ESSArch_Core.fixity.format.mimetypes_registry.invalidate') as mock_invalidate:
+            Path.objects.create(entity="mimetypes_definitionfile", value='path/to/mime.types')
+        mock_invalidate.assert_called_once_with()
+
+
+class IdentifyManyTests(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        format_identification_cache.clear()
+        self.addCleanup(format_identification_cache.clear)
+
+        self.paths = []
+        for name, content in [('foo.xml', '<?xml version="1.0"?><root/>'), ('bar.txt', 'bar')]:
+            path = os.path.join(self.datadir, name)
+            with open(path, 'w') as f:
+                f.write(content)
+            self.paths.append(path)
+
+    def test_shared_signatures(self):
+        self.assertIs(get_fido().formats, get_fido().formats)
+        self.assertIsNot(FormatIdentifier().fido, FormatIdentifier().fido)
+
+    def test_same_result_as_single(self):
+        fid = FormatIdentifier(allow_unknown_file_types=True)
+        expected = [(path, fid.identify_file_format(path)) for path in self.paths]
+        self.assertEqual(list(fid.identify_many(self.paths)), expected)
+
+    def test_cached(self):
+        fid = FormatIdentifier(allow_unknown_file_types=True)
+        first = list(fid.identify_many(self.paths))
+
+        with mock.patch.object(fid, 'identify_file_format') as mock_identify:
+            self.assertEqual(list(fid.identify_many(self.paths)), first)
+            mock_identify.assert_not_called()
+
+            list(fid.identify_many(self.paths, use_cache=False))
+            self.assertEqual(mock_identify.call_count, 2)
+
+    def test_cache_invalidated_when_file_changes(self):
+        fid = FormatIdentifier(allow_unknown_file_types=True)
+        list(fid.identify_many(self.paths))
+
+        with open(self.paths[1], 'a') as f:
+            f.write('baz')
+
+        with mock.patch.object(fid, 'identify_file_format', return_value=('a', 'b', 'c')) as mock_identify:
+            list(fid.identify_many(self.paths))
+            mock_identify.assert_called_once_with(self.paths[1])
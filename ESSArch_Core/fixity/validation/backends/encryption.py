@@ -13,6 +13,9 @@ from ESSArch_Core.fixity.validation.backends.base import BaseValidator
 
 logger = logging.getLogger('essarch.fixity.validation.encryption')
 
+# End of central directory record with a comment of maximum length
+ZIP_EOCD_MAX_SIZE = 22 + 65535
+
 
 class FileEncryptionValidator(BaseValidator):
     """
@@ -39,10 +42,30 @@ class FileEncryptionValidator(BaseValidator):
         return False
 
     @staticmethod
-    def is_file_encrypted(filepath):
-        if olefile.isOleFile(filepath):
+    def is_file_encrypted(filepath, bofbuffer=None, eofbuffer=None, size=None):
+        """
+        If buffers from the beginning and the end of the file are given they
+        are used to rule out OLE and ZIP files without reopening the file.
+        The end buffer is only used if it contains the whole file (given its
+        size) or is large enough to hold any ZIP end of central directory
+        record.
+        """
+
+        if bofbuffer is not None:
+            is_ole = bofbuffer[:len(olefile.MAGIC)] == olefile.MAGIC
+        else:
+            is_ole = olefile.isOleFile(filepath)
+
+        if is_ole:
             return FileEncryptionValidator._validate_ole_file(filepath)
-        elif zipfile.is_zipfile(filepath):
+
+        might_be_zip = True
+        if eofbuffer is not None:
+            complete = size is not None and len(eofbuffer) >= size
+            if complete or len(eofbuffer) >= ZIP_EOCD_MAX_SIZE:
+                might_be_zip = zipfile.stringEndArchive in eofbuffer
+
+        if might_be_zip and zipfile.is_zipfile(filepath):
             return FileEncryptionValidator._validate_zip_file(filepath)
 
         return None
@@ -46,7 +46,7 @@ class FormatValidator(BaseValidator):
 
         passed = False
         try:
-            actual_name, actual_version, actual_reg_key = self.fid.identify_file_format(filepath)
+            _, (actual_name, actual_version, actual_reg_key) = next(self.fid.identify_many([filepath]))
             if name and name != actual_name:
                 raise ValidationError("format name for {} is not valid, ({} !={})"
                                       .format(filepath, name, actual_name))
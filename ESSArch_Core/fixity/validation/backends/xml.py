@@ -1,9 +1,10 @@
-import copy
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from os import walk
 
 import click
+from django.conf import settings
 from django.utils import timezone
 from lxml import etree, isoschematron
 
@@ -16,7 +17,7 @@ from ESSArch_Core.exceptions import ValidationError
 from ESSArch_Core.fixity.checksum import calculate_checksum
 from ESSArch_Core.fixity.models import Validation
 from ESSArch_Core.fixity.validation.backends.base import BaseValidator
-from ESSArch_Core.util import normalize_path, win_to_posix
+from ESSArch_Core.util import bounded_map, normalize_path, win_to_posix
 
 logger = logging.getLogger('essarch.fixity.validation.xml')
 
@@ -28,6 +29,11 @@ class DiffCheckValidator(BaseValidator):
 
     The post validation checks if there are files that has been deleted after
     the XML was generated.
+
+    Files are hashed by a pool of ``workers`` threads (option, defaults to
+    settings.DIFF_CHECK_WORKERS). Checksums are read from the checksum cache
+    (settings.CHECKSUM_CACHE_PATH) when the file is unchanged since it was
+    last hashed, e.g. by a previous validation.
     """
 
     file_validator = False
@@ -39,12 +45,16 @@ class DiffCheckValidator(BaseValidator):
             raise ValueError('A context (xml) is required')
 
         self.context = normalize_path(self.context)
+        self.exclude = set(self.exclude)
         self.rootdir = self.options.get('rootdir')
         self.recursive = self.options.get('recursive', True)
         self.default_algorithm = self.options.get('default_algorithm', 'SHA-256')
+        self.workers = self.options.get('workers') or getattr(settings, 'DIFF_CHECK_WORKERS', 1)
 
-        self.initial_present = {}  # Map checksum -> fname
-        self.initial_deleted = {}  # Map checksum -> fname
+        # Map checksum -> fnames, the fnames are stored as keys in a dict to
+        # get constant time lookups and removals while keeping the order
+        self.initial_present = {}
+        self.initial_deleted = {}
         self.sizes = {}  # Map fname -> size
         self.checksums = {}  # Map fname -> checksum
         self.checksum_algorithms = {}  # Map fname -> checksum algorithm
@@ -58,21 +68,15 @@ class DiffCheckValidator(BaseValidator):
             logical_path = win_to_posix(logical_path)
 
             if logical_path not in self.exclude:
-                try:
-                    self.initial_deleted[logical.checksum].append(logical_path)
-                except KeyError:
-                    self.initial_deleted[logical.checksum] = [logical_path]
-                try:
-                    self.initial_present[logical.checksum].append(logical_path)
-                except KeyError:
-                    self.initial_present[logical.checksum] = [logical_path]
+                self.initial_deleted.setdefault(logical.checksum, {})[logical_path] = None
+                self.initial_present.setdefault(logical.checksum, {})[logical_path] = None
                 self.checksums[logical_path] = logical.checksum
                 self.checksum_algorithms[logical_path] = logical.checksum_type
                 self.sizes[logical_path] = logical.size
 
     def _reset_dicts(self):
-        self.present = copy.deepcopy(self.initial_present)
-        self.deleted = copy.deepcopy(self.initial_deleted)
+        self.present = {checksum: fnames.copy() for checksum, fnames in self.initial_present.items()}
+        self.deleted = {checksum: fnames.copy() for checksum, fnames in self.initial_deleted.items()}
 
     def _reset_counters(self):
         self.confirmed = 0
@@ -102,10 +106,10 @@ class DiffCheckValidator(BaseValidator):
         )
 
     def _pop_checksum_dict(self, d, checksum, filepath):
-        checksum_list = d[checksum]
-        checksum_list.remove(filepath)
+        fnames = d[checksum]
+        del fnames[filepath]
 
-        if not len(checksum_list):
+        if not fnames:
             d.pop(checksum)
 
     def _get_filepath(self, input_file):
@@ -119,16 +123,34 @@ class DiffCheckValidator(BaseValidator):
     def _get_size(self, input_file):
         return os.path.getsize(input_file)
 
-    def _validate(self, filepath):
-        relpath = normalize_path(os.path.relpath(self._get_filepath(filepath), self.rootdir))
+    def _get_relpath(self, input_file):
+        return normalize_path(os.path.relpath(self._get_filepath(input_file), self.rootdir))
+
+    def _hash(self, input_file):
+        relpath = self._get_relpath(input_file)
+        return relpath, self._get_checksum(input_file, relpath=relpath), self._get_size(input_file)
+
+    def _hash_files(self, input_files):
+        """
+        Yields the relative path, checksum and size of each file, in the same
+        order as input_files, hashing up to self.workers files concurrently
+        """
 
-        newhash = self._get_checksum(filepath, relpath=relpath)
-        newsize = self._get_size(filepath)
+        if self.workers <= 1:
+            for input_file in input_files:
+                yield self._hash(input_file)
+            return
+
+        # keep a bounded number of files in flight to keep memory flat
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            args_list = ((input_file,) for input_file in input_files)
+            yield from bounded_map(pool, self._hash, args_list, self.workers * 4)
+
+    def _validate(self, filepath):
+        return self._compare(*self._hash(filepath))
 
-        if newhash not in self.present:
-            self.present[newhash] = [relpath]
-        elif relpath not in self.present[newhash]:
-            self.present[newhash].append(relpath)
+    def _compare(self, relpath, newhash, newsize):
+        self.present.setdefault(newhash, {})[relpath] = None
 
         if relpath not in self.checksums:
             return
@@ -170,30 +192,39 @@ class DiffCheckValidator(BaseValidator):
         logger.debug(msg)
         return self._create_obj(relpath, True, msg)
 
+    def _walk(self, path):
+        for root, _dirs, files in walk(path):
+            for f in files:
+                filepath = normalize_path(os.path.join(root, f))
+                if filepath in self.exclude or filepath == self.context:
+                    continue
+                yield filepath
+
     def _validate_deleted_files(self, objs):
         delete_count = 0
         for deleted_hash, deleted_hash_files in self.deleted.items():
-            present_hash_files = self.present.get(deleted_hash, [])
+            present_hash_files = self.present.get(deleted_hash, {})
 
-            for f in present_hash_files[:]:
+            for f in list(present_hash_files):
                 if f not in deleted_hash_files:
                     try:
-                        old = deleted_hash_files.pop()
-                        self.renamed += 1
-                        msg = '{old} has been renamed to {new}'.format(old=old, new=f)
-                        logger.error(msg)
-                        objs.append(self._create_obj(old, False, msg))
-                        present_hash_files.remove(old)
-                        present_hash_files.remove(f)
-                    except IndexError:
-                        pass
+                        old, _ = deleted_hash_files.popitem()
+                    except KeyError:
+                        continue
+
+                    self.renamed += 1
+                    msg = '{old} has been renamed to {new}'.format(old=old, new=f)
+                    logger.error(msg)
+                    objs.append(self._create_obj(old, False, msg))
+                    del present_hash_files[old]
+                    del present_hash_files[f]
 
             for f in deleted_hash_files:
                 msg = '{file} has been deleted'.format(file=f)
                 logger.error(msg)
                 objs.append(self._create_obj(f, False, msg))
                 delete_count += 1
-                present_hash_files.remove(f)
+                del present_hash_files[f]
 
             if not len(present_hash_files):
                 self.present.pop(deleted_hash, None)
@@ -216,14 +247,12 @@ class DiffCheckValidator(BaseValidator):
         logger.debug('Validating {path} against {xml}'.format(path=path, xml=xmlfile))
 
         if os.path.isdir(path):
-            for root, _dirs, files in walk(path):
-                for f in files:
-                    filepath = normalize_path(os.path.join(root, f))
-                    if filepath in self.exclude or filepath == xmlfile:
-                        continue
-                    objs.append(self._validate(filepath))
+            filepaths = self._walk(path)
         else:
-            objs.append(self._validate(path))
+            filepaths = [path]
+
+        for relpath, newhash, newsize in self._hash_files(filepaths):
+            objs.append(self._compare(relpath, newhash, newsize))
 
         delete_count = self._validate_deleted_files(objs)
         self._validate_present_files(objs)
@@ -288,15 +317,8 @@ class XMLComparisonValidator(DiffCheckValidator):
         self._validate_present_files(objs)
 
         if checksum_in_context_file:
-            try:
-                self.deleted[checksum_in_context_file].append(path)
-            except KeyError:
-                self.deleted[checksum_in_context_file] = [path]
-
-            try:
-                self.present[checksum_in_context_file].append(path)
-            except KeyError:
-                self.present[checksum_in_context_file] = [path]
+            self.deleted.setdefault(checksum_in_context_file, {})[path] = None
+            self.present.setdefault(checksum_in_context_file, {})[path] = None
 
         objs = [o for o in objs if o is not None]
         Validation.objects.bulk_create(objs, batch_size=100)
@@ -4,10 +4,11 @@ import tempfile
 from unittest import mock
 
 from click.testing import CliRunner
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from lxml import etree
 from lxml.etree import DocumentInvalid
 
+from ESSArch_Core.essxml.util import xml_schema_cache
 from ESSArch_Core.exceptions import ValidationError
 from ESSArch_Core.fixity.models import Validation
 from ESSArch_Core.fixity.validation.backends.xml import (
@@ -31,6 +32,7 @@ class XMLSchemaValidatorTests(TestCase):
     def setUp(self):
         self.datadir = tempfile.mkdtemp()
         self.addCleanup(shutil.rmtree, self.datadir)
+        self.addCleanup(xml_schema_cache.clear)
 
     @staticmethod
     def create_schema():
@@ -157,7 +159,8 @@ class XMLSchemaValidatorTests(TestCase):
         with self.assertRaises(ValidationError):
             validator.validate(bad_xml_file_path)
 
-        mock_download.assert_called_once()
+        # the compiled schema is reused
+        mock_download.assert_not_called()
 
         expected_error_message = "Element 'price': 'foo' is not a valid value of the atomic type 'xs:decimal'"
         # self.assertTrue(Validation.objects.filter(message__icontains=expected_error_message).exists())
@@ -172,6 +175,45 @@ class XMLSchemaValidatorTests(TestCase):
         schemaLocation = schema_doc.xpath('//*[local-name()="import"]/@schemaLocation')[0]
         self.assertEqual(schemaLocation, "https://www.loc.gov/standards/mets/mets.xsd")
 
+    @mock.patch('ESSArch_Core.ip.utils.download_schema', side_effect=mock_download_schema)
+    def test_validate_with_cached_imported_schema(self, mock_download):
+        schema_file_path = self.create_schema_file_with_import("schema.xsd")
+        xml_file_path = self.create_xml("xml_file.xml")
+        cache_dir = os.path.join(self.datadir, 'schema_cache')
+
+        validator = XMLSchemaValidator(
+            context=schema_file_path,
+            options={'rootdir': self.datadir},
+        )
+
+        with override_settings(XML_SCHEMA_CACHE_DIR=cache_dir):
+            validator.validate(xml_file_path)
+            xml_schema_cache.clear()
+            validator.validate(xml_file_path)
+
+        mock_download.assert_called_once()
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_compiled_schema_is_cached(self):
+        schema_file_path = self.create_schema_file("schema.xsd")
+        xml_file_path = self.create_xml("xml_file.xml")
+
+        validator = XMLSchemaValidator(
+            context=schema_file_path,
+            options={'rootdir': self.datadir},
+        )
+
+        with mock.patch('ESSArch_Core.essxml.util.etree.XMLSchema', wraps=etree.XMLSchema) as mock_schema:
+            for _ in range(3):
+                validator.validate(xml_file_path)
+            mock_schema.assert_called_once()
+
+            # the schema is compiled again when it is changed
+            with open(schema_file_path, 'a') as f:
+                f.write('<!-- changed -->')
+            validator.validate(xml_file_path)
+            self.assertEqual(mock_schema.call_count, 2)
+
     @mock.patch("ESSArch_Core.fixity.validation.backends.xml.validate_against_schema")
     def test_when_documentInvalid_raised_create_validation_objects(self, validate_against_schema):
         exception_obj = DocumentInvalid("error msg")
@@ -3,8 +3,9 @@ import os
 import shutil
 import tempfile
 from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from lxml import etree
 from pyfakefs import fake_filesystem_unittest
 
@@ -819,6 +820,55 @@ class DiffCheckValidatorTests(TestCase):
         with self.assertRaisesRegexp(ValidationError, msg):
             self.validator.validate(self.datadir)
 
+    def test_validation_with_all_alterations_using_workers(self):
+        files = self.create_files()
+        for i in range(3, 20):
+            with open(os.path.join(self.datadir, '%s.txt' % i), 'w') as f:
+                f.write('%s' % i)
+        self.generate_xml()
+
+        with open(files[0], 'a') as f:
+            f.write('changed')
+        os.remove(files[1])
+        os.rename(files[2], os.path.join(self.datadir, 'new.txt'))
+        added = os.path.join(self.datadir, 'added.txt')
+        with open(added, 'w') as f:
+            f.write('added')
+
+        options = dict(self.options, workers=4)
+        self.validator = DiffCheckValidator(context=self.fname, options=options)
+        msg = '17 confirmed, 1 added, 1 changed, 1 renamed, 1 deleted$'
+        with self.assertRaisesRegexp(ValidationError, msg):
+            self.validator.validate(self.datadir)
+
+        self.assertEqual(Validation.objects.filter(passed=True).count(), 17)
+        self.assertEqual(Validation.objects.filter(passed=False).count(), 4)
+
+    def test_validation_with_checksum_cache(self):
+        files = self.create_files()
+        self.generate_xml()
+
+        # files modified within the last few seconds are not cached
+        for f in files:
+            os.utime(f, (0, 0))
+
+        cache_path = os.path.join(tempfile.mkdtemp(), 'checksums.db')
+        self.addCleanup(shutil.rmtree, os.path.dirname(cache_path))
+
+        with override_settings(CHECKSUM_CACHE_PATH=cache_path):
+            self.validator = DiffCheckValidator(context=self.fname, options=self.options)
+            self.validator.validate(self.datadir)
+
+            with mock.patch('ESSArch_Core.fixity.checksum.open', create=True) as mock_open:
+                self.validator.validate(self.datadir)
+            mock_open.assert_not_called()
+
+            with open(files[0], 'a') as f:
+                f.write('changed')
+
+            with self.assertRaisesRegexp(ValidationError, '2 confirmed, 0 added, 1 changed'):
+                self.validator.validate(self.datadir)
+
 
 class DiffCheckValidatorRecursiveTests(TestCase):
     @classmethod
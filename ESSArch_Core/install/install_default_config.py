@@ -1265,7 +1265,7 @@ def installPipelines():
             {
                 "attachment": {
                     "field": "data",
-                    "indexed_chars": "-1"
+                    "indexed_chars": str(getattr(settings, 'ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS', -1)),
                 },
                 "remove": {
                     "field": "data"
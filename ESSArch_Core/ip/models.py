@@ -31,7 +31,6 @@ import uuid
 import zipfile
 from copy import deepcopy
 from datetime import datetime
-from os import walk
 from time import sleep
 from urllib.parse import urljoin
 
@@ -90,7 +89,8 @@ from ESSArch_Core.profiles.models import (
 )
 from ESSArch_Core.profiles.utils import fill_specification_data
 from ESSArch_Core.search.importers import get_backend as get_importer
-from ESSArch_Core.search.ingest import index_path
+from ESSArch_Core.search.ingest import index_tree
+from ESSArch_Core.storage.directory_size import get_directory_size_and_count
 from ESSArch_Core.storage.exceptions import StorageMediumFull
 from ESSArch_Core.storage.models import (
     STORAGE_TARGET_STATUS_ENABLED,
@@ -901,7 +901,7 @@ class InformationPackage(models.Model):
 
         return InformationPackage.objects.none()
 
-    def list_files(self, path=''):
+    def list_files(self, path='', sizes=True):
         fullpath = os.path.join(self.object_path, path).rstrip('/')
         if os.path.basename(self.object_path) == path and os.path.isfile(self.object_path):
             if tarfile.is_tarfile(self.object_path):
@@ -958,14 +958,21 @@ class InformationPackage(models.Model):
         for entry in sorted(get_files_and_dirs(fullpath), key=lambda x: x.name):
             try:
                 entry_type = "dir" if entry.is_dir() else "file"
-                size, _ = get_tree_size_and_count(entry.path)
+                st = entry.stat()
+                if entry_type == "file":
+                    size = st.st_size
+                elif sizes:
+                    size, _ = get_directory_size_and_count(entry.path)
+                else:
+                    # deferred to a separate request for the directory
+                    size = None
 
                 entries.append(
                     {
                         "name": os.path.basename(entry.path),
                         "type": entry_type,
                         "size": size,
-                        "modified": timestamp_to_datetime(entry.stat().st_mtime),
+                        "modified": timestamp_to_datetime(st.st_mtime),
                     }
                 )
             except OSError as e:
@@ -985,7 +992,7 @@ class InformationPackage(models.Model):
         if not in_directory(fullpath, self.object_path) and fullpath != os.path.splitext(self.object_path)[0] + '.xml':
             raise exceptions.ValidationError('Illegal path: {}'.format(path))
 
-    def get_path_response(self, path, request, force_download=False, paginator=None):
+    def get_path_response(self, path, request, force_download=False, paginator=None, sizes=True):
         self.validate_path(path)
         try:
             if not path:
@@ -1027,7 +1034,7 @@ class InformationPackage(models.Model):
                     name=path
                 )
 
-        entries = self.list_files(path)
+        entries = self.list_files(path, sizes=sizes)
         if paginator is not None:
             paginated = paginator.paginate_queryset(entries, request)
             return paginator.get_paginated_response(paginated)
@@ -1667,19 +1674,8 @@ class InformationPackage(models.Model):
                 ct_importer = get_importer(ct_importer_name)(task)
                 indexed_files = ct_importer.import_content(cts, ip=self)
 
-        for root, dirs, files in walk(srcdir):
-            for d in dirs:
-                src = os.path.join(root, d)
-                index_path(self, src)
-
-            for f in files:
-                src = os.path.join(root, f)
-                try:
-                    # check if file has already been indexed
-                    indexed_files.remove(src)
-                except ValueError:
-                    # file has not been indexed, index it
-                    index_path(self, src)
+        # files already indexed by the content type importer are skipped
+        index_tree(self, srcdir, exclude=set(indexed_files))
 
         InformationPackageDocument.from_obj(self).save()
 
@@ -0,0 +1,193 @@
+"""
+Index of the packages in the reception.
+
+Submit descriptions are parsed once and cached by the device, inode, size,
+mtime and ctime of the XML file, so listing the reception only needs to
+stat the files. The index can be kept warm by a background thread polling
+the reception (RECEPTION_INDEX_POLL_INTERVAL).
+"""
+
+import logging
+import os
+import threading
+
+from celery import states as celery_states
+from django.db import close_old_connections
+from lxml import etree
+
+from ESSArch_Core.essxml.util import get_objectpath, parse_submit_description
+from ESSArch_Core.fixity.checksum import stat_fingerprint
+
+logger = logging.getLogger('essarch.ip.reception')
+
+
+def get_container_for_xml(xmlfile):
+    doc = etree.parse(xmlfile)
+    root = doc.getroot()
+    return get_objectpath(root)
+
+
+def find_xml_files(path):
+    """
+    Yields the submit descriptions in path together with their stat results
+    """
+
+    with os.scandir(path) as it:
+        for entry in it:
+            # hidden files are skipped, like when globbing
+            if entry.name.startswith('.') or not entry.name.endswith('.xml'):
+                continue
+
+            if entry.name.endswith('_ipevents.xml') or not entry.is_file():
+                continue
+
+            yield entry.path, entry.stat()
+
+
+def get_object_identifier(xmlfile):
+    return os.path.splitext(os.path.basename(xmlfile))[0]
+
+
+def parse_contained_package(path, xmlfile):
+    """
+    Parses the submit description of a contained package in path, returns
+    None if the XML file can't be parsed
+    """
+
+    try:
+        container = os.path.join(path, get_container_for_xml(xmlfile))
+    except etree.LxmlError:
+        return None
+
+    ip = parse_submit_description(xmlfile, srcdir=os.path.split(container)[0])
+
+    ip['container'] = container
+    ip['xml'] = xmlfile
+    ip['type'] = 'contained'
+    ip['state'] = 'At reception'
+    ip['status'] = 100
+    ip['step_state'] = celery_states.SUCCESS
+    return ip
+
+
+class ReceptionIndex:
+    def __init__(self):
+        # reception path -> {xml file: (stat fingerprint, parsed package or None)}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._watchers = {}
+
+    def get_contained_packages(self, path, exclude=None):
+        """
+        Returns the parsed submit descriptions of all contained packages in
+        path, parsing only the XML files that are new or have changed since
+        the last call
+
+        Args:
+            path: The reception
+            exclude: A callable given the object identifiers (the names of
+                the XML files without extension) of the packages in path,
+                returning the ones to skip without parsing them
+        """
+
+        with self._lock:
+            cached = self._entries.get(path, {})
+
+        xmlfiles = list(find_xml_files(path))
+        excluded = set()
+        if exclude is not None:
+            excluded = set(exclude([get_object_identifier(xmlfile) for xmlfile, _st in xmlfiles]))
+
+        entries = {}
+        packages = []
+        parsed = 0
+        for xmlfile, st in xmlfiles:
+            if get_object_identifier(xmlfile) in excluded:
+                # kept in the index if already parsed
+                if xmlfile in cached:
+                    entries[xmlfile] = cached[xmlfile]
+                continue
+
+            fingerprint = stat_fingerprint(st)
+            try:
+                cached_fingerprint, ip = cached[xmlfile]
+            except KeyError:
+                cached_fingerprint = ip = None
+
+            try:
+                if cached_fingerprint != fingerprint:
+                    parsed += 1
+                    ip = parse_contained_package(path, xmlfile)
+                    entries[xmlfile] = (fingerprint, ip)
+                else:
+                    entries[xmlfile] = (cached_fingerprint, ip)
+
+                if ip is None:
+                    continue
+
+                # the cached package is not changed by the caller and the
+                # size of the container is updated while it is being
+                # transferred
+                ip = dict(ip)
+                if 'object_path' in ip:
+                    ip['object_size'] = os.stat(ip['object_path']).st_size
+            except FileNotFoundError:
+                # the container is not yet, or no longer, in the reception.
+                # Not cached, to be parsed again when it is
+                logger.debug('Skipping {}, its container was not found'.format(xmlfile))
+                entries.pop(xmlfile, None)
+                continue
+
+            packages.append(ip)
+
+        with self._lock:
+            self._entries[path] = entries
+
+        if parsed:
+            logger.debug('Parsed {} of {} submit descriptions in {}'.format(parsed, len(xmlfiles), path))
+
+        return packages
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def watch(self, path, interval, exclude=None):
+        """
+        Starts a daemon thread that refreshes the index of path every
+        interval seconds, unless one is already running. exclude is passed
+        to get_contained_packages on each refresh
+        """
+
+        with self._lock:
+            if path in self._watchers:
+                return
+
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=self._poll, args=(path, interval, stop, exclude), name='reception-index', daemon=True,
+            )
+            self._watchers[path] = (thread, stop)
+
+        thread.start()
+
+    def unwatch(self, path):
+        with self._lock:
+            thread, stop = self._watchers.pop(path, (None, None))
+
+        if thread is not None:
+            stop.set()
+            thread.join()
+
+    def _poll(self, path, interval, stop, exclude):
+        while not stop.wait(interval):
+            try:
+                self.get_contained_packages(path, exclude=exclude)
+            except Exception:
+                logger.exception('Failed to refresh reception index of {}'.format(path))
+            finally:
+                # exclude may query the database from this thread
+                close_old_connections()
+
+
+reception_index = ReceptionIndex()
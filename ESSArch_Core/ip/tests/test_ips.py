@@ -39,8 +39,10 @@ from django.conf import settings
 from django.contrib.auth.models import Permission, User
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.http import FileResponse
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.timezone import make_aware
 from groups_manager.models import GroupType
@@ -614,7 +616,7 @@ class WorkareaFilesViewTestCase(TestCase):
             res = self.client.get(self.url, {'type': 'access', 'path': path})
             self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        mock_list_files.assert_called_once_with(fullpath, False, paginator=mock.ANY, request=mock.ANY)
+        mock_list_files.assert_called_once_with(fullpath, False, paginator=mock.ANY, request=mock.ANY, sizes=True)
 
     def test_add_to_dip_not_responsible(self):
         self.url = reverse('workarea-files-add-to-dip')
@@ -2092,6 +2094,46 @@ class InformationPackageReceptionViewSetTestCase(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 2)
 
+    def test_list_query_count_independent_of_number_of_packages(self):
+        url = reverse('ip-reception-list')
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(ctx.captured_queries)
+
+        package = self.create_ip_package('foo')
+        self.create_ip_xml('foo', package, self.sa)
+        os.mkdir(os.path.join(self.reception, 'extracted1'))
+        queries = count_queries()
+
+        for objid in ['bar', 'baz']:
+            package = self.create_ip_package(objid)
+            self.create_ip_xml(objid, package, self.sa)
+        os.mkdir(os.path.join(self.reception, 'extracted2'))
+        InformationPackage.objects.create(object_identifier_value='baz')
+
+        self.assertEqual(count_queries(), queries)
+
+        res = self.client.get(url)
+        self.assertCountEqual(
+            [ip['object_identifier_value'] for ip in res.data],
+            ['foo', 'bar', 'extracted1', 'extracted2'],
+        )
+
+    @override_settings(RECEPTION_INDEX_POLL_INTERVAL=60)
+    @mock.patch('ESSArch_Core.ip.views.reception_index.watch')
+    def test_list_watches_reception_excluding_existing_packages(self, mock_watch):
+        InformationPackage.objects.create(object_identifier_value='foo')
+
+        res = self.client.get(reverse('ip-reception-list'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        mock_watch.assert_called_once_with(self.reception, 60, exclude=mock.ANY)
+        exclude = mock_watch.call_args.kwargs['exclude']
+        self.assertEqual(exclude(['foo', 'bar']), {'foo'})
+
     def test_retrieve(self):
         url = reverse('ip-reception-detail', args=('foo',))
 
@@ -3397,6 +3439,52 @@ class UploadTestCase(TestCase):
             res = self.client.post(self.baseurl + 'upload/', data, format='multipart')
             self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_upload_file_with_offsets(self):
+        perms = {'group': ['view_informationpackage', 'ip.can_upload']}
+        self.member.assign_object(self.group, self.ip, custom_permissions=perms)
+        InformationPackage.objects.filter(pk=self.ip.pk).update(responsible=self.user)
+
+        content = b'abcdefghij'
+        dstfile = os.path.join(self.dst, 'foo.txt')
+        chunk_size = 3
+
+        def chunk_data(chunk_nr):
+            return {
+                'flowChunkNumber': chunk_nr,
+                'flowChunkSize': chunk_size,
+                'flowTotalSize': len(content),
+                'flowRelativePath': 'foo.txt',
+            }
+
+        # the last chunk includes the remainder
+        chunks = {1: content[:3], 2: content[3:6], 3: content[6:]}
+        for chunk_nr in (3, 1):
+            data = chunk_data(chunk_nr)
+            data['file'] = SimpleUploadedFile('blob', chunks[chunk_nr], content_type='multipart/form-data')
+            res = self.client.post(self.baseurl + 'upload/', data, format='multipart')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.get(self.baseurl + 'upload/', chunk_data(1))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(self.baseurl + 'upload/', chunk_data(2))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        # the partial file is written to the temporary upload directory
+        self.assertFalse(os.path.exists(dstfile + '.part'))
+
+        res = self.client.post(self.baseurl + 'merge-uploaded-chunks/', {'path': 'foo.txt'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = chunk_data(2)
+        data['file'] = SimpleUploadedFile('blob', chunks[2], content_type='multipart/form-data')
+        self.client.post(self.baseurl + 'upload/', data, format='multipart')
+
+        res = self.client.post(self.baseurl + 'merge-uploaded-chunks/', {'path': 'foo.txt'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with open(dstfile, 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(os.listdir(self.dst), ['foo.txt'])
+
     def test_upload_file_with_square_brackets_in_name(self):
         perms = {'group': ['view_informationpackage', 'ip.can_upload']}
         self.member.assign_object(self.group, self.ip, custom_permissions=perms)
@@ -3465,6 +3553,26 @@ class FilesActionTests(APITestCase):
         resp = self.client.get(self.url, data={'pager': 'none'})
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
 
+    def test_get_method_with_deferred_sizes(self):
+        os.makedirs(os.path.join(self.datadir, 'dir', 'subdir'))
+        for path in ['dir/a.txt', 'dir/subdir/b.txt']:
+            with open(os.path.join(self.datadir, path), 'w') as f:
+                f.write('foo')
+
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.get(self.url, data={'pager': 'none'})
+        self.assertEqual(resp.data[0]['size'], 6)
+
+        resp = self.client.get(self.url, data={'pager': 'none', 'sizes': 'false'})
+        self.assertIsNone(resp.data[0]['size'])
+
+        resp = self.client.get(self.url, data={'path': 'dir', 'size': 'true'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data, {'name': 'dir', 'type': 'dir', 'size': 6, 'count': 2})
+
+        resp = self.client.get(self.url, data={'path': 'dir/a.txt', 'size': 'true'})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
     @mock.patch('ESSArch_Core.ip.models.InformationPackage.get_path_response')
     def test_get_method_with_download_params_True(self, mock_ip_get_path_response):
         mock_ip_get_path_response.return_value = Response("dummy message")
@@ -3477,7 +3585,8 @@ class FilesActionTests(APITestCase):
             '',
             mock.ANY,
             force_download='True',
-            paginator=mock.ANY
+            paginator=mock.ANY,
+            sizes=True,
         )
 
     @mock.patch('ESSArch_Core.ip.models.InformationPackage.get_path_response')
@@ -3492,7 +3601,8 @@ class FilesActionTests(APITestCase):
             '',
             mock.ANY,
             force_download='False',
-            paginator=mock.ANY
+            paginator=mock.ANY,
+            sizes=True,
         )
 
     @mock.patch('ESSArch_Core.ip.models.InformationPackage.get_path_response')
@@ -3507,7 +3617,8 @@ class FilesActionTests(APITestCase):
             'here_is_some/other_path',
             mock.ANY,
             force_download=False,
-            paginator=mock.ANY
+            paginator=mock.ANY,
+            sizes=True,
         )
 
     @mock.patch('ESSArch_Core.ip.models.InformationPackage.get_path_response')
@@ -3522,7 +3633,8 @@ class FilesActionTests(APITestCase):
             'here_is_some/other_path',
             mock.ANY,
             force_download=False,
-            paginator=mock.ANY
+            paginator=mock.ANY,
+            sizes=True,
         )
 
     def test_post_method_when_ip_state_is_Prepared_and_path_parameter_not_set(self):
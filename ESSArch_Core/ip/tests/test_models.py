@@ -108,6 +108,14 @@ class InformationPackageListFilesTests(TestCase):
             }]
         )
 
+    def test_list_folder_with_deferred_sizes(self):
+        path = tempfile.mkdtemp(dir=self.datadir)
+        with open(os.path.join(path, 'foo.txt'), 'w') as f:
+            f.write('foo')
+
+        self.assertEqual(self.ip.list_files()[0]['size'], 3)
+        self.assertIsNone(self.ip.list_files(sizes=False)[0]['size'])
+
     def test_list_folder_content(self):
         path = tempfile.mkdtemp(dir=self.datadir)
         fd, filepath = tempfile.mkstemp(dir=path)
@@ -250,7 +258,7 @@ class GetPathResponseTests(TestCase):
 
         relpath = os.path.basename(path)
         self.ip.get_path_response(relpath, self.request)
-        mock_list_files.assert_called_once_with(relpath)
+        mock_list_files.assert_called_once_with(relpath, sizes=True)
 
     @mock.patch('ESSArch_Core.ip.models.InformationPackage.open_file')
     @mock.patch('ESSArch_Core.ip.models.generate_file_response')
@@ -289,7 +297,7 @@ class GetPathResponseContainerTests(TestCase):
 
         mock_open_file.return_value
         mock_fid.return_value.get_mimetype.return_value
-        mock_list_files.assert_called_once_with(path)
+        mock_list_files.assert_called_once_with(path, sizes=True)
 
 
 class StatusTest(APITestCase):
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from lxml import etree
+
+from ESSArch_Core.essxml.util import parse_submit_description
+from ESSArch_Core.ip.reception import ReceptionIndex
+
+METS = '''<?xml version="1.0" encoding="UTF-8"?>
+<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:xlink="http://www.w3.org/1999/xlink"
+           OBJID="{objid}" LABEL="{label}">
+  <mets:fileSec>
+    <mets:fileGrp>
+      <mets:file ID="ID1">
+        <mets:FLocat LOCTYPE="URL" xlink:href="file:///{objid}.tar"/>
+      </mets:file>
+    </mets:fileGrp>
+  </mets:fileSec>
+</mets:mets>
+'''
+
+
+class ReceptionIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.reception = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.reception)
+        self.index = ReceptionIndex()
+
+    def create_package(self, objid, label='label'):
+        with open(os.path.join(self.reception, '{}.tar'.format(objid)), 'wb') as f:
+            f.write(b'tar')
+
+        xmlfile = os.path.join(self.reception, '{}.xml'.format(objid))
+        with open(xmlfile, 'w') as f:
+            f.write(METS.format(objid=objid, label=label))
+        return xmlfile
+
+    def test_unchanged_files_are_parsed_once(self):
+        self.create_package('foo')
+        self.create_package('bar')
+        with open(os.path.join(self.reception, 'foo_ipevents.xml'), 'w') as f:
+            f.write('<events/>')
+
+        with mock.patch(
+            'ESSArch_Core.ip.reception.parse_submit_description', wraps=parse_submit_description,
+        ) as mock_parse:
+            packages = self.index.get_contained_packages(self.reception)
+            self.assertEqual(mock_parse.call_count, 2)
+
+            packages_again = self.index.get_contained_packages(self.reception)
+            self.assertEqual(mock_parse.call_count, 2)
+
+        self.assertCountEqual([p['id'] for p in packages], ['foo', 'bar'])
+        self.assertEqual(packages, packages_again)
+        self.assertEqual(packages[0]['type'], 'contained')
+        self.assertEqual(packages[0]['object_size'], 3)
+
+    def test_changed_file_is_parsed_again(self):
+        xmlfile = self.create_package('foo', label='first')
+        self.assertEqual(self.index.get_contained_packages(self.reception)[0]['label'], 'first')
+
+        self.create_package('foo', label='second')
+        os.utime(xmlfile, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        self.assertEqual(self.index.get_contained_packages(self.reception)[0]['label'], 'second')
+
+    def test_removed_file_is_removed_from_index(self):
+        xmlfile = self.create_package('foo')
+        self.assertEqual(len(self.index.get_contained_packages(self.reception)), 1)
+
+        os.remove(xmlfile)
+        self.assertEqual(self.index.get_contained_packages(self.reception), [])
+
+    def test_returned_packages_are_copies(self):
+        self.create_package('foo')
+        self.index.get_contained_packages(self.reception)[0]['label'] = 'changed'
+        self.assertEqual(self.index.get_contained_packages(self.reception)[0]['label'], 'label')
+
+    def test_container_size_is_updated(self):
+        self.create_package('foo')
+        self.index.get_contained_packages(self.reception)
+
+        with open(os.path.join(self.reception, 'foo.tar'), 'ab') as f:
+            f.write(b'more')
+        self.assertEqual(self.index.get_contained_packages(self.reception)[0]['object_size'], 7)
+
+    def test_excluded_packages_are_not_parsed(self):
+        self.create_package('foo')
+        self.create_package('bar')
+        exclude = mock.Mock(return_value={'foo'})
+
+        with mock.patch(
+            'ESSArch_Core.ip.reception.parse_submit_description', wraps=parse_submit_description,
+        ) as mock_parse:
+            packages = self.index.get_contained_packages(self.reception, exclude=exclude)
+            mock_parse.assert_called_once()
+
+        self.assertEqual([p['id'] for p in packages], ['bar'])
+        self.assertCountEqual(exclude.call_args.args[0], ['foo', 'bar'])
+
+    def test_missing_container_is_skipped(self):
+        self.create_package('foo')
+        self.create_package('bar')
+        os.remove(os.path.join(self.reception, 'foo.tar'))
+        self.assertEqual([p['id'] for p in self.index.get_contained_packages(self.reception)], ['bar'])
+
+        # parsed again when the container is added
+        with open(os.path.join(self.reception, 'foo.tar'), 'wb') as f:
+            f.write(b'tar')
+        self.assertCountEqual([p['id'] for p in self.index.get_contained_packages(self.reception)], ['foo', 'bar'])
+
+        os.remove(os.path.join(self.reception, 'bar.tar'))
+        self.assertEqual([p['id'] for p in self.index.get_contained_packages(self.reception)], ['foo'])
+
+    def test_invalid_xml_is_skipped(self):
+        with open(os.path.join(self.reception, 'invalid.xml'), 'w') as f:
+            f.write('<invalid')
+
+        error = etree.XMLSyntaxError('invalid', 1, 1, 1)
+        with mock.patch('ESSArch_Core.ip.reception.get_container_for_xml', side_effect=error) as m:
+            self.assertEqual(self.index.get_contained_packages(self.reception), [])
+            self.assertEqual(self.index.get_contained_packages(self.reception), [])
+            m.assert_called_once()
+
+    def test_watch(self):
+        with mock.patch.object(self.index, 'get_contained_packages') as mock_get:
+            exclude = mock.Mock()
+            self.index.watch(self.reception, 0.01, exclude=exclude)
+            self.index.watch(self.reception, 0.01)
+            self.assertEqual(len(self.index._watchers), 1)
+
+            for _ in range(100):
+                if mock_get.call_count:
+                    break
+                time.sleep(0.01)
+
+            self.index.unwatch(self.reception)
+
+        mock_get.assert_called_with(self.reception, exclude=exclude)
+        self.assertEqual(self.index._watchers, {})
@@ -0,0 +1,168 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from ESSArch_Core.exceptions import MissingFileChunks, NoFileChunksFound
+from ESSArch_Core.ip import upload as upload_module
+from ESSArch_Core.ip.upload import (
+    ChunkedUpload,
+    get_chunked_upload,
+    merge_uploaded_file,
+)
+
+CONTENT = b'abcdefghijklmnopqrstuvwxyz'
+
+
+class ChunkedUploadTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.dst = os.path.join(self.datadir, 'dst', 'foo.txt')
+        self.chunks_path = os.path.join(self.datadir, 'temp', 'foo.txt')
+        self.index_path = self.chunks_path + upload_module.INDEX_SUFFIX
+
+        upload_module._hashers.clear()
+        self.addCleanup(upload_module._hashers.clear)
+
+    def get_upload(self, chunk_size=10, content=CONTENT):
+        return ChunkedUpload(self.dst, self.chunks_path, len(content), chunk_size)
+
+    def write_chunk(self, upload, chunk_nr, content=CONTENT):
+        start = (chunk_nr - 1) * upload.chunk_size
+        end = start + upload.chunk_size
+        if end + upload.chunk_size > len(content):
+            # the last chunk includes the remainder
+            end = len(content)
+        upload.write_chunk(chunk_nr, SimpleUploadedFile('blob', content[start:end]))
+
+    def test_chunks_in_order(self):
+        upload = self.get_upload()
+        for chunk_nr in (1, 2):
+            self.write_chunk(upload, chunk_nr)
+
+        self.assertEqual(os.path.getsize(upload.partial_path), len(CONTENT))
+        self.assertCountEqual(os.listdir(os.path.dirname(self.chunks_path)), ['foo.txt.index', 'foo.txt.part'])
+        self.assertFalse(os.path.exists(os.path.dirname(self.dst)))
+
+        with mock.patch('ESSArch_Core.ip.upload.open', side_effect=open) as mock_open:
+            checksum = upload.complete()
+
+        self.assertEqual(checksum, hashlib.sha256(CONTENT).hexdigest())
+        # the checksum was calculated while the chunks were written
+        self.assertNotIn(upload.partial_path, [c.args[0] for c in mock_open.call_args_list])
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+        self.assertFalse(os.path.exists(upload.partial_path))
+        self.assertFalse(os.path.exists(self.index_path))
+
+    def test_without_checksum(self):
+        upload = ChunkedUpload(self.dst, self.chunks_path, len(CONTENT), 10, checksum=False)
+        for chunk_nr in (1, 2):
+            self.write_chunk(upload, chunk_nr)
+
+        with mock.patch('ESSArch_Core.ip.upload.alg_from_str') as mock_alg:
+            self.assertIsNone(upload.complete())
+        mock_alg.assert_not_called()
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+
+    def test_complete_on_other_filesystem(self):
+        upload = self.get_upload()
+        for chunk_nr in (1, 2):
+            self.write_chunk(upload, chunk_nr)
+
+        with mock.patch('ESSArch_Core.ip.upload.os.replace', side_effect=OSError(errno.EXDEV, 'Cross-device link')):
+            upload.complete()
+
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+        self.assertFalse(os.path.exists(upload.partial_path))
+
+    def test_chunks_out_of_order(self):
+        upload = self.get_upload(chunk_size=5)
+        for chunk_nr in (3, 1, 5, 2, 4):
+            self.write_chunk(upload, chunk_nr)
+
+        self.assertEqual(upload.complete(), hashlib.sha256(CONTENT).hexdigest())
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+
+    def test_missing_chunk(self):
+        upload = self.get_upload(chunk_size=5)
+        for chunk_nr in (1, 2, 4, 5):
+            self.write_chunk(upload, chunk_nr)
+
+        self.assertEqual(upload.get_missing_ranges(), [(10, 15)])
+        self.assertTrue(upload.has_chunk(4))
+        self.assertFalse(upload.has_chunk(3))
+
+        with self.assertRaises(MissingFileChunks):
+            upload.complete()
+        self.assertFalse(os.path.exists(self.dst))
+
+        self.write_chunk(upload, 3)
+        upload.complete()
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+
+    def test_chunk_exceeding_total_size(self):
+        upload = self.get_upload()
+        with self.assertRaises(ValueError):
+            upload.write_chunk(3, SimpleUploadedFile('blob', b'x' * 10))
+
+    def test_new_upload_of_same_file_restarts(self):
+        self.write_chunk(self.get_upload(), 1)
+
+        content = b'0123456789'
+        upload = self.get_upload(chunk_size=5, content=content)
+        self.write_chunk(upload, 1, content)
+        self.write_chunk(upload, 2, content)
+
+        self.assertEqual(upload.complete(), hashlib.sha256(content).hexdigest())
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_from_index(self):
+        self.assertIsNone(ChunkedUpload.from_index(self.dst, self.chunks_path))
+
+        self.write_chunk(self.get_upload(), 1)
+        upload = ChunkedUpload.from_index(self.dst, self.chunks_path)
+        self.assertEqual((upload.total_size, upload.chunk_size), (len(CONTENT), 10))
+        self.assertEqual(upload.get_received(), {1: (0, 10)})
+
+    def test_get_chunked_upload(self):
+        self.assertIsNone(get_chunked_upload({'flowChunkNumber': 1}, self.dst, self.chunks_path))
+
+        upload = get_chunked_upload(
+            {'flowChunkNumber': 1, 'flowChunkSize': '10', 'flowTotalSize': '26'}, self.dst, self.chunks_path,
+        )
+        self.assertEqual((upload.total_size, upload.chunk_size), (26, 10))
+        self.assertEqual(upload.index_path, self.index_path)
+
+    def test_merge_uploaded_file(self):
+        upload = self.get_upload()
+        for chunk_nr in (1, 2):
+            self.write_chunk(upload, chunk_nr)
+
+        self.assertEqual(merge_uploaded_file(self.chunks_path, self.dst), hashlib.sha256(CONTENT).hexdigest())
+
+    def test_merge_uploaded_file_without_index(self):
+        with self.assertRaises(NoFileChunksFound):
+            merge_uploaded_file(self.chunks_path, self.dst)
+
+        os.makedirs(os.path.dirname(self.chunks_path))
+        os.makedirs(os.path.dirname(self.dst))
+        for i, data in enumerate([CONTENT[:10], CONTENT[10:]]):
+            with open('{}_{}'.format(self.chunks_path, i), 'wb') as f:
+                f.write(data)
+
+        self.assertIsNone(merge_uploaded_file(self.chunks_path, self.dst))
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
@@ -0,0 +1,327 @@
+"""
+Assembly of files uploaded in chunks.
+
+Each chunk is written directly at its offset in a preallocated partial file
+in the temporary upload directory, and the range it covers is appended to a
+sidecar index next to it. Once all chunks have arrived the partial file is
+renamed to the destination, without reading or copying any of the chunks
+again unless the destination is on another filesystem.
+
+A checksum of the file is calculated while chunks arrive in order and only
+the remaining part of the file is read when the upload is completed.
+"""
+
+import errno
+import logging
+import os
+import shutil
+
+from django.conf import settings
+
+from ESSArch_Core.cache.lru import LRUCache
+from ESSArch_Core.exceptions import MissingFileChunks
+from ESSArch_Core.fixity.checksum import alg_from_str
+from ESSArch_Core.storage.directory_size import invalidate_directory_size
+from ESSArch_Core.util import merge_file_chunks
+
+logger = logging.getLogger('essarch.ip.upload')
+
+PARTIAL_SUFFIX = '.part'
+INDEX_SUFFIX = '.index'
+
+MAX_HASHERS = 64
+
+# Checksums of uploads currently being received by this process, only
+# kept while the chunks arrive in order
+_hashers = LRUCache(MAX_HASHERS)
+
+
+def _pwrite(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def _preallocate(fd, size):
+    if os.fstat(fd).st_size >= size:
+        return
+
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # not supported by the filesystem
+            pass
+
+    os.ftruncate(fd, size)
+
+
+class ChunkedUpload:
+    """
+    Args:
+        filepath: The destination of the uploaded file
+        chunks_path: The path in the temporary upload directory that the
+            partial file and the sidecar index of received chunks are
+            written to, with PARTIAL_SUFFIX and INDEX_SUFFIX appended
+        total_size: The size of the complete file
+        chunk_size: The size of all chunks except the last one, which may
+            be larger or smaller
+        algorithm: The algorithm used for the checksum of the file
+        checksum: Whether to calculate the checksum of the file
+    """
+
+    def __init__(self, filepath, chunks_path, total_size, chunk_size, algorithm=None, checksum=True):
+        self.filepath = filepath
+        self.partial_path = chunks_path + PARTIAL_SUFFIX
+        self.index_path = chunks_path + INDEX_SUFFIX
+        self.total_size = int(total_size)
+        self.chunk_size = int(chunk_size)
+
+        if algorithm is None:
+            algorithm = getattr(settings, 'UPLOAD_CHECKSUM_ALGORITHM', 'SHA-256')
+        self.algorithm = algorithm
+        self.checksum = checksum
+
+        if self.chunk_size <= 0 or self.total_size < 0:
+            raise ValueError('Invalid chunk size or total size')
+
+    @classmethod
+    def from_index(cls, filepath, chunks_path, algorithm=None, checksum=True):
+        """
+        Returns the upload described by the index, or None if there is no
+        index
+        """
+
+        try:
+            with open(chunks_path + INDEX_SUFFIX) as f:
+                total_size, chunk_size = f.readline().split()
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return cls(filepath, chunks_path, total_size, chunk_size, algorithm=algorithm, checksum=checksum)
+
+    @property
+    def _header(self):
+        return '{} {}\n'.format(self.total_size, self.chunk_size)
+
+    def _open_index(self):
+        """
+        Creates the index, or resets the upload if an index for another
+        upload of the same file exists
+        """
+
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+
+        try:
+            fd = os.open(self.index_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            with open(self.index_path) as f:
+                if f.readline() == self._header:
+                    return
+
+            logger.debug('Restarting upload of {}'.format(self.filepath))
+            self.abort()
+            return self._open_index()
+
+        try:
+            os.write(fd, self._header.encode())
+        finally:
+            os.close(fd)
+
+    def _append_to_index(self, chunk_nr, start, end):
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, '{} {} {}\n'.format(chunk_nr, start, end).encode())
+        finally:
+            os.close(fd)
+
+    def get_received(self):
+        """
+        Returns a dict with the chunk numbers and ranges received so far
+        """
+
+        received = {}
+        try:
+            with open(self.index_path) as f:
+                f.readline()
+                for line in f:
+                    try:
+                        chunk_nr, start, end = (int(v) for v in line.split())
+                    except ValueError:
+                        # partially written line
+                        continue
+                    received[chunk_nr] = (start, end)
+        except FileNotFoundError:
+            pass
+
+        return received
+
+    def has_chunk(self, chunk_nr):
+        return int(chunk_nr) in self.get_received()
+
+    def get_missing_ranges(self):
+        missing = []
+        offset = 0
+        for start, end in sorted(self.get_received().values()):
+            if start > offset:
+                missing.append((offset, start))
+            offset = max(offset, end)
+
+        if offset < self.total_size:
+            missing.append((offset, self.total_size))
+
+        return missing
+
+    def _take_hasher(self, start):
+        if not self.checksum:
+            return None
+
+        with _hashers.lock:
+            if start == 0:
+                _hashers.pop(self.partial_path)
+                return alg_from_str(self.algorithm)()
+
+            hasher, offset = _hashers.get(self.partial_path, (None, None))
+            if offset != start:
+                return None
+
+            _hashers.pop(self.partial_path)
+            return hasher
+
+    def _put_hasher(self, hasher, offset):
+        _hashers.set(self.partial_path, (hasher, offset))
+
+    def write_chunk(self, chunk_nr, chunk):
+        """
+        Writes the chunk at its offset in the partial file
+
+        Args:
+            chunk_nr: The number of the chunk, starting at 1
+            chunk: An UploadedFile with the content of the chunk
+        """
+
+        chunk_nr = int(chunk_nr)
+        if chunk_nr < 1:
+            raise ValueError('Invalid chunk number {}'.format(chunk_nr))
+
+        start = (chunk_nr - 1) * self.chunk_size
+        offset = start
+
+        self._open_index()
+
+        hasher = self._take_hasher(start)
+        fd = os.open(self.partial_path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            _preallocate(fd, self.total_size)
+            for data in chunk.chunks():
+                if offset + len(data) > self.total_size:
+                    raise ValueError('Chunk {} exceeds the size of {}'.format(chunk_nr, self.filepath))
+
+                _pwrite(fd, data, offset)
+                if hasher is not None:
+                    hasher.update(data)
+                offset += len(data)
+        finally:
+            os.close(fd)
+
+        self._append_to_index(chunk_nr, start, offset)
+
+        if hasher is not None:
+            self._put_hasher(hasher, offset)
+
+    def complete(self):
+        """
+        Moves the complete file to its destination
+
+        Returns:
+            The checksum of the file, or None if not calculated
+
+        Raises:
+            MissingFileChunks: If any part of the file has not been received
+        """
+
+        missing = self.get_missing_ranges()
+        if missing:
+            raise MissingFileChunks('Missing {} byte range(s) of {}'.format(len(missing), self.filepath))
+
+        checksum = self._get_checksum() if self.checksum else None
+
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        try:
+            os.replace(self.partial_path, self.filepath)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            logger.debug('Copying {} to another filesystem'.format(self.filepath))
+            shutil.move(self.partial_path, self.filepath)
+        os.remove(self.index_path)
+
+        return checksum
+
+    def _get_checksum(self):
+        hasher, offset = _hashers.pop(self.partial_path, (None, 0))
+
+        if hasher is None:
+            hasher = alg_from_str(self.algorithm)()
+            offset = 0
+
+        if offset < self.total_size:
+            logger.debug('Calculating checksum of {} from offset {}'.format(self.filepath, offset))
+            with open(self.partial_path, 'rb') as f:
+                f.seek(offset)
+                for data in iter(lambda: f.read(65536), b''):
+                    hasher.update(data)
+
+        return hasher.hexdigest()
+
+    def abort(self):
+        _hashers.pop(self.partial_path)
+
+        for path in (self.partial_path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def get_chunked_upload(data, filepath, chunks_path, checksum=True):
+    """
+    Returns the upload for the flow.js request data if it contains the sizes
+    needed to write chunks directly to their offsets, otherwise None
+    """
+
+    try:
+        total_size = int(data['flowTotalSize'])
+        chunk_size = int(data['flowChunkSize'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    return ChunkedUpload(filepath, chunks_path, total_size, chunk_size, checksum=checksum)
+
+
+def merge_uploaded_file(chunks_path, filepath, checksum=True):
+    """
+    Completes the upload of filepath, either by moving the assembled file
+    into place or, for uploads without an index, by merging the chunk files
+
+    Returns:
+        The checksum of the file if it was calculated during the upload,
+        otherwise None
+    """
+
+    upload = ChunkedUpload.from_index(filepath, chunks_path, checksum=checksum)
+    if upload is not None:
+        digest = upload.complete()
+    else:
+        merge_file_chunks(chunks_path, filepath)
+        digest = None
+
+    invalidate_directory_size(filepath)
+    return digest
@@ -1,5 +1,6 @@
 import copy
 import errno
+import functools
 import glob
 import io
 import itertools
@@ -67,8 +68,12 @@ from ESSArch_Core.cache.decorators import lock_obj
 from ESSArch_Core.configuration.decorators import feature_enabled_or_404
 from ESSArch_Core.configuration.models import Path
 from ESSArch_Core.essxml.Generator.xmlGenerator import parseContent
-from ESSArch_Core.essxml.util import get_objectpath, parse_submit_description
-from ESSArch_Core.exceptions import Conflict, NoFileChunksFound
+from ESSArch_Core.essxml.util import parse_submit_description
+from ESSArch_Core.exceptions import (
+    Conflict,
+    MissingFileChunks,
+    NoFileChunksFound,
+)
 from ESSArch_Core.fixity.format import FormatIdentifier
 from ESSArch_Core.fixity.models import ActionTool
 from ESSArch_Core.fixity.transformation import AVAILABLE_TRANSFORMERS
@@ -102,6 +107,7 @@ from ESSArch_Core.ip.permissions import (
     IsResponsibleOrCanSeeAllFiles,
     IsResponsibleOrReadOnly,
 )
+from ESSArch_Core.ip.reception import get_container_for_xml, reception_index
 from ESSArch_Core.ip.serializers import (
     ActionToolSerializer,
     AgentSerializer,
@@ -119,6 +125,7 @@ from ESSArch_Core.ip.serializers import (
     OrderWriteSerializer,
     WorkareaSerializer,
 )
+from ESSArch_Core.ip.upload import get_chunked_upload, merge_uploaded_file
 from ESSArch_Core.ip.utils import parse_submit_description_from_ip
 from ESSArch_Core.mixins import PaginatedViewMixin
 from ESSArch_Core.profiles.models import (
@@ -128,19 +135,22 @@ from ESSArch_Core.profiles.models import (
 )
 from ESSArch_Core.profiles.utils import fill_specification_data
 from ESSArch_Core.search import DEFAULT_MAX_RESULT_WINDOW
+from ESSArch_Core.storage.directory_size import invalidate_directory_size
 from ESSArch_Core.util import (
+    chunks,
     creation_date,
     find_destination,
     generate_file_response,
+    get_directory_size_response,
     get_immediate_subdirectories,
     get_value_from_path,
     in_directory,
     list_files,
-    merge_file_chunks,
     normalize_path,
     parse_content_range_header,
     remove_prefix,
     timestamp_to_datetime,
+    write_file_chunk,
     zip_directory,
 )
 from ESSArch_Core.WorkflowEngine.models import ProcessStep, ProcessTask
@@ -152,6 +162,36 @@ from ESSArch_Core.WorkflowEngine.util import create_workflow
 User = get_user_model()
 
 
+def get_size_params(request):
+    """
+    Returns whether the size of a directory itself is requested (size=true)
+    and whether sizes of directories are included when listing its content
+    (sizes=false defers them to separate requests)
+    """
+
+    size = string_to_bool(request.query_params.get('size', 'false')) is True
+    sizes = string_to_bool(request.query_params.get('sizes', 'true')) is not False
+    return size, sizes
+
+
+def upload_chunk(request, upload, chunk_nr):
+    """
+    Handles a flow.js chunk request for an upload that is assembled in place
+    """
+
+    if request.method == 'GET':
+        if upload.has_chunk(chunk_nr):
+            return Response(status=status.HTTP_200_OK)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    try:
+        upload.write_chunk(chunk_nr, request.FILES['file'])
+    except (TypeError, ValueError) as e:
+        raise exceptions.ParseError(str(e))
+
+    return Response("Uploaded chunk", status=status.HTTP_201_CREATED)
+
+
 class AgentViewSet(viewsets.ModelViewSet):
     queryset = Agent.objects.all()
     serializer_class = AgentSerializer
@@ -830,6 +870,13 @@ class InformationPackageViewSet(viewsets.ModelViewSet):
 
         temp_path = os.path.join(Path.objects.get(entity='temp').value, 'file_upload')
         full_chunk_path = os.path.join(temp_path, str(ip.pk), chunk_path)
+        # the checksum is not used when merging the chunks
+        upload = get_chunked_upload(
+            data, os.path.join(ip.object_path, path), os.path.join(temp_path, str(ip.pk), path), checksum=False,
+        )
+
+        if upload is not None:
+            return upload_chunk(request, upload, chunk_nr)
 
         if request.method == 'GET':
             if os.path.exists(full_chunk_path):
@@ -863,9 +910,11 @@ class InformationPackageViewSet(viewsets.ModelViewSet):
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
         try:
-            merge_file_chunks(chunks_path, filepath)
+            merge_uploaded_file(chunks_path, filepath, checksum=False)
         except NoFileChunksFound:
             raise exceptions.NotFound('No chunks found')
+        except MissingFileChunks as e:
+            raise exceptions.ParseError(str(e))
 
         logger = logging.getLogger('essarch')
         extra = {'event_type': 50700, 'object': str(ip.pk), 'agent': request.user.username, 'outcome': EventIP.SUCCESS}
@@ -1399,13 +1448,7 @@ class InformationPackageViewSet(viewsets.ModelViewSet):
         if f.size != end - start + 1:
             raise exceptions.ParseError("File size doesn't match headers")
 
-        if start == 0:
-            with open(filename, 'wb') as dstf:
-                dstf.write(f.read())
-        else:
-            with open(filename, 'ab') as dstf:
-                dstf.seek(start)
-                dstf.write(f.read())
+        write_file_chunk(filename, f, start)
 
         upload_id = request.data.get('upload_id', uuid.uuid4().hex)
         return Response({'upload_id': upload_id})
@@ -2106,6 +2149,7 @@ class InformationPackageViewSet(viewsets.ModelViewSet):
 
                 os.remove(fullpath)
 
+            invalidate_directory_size(fullpath)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         if request.method == 'POST':
@@ -2143,7 +2187,12 @@ class InformationPackageViewSet(viewsets.ModelViewSet):
 
             return Response(path, status=status.HTTP_201_CREATED)
 
-        return ip.get_path_response(path, request, force_download=download, paginator=self.paginator)
+        size, sizes = get_size_params(request)
+        if size:
+            ip.validate_path(path)
+            return get_directory_size_response(os.path.join(ip.object_path, path))
+
+        return ip.get_path_response(path, request, force_download=download, paginator=self.paginator, sizes=sizes)
 
     @transaction.atomic
     @action(detail=True, methods=['post'], url_path='unlock-profile', permission_classes=[CanUnlockProfile])
@@ -2295,49 +2344,36 @@ class InformationPackageReceptionViewSet(viewsets.ViewSet, PaginatedViewMixin):
                 yield xmlfile
 
     def get_container_for_xml(self, xmlfile):
-        doc = etree.parse(xmlfile)
-        root = doc.getroot()
-        return get_objectpath(root)
+        return get_container_for_xml(xmlfile)
 
-    def get_contained_packages(self, path):
-        ips = []
-
-        for xmlfile in self.find_xml_files(path):
-            try:
-                container = os.path.join(path, self.get_container_for_xml(xmlfile))
-            except etree.LxmlError:
-                continue
-
-            ip_id = os.path.splitext(os.path.basename(xmlfile))[0]
-            existing_ips = InformationPackage.objects.filter(
-                object_identifier_value=ip_id
+    @staticmethod
+    def get_existing_object_identifiers(ids, exclude_states=()):
+        existing = set()
+        for batch in chunks(list(ids), 1000):
+            existing.update(InformationPackage.objects.filter(
+                object_identifier_value__in=batch,
             ).exclude(
-                state="Submitted"
-            )
+                state__in=exclude_states,
+            ).values_list('object_identifier_value', flat=True))
+        return existing
 
-            if existing_ips.exists():
-                continue
+    def get_contained_packages(self, path):
+        exclude = functools.partial(self.get_existing_object_identifiers, exclude_states=['Submitted'])
 
-            ip = parse_submit_description(xmlfile, srcdir=os.path.split(container)[0])
+        interval = getattr(settings, 'RECEPTION_INDEX_POLL_INTERVAL', None)
+        if interval:
+            reception_index.watch(path, interval, exclude=exclude)
 
-            ip['container'] = container
-            ip['xml'] = xmlfile
-            ip['type'] = 'contained'
-            ip['state'] = 'At reception'
-            ip['status'] = 100
-            ip['step_state'] = celery_states.SUCCESS
-            ips.append(ip)
-
-        return ips
+        return reception_index.get_contained_packages(path, exclude=exclude)
 
     def get_extracted_packages(self, path):
         ips = []
 
-        for d in os.listdir(path):
-            if not os.path.isdir(os.path.join(path, d)):
-                continue
+        dirs = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
+        existing = self.get_existing_object_identifiers(dirs)
 
-            if InformationPackage.objects.filter(object_identifier_value=d).exists():
+        for d in dirs:
+            if d in existing:
                 continue
 
             ip = {
@@ -2390,9 +2426,9 @@ class InformationPackageReceptionViewSet(viewsets.ViewSet, PaginatedViewMixin):
         serializer.is_valid()
 
         # Remove IPs from new_ips if they already are in the database
-        db_ip_ids = from_db.filter(
+        db_ip_ids = set(from_db.filter(
             object_identifier_value__in=[i['id'] for i in new_ips]
-        ).values_list('object_identifier_value', flat=True)
+        ).values_list('object_identifier_value', flat=True))
         new_ips = [ip for ip in new_ips if ip['id'] not in db_ip_ids]
 
         new_ips.extend(serializer.data)
@@ -2841,9 +2877,13 @@ class InformationPackageReceptionViewSet(viewsets.ViewSet, PaginatedViewMixin):
         path = request.query_params.get('path', '').rstrip('/ ')
         download = request.query_params.get('download', False)
 
+        size, sizes = get_size_params(request)
+
         if os.path.isdir(os.path.join(reception, pk)):
             path = os.path.join(reception, pk, path)
-            return list_files(path, force_download=download, paginator=self.paginator, request=request)
+            if size:
+                return get_directory_size_response(path)
+            return list_files(path, force_download=download, paginator=self.paginator, request=request, sizes=sizes)
 
         xml = os.path.join(reception, "%s.xml" % pk)
 
@@ -2888,13 +2928,7 @@ class InformationPackageReceptionViewSet(viewsets.ViewSet, PaginatedViewMixin):
         if f.size != end - start + 1:
             raise exceptions.ParseError("File size doesn't match headers")
 
-        if start == 0:
-            with open(filename, 'wb') as dstf:
-                dstf.write(f.read())
-        else:
-            with open(filename, 'ab') as dstf:
-                dstf.seek(start)
-                dstf.write(f.read())
+        write_file_chunk(filename, f, start)
 
         upload_id = request.data.get('upload_id', uuid.uuid4().hex)
         return Response({'upload_id': upload_id})
@@ -3218,7 +3252,11 @@ class WorkareaFilesViewSet(viewsets.ViewSet, PaginatedViewMixin):
             else:
                 raise
 
-        return list_files(fullpath, force_download, paginator=self.paginator, request=request)
+        size, sizes = get_size_params(request)
+        if size:
+            return get_directory_size_response(fullpath)
+
+        return list_files(fullpath, force_download, paginator=self.paginator, request=request, sizes=sizes)
 
     @action(detail=False, methods=['post'], url_path='add-directory')
     def add_directory(self, request):
@@ -3288,6 +3326,7 @@ class WorkareaFilesViewSet(viewsets.ViewSet, PaginatedViewMixin):
 
             os.remove(path)
 
+        invalidate_directory_size(path)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['get', 'post'], url_path='upload')
@@ -3331,6 +3370,13 @@ class WorkareaFilesViewSet(viewsets.ViewSet, PaginatedViewMixin):
 
         temp_path = os.path.join(Path.objects.get(entity='temp').value, 'file_upload')
         full_chunk_path = os.path.join(temp_path, str(workarea_obj.pk), chunk_path)
+        upload = get_chunked_upload(
+            data, os.path.join(root, path), os.path.join(temp_path, str(workarea_obj.pk), path),
+        )
+
+        if upload is not None:
+            self.validate_path(upload.filepath, root, existence=False)
+            return upload_chunk(request, upload, chunk_nr)
 
         if request.method == 'GET':
             if os.path.exists(full_chunk_path):
@@ -3385,11 +3431,17 @@ class WorkareaFilesViewSet(viewsets.ViewSet, PaginatedViewMixin):
         chunks_path = os.path.join(temp_path, str(workarea_obj.pk), relative_path)
 
         try:
-            merge_file_chunks(chunks_path, path)
+            checksum = merge_uploaded_file(chunks_path, path)
         except NoFileChunksFound:
             raise exceptions.NotFound('No chunks found')
+        except MissingFileChunks as e:
+            raise exceptions.ParseError(str(e))
+
+        response = {'detail': 'Merged chunks'}
+        if checksum is not None:
+            response['checksum'] = checksum
 
-        return Response({'detail': 'Merged chunks'})
+        return Response(response)
 
     @action(detail=False, methods=['post'], url_path='add-to-dip')
     def add_to_dip(self, request):
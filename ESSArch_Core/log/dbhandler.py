@@ -1,10 +1,59 @@
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from logging import Handler
+from weakref import WeakSet
 
+from django.conf import settings
+from django.core import serializers
 from django.core.cache import cache
+from django.db import InterfaceError, OperationalError
 from django.utils.text import Truncator
 
 from ESSArch_Core._version import get_versions
 
+logger = logging.getLogger('essarch.log.dbhandler')
+
+FAILED_OVERFLOW_SUFFIX = '.failed'
+
+_handlers = WeakSet()
+_local = threading.local()
+
+
+def is_buffering():
+    return getattr(_local, 'depth', 0) > 0
+
+
+@contextmanager
+def buffer_events():
+    """
+    Buffers the events logged to DBHandlers by the current thread and writes
+    them to the database in bulk, at the latest when the outermost block is
+    left
+    """
+
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        if depth == 0:
+            flush_events()
+
+
+def flush_events():
+    """
+    Writes the buffered events of all DBHandlers to the database
+    """
+
+    for handler in list(_handlers):
+        handler.flush()
+
 
 class DBHandler(Handler):
     model_name = 'ESSArch_Core.ip.models.EventIP'
@@ -15,6 +64,22 @@ class DBHandler(Handler):
         self.application = application
         self.agent_role = agent_role
         self.version = get_versions()['version']
+        self.buffer = []
+        self.buffer_started = None
+        self.enabled_event_types = {}
+        _handlers.add(self)
+
+    @property
+    def buffer_size(self):
+        return getattr(settings, 'EVENT_BUFFER_SIZE', 500)
+
+    @property
+    def buffer_max_age(self):
+        return getattr(settings, 'EVENT_BUFFER_MAX_AGE', 5)
+
+    @property
+    def overflow_dir(self):
+        return getattr(settings, 'EVENT_BUFFER_OVERFLOW_DIR', None)
 
     def emit(self, record):
         try:
@@ -34,12 +99,19 @@ class DBHandler(Handler):
         enabled = False
 
         if not forced:
-            cache_name = 'event_type_%s_enabled' % record.event_type
-            enabled = cache.get(cache_name)
+            enabled = self.enabled_event_types.get(record.event_type)
 
             if enabled is None:
-                enabled = EventType.objects.values_list('enabled', flat=True).get(pk=record.event_type)
-                cache.set(cache_name, enabled, 3600)
+                cache_name = 'event_type_%s_enabled' % record.event_type
+                enabled = cache.get(cache_name)
+
+                if enabled is None:
+                    enabled = EventType.objects.values_list('enabled', flat=True).get(pk=record.event_type)
+                    cache.set(cache_name, enabled, 3600)
+
+                # reused until the buffered events are flushed
+                if is_buffering():
+                    self.enabled_event_types[record.event_type] = enabled
 
         if enabled or forced:
             obj = getattr(record, 'object', '')
@@ -50,7 +122,7 @@ class DBHandler(Handler):
             if agent is None:
                 agent = ''
 
-            EventIP.objects.create(
+            event = EventIP(
                 eventType_id=record.event_type,
                 application=self.application,
                 task_id=getattr(record, 'task', None),
@@ -62,6 +134,99 @@ class DBHandler(Handler):
                 linkingObjectIdentifierValue=obj,
             )
 
+            if not is_buffering() or self.buffer_size <= 0:
+                event.save()
+                return
+
+            if not self.buffer:
+                self.buffer_started = time.monotonic()
+            self.buffer.append(event)
+
+            if len(self.buffer) >= self.buffer_size or time.monotonic() - self.buffer_started >= self.buffer_max_age:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered events to the database. If that fails and
+        EVENT_BUFFER_OVERFLOW_DIR is set the events are written to a file in
+        it instead, to be written to the database by the next flush
+        """
+
+        self.acquire()
+        try:
+            events, self.buffer = self.buffer, []
+            self.enabled_event_types = {}
+
+            overflow_dir = self.overflow_dir
+            if overflow_dir and os.path.isdir(overflow_dir):
+                self.replay_overflow(overflow_dir)
+
+            if not events:
+                return
+
+            EventIP = events[0].__class__
+            try:
+                EventIP.objects.bulk_create(events, batch_size=max(self.buffer_size, 1))
+            except Exception:
+                if not overflow_dir:
+                    raise
+
+                path = self.write_overflow(overflow_dir, events)
+                logger.exception('Failed to write {} events, wrote them to {}'.format(len(events), path))
+        finally:
+            self.release()
+
+    def write_overflow(self, overflow_dir, events):
+        os.makedirs(overflow_dir, exist_ok=True)
+        path = os.path.join(overflow_dir, 'events-{}.json'.format(uuid.uuid4()))
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            serializers.serialize('json', events, stream=f)
+        os.replace(tmp, path)
+        return path
+
+    def replay_overflow(self, overflow_dir):
+        """
+        Writes the events of each overflow file to the database, one file at
+        a time. Files that can't be written are renamed with the suffix
+        .failed, unless the database is unavailable, then they are left to
+        be written by the next flush
+        """
+
+        for path in sorted(glob.glob(os.path.join(overflow_dir, 'events-*.json'))):
+            # claim the file before reading it, to not write its events twice
+            # when flushed by multiple processes
+            claimed = '{}.{}'.format(path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+
+            try:
+                with open(claimed) as f:
+                    events = [obj.object for obj in serializers.deserialize('json', f.read())]
+                if events:
+                    events[0].__class__.objects.bulk_create(events, batch_size=max(self.buffer_size, 1))
+            except (InterfaceError, OperationalError):
+                os.rename(claimed, path)
+                logger.exception('Failed to write events in {}, the database is unavailable'.format(path))
+                return
+            except Exception:
+                os.rename(claimed, path + FAILED_OVERFLOW_SUFFIX)
+                logger.exception('Failed to write events in {}, moved it to {}'.format(
+                    path, path + FAILED_OVERFLOW_SUFFIX,
+                ))
+                continue
+
+            os.remove(claimed)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            _handlers.discard(self)
+            Handler.close(self)
+
     def get_model(self, name):
         names = name.split('.')
         mod = __import__('.'.join(names[:-1]), fromlist=names[-1:])
@@ -0,0 +1,180 @@
+import logging
+import os
+import shutil
+import tempfile
+from unittest import mock
+from weakref import WeakSet
+
+from django.core.cache import cache
+from django.db import DatabaseError, OperationalError
+from django.test import TestCase, override_settings
+
+from ESSArch_Core.configuration.models import EventType
+from ESSArch_Core.ip.models import EventIP
+from ESSArch_Core.log.dbhandler import DBHandler, buffer_events
+
+
+class DBHandlerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event_type = EventType.objects.create(eventType=1, category=EventType.CATEGORY_INFORMATION_PACKAGE)
+
+        # only flush the handler of this test when leaving buffer_events
+        patcher = mock.patch('ESSArch_Core.log.dbhandler._handlers', WeakSet())
+        self.handlers = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.handler = DBHandler(application='test', agent_role='Producer')
+        self.addCleanup(self.handler.close)
+
+    def log(self, msg='foo', **extra):
+        # logging is disabled when running tests, the records are handled
+        # directly
+        record = logging.LogRecord('essarch', logging.INFO, __file__, 0, msg, None, None)
+        record.__dict__.update({'event_type': self.event_type.pk, 'object': 'ip', **extra})
+        self.handler.handle(record)
+
+    def test_unbuffered(self):
+        self.log()
+
+        event = EventIP.objects.get()
+        self.assertEqual(event.eventOutcomeDetailNote, 'foo')
+        self.assertEqual(event.application, 'test')
+        self.assertEqual(event.linkingAgentRole, 'Producer')
+        self.assertEqual(event.linkingObjectIdentifierValue, 'ip')
+        self.assertEqual(event.eventOutcome, EventIP.SUCCESS)
+
+    def test_without_event_type(self):
+        self.handler.handle(logging.LogRecord('essarch', logging.INFO, __file__, 0, 'foo', None, None))
+        self.assertFalse(EventIP.objects.exists())
+
+    def test_disabled_event_type(self):
+        self.event_type.enabled = False
+        self.event_type.save()
+
+        self.log()
+        self.assertFalse(EventIP.objects.exists())
+
+        self.log(force=True)
+        self.assertEqual(EventIP.objects.count(), 1)
+
+    def test_buffered(self):
+        with buffer_events():
+            with self.assertNumQueries(0):
+                for i in range(10):
+                    self.log(str(i))
+
+            with buffer_events():
+                self.log('10')
+            self.assertFalse(EventIP.objects.exists())
+
+        self.assertEqual(
+            list(EventIP.objects.values_list('eventOutcomeDetailNote', flat=True)),
+            [str(i) for i in range(11)],
+        )
+
+    @override_settings(EVENT_BUFFER_SIZE=3)
+    def test_buffer_size(self):
+        with buffer_events():
+            for i in range(7):
+                self.log(str(i))
+            self.assertEqual(EventIP.objects.count(), 6)
+
+        self.assertEqual(EventIP.objects.count(), 7)
+
+    @override_settings(EVENT_BUFFER_SIZE=0)
+    def test_buffering_disabled(self):
+        with buffer_events():
+            self.log()
+            self.assertEqual(EventIP.objects.count(), 1)
+
+    @override_settings(EVENT_BUFFER_MAX_AGE=5)
+    @mock.patch('ESSArch_Core.log.dbhandler.time.monotonic')
+    def test_buffer_max_age(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        with buffer_events():
+            self.log()
+            self.assertFalse(EventIP.objects.exists())
+
+            mock_monotonic.return_value = 105
+            self.log()
+            self.assertEqual(EventIP.objects.count(), 2)
+
+    def test_event_type_looked_up_once_per_flush(self):
+        with buffer_events():
+            with mock.patch('ESSArch_Core.log.dbhandler.cache.get', return_value=True) as mock_cache_get:
+                self.log()
+                self.log()
+            mock_cache_get.assert_called_once()
+
+    def test_overflow(self):
+        overflow_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, overflow_dir)
+
+        with override_settings(EVENT_BUFFER_OVERFLOW_DIR=overflow_dir):
+            with mock.patch.object(EventIP.objects, 'bulk_create', side_effect=OperationalError):
+                with buffer_events():
+                    self.log('foo')
+                    self.log('bar')
+
+            self.assertFalse(EventIP.objects.exists())
+            self.assertEqual(len(os.listdir(overflow_dir)), 1)
+
+            with buffer_events():
+                self.log('baz')
+
+        self.assertEqual(os.listdir(overflow_dir), [])
+        self.assertEqual(
+            list(EventIP.objects.values_list('eventOutcomeDetailNote', flat=True)),
+            ['foo', 'bar', 'baz'],
+        )
+
+    def write_overflow_file(self, overflow_dir, content):
+        with open(os.path.join(overflow_dir, 'events-0.json'), 'w') as f:
+            f.write(content)
+
+    def test_failed_overflow_file_is_moved_aside(self):
+        overflow_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, overflow_dir)
+        self.write_overflow_file(overflow_dir, '[{"model": "ip.eventip", "fields": {"invalid": 1}}]')
+
+        with override_settings(EVENT_BUFFER_OVERFLOW_DIR=overflow_dir):
+            with mock.patch.object(EventIP.objects, 'bulk_create', side_effect=OperationalError):
+                with buffer_events():
+                    self.log('foo')
+
+            with buffer_events():
+                self.log('bar')
+
+        self.assertEqual(os.listdir(overflow_dir), ['events-0.json.failed'])
+        self.assertCountEqual(EventIP.objects.values_list('eventOutcomeDetailNote', flat=True), ['foo', 'bar'])
+
+    def test_overflow_kept_while_database_is_unavailable(self):
+        overflow_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, overflow_dir)
+
+        with override_settings(EVENT_BUFFER_OVERFLOW_DIR=overflow_dir):
+            with mock.patch.object(EventIP.objects, 'bulk_create', side_effect=DatabaseError):
+                with buffer_events():
+                    self.log('foo')
+            path, = os.listdir(overflow_dir)
+
+            with mock.patch.object(EventIP.objects, 'bulk_create', side_effect=OperationalError):
+                self.handler.flush()
+            self.assertEqual(os.listdir(overflow_dir), [path])
+
+            self.handler.flush()
+
+        self.assertEqual(os.listdir(overflow_dir), [])
+        self.assertEqual(EventIP.objects.get().eventOutcomeDetailNote, 'foo')
+
+    def test_close_unregisters_handler(self):
+        self.assertIn(self.handler, self.handlers)
+        self.handler.close()
+        self.assertNotIn(self.handler, self.handlers)
+
+    def test_failure_without_overflow(self):
+        with mock.patch.object(EventIP.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                with buffer_events():
+                    self.log()
@@ -0,0 +1,131 @@
+"""
+Synchronization of the ACL tokens and security levels denormalized into
+indexed documents when the organizations and permissions of archives and
+IPs change.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from elasticsearch.exceptions import ElasticsearchException
+from elasticsearch_dsl import Q, Search, UpdateByQuery
+
+from ESSArch_Core.auth.util import get_object_acl_tokens
+
+logger = logging.getLogger('essarch.search.acl')
+
+# indices with documents of components in archives and files in IPs
+ARCHIVE_INDICES = ['component', 'document', 'directory', 'structure_unit']
+IP_INDICES = ['document', 'directory']
+
+DOCUMENTS_WITHOUT_ACL_CACHE_KEY = 'search_documents_without_acl'
+
+UPDATE_ARCHIVE_SCRIPT = """
+def archives = ctx._source.archive instanceof List ? ctx._source.archive : [ctx._source.archive];
+for (archive in archives) {
+    if (archive != null && archive.id == params.id) {
+        archive.acl = params.acl;
+        archive.security_level = params.security_level;
+    }
+}
+"""
+
+UPDATE_IP_SCRIPT = """
+ctx._source.ip_acl = params.acl;
+ctx._source.ip_responsible = params.responsible;
+"""
+
+
+def documents_without_acl_query():
+    """
+    Matches documents indexed before ACL tokens were added to the index,
+    i.e. with an archive or IP but without its tokens
+    """
+
+    return Q('bool', minimum_should_match=1, should=[
+        Q('nested', path='archive', ignore_unmapped=True, query=Q('bool', filter=[
+            Q('exists', field='archive.id'),
+        ], must_not=[
+            Q('exists', field='archive.acl'),
+        ])),
+        Q('bool', filter=[Q('exists', field='ip')], must_not=[Q('exists', field='ip_acl')]),
+    ])
+
+
+def has_documents_without_acl():
+    """
+    Checks if any document is missing its ACL tokens and has to be checked
+    against lists of archive and IP ids until the indices are rebuilt. The
+    result is cached for SEARCH_ACL_CACHE_TIMEOUT seconds
+    """
+
+    found = cache.get(DOCUMENTS_WITHOUT_ACL_CACHE_KEY)
+    if found is None:
+        s = Search(index=ARCHIVE_INDICES).query(documents_without_acl_query())
+        found = s.params(ignore_unavailable=True, terminate_after=1).count() > 0
+        cache.set(DOCUMENTS_WITHOUT_ACL_CACHE_KEY, found, getattr(settings, 'SEARCH_ACL_CACHE_TIMEOUT', 300))
+
+    return found
+
+
+def update_archive_acl(archive):
+    """
+    Updates the ACL tokens and security level of archive in the documents of
+    all components in it
+    """
+
+    ubq = UpdateByQuery(index=ARCHIVE_INDICES).query(
+        'nested', path='archive', ignore_unmapped=True, query=Q('term', archive__id=str(archive.pk)),
+    ).script(
+        source=UPDATE_ARCHIVE_SCRIPT, lang='painless', params={
+            'id': str(archive.pk),
+            'acl': get_object_acl_tokens(archive),
+            'security_level': archive.security_level,
+        },
+    ).params(conflicts='proceed', ignore_unavailable=True)
+    return ubq.execute()
+
+
+def update_ip_acl(ip):
+    """
+    Updates the ACL tokens and responsible user of ip in the documents of all
+    files in it
+    """
+
+    ubq = UpdateByQuery(index=IP_INDICES).filter(
+        'term', ip=str(ip.pk),
+    ).script(
+        source=UPDATE_IP_SCRIPT, lang='painless', params={
+            'acl': get_object_acl_tokens(ip),
+            'responsible': str(ip.responsible_id) if ip.responsible_id is not None else None,
+        },
+    ).params(conflicts='proceed', ignore_unavailable=True)
+    return ubq.execute()
+
+
+def schedule_acl_update(obj):
+    """
+    Updates the indexed ACL of obj, if it is an archive or an IP, when the
+    current transaction is committed. Failures are logged, the documents are
+    updated when they are indexed again
+    """
+
+    from ESSArch_Core.ip.models import InformationPackage
+    from ESSArch_Core.tags.models import TagVersion
+
+    if isinstance(obj, InformationPackage):
+        update = update_ip_acl
+    elif isinstance(obj, TagVersion) and obj.elastic_index == 'archive':
+        update = update_archive_acl
+    else:
+        return
+
+    def run():
+        try:
+            update(obj)
+        except ElasticsearchException:
+            logger.exception('Failed to update indexed ACL of {}'.format(obj.pk))
+
+    transaction.on_commit(run)
@@ -9,3 +9,5 @@ class SearchConfig(AppConfig):
 
     def ready(self):
         connections.configure(**settings.ELASTICSEARCH_CONNECTIONS)
+
+        import ESSArch_Core.search.signals  # noqa isort:skip
@@ -0,0 +1,135 @@
+"""
+Reading the content of files to be indexed, either as base64 encoded data
+for the ingest_attachment pipeline or, for text files too large to be sent
+to Elasticsearch, as text extracted locally.
+"""
+
+import base64
+import codecs
+import io
+import logging
+import mimetypes
+
+from django.conf import settings
+
+logger = logging.getLogger('essarch.search.attachment')
+
+MB = 1024 * 1024
+
+ATTACHMENT_PIPELINE = 'ingest_attachment'
+
+# multiple of 3 bytes to base64 encode chunks without padding in between
+ENCODE_CHUNK_SIZE = 3 * 256 * 1024
+
+
+def get_max_size():
+    return getattr(settings, 'ELASTICSEARCH_ATTACHMENT_MAX_SIZE', 50 * MB)
+
+
+def get_indexed_chars():
+    return getattr(settings, 'ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS', -1)
+
+
+def is_text(filename):
+    mimetype = mimetypes.guess_type(filename)[0]
+    return mimetype is not None and mimetype.startswith('text/')
+
+
+def encode_file(f, chunk_size=ENCODE_CHUNK_SIZE):
+    """
+    Base64 encodes the content of f, one chunk at a time
+    """
+
+    encoded = bytearray()
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        encoded += base64.b64encode(chunk)
+
+    return encoded.decode('ascii')
+
+
+def extract_text(f, max_chars, chunk_size=MB):
+    """
+    Decodes at most max_chars characters from the beginning of f as UTF-8,
+    ignoring invalid bytes
+    """
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    parts = []
+    length = 0
+
+    while length < max_chars:
+        chunk = f.read(chunk_size)
+        text = decoder.decode(chunk, final=not chunk)
+        parts.append(text[:max_chars - length])
+        length += len(parts[-1])
+        if not chunk:
+            break
+
+    return ''.join(parts)
+
+
+def read_attachment(f, filename, size):
+    """
+    Reads the content of the file f to be indexed with a document
+
+    Files up to ELASTICSEARCH_ATTACHMENT_MAX_SIZE bytes are encoded for the
+    ingest_attachment pipeline. Larger text files are truncated to
+    ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS characters, or the max size if
+    unlimited, and larger files of other formats are indexed without their
+    content.
+
+    Args:
+        f: The file, opened in binary mode
+        filename: The name of the file
+        size: The size of the file in bytes, or None to seek to the end of
+            f to get it
+
+    Returns:
+        A dict with the fields to add to the document, ``data`` to be sent
+        through the ingest_attachment pipeline or ``attachment``, or an
+        empty dict
+    """
+
+    if size is None:
+        size = f.seek(0, io.SEEK_END)
+        f.seek(0)
+
+    max_size = get_max_size()
+    if size <= max_size:
+        return {'data': encode_file(f)}
+
+    if not is_text(filename):
+        logger.info('Skip to index content of {} ({} bytes), larger than {} bytes'.format(filename, size, max_size))
+        return {}
+
+    max_chars = get_indexed_chars()
+    if max_chars < 0 or max_chars > max_size:
+        max_chars = max_size
+
+    logger.info('Indexing the first {} characters of {} ({} bytes)'.format(max_chars, filename, size))
+    content = extract_text(f, max_chars)
+    return {
+        'attachment': {
+            'content': content,
+            'content_length': len(content),
+            'content_type': mimetypes.guess_type(filename)[0],
+        },
+    }
+
+
+def add_attachment(doc, f, filename, size):
+    """
+    Adds the content of the file f to doc, see read_attachment
+
+    Returns:
+        The pipeline to index doc with, or None
+    """
+
+    fields = read_attachment(f, filename, size)
+    for key, value in fields.items():
+        setattr(doc, key, value)
+
+    return ATTACHMENT_PIPELINE if 'data' in fields else None
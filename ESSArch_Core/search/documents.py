@@ -1,17 +1,59 @@
 import logging
 import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 
 import elasticsearch_dsl as es
 from django.conf import settings
 from elasticsearch import helpers as es_helpers
 from elasticsearch_dsl.connections import get_connection as get_es_connection
 
+from ESSArch_Core.auth.util import memoize_object_acl_tokens
 from ESSArch_Core.search.alias_migration import migrate
 
 logger = logging.getLogger('essarch.search.documents.DocumentBase')
 
+MAX_REPORTED_INDEX_ERRORS = 100
+
+
+class IndexProgress:
+    """
+    Counters for a running (re)indexing of a document type
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.indexed = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    @property
+    def processed(self):
+        return self.indexed + self.failed
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed else 0.0
+
+    def __repr__(self):
+        return '<IndexProgress {}/{} ({} failed)>'.format(self.processed, self.total, self.failed)
+
 
 class DocumentBase(es.Document):
+    # related objects to fetch together with the objects when (re)indexing,
+    # see get_index_queryset_hints
+    index_select_related = ()
+    index_prefetch_related = ()
+
     @classmethod
     def get_model(cls):
         raise NotImplementedError
@@ -45,9 +87,27 @@ class DocumentBase(es.Document):
         migrate(cls, move_data=False, update_alias=True, delete_old_index=True)
 
     @classmethod
-    def index_documents(cls, batch_size=None, remove_stale=False, index_file_content=False, queryset=None):
+    def get_index_queryset_hints(cls, queryset):
+        """
+        Applies the select_related and prefetch_related hints of the document
+        to a queryset, to avoid per-object queries when serializing
+        documents using from_obj
+        """
+
+        if cls.index_select_related:
+            queryset = queryset.select_related(*cls.index_select_related)
+        if cls.index_prefetch_related:
+            queryset = queryset.prefetch_related(*cls.index_prefetch_related)
+        return queryset
+
+    @classmethod
+    def index_documents(cls, batch_size=None, remove_stale=False, index_file_content=False, queryset=None,
+                        workers=None, progress_callback=None):
         """
         Main method for indexing the documents.
+
+        Returns:
+            An IndexProgress with the number of indexed and failed documents
         """
 
         if not batch_size:
@@ -58,25 +118,108 @@ class DocumentBase(es.Document):
             queryset = cls().get_index_queryset()
 
         # perform the indexing
-        if queryset:
-            cls.perform_index(queryset, batch_size, index_file_content)
+        progress = cls.perform_index(
+            queryset, batch_size, index_file_content,
+            workers=workers, progress_callback=progress_callback,
+        )
 
         # remove the stale values.
         if remove_stale:
             cls.remove_stale(queryset, batch_size)
 
+        # make the changes visible to search once, instead of waiting for
+        # the refresh interval after each batch
+        if progress.processed or remove_stale:
+            cls._index.refresh()
+
+        return progress
+
+    @classmethod
+    def iter_batches(cls, queryset, batch_size):
+        """
+        Iterates over the queryset in batches ordered by primary key.
+
+        Each batch is fetched using the last primary key of the previous
+        batch instead of an offset, so that fetching a batch does not get
+        slower the further into the table we get.
+        """
+
+        queryset = cls.get_index_queryset_hints(queryset).order_by('pk')
+        last_pk = None
+
+        while True:
+            batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch_qs[:batch_size])
+            if not batch:
+                return
+
+            yield batch
+
+            if len(batch) < batch_size:
+                return
+            last_pk = batch[-1].pk
+
     @classmethod
-    def perform_index(cls, queryset, batch_size, index_file_content=False):
+    def perform_index(cls, queryset, batch_size, index_file_content=False, workers=None, progress_callback=None):
         """
         Performs the indexing.
+
+        Documents are created from the database in this thread while
+        previous batches are sent to Elasticsearch by up to ``workers``
+        threads. At most ``ELASTICSEARCH_INDEX_QUEUE_SIZE`` batches per
+        worker are kept in memory waiting to be sent.
         """
 
-        for start in range(0, queryset.count(), batch_size):
-            end = start + batch_size
-            batch_qs = queryset[start:end]
-            batch = cls.create_batch(list(batch_qs), index_file_content)
-            cls.index_batch(batch)
-            time.sleep(0.5)
+        if workers is None:
+            workers = getattr(settings, 'ELASTICSEARCH_INDEX_WORKERS', 1)
+        workers = max(workers, 1)
+        max_pending = workers * getattr(settings, 'ELASTICSEARCH_INDEX_QUEUE_SIZE', 2)
+
+        progress = IndexProgress(queryset.count())
+        if not progress.total:
+            return progress
+
+        errors = []
+
+        def handle_result(result):
+            indexed, failed = result
+            progress.indexed += indexed
+            progress.failed += len(failed)
+            for error in failed:
+                logger.warning('Failed to index document in {}: {}'.format(cls._index._name, error))
+            errors.extend(failed[:MAX_REPORTED_INDEX_ERRORS - len(errors)])
+
+            logger.debug('Indexed {}/{} documents in {} ({} failed, {:.1f} docs/s)'.format(
+                progress.indexed, progress.total, cls._index._name, progress.failed, progress.rate,
+            ))
+            if progress_callback is not None:
+                progress_callback(progress)
+
+        batches = (cls.create_batch(objects, index_file_content) for objects in cls.iter_batches(queryset, batch_size))
+
+        if workers == 1:
+            for batch in batches:
+                handle_result(cls.index_batch(batch))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = set()
+                for batch in batches:
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            handle_result(future.result())
+                    pending.add(executor.submit(cls.index_batch, batch))
+
+                for future in as_completed(pending):
+                    handle_result(future.result())
+
+        if progress.failed:
+            raise es_helpers.BulkIndexError(
+                '{} document(s) failed to index in {}'.format(progress.failed, cls._index._name),
+                errors,
+            )
+
+        return progress
 
     @classmethod
     def create_batch(cls, objects, index_file_content=False):
@@ -85,23 +228,40 @@ class DocumentBase(es.Document):
         """
 
         batch = []
-        for obj in objects:
-            if cls.__name__ == 'File' and index_file_content:
-                d_dict = cls.from_obj(obj, index_file_content=True).to_dict(include_meta=True)
-                d_dict['pipeline'] = 'ingest_attachment'
-            else:
-                d_dict = cls.from_obj(obj).to_dict(include_meta=True)
-            batch.append(d_dict)
+        with memoize_object_acl_tokens():
+            for obj in objects:
+                if cls.__name__ == 'File' and index_file_content:
+                    d_dict = cls.from_obj(obj, index_file_content=True).to_dict(include_meta=True)
+                    # files too large to be sent whole are indexed without the
+                    # pipeline
+                    if 'data' in d_dict['_source']:
+                        d_dict['pipeline'] = 'ingest_attachment'
+                else:
+                    d_dict = cls.from_obj(obj).to_dict(include_meta=True)
+                batch.append(d_dict)
         return batch
 
     @classmethod
     def index_batch(cls, batch):
         """
         Index the specified batch.
+
+        Returns:
+            A tuple with the number of indexed documents and a list of errors
+            for the documents that could not be indexed
         """
 
         conn = get_es_connection()
-        es_helpers.bulk(client=conn, actions=batch)
+        indexed = 0
+        errors = []
+        for ok, item in es_helpers.streaming_bulk(
+            client=conn, actions=batch, chunk_size=len(batch), raise_on_error=False,
+        ):
+            if ok:
+                indexed += 1
+            else:
+                errors.append(item)
+        return indexed, errors
 
     @classmethod
     def remove_stale(cls, queryset, batch_size):
@@ -110,18 +270,29 @@ class DocumentBase(es.Document):
         Index meta id and db instance pk needs to be same.
         """
 
-        db_ids = list(str(obj_id) for obj_id in queryset.values_list('id', flat=True))
-        s = cls.search()
-        resp = s.execute()
-        total_index = resp.hits.total['value']
-        removed = []
-        for start in range(0, total_index, batch_size):
-            end = start + batch_size
-            items = resp.hits[start:end]
-            for item in items:
-                if str(item.meta.id) not in db_ids:
-                    removed.append(item.meta.id)
-        for remove_id in removed:
-            cls.get(id=remove_id).delete()
-
-        time.sleep(0.5)
+        def get_stale_ids():
+            index_ids = []
+            for hit in cls.search().source(False).params(size=batch_size).scan():
+                index_ids.append(hit.meta.id)
+                if len(index_ids) >= batch_size:
+                    yield from get_missing(index_ids)
+                    index_ids = []
+            yield from get_missing(index_ids)
+
+        def get_missing(index_ids):
+            if not index_ids:
+                return
+            db_ids = {str(pk) for pk in queryset.filter(pk__in=index_ids).values_list('pk', flat=True)}
+            for index_id in index_ids:
+                if index_id not in db_ids:
+                    yield index_id
+
+        # collect the ids before deleting anything to not modify the index
+        # while scrolling through it
+        removed = list(get_stale_ids())
+        if not removed:
+            return
+
+        logger.info('Removing {} stale documents from {}'.format(len(removed), cls._index._name))
+        actions = ({'_op_type': 'delete', '_index': cls._index._name, '_id': remove_id} for remove_id in removed)
+        es_helpers.bulk(client=get_es_connection(), actions=actions, chunk_size=batch_size, raise_on_error=False)
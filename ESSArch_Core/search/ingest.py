@@ -1,13 +1,19 @@
-import base64
+import itertools
 import logging
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
+from django.db import transaction
 from elasticsearch.exceptions import ElasticsearchException
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl.connections import get_connection as get_es_connection
 
 from ESSArch_Core.fixity.format import FormatIdentifier
-from ESSArch_Core.tags.documents import Directory, File
+from ESSArch_Core.search.attachment import add_attachment
+from ESSArch_Core.tags.documents import Directory, File, get_ip_fields
 from ESSArch_Core.tags.models import (
     Tag,
     TagStructure,
@@ -27,7 +33,7 @@ def index_document(tag_version, filepath):
     exclude_file_format_from_indexing_content = settings.EXCLUDE_FILE_FORMAT_FROM_INDEXING_CONTENT
 
     fid = FormatIdentifier()
-    (format_name, format_version, format_registry_key) = fid.identify_file_format(filepath)
+    _, (format_name, format_version, format_registry_key) = next(fid.identify_many([filepath]))
     if format_registry_key not in exclude_file_format_from_indexing_content:
         index_file_content = True
     else:
@@ -58,9 +64,8 @@ def index_document(tag_version, filepath):
     try:
         if index_file_content:
             with open(filepath, 'rb') as f:
-                content = f.read()
-            doc.data = base64.b64encode(content).decode("ascii")
-            doc.save(pipeline='ingest_attachment')
+                pipeline = add_attachment(doc, f, tag_version.name, size)
+            doc.save(pipeline=pipeline)
         else:
             logger.debug('Skip to index file content for {}'.format(filepath))
             doc.save()
@@ -121,3 +126,240 @@ def index_path(ip, path, parent=None):
         tag_version.type = TagVersionType.objects.get_or_create(name='directory', archive_type=False)[0]
         doc, tag_version = index_directory(tag_version, path)
         tag_version.save()
+    return doc
+
+
+_format_identifiers = threading.local()
+
+
+def _identify_format(filepath):
+    # format identifiers keep the result of the last identification as
+    # state and can't be shared between threads
+    fid = getattr(_format_identifiers, 'fid', None)
+    if fid is None:
+        fid = _format_identifiers.fid = FormatIdentifier()
+
+    return next(fid.identify_many([filepath]))[1]
+
+
+def identify_formats(filepaths, executor=None):
+    """
+    Identifies the formats of filepaths, using the threads of executor if
+    given
+
+    Returns:
+        A list with a tuple with the format name, version and registry key for
+        each path, in the same order as filepaths
+    """
+
+    if executor is None:
+        return [_identify_format(filepath) for filepath in filepaths]
+
+    return list(executor.map(_identify_format, filepaths))
+
+
+def get_tag_version_types():
+    """
+    Returns the tag version types of indexed files and directories, by
+    elastic index
+    """
+
+    return {
+        index: TagVersionType.objects.get_or_create(name=index, archive_type=False)[0]
+        for index in ('document', 'directory')
+    }
+
+
+def iter_tree(rootdir, exclude=None):
+    """
+    Yields the path of every directory and file in rootdir, except the files
+    in exclude, together with a boolean telling if it is a file
+    """
+
+    exclude = exclude or set()
+    for root, dirs, files in os.walk(rootdir):
+        for d in dirs:
+            yield os.path.join(root, d), False
+
+        for f in files:
+            src = os.path.join(root, f)
+            if src not in exclude:
+                yield src, True
+
+
+def _get_href(ip, dirname):
+    href = normalize_path(os.path.relpath(dirname, ip.object_path))
+    return '' if href == '.' else href
+
+
+def create_tag_versions(ip, paths, types, executor=None):
+    """
+    Creates the tags of paths, a list of (path, isfile) tuples, in ip using a
+    few bulk inserts
+
+    Returns:
+        A list with the created tag version of each path
+    """
+
+    filepaths = [path for path, isfile in paths if isfile]
+    formats = dict(zip(filepaths, identify_formats(filepaths, executor)))
+
+    tags = []
+    tag_versions = []
+    for path, isfile in paths:
+        name = os.path.basename(path)
+        tag = Tag(information_package=ip)
+
+        if isfile:
+            st = os.stat(path)
+            dirname = os.path.dirname(path)
+            format_name, format_version, format_registry_key = formats[path]
+            custom_fields = {
+                'extension': os.path.splitext(name)[1][1:],
+                'dirname': dirname,
+                'href': _get_href(ip, dirname),
+                'filename': name,
+                'size': st.st_size,
+                'modified': timestamp_to_datetime(st.st_mtime),
+                'formatname': format_name,
+                'formatversion': format_version,
+                'formatkey': format_registry_key,
+            }
+            elastic_index = 'document'
+        else:
+            custom_fields = {
+                'href': _get_href(ip, os.path.dirname(path)),
+            }
+            elastic_index = 'directory'
+
+        tags.append(tag)
+        tag_versions.append(TagVersion(
+            pk=uuid.uuid4(), tag=tag, name=name, elastic_index=elastic_index,
+            type=types[elastic_index], custom_fields=custom_fields,
+        ))
+
+    with transaction.atomic():
+        Tag.objects.bulk_create(tags)
+        TagVersion.objects.bulk_create(tag_versions)
+
+        # set by a post_save signal when created one by one
+        for tag, tag_version in zip(tags, tag_versions):
+            tag.current_version = tag_version
+        Tag.objects.bulk_update(tags, ['current_version'])
+
+    return tag_versions
+
+
+def create_document(tag_version, ip_fields):
+    """
+    Creates the document of a tag version created by create_tag_versions,
+    without looking up the archive, structure units, agents and attachment
+    that it can't have yet
+    """
+
+    fields = {
+        '_id': str(tag_version.pk),
+        'id': str(tag_version.pk),
+        'task_id': None,
+        'appraisal_date': None,
+        'archive': None,
+        'structure_units': [],
+        'current_version': True,
+        'name': tag_version.name,
+        'desc': tag_version.description,
+        'reference_code': tag_version.reference_code,
+        'type': tag_version.type.name,
+        'agents': [],
+    }
+
+    if tag_version.elastic_index == 'directory':
+        return Directory(**fields, **ip_fields, **tag_version.custom_fields)
+
+    doc = File(
+        start_date=tag_version.start_date,
+        end_date=tag_version.end_date,
+        date_render_format=tag_version.type.date_render_format,
+        security_level=tag_version.security_level,
+        **fields, **ip_fields, **tag_version.custom_fields,
+    )
+    return doc
+
+
+def _get_index_action(tag_version, ip_fields):
+    doc = create_document(tag_version, ip_fields)
+    pipeline = None
+
+    if tag_version.elastic_index == 'document':
+        exclude_file_format_from_indexing_content = settings.EXCLUDE_FILE_FORMAT_FROM_INDEXING_CONTENT
+        filepath = os.path.join(tag_version.custom_fields['dirname'], tag_version.name)
+
+        if tag_version.custom_fields['formatkey'] not in exclude_file_format_from_indexing_content:
+            with open(filepath, 'rb') as f:
+                pipeline = add_attachment(doc, f, tag_version.name, tag_version.custom_fields['size'])
+        else:
+            logger.debug('Skip to index file content for {}'.format(filepath))
+
+    action = doc.to_dict(include_meta=True)
+    if pipeline is not None:
+        action['pipeline'] = pipeline
+    return action
+
+
+def index_tree(ip, rootdir=None, exclude=None, batch_size=None, workers=None):
+    """
+    Indexes every file and directory in the IP to elasticsearch
+
+    The paths are indexed in batches of batch_size, defaulting to
+    ELASTICSEARCH_BATCH_SIZE, with the tags of each batch created in bulk and
+    the documents sent using the bulk API. The content of each file is read
+    when its document is sent.
+
+    :param ip: The IP to index
+    :type ip: InformationPackage
+    :param rootdir: The directory to index, defaults to the path of the IP
+    :type rootdir: str
+    :param exclude: Paths of files that are already indexed
+    :type exclude: set
+    :param batch_size: Number of paths in each batch
+    :type batch_size: int
+    :param workers: Number of threads identifying file formats, defaults
+        to ELASTICSEARCH_INGEST_FORMAT_WORKERS
+    :type workers: int
+    :return: The number of indexed documents
+    :rtype: int
+    """
+
+    if rootdir is None:
+        rootdir = ip.object_path
+    if not batch_size:
+        batch_size = settings.ELASTICSEARCH_BATCH_SIZE
+    if workers is None:
+        workers = getattr(settings, 'ELASTICSEARCH_INGEST_FORMAT_WORKERS', 1)
+
+    types = get_tag_version_types()
+    ip_fields = get_ip_fields(ip)
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def get_actions():
+        paths = iter_tree(rootdir, exclude)
+        while True:
+            batch = list(itertools.islice(paths, batch_size))
+            if not batch:
+                return
+
+            logger.debug('indexing {} paths in {}'.format(len(batch), rootdir))
+            for tag_version in create_tag_versions(ip, batch, types, executor):
+                yield _get_index_action(tag_version, ip_fields)
+
+    indexed = 0
+    try:
+        for _ok, _item in streaming_bulk(get_es_connection(), get_actions(), chunk_size=batch_size):
+            indexed += 1
+    except ElasticsearchException:
+        logger.exception('Failed to index {}'.format(rootdir))
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return indexed
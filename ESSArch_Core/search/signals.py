@@ -0,0 +1,85 @@
+import logging
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from ESSArch_Core.auth.models import GroupGenericObjects
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.search.acl import schedule_acl_update
+from ESSArch_Core.tags.models import TagVersion
+
+logger = logging.getLogger('essarch.search')
+
+
+def _get_content_object(instance, object_id):
+    model = instance.content_type.model_class()
+    if model not in (InformationPackage, TagVersion):
+        return None
+
+    return model.objects.filter(pk=object_id).first()
+
+
+@receiver(post_save, sender=GroupGenericObjects)
+@receiver(post_delete, sender=GroupGenericObjects)
+def group_generic_object_changed(sender, instance, **kwargs):
+    obj = _get_content_object(instance, instance.object_id)
+    if obj is not None:
+        schedule_acl_update(obj)
+
+
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+def object_permission_changed(sender, instance, **kwargs):
+    obj = _get_content_object(instance, instance.object_pk)
+    if obj is not None:
+        schedule_acl_update(obj)
+
+
+# the value of a field that has not been loaded
+UNCHANGED = object()
+
+
+def _record_indexed_value(instance, attr, field):
+    # deferred fields are not loaded and not in __dict__
+    setattr(instance, attr, instance.__dict__.get(field, UNCHANGED))
+
+
+def _is_changed(instance, attr, field, created, update_fields):
+    """
+    Checks if field has been saved with a value other than the one recorded
+    in attr, and records the saved value
+    """
+
+    model_field = instance._meta.get_field(field)
+    if update_fields is not None and not {model_field.name, model_field.attname} & set(update_fields):
+        return False
+
+    old = getattr(instance, attr, UNCHANGED)
+    value = getattr(instance, field)
+    setattr(instance, attr, value)
+    return not created and old is not UNCHANGED and old != value
+
+
+@receiver(post_init, sender=InformationPackage)
+def ip_post_init(sender, instance, **kwargs):
+    _record_indexed_value(instance, '_indexed_responsible_id', 'responsible_id')
+
+
+@receiver(post_save, sender=InformationPackage)
+def ip_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if _is_changed(instance, '_indexed_responsible_id', 'responsible_id', created, update_fields):
+        schedule_acl_update(instance)
+
+
+@receiver(post_init, sender=TagVersion)
+def tag_version_post_init(sender, instance, **kwargs):
+    _record_indexed_value(instance, '_indexed_security_level', 'security_level')
+
+
+@receiver(post_save, sender=TagVersion)
+def tag_version_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if _is_changed(instance, '_indexed_security_level', 'security_level', created, update_fields):
+        schedule_acl_update(instance)
@@ -0,0 +1,36 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ESSArch_Core.search.acl import (
+    DOCUMENTS_WITHOUT_ACL_CACHE_KEY,
+    has_documents_without_acl,
+)
+
+
+@mock.patch('ESSArch_Core.search.acl.Search')
+class HasDocumentsWithoutAclTests(TestCase):
+    def setUp(self):
+        cache.delete(DOCUMENTS_WITHOUT_ACL_CACHE_KEY)
+        self.addCleanup(cache.delete, DOCUMENTS_WITHOUT_ACL_CACHE_KEY)
+
+    def test_found(self, mock_search):
+        mock_search.return_value.query.return_value.params.return_value.count.return_value = 1
+
+        self.assertTrue(has_documents_without_acl())
+        mock_search.return_value.query.return_value.params.assert_called_once_with(
+            ignore_unavailable=True, terminate_after=1,
+        )
+
+    def test_not_found(self, mock_search):
+        mock_search.return_value.query.return_value.params.return_value.count.return_value = 0
+
+        self.assertFalse(has_documents_without_acl())
+
+    def test_cached(self, mock_search):
+        mock_search.return_value.query.return_value.params.return_value.count.return_value = 0
+
+        self.assertFalse(has_documents_without_acl())
+        self.assertFalse(has_documents_without_acl())
+        mock_search.assert_called_once()
@@ -0,0 +1,60 @@
+import base64
+import io
+
+from django.test import SimpleTestCase, override_settings
+
+from ESSArch_Core.search.attachment import (
+    encode_file,
+    extract_text,
+    read_attachment,
+)
+
+
+class EncodeFileTests(SimpleTestCase):
+    def test_chunked(self):
+        for size in range(10):
+            data = bytes(range(size))
+            self.assertEqual(encode_file(io.BytesIO(data), chunk_size=3), base64.b64encode(data).decode('ascii'))
+
+
+class ExtractTextTests(SimpleTestCase):
+    def test_truncated(self):
+        f = io.BytesIO('åäö abc'.encode('utf-8'))
+        self.assertEqual(extract_text(f, 5, chunk_size=1), 'åäö a')
+
+    def test_shorter_than_max_chars(self):
+        f = io.BytesIO('åäö'.encode('utf-8'))
+        self.assertEqual(extract_text(f, 100, chunk_size=2), 'åäö')
+
+    def test_invalid_bytes(self):
+        f = io.BytesIO(b'a\xffb')
+        self.assertEqual(extract_text(f, 100), 'ab')
+
+
+@override_settings(ELASTICSEARCH_ATTACHMENT_MAX_SIZE=10, ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS=-1)
+class ReadAttachmentTests(SimpleTestCase):
+    def test_small_file(self):
+        self.assertEqual(
+            read_attachment(io.BytesIO(b'foo'), 'foo.pdf', 3),
+            {'data': base64.b64encode(b'foo').decode('ascii')},
+        )
+
+    def test_unknown_size(self):
+        f = io.BytesIO(b'foo')
+        f.seek(2)
+        self.assertEqual(read_attachment(f, 'foo.pdf', None), {'data': base64.b64encode(b'foo').decode('ascii')})
+
+        self.assertEqual(read_attachment(io.BytesIO(b'x' * 11), 'foo.pdf', None), {})
+
+    def test_large_file(self):
+        self.assertEqual(read_attachment(io.BytesIO(b'x' * 11), 'foo.pdf', 11), {})
+
+    def test_large_text_file(self):
+        self.assertEqual(read_attachment(io.BytesIO(b'x' * 11), 'foo.txt', 11), {
+            'attachment': {'content': 'x' * 10, 'content_length': 10, 'content_type': 'text/plain'},
+        })
+
+    @override_settings(ELASTICSEARCH_ATTACHMENT_INDEXED_CHARS=4)
+    def test_large_text_file_with_indexed_chars(self):
+        attachment = read_attachment(io.BytesIO(b'x' * 11), 'foo.txt', 11)['attachment']
+        self.assertEqual(attachment['content'], 'xxxx')
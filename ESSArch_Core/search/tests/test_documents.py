@@ -0,0 +1,113 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from elasticsearch.helpers import BulkIndexError
+from elasticsearch_dsl import Keyword
+
+from ESSArch_Core.search.documents import DocumentBase
+
+User = get_user_model()
+
+
+class UserDocument(DocumentBase):
+    username = Keyword()
+
+    index_prefetch_related = ('groups',)
+
+    @classmethod
+    def get_model(cls):
+        return User
+
+    @classmethod
+    def from_obj(cls, obj):
+        return cls(_id=str(obj.pk), username=obj.username)
+
+    class Index:
+        name = 'test_user'
+
+
+def fake_streaming_bulk(client, actions, **kwargs):
+    for action in actions:
+        yield True, {'index': {'_id': action['_id']}}
+
+
+@mock.patch('ESSArch_Core.search.documents.get_es_connection')
+@mock.patch('ESSArch_Core.search.documents.es_helpers.streaming_bulk', side_effect=fake_streaming_bulk)
+@mock.patch.object(UserDocument._index, 'refresh')
+class PerformIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username='user{}'.format(i)) for i in range(10)]
+        cls.queryset = User.objects.filter(username__startswith='user')
+
+    def get_indexed_ids(self, mock_bulk):
+        return [action['_id'] for c in mock_bulk.call_args_list for action in c.kwargs['actions']]
+
+    def test_batches_are_fetched_by_primary_key(self, mock_refresh, mock_bulk, mock_conn):
+        with self.assertNumQueries(1 + 4 * 2):
+            # one count, then 4 batches with a prefetch query each
+            progress = UserDocument.index_documents(queryset=self.queryset, batch_size=3)
+
+        self.assertEqual(mock_bulk.call_count, 4)
+        self.assertEqual(self.get_indexed_ids(mock_bulk), [str(u.pk) for u in self.users])
+        self.assertEqual((progress.total, progress.indexed, progress.failed), (10, 10, 0))
+        mock_refresh.assert_called_once_with()
+
+    def test_no_offset_is_used(self, mock_refresh, mock_bulk, mock_conn):
+        with CaptureQueriesContext(connection) as ctx:
+            UserDocument.index_documents(queryset=self.queryset, batch_size=3)
+
+        self.assertFalse(any('OFFSET' in q['sql'] for q in ctx.captured_queries))
+
+    def test_empty_queryset(self, mock_refresh, mock_bulk, mock_conn):
+        progress = UserDocument.index_documents(queryset=User.objects.none())
+
+        self.assertEqual(progress.total, 0)
+        mock_bulk.assert_not_called()
+        mock_refresh.assert_not_called()
+
+    @override_settings(ELASTICSEARCH_INDEX_QUEUE_SIZE=1)
+    def test_concurrent(self, mock_refresh, mock_bulk, mock_conn):
+        callback = mock.Mock()
+        progress = UserDocument.index_documents(
+            queryset=self.queryset, batch_size=2, workers=3, progress_callback=callback,
+        )
+
+        self.assertEqual(mock_bulk.call_count, 5)
+        self.assertCountEqual(self.get_indexed_ids(mock_bulk), [str(u.pk) for u in self.users])
+        self.assertEqual(progress.indexed, 10)
+        self.assertEqual(callback.call_count, 5)
+
+    def test_failed_documents(self, mock_refresh, mock_bulk, mock_conn):
+        def fail_first(client, actions, **kwargs):
+            for i, action in enumerate(actions):
+                yield i != 0, {'index': {'_id': action['_id']}}
+
+        mock_bulk.side_effect = fail_first
+
+        with self.assertRaises(BulkIndexError) as cm:
+            UserDocument.index_documents(queryset=self.queryset, batch_size=5)
+
+        self.assertEqual(len(cm.exception.errors), 2)
+        # all batches are sent even if some documents fail
+        self.assertEqual(mock_bulk.call_count, 2)
+
+
+@mock.patch('ESSArch_Core.search.documents.get_es_connection')
+@mock.patch('ESSArch_Core.search.documents.es_helpers.bulk')
+class RemoveStaleTests(TestCase):
+    def test_remove_stale(self, mock_bulk, mock_conn):
+        users = [User.objects.create(username='user{}'.format(i)) for i in range(3)]
+        index_ids = [str(u.pk) for u in users] + ['99998', '99999']
+        hits = [mock.Mock(meta=mock.Mock(id=index_id)) for index_id in index_ids]
+
+        with mock.patch.object(UserDocument, 'search') as mock_search:
+            mock_search.return_value.source.return_value.params.return_value.scan.return_value = iter(hits)
+            UserDocument.remove_stale(User.objects.all(), 2)
+
+        actions = list(mock_bulk.call_args.kwargs['actions'])
+        self.assertEqual([a['_id'] for a in actions], ['99998', '99999'])
+        self.assertTrue(all(a['_op_type'] == 'delete' for a in actions))
@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from elasticsearch.exceptions import NotFoundError
+
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.search.ingest import (
+    create_document,
+    create_tag_versions,
+    get_tag_version_types,
+    identify_formats,
+    index_tree,
+    iter_tree,
+)
+from ESSArch_Core.tags.documents import Directory, File, get_ip_fields
+from ESSArch_Core.tags.models import Tag, TagVersion
+from ESSArch_Core.tags.tests.test_search import ESSArchSearchBaseTestCase
+
+
+class IngestTestCase(TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.ip = InformationPackage.objects.create(object_path=self.datadir)
+
+    def create_file(self, *path, content='foo'):
+        filepath = os.path.join(self.datadir, *path)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as f:
+            f.write(content)
+        return filepath
+
+
+class IterTreeTests(IngestTestCase):
+    def test_iter_tree(self):
+        foo = self.create_file('foo.txt')
+        bar = self.create_file('nested', 'bar.txt')
+        baz = self.create_file('nested', 'baz.txt')
+
+        self.assertCountEqual(list(iter_tree(self.datadir)), [
+            (os.path.join(self.datadir, 'nested'), False),
+            (foo, True),
+            (bar, True),
+            (baz, True),
+        ])
+
+    def test_exclude(self):
+        foo = self.create_file('foo.txt')
+        bar = self.create_file('bar.txt')
+
+        self.assertEqual(list(iter_tree(self.datadir, exclude={foo})), [(bar, True)])
+
+
+class IdentifyFormatsTests(IngestTestCase):
+    def test_same_order_with_threads(self):
+        files = [self.create_file('{}.txt'.format(i)) for i in range(10)]
+        files.append(self.create_file('foo.pdf', content='%PDF-1.4'))
+
+        expected = identify_formats(files)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(identify_formats(files, executor), expected)
+
+
+class CreateTagVersionsTests(IngestTestCase):
+    def test_create(self):
+        filepath = self.create_file('nested', 'foo.txt')
+        dirpath = os.path.dirname(filepath)
+        types = get_tag_version_types()
+
+        directory, document = create_tag_versions(self.ip, [(dirpath, False), (filepath, True)], types)
+
+        directory.refresh_from_db()
+        self.assertEqual(directory.tag.information_package, self.ip)
+        self.assertEqual(directory.tag.current_version, directory)
+        self.assertEqual(directory.elastic_index, 'directory')
+        self.assertEqual(directory.type, types['directory'])
+        self.assertEqual(directory.name, 'nested')
+        self.assertEqual(directory.custom_fields, {'href': ''})
+
+        document.refresh_from_db()
+        self.assertEqual(document.tag.information_package, self.ip)
+        self.assertEqual(document.tag.current_version, document)
+        self.assertEqual(document.elastic_index, 'document')
+        self.assertEqual(document.type, types['document'])
+        self.assertEqual(document.name, 'foo.txt')
+        self.assertEqual(document.custom_fields['href'], 'nested')
+        self.assertEqual(document.custom_fields['dirname'], dirpath)
+        self.assertEqual(document.custom_fields['extension'], 'txt')
+        self.assertEqual(document.custom_fields['size'], 3)
+
+    def test_constant_number_of_queries(self):
+        types = get_tag_version_types()
+
+        def count_queries(n):
+            paths = [(self.create_file('{}_{}.txt'.format(n, i)), True) for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                create_tag_versions(self.ip, paths, types)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(2), count_queries(20))
+        self.assertEqual(TagVersion.objects.count(), 22)
+        self.assertEqual(Tag.objects.filter(current_version__isnull=True).count(), 0)
+
+
+class CreateDocumentTests(IngestTestCase):
+    @mock.patch('ESSArch_Core.tags.documents.File.get', side_effect=NotFoundError)
+    def test_same_as_from_obj(self, mock_get):
+        filepath = self.create_file('nested', 'foo.txt')
+        dirpath = os.path.dirname(filepath)
+        paths = [(dirpath, False), (filepath, True)]
+        ip_fields = get_ip_fields(self.ip)
+
+        for tag_version in create_tag_versions(self.ip, paths, get_tag_version_types()):
+            tag_version.refresh_from_db()
+            doc_class = File if tag_version.elastic_index == 'document' else Directory
+
+            self.assertEqual(
+                create_document(tag_version, ip_fields).to_dict(include_meta=True),
+                doc_class.from_obj(tag_version).to_dict(include_meta=True),
+            )
+
+
+@mock.patch('ESSArch_Core.search.ingest.get_es_connection')
+@mock.patch('ESSArch_Core.search.ingest.streaming_bulk')
+class IndexTreeTests(IngestTestCase):
+    def setUp(self):
+        super().setUp()
+
+        def consume(client, actions, **kwargs):
+            self.actions = list(actions)
+            return [(True, {}) for _ in self.actions]
+
+        self.consume = consume
+
+    def test_index_tree(self, mock_streaming_bulk, mock_get_es_connection):
+        mock_streaming_bulk.side_effect = self.consume
+        foo = self.create_file('foo.txt', content='hello')
+        self.create_file('nested', 'bar.txt')
+        self.create_file('nested', 'baz.txt')
+
+        self.assertEqual(index_tree(self.ip, batch_size=2, exclude={foo}), 3)
+
+        self.assertEqual(TagVersion.objects.filter(elastic_index='directory').count(), 1)
+        self.assertEqual(TagVersion.objects.filter(elastic_index='document').count(), 2)
+        self.assertFalse(TagVersion.objects.filter(name='foo.txt').exists())
+
+        docs = [action for action in self.actions if action['_index'] == 'document']
+        self.assertEqual(len(docs), 2)
+        for doc in docs:
+            self.assertEqual(doc['pipeline'], 'ingest_attachment')
+            self.assertEqual(doc['_source']['ip'], str(self.ip.pk))
+            self.assertIn('data', doc['_source'])
+
+    def test_excluded_file_formats(self, mock_streaming_bulk, mock_get_es_connection):
+        mock_streaming_bulk.side_effect = self.consume
+        self.create_file('foo.txt')
+
+        with mock.patch('ESSArch_Core.search.ingest.identify_formats', return_value=[('name', '1', 'x-fmt/111')]):
+            with override_settings(EXCLUDE_FILE_FORMAT_FROM_INDEXING_CONTENT=['x-fmt/111']):
+                index_tree(self.ip)
+
+        doc, = self.actions
+        self.assertNotIn('pipeline', doc)
+        self.assertNotIn('data', doc['_source'])
+        self.assertEqual(doc['_source']['formatkey'], 'x-fmt/111')
+
+    @override_settings(ELASTICSEARCH_ATTACHMENT_MAX_SIZE=4)
+    def test_large_files(self, mock_streaming_bulk, mock_get_es_connection):
+        mock_streaming_bulk.side_effect = self.consume
+        self.create_file('foo.txt', content='hello world')
+        self.create_file('foo.pdf', content='%PDF-1.4')
+
+        index_tree(self.ip)
+
+        docs = {action['_source']['filename']: action for action in self.actions}
+        self.assertNotIn('pipeline', docs['foo.txt'])
+        self.assertEqual(docs['foo.txt']['_source']['attachment']['content'], 'hell')
+        self.assertNotIn('pipeline', docs['foo.pdf'])
+        self.assertNotIn('data', docs['foo.pdf']['_source'])
+        self.assertNotIn('attachment', docs['foo.pdf']['_source'])
+
+
+class IndexTreeSearchTests(ESSArchSearchBaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.ip = InformationPackage.objects.create(object_path=self.datadir)
+
+    def test_index_tree(self):
+        os.makedirs(os.path.join(self.datadir, 'nested'))
+        with open(os.path.join(self.datadir, 'nested', 'foo.txt'), 'w') as f:
+            f.write('hello world')
+
+        self.assertEqual(index_tree(self.ip), 2)
+        File._index.refresh()
+        Directory._index.refresh()
+
+        doc = File.search().filter('term', ip=str(self.ip.pk)).execute()[0]
+        self.assertEqual(doc.filename, 'foo.txt')
+        self.assertEqual(doc.href, 'nested')
+        self.assertEqual(doc.attachment.content, 'hello world')
+        self.assertEqual(Directory.search().filter('term', ip=str(self.ip.pk)).count(), 1)
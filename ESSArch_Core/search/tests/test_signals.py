@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from ESSArch_Core.auth.models import Group, GroupType
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.tags.models import Tag, TagVersion, TagVersionType
+
+User = get_user_model()
+
+
+@mock.patch('ESSArch_Core.search.acl.update_archive_acl')
+@mock.patch('ESSArch_Core.search.acl.update_ip_acl')
+class AclSignalsTests(TestCase):
+    def setUp(self):
+        self.org_group_type = GroupType.objects.create(label='organization')
+        self.group = Group.objects.create(name='organization', group_type=self.org_group_type)
+        self.user = User.objects.create(username="user")
+
+    def test_ip_added_to_organization(self, mock_update_ip_acl, mock_update_archive_acl):
+        ip = InformationPackage.objects.create()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.add_object(ip)
+
+        mock_update_ip_acl.assert_called_once_with(ip)
+        mock_update_archive_acl.assert_not_called()
+
+    def test_ip_responsible_changed(self, mock_update_ip_acl, mock_update_archive_acl):
+        ip = InformationPackage.objects.create()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ip.label = 'foo'
+            ip.save()
+        mock_update_ip_acl.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ip.responsible = self.user
+            ip.save()
+        mock_update_ip_acl.assert_called_once_with(ip)
+
+        mock_update_ip_acl.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            ip.label = 'bar'
+            ip.save(update_fields=['label'])
+        mock_update_ip_acl.assert_not_called()
+
+    def test_archive_security_level_changed(self, mock_update_ip_acl, mock_update_archive_acl):
+        tag_type = TagVersionType.objects.create(name='archive', archive_type=True)
+        archive = TagVersion.objects.create(
+            tag=Tag.objects.create(), name='archive', type=tag_type, elastic_index='archive',
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.name = 'renamed'
+            archive.save()
+        mock_update_archive_acl.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.security_level = 2
+            archive.save()
+        mock_update_archive_acl.assert_called_once_with(archive)
+        mock_update_ip_acl.assert_not_called()
+
+    def test_ip_loaded_from_database(self, mock_update_ip_acl, mock_update_archive_acl):
+        ip = InformationPackage.objects.create()
+        ip = InformationPackage.objects.get(pk=ip.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ip.responsible = self.user
+            ip.save(update_fields=['responsible'])
+        mock_update_ip_acl.assert_called_once_with(ip)
+
+        mock_update_ip_acl.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            ip.save()
+        mock_update_ip_acl.assert_not_called()
+
+    def test_ip_saved_without_querying_old_values(self, mock_update_ip_acl, mock_update_archive_acl):
+        ip = InformationPackage.objects.create()
+
+        with self.assertNumQueries(1):
+            ip.responsible = self.user
+            ip.save(update_fields=['responsible'])
+
+    def test_ip_with_deferred_responsible(self, mock_update_ip_acl, mock_update_archive_acl):
+        ip = InformationPackage.objects.create(responsible=self.user)
+        ip = InformationPackage.objects.only('label').get(pk=ip.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ip.label = 'foo'
+            ip.save(update_fields=['label'])
+        mock_update_ip_acl.assert_not_called()
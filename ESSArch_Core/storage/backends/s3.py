@@ -1,45 +1,190 @@
-import errno
 import io
 import logging
 import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from os import walk
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from django.conf import settings
 
 from ESSArch_Core.storage.backends.base import BaseStorageBackend
 from ESSArch_Core.storage.copy import DEFAULT_BLOCK_SIZE
 from ESSArch_Core.storage.models import CAS, StorageObject
+from ESSArch_Core.storage.tape import _extract_stream
+from ESSArch_Core.util import bounded_map
 
 logger = logging.getLogger('essarch.storage.backends.s3')
-AWS = settings.AWS
 
-s3 = boto3.resource('s3',
-                    aws_access_key_id=AWS.get('ACCESS_KEY_ID'),
-                    aws_secret_access_key=AWS.get('SECRET_ACCESS_KEY'),
-                    endpoint_url=AWS.get('ENDPOINT_URL'))
+MB = 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """
+    Returns the S3 client shared by all threads, with a connection pool large
+    enough for concurrent objects and concurrent parts of each object
+    """
+
+    AWS = getattr(settings, 'AWS', {})
+    max_pool_connections = max(
+        getattr(settings, 'S3_OBJECT_WORKERS', 4) * getattr(settings, 'S3_MULTIPART_CONCURRENCY', 8), 10,
+    )
+
+    return boto3.client(
+        's3',
+        aws_access_key_id=AWS.get('ACCESS_KEY_ID'),
+        aws_secret_access_key=AWS.get('SECRET_ACCESS_KEY'),
+        endpoint_url=AWS.get('ENDPOINT_URL'),
+        config=Config(max_pool_connections=max_pool_connections),
+    )
+
+
+def get_transfer_config():
+    chunk_size = getattr(settings, 'S3_MULTIPART_CHUNK_SIZE', 8 * MB)
+    return TransferConfig(
+        multipart_threshold=chunk_size,
+        multipart_chunksize=chunk_size,
+        max_concurrency=getattr(settings, 'S3_MULTIPART_CONCURRENCY', 8),
+        use_threads=True,
+    )
+
+
+def run_concurrently(func, args_list, workers=None):
+    """
+    Calls func with each tuple of arguments in args_list, at most workers
+    (defaults to settings.S3_OBJECT_WORKERS) at a time
+    """
+
+    if workers is None:
+        workers = getattr(settings, 'S3_OBJECT_WORKERS', 4)
+    workers = max(int(workers), 1)
+
+    if workers == 1:
+        for args in args_list:
+            func(*args)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in bounded_map(executor, func, args_list, workers * 2):
+            pass
+
+
+class S3ObjectFile(io.RawIOBase):
+    """
+    Read-only, seekable file reading an S3 object with ranged GET requests
+    """
+
+    def __init__(self, bucket, key, client=None):
+        self._client = client if client is not None else get_client()
+        self._bucket = bucket
+        self._key = key
+        self._size = self._client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self._pos = 0
+        self.name = key
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self._size - self._pos)
+        if n <= 0:
+            return 0
+
+        byte_range = 'bytes={}-{}'.format(self._pos, self._pos + n - 1)
+        body = self._client.get_object(Bucket=self._bucket, Key=self._key, Range=byte_range)['Body']
+        try:
+            data = body.read()
+        finally:
+            body.close()
+
+        n = len(data)
+        memoryview(b)[:n] = data
+        self._pos += n
+        return n
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            new_pos = pos
+        elif whence == io.SEEK_CUR:
+            new_pos = self._pos + pos
+        elif whence == io.SEEK_END:
+            new_pos = self._size + pos
+        else:
+            raise ValueError('Invalid whence ({})'.format(whence))
+
+        if new_pos < 0:
+            raise OSError('Negative seek position {}'.format(new_pos))
+
+        self._pos = new_pos
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def open_object(bucket, key, mode='rb', buffer_size=MB):
+    """
+    Opens an S3 object as a seekable file, each ranged GET request reads at
+    least buffer_size bytes
+    """
+
+    f = io.BufferedReader(S3ObjectFile(bucket, key), buffer_size=buffer_size)
+    if 'b' in mode:
+        return f
+    return io.TextIOWrapper(f)
 
 
 class S3StorageBackend(BaseStorageBackend):
     type = CAS
 
     def _extract(self, storage_object, dst):
-        raise NotImplementedError
+        bucket_name, key = storage_object.content_location_value.split('/', 1)
+        logger.debug('Extracting {src} to {dst}'.format(src=storage_object.content_location_value, dst=dst))
+
+        # the container is extracted while it is downloaded, without a local
+        # copy of it
+        body = get_client().get_object(Bucket=bucket_name, Key=key)['Body']
+        try:
+            with tarfile.open(fileobj=body, mode='r|*') as t:
+                root = _extract_stream(t, dst)
+        finally:
+            body.close()
 
-    def open(self, storage_object, file, *args, **kwargs):
-        data = io.StringIO()
+        return os.path.join(dst, root)
+
+    def open(self, storage_object, file, mode='r', *args, **kwargs):
         bucket_name, key = storage_object.content_location_value.split('/', 1)
-        key = os.path.join(key, file)
-        bucket = s3.Bucket(bucket_name)
-        bucket.download_fileobj(key, data)
-        data.seek(0)
-        return data
+
+        if storage_object.container:
+            tar = tarfile.open(fileobj=open_object(bucket_name, key), mode='r:')
+            name = os.path.join(storage_object.ip.object_identifier_value, file)
+            try:
+                f = tar.extractfile(name)
+            except KeyError:
+                raise FileNotFoundError('{} not found in {}'.format(name, key))
+
+            if f is None:
+                raise IsADirectoryError('{} in {} is not a file'.format(name, key))
+
+            if 'b' in mode:
+                return f
+            return io.TextIOWrapper(f)
+
+        return open_object(bucket_name, os.path.join(key, file), mode)
 
     def read(self, storage_object, dst, extract=False, include_xml=True, block_size=DEFAULT_BLOCK_SIZE):
         ip = storage_object.ip
+        client = get_client()
+        config = get_transfer_config()
 
         bucket_name, key = storage_object.content_location_value.split('/', 1)
-        bucket = s3.Bucket(bucket_name)
 
         if storage_object.container:
             src_tar = key
@@ -50,17 +195,29 @@ class S3StorageBackend(BaseStorageBackend):
             dst_aic_xml = os.path.join(dst, os.path.basename(src_aic_xml))
 
             if include_xml:
-                bucket.download_file(src_xml, dst_xml)
-                bucket.download_file(src_aic_xml, dst_aic_xml)
+                run_concurrently(
+                    lambda src, dst: client.download_file(bucket_name, src, dst, Config=config),
+                    [(src_xml, dst_xml), (src_aic_xml, dst_aic_xml)],
+                )
             if extract:
                 return self._extract(storage_object, dst)
             else:
-                bucket.download_file(src_tar, dst_tar)
+                client.download_file(bucket_name, src_tar, dst_tar, Config=config)
                 return dst_tar
         else:
-            for object_summary in bucket.objects.filter(Prefix=key):
-                dst_file = os.path.join(dst, os.path.basename(object_summary.key))
-                bucket.download_file(object_summary.key, dst_file)
+            def download(src, dst_file):
+                os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+                client.download_file(bucket_name, src, dst_file, Config=config)
+
+            # the content of the directory is written into dst, like
+            # copying it from disk
+            prefix = key.rstrip('/')
+            paginator = client.get_paginator('list_objects_v2')
+            run_concurrently(download, (
+                (obj['Key'], os.path.join(dst, os.path.relpath(obj['Key'], prefix)))
+                for page in paginator.paginate(Bucket=bucket_name, Prefix=key.rstrip('/') + '/')
+                for obj in page.get('Contents', [])
+            ))
             return dst
 
     def write(self, src, ip, container, storage_medium, block_size=DEFAULT_BLOCK_SIZE):
@@ -70,28 +227,33 @@ class S3StorageBackend(BaseStorageBackend):
         logger.debug('Writing {src} to {dst}'.format(src=', '.join(src), dst=dst))
 
         bucket_name = dst
-        bucket = s3.Bucket(bucket_name)
+        client = get_client()
+        config = get_transfer_config()
 
         content_location_value = None
+        uploads = []
         for f in src:
-            try:
+            if not os.path.isdir(f):
                 key = os.path.basename(f)
-                bucket.upload_file(f, key)
+                uploads.append((f, key))
                 if content_location_value is None:
                     content_location_value = '{}/{}'.format(bucket_name, key)
-            except IOError as e:
-                if e.errno != errno.EISDIR:
-                    raise
+                continue
 
-                parent_dir = os.path.dirname(f)
-                for root, _dirs, files in walk(f):
-                    for fi in files:
-                        srcf = os.path.join(root, fi)
-                        dstf = os.path.relpath(os.path.join(root, fi), parent_dir)
-                        bucket.upload_file(srcf, dstf)
+            parent_dir = os.path.dirname(f)
+            for root, _dirs, files in walk(f):
+                for fi in files:
+                    srcf = os.path.join(root, fi)
+                    dstf = os.path.relpath(os.path.join(root, fi), parent_dir)
+                    uploads.append((srcf, dstf))
 
-                if content_location_value is None:
-                    content_location_value = '{}/{}'.format(bucket_name, os.path.basename(f))
+            if content_location_value is None:
+                content_location_value = '{}/{}'.format(bucket_name, os.path.basename(f))
+
+        run_concurrently(
+            lambda srcf, key: client.upload_file(srcf, bucket_name, key, Config=config),
+            uploads,
+        )
 
         return StorageObject.objects.create(
             content_location_value=content_location_value,
@@ -102,5 +264,9 @@ class S3StorageBackend(BaseStorageBackend):
 
     def delete(self, storage_object):
         bucket_name, key = storage_object.content_location_value.split('/', 1)
-        bucket = s3.Bucket(bucket_name)
-        bucket.objects.filter(Prefix=key).delete()
+        client = get_client()
+        paginator = client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=key):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                client.delete_objects(Bucket=bucket_name, Delete={'Objects': objects})
@@ -2,7 +2,6 @@ import errno
 import logging
 import os
 import shutil
-import tarfile
 import tempfile
 
 from celery.result import allow_join_result
@@ -11,13 +10,12 @@ from django.db.models.functions import Cast
 from django.utils import timezone
 
 from ESSArch_Core.storage.backends.base import BaseStorageBackend
-from ESSArch_Core.storage.copy import copy
 from ESSArch_Core.storage.exceptions import StorageMediumFull
 from ESSArch_Core.storage.models import TAPE, StorageObject, TapeDrive
 from ESSArch_Core.storage.tape import (
     DEFAULT_TAPE_BLOCK_SIZE,
-    read_tape,
     set_tape_file_number,
+    stream_tape,
     write_to_tape,
 )
 from ESSArch_Core.WorkflowEngine.models import ProcessTask
@@ -25,6 +23,22 @@ from ESSArch_Core.WorkflowEngine.models import ProcessTask
 logger = logging.getLogger('essarch.storage.backends.tape')
 
 
+def _move_content(src, dst):
+    """
+    Moves the content of the directory src into the directory dst, merging
+    it with any directories already in dst
+    """
+
+    for entry in os.listdir(src):
+        src_entry = os.path.join(src, entry)
+        dst_entry = os.path.join(dst, entry)
+
+        if os.path.isdir(dst_entry) and os.path.isdir(src_entry) and not os.path.islink(src_entry):
+            _move_content(src_entry, dst_entry)
+        else:
+            os.replace(src_entry, dst_entry)
+
+
 class TapeStorageBackend(BaseStorageBackend):
     type = TAPE
 
@@ -48,69 +62,80 @@ class TapeStorageBackend(BaseStorageBackend):
 
         return self.prepare_for_io(storage_medium)
 
-    def read(self, storage_object, dst, extract=False, include_xml=True, block_size=DEFAULT_TAPE_BLOCK_SIZE):
+    def read(self, storage_object, dst, extract=False, include_xml=True, block_size=DEFAULT_TAPE_BLOCK_SIZE,
+             member=None):
+        """
+        Streams the storage object from tape into dst, in the same way as
+        copying it from disk.
+
+        Content that isn't a container is written into the directory dst. A
+        container is written into dst if it is a directory and to the path dst
+        otherwise, with its xml files next to it.
+
+        If member is given, only that member (e.g. the package xml) is read
+        and the rest of the tape file is never written to disk.
+        """
+
         tape_pos = int(storage_object.content_location_value)
         medium = storage_object.storage_medium
         ip = storage_object.ip
         block_size = medium.block_size * 512
 
-        # TODO: Create temp dir inside configured temp directory
-        tmp_path = tempfile.mkdtemp()
-
         try:
             drive = TapeDrive.objects.get(storage_medium=medium)
         except TapeDrive.DoesNotExist:
             raise ValueError("Tape not mounted")
 
-        set_tape_file_number(drive.device, tape_pos)
-        read_tape(drive.device, path=tmp_path, block_size=block_size)
-
-        drive.last_change = timezone.now()
-        drive.save(update_fields=['last_change'])
-
-        src = os.path.join(tmp_path, ip.object_identifier_value)
         if storage_object.container:
-            src_tar = src + '.tar'
-            src_xml = src + '.xml'
-            src_aic_xml = os.path.join(tmp_path, str(ip.aic.pk)) + '.xml'
-
-            if include_xml:
-                copy(src_xml, dst, block_size=block_size)
-                copy(src_aic_xml, dst, block_size=block_size)
-            if extract:
-                with tarfile.open(src_tar) as t:
-                    root = os.path.commonprefix(t.getnames())
-                    def is_within_directory(directory, target):
-                        
-                        abs_directory = os.path.abspath(directory)
-                        abs_target = os.path.abspath(target)
-                    
-                        prefix = os.path.commonprefix([abs_directory, abs_target])
-                        
-                        return prefix == abs_directory
-                    
-                    def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-                    
-                        for member in tar.getmembers():
-                            member_path = os.path.join(path, member.name)
-                            if not is_within_directory(path, member_path):
-                                raise Exception("Attempted Path Traversal in Tar File")
-                    
-                        tar.extractall(path, members, numeric_owner=numeric_owner) 
-                        
-                    
-                    safe_extract(t, dst)
-                    new = os.path.join(dst, root)
+            name = ip.object_identifier_value + '.tar'
+            xml_names = [ip.object_identifier_value + '.xml', str(ip.aic.pk) + '.xml']
+
+            if member is not None:
+                members = [member]
+            elif include_xml:
+                members = [name] + xml_names
             else:
-                new = copy(src_tar, dst, block_size=block_size)
+                members = [name]
         else:
-            new = copy(src, dst, block_size=block_size)
+            name = ip.object_identifier_value
+            members = [member if member is not None else name]
+
+        file_target = storage_object.container and not extract and not os.path.isdir(dst)
+        target_dir = os.path.dirname(os.path.abspath(dst)) if file_target else dst
+        os.makedirs(target_dir, exist_ok=True)
 
+        # stream to a directory next to the destination to be able to move
+        # the content in place without copying it again
+        tmp_path = tempfile.mkdtemp(dir=target_dir, prefix='.tape-')
         try:
-            shutil.rmtree(tmp_path)
-        except OSError as e:
-            if e.errno != errno.ENOENT:
-                raise
+            set_tape_file_number(drive.device, tape_pos)
+            written = stream_tape(
+                drive.device, path=tmp_path, block_size=block_size, members=members,
+                extract=[name] if extract and storage_object.container else None,
+            )[members[0]]
+
+            if storage_object.container:
+                root = tmp_path
+                if file_target:
+                    os.replace(written, dst)
+            else:
+                # the tape file has the object identifier as its root, the
+                # content is placed directly in dst
+                root = os.path.join(tmp_path, name)
+
+            _move_content(root, target_dir)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        drive.last_change = timezone.now()
+        drive.save(update_fields=['last_change'])
+
+        if file_target:
+            return dst
+
+        new = os.path.normpath(os.path.join(target_dir, os.path.relpath(written, root)))
+        if written.endswith('/'):
+            new += '/'
         return new
 
     def prepare_for_write(self, storage_medium):
@@ -0,0 +1,181 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from moto import mock_s3
+
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.storage.backends.s3 import (
+    S3ObjectFile,
+    S3StorageBackend,
+    get_client,
+    run_concurrently,
+)
+from ESSArch_Core.storage.models import CAS, StorageMedium, StorageTarget
+
+BUCKET = 'essarch'
+
+
+@mock_s3
+@override_settings(
+    AWS={'ACCESS_KEY_ID': 'testing', 'SECRET_ACCESS_KEY': 'testing'},
+    S3_MULTIPART_CHUNK_SIZE=5 * 1024 * 1024,
+    S3_OBJECT_WORKERS=4,
+)
+@mock.patch.dict(os.environ, {'AWS_DEFAULT_REGION': 'us-east-1'})
+class S3StorageBackendTests(TestCase):
+    def setUp(self):
+        get_client.cache_clear()
+        self.addCleanup(get_client.cache_clear)
+
+        self.client = get_client()
+        self.client.create_bucket(Bucket=BUCKET)
+
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.aic = InformationPackage.objects.create(package_type=InformationPackage.AIC)
+        self.ip = InformationPackage.objects.create(object_identifier_value='ip', aic=self.aic)
+        target = StorageTarget.objects.create(name='s3', type=CAS, target=BUCKET)
+        self.storage_medium = StorageMedium.objects.create(
+            medium_id='s3', storage_target=target, status=20, location_status=50,
+            block_size=1024, format=103,
+        )
+        self.backend = S3StorageBackend()
+
+    def create_file(self, path, content):
+        path = os.path.join(self.datadir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def write_container(self):
+        src = os.path.join(self.datadir, 'src')
+        self.create_file('src/ip/content/a.txt', b'foo')
+        self.create_file('src/ip/content/b.bin', os.urandom(1024))
+
+        tar_path = os.path.join(self.datadir, 'ip.tar')
+        with tarfile.open(tar_path, 'w') as tar:
+            tar.add(os.path.join(src, 'ip'), 'ip')
+
+        xml_path = self.create_file('ip.xml', b'<xml/>')
+        self.client.put_object(Bucket=BUCKET, Key='{}.xml'.format(self.aic.pk), Body=b'<aic/>')
+        return self.backend.write([tar_path, xml_path], self.ip, True, self.storage_medium)
+
+    def test_write_and_read_directory(self):
+        self.create_file('ip/content/a.txt', b'foo')
+        self.create_file('ip/content/sub/b.txt', b'bar')
+        # large enough to be uploaded in multiple parts
+        large = self.create_file('ip/content/large.bin', os.urandom(11 * 1024 * 1024))
+
+        storage_object = self.backend.write(os.path.join(self.datadir, 'ip'), self.ip, False, self.storage_medium)
+        self.assertEqual(storage_object.content_location_value, '{}/ip'.format(BUCKET))
+
+        keys = sorted(obj['Key'] for obj in self.client.list_objects_v2(Bucket=BUCKET)['Contents'])
+        self.assertEqual(keys, ['ip/content/a.txt', 'ip/content/large.bin', 'ip/content/sub/b.txt'])
+        self.assertIn('-', self.client.head_object(Bucket=BUCKET, Key='ip/content/large.bin')['ETag'])
+
+        dst = tempfile.mkdtemp(dir=self.datadir)
+        self.assertEqual(self.backend.read(storage_object, dst), dst)
+        self.assertEqual(os.listdir(dst), ['content'])
+        with open(os.path.join(dst, 'content', 'sub', 'b.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'bar')
+        with open(os.path.join(dst, 'content', 'large.bin'), 'rb') as f, open(large, 'rb') as expected:
+            self.assertEqual(f.read(), expected.read())
+
+    def test_open(self):
+        self.create_file('ip/content/a.txt', b'0123456789')
+        storage_object = self.backend.write(os.path.join(self.datadir, 'ip'), self.ip, False, self.storage_medium)
+
+        with self.backend.open(storage_object, 'content/a.txt', 'rb') as f:
+            f.seek(5)
+            self.assertEqual(f.read(2), b'56')
+            f.seek(-2, io.SEEK_END)
+            self.assertEqual(f.read(), b'89')
+
+        with self.backend.open(storage_object, 'content/a.txt') as f:
+            self.assertEqual(f.read(), '0123456789')
+
+    def test_object_file_uses_ranged_requests(self):
+        self.client.put_object(Bucket=BUCKET, Key='key', Body=b'0123456789')
+        with mock.patch.object(self.client, 'get_object', wraps=self.client.get_object) as mock_get:
+            f = S3ObjectFile(BUCKET, 'key', client=self.client)
+            f.seek(3)
+            self.assertEqual(f.read(4), b'3456')
+            self.assertEqual(f.read(100), b'789')
+            self.assertEqual(f.read(100), b'')
+
+        mock_get.assert_any_call(Bucket=BUCKET, Key='key', Range='bytes=3-6')
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_open_file_in_container(self):
+        storage_object = self.write_container()
+        self.assertEqual(storage_object.content_location_value, '{}/ip.tar'.format(BUCKET))
+
+        with self.backend.open(storage_object, 'content/a.txt', 'rb') as f:
+            self.assertEqual(f.read(), b'foo')
+
+        with self.assertRaises(FileNotFoundError):
+            self.backend.open(storage_object, 'content/missing.txt', 'rb')
+
+    def test_read_container(self):
+        storage_object = self.write_container()
+
+        dst = tempfile.mkdtemp(dir=self.datadir)
+        self.assertEqual(self.backend.read(storage_object, dst), os.path.join(dst, 'ip.tar'))
+        self.assertTrue(os.path.isfile(os.path.join(dst, 'ip.xml')))
+        self.assertTrue(os.path.isfile(os.path.join(dst, '{}.xml'.format(self.aic.pk))))
+
+    def test_read_and_extract_container(self):
+        storage_object = self.write_container()
+
+        dst = tempfile.mkdtemp(dir=self.datadir)
+        with mock.patch.object(self.client, 'download_file') as mock_download:
+            root = self.backend.read(storage_object, dst, extract=True, include_xml=False)
+
+        mock_download.assert_not_called()
+        self.assertEqual(root, os.path.join(dst, 'ip'))
+        with open(os.path.join(dst, 'ip', 'content', 'a.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'foo')
+
+    def test_extract_link_outside_of_destination(self):
+        tar_path = os.path.join(self.datadir, 'ip.tar')
+        with tarfile.open(tar_path, 'w') as tar:
+            member = tarfile.TarInfo('ip/link')
+            member.type = tarfile.SYMTYPE
+            member.linkname = '../../outside'
+            tar.addfile(member)
+        storage_object = self.backend.write([tar_path], self.ip, True, self.storage_medium)
+
+        dst = tempfile.mkdtemp(dir=self.datadir)
+        with self.assertRaisesRegex(Exception, 'Path Traversal'):
+            self.backend.read(storage_object, dst, extract=True, include_xml=False)
+        self.assertFalse(os.path.lexists(os.path.join(dst, 'ip', 'link')))
+
+    def test_delete(self):
+        storage_object = self.write_container()
+        self.backend.delete(storage_object)
+
+        keys = [obj['Key'] for obj in self.client.list_objects_v2(Bucket=BUCKET).get('Contents', [])]
+        self.assertCountEqual(keys, ['ip.xml', '{}.xml'.format(self.aic.pk)])
+
+
+class RunConcurrentlyTests(TestCase):
+    def test_all_called(self):
+        for workers in (1, 4):
+            called = []
+            run_concurrently(lambda a, b: called.append(a + b), [(i, i) for i in range(20)], workers=workers)
+            self.assertCountEqual(called, [i * 2 for i in range(20)])
+
+    def test_exception_is_raised(self):
+        def func(i):
+            if i == 5:
+                raise ValueError
+
+        with self.assertRaises(ValueError):
+            run_concurrently(func, [(i,) for i in range(20)], workers=4)
@@ -0,0 +1,134 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ESSArch_Core.storage.backends.tape import TapeStorageBackend
+from ESSArch_Core.storage.models import TapeDrive
+
+
+class TapeStorageBackendReadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_dir)
+
+        self.device = os.path.join(self.root_dir, 'nst0')
+        self.dst = os.path.join(self.root_dir, 'dst')
+        os.makedirs(self.dst)
+
+        patcher = mock.patch('ESSArch_Core.storage.backends.tape.set_tape_file_number')
+        self.mock_set_tape_file_number = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('ESSArch_Core.storage.backends.tape.TapeDrive.objects.get')
+        self.mock_drive = patcher.start().return_value
+        self.mock_drive.device = self.device
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def add_bytes(tar, name, content):
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+
+    def create_storage_object(self, container):
+        storage_object = mock.Mock(container=container, content_location_value='3')
+        storage_object.storage_medium.block_size = 20
+        storage_object.ip.object_identifier_value = 'objid'
+        storage_object.ip.aic.pk = 1234
+        return storage_object
+
+    def create_container_tape(self):
+        inner = io.BytesIO()
+        with tarfile.open(fileobj=inner, mode='w') as tar:
+            self.add_bytes(tar, 'objid/content/foo.txt', b'foo')
+            self.add_bytes(tar, 'objid/bar.txt', b'bar')
+
+        with tarfile.open(self.device, 'w|') as tar:
+            self.add_bytes(tar, 'objid.tar', inner.getvalue())
+            self.add_bytes(tar, 'objid.xml', b'<xml/>')
+            self.add_bytes(tar, '1234.xml', b'<aic/>')
+
+    def test_read_container(self):
+        self.create_container_tape()
+        storage_object = self.create_storage_object(container=True)
+
+        new = TapeStorageBackend().read(storage_object, self.dst)
+
+        self.mock_set_tape_file_number.assert_called_once_with(self.device, 3)
+        self.assertEqual(new, os.path.join(self.dst, 'objid.tar'))
+        self.assertTrue(tarfile.is_tarfile(new))
+        self.assertTrue(os.path.isfile(os.path.join(self.dst, 'objid.xml')))
+        self.assertTrue(os.path.isfile(os.path.join(self.dst, '1234.xml')))
+        self.mock_drive.save.assert_called_once_with(update_fields=['last_change'])
+
+    def test_read_container_to_file(self):
+        self.create_container_tape()
+        storage_object = self.create_storage_object(container=True)
+        dst = os.path.join(self.root_dir, 'temp', 'objid.tar')
+
+        new = TapeStorageBackend().read(storage_object, dst)
+
+        self.assertEqual(new, dst)
+        self.assertTrue(tarfile.is_tarfile(dst))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(dst))), ['1234.xml', 'objid.tar', 'objid.xml'])
+
+    def test_read_container_extract(self):
+        self.create_container_tape()
+        storage_object = self.create_storage_object(container=True)
+
+        new = TapeStorageBackend().read(storage_object, self.dst, extract=True, include_xml=False)
+
+        self.assertEqual(new, os.path.join(self.dst, 'objid/'))
+        with open(os.path.join(self.dst, 'objid', 'content', 'foo.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'foo')
+        self.assertEqual(sorted(os.listdir(self.dst)), ['objid'])
+
+    def test_read_single_member(self):
+        self.create_container_tape()
+        storage_object = self.create_storage_object(container=True)
+
+        new = TapeStorageBackend().read(storage_object, self.dst, member='objid.xml')
+
+        self.assertEqual(new, os.path.join(self.dst, 'objid.xml'))
+        self.assertEqual(os.listdir(self.dst), ['objid.xml'])
+
+    def test_read_not_container(self):
+        with tarfile.open(self.device, 'w|') as tar:
+            self.add_bytes(tar, 'objid/content/foo.txt', b'foo')
+            self.add_bytes(tar, 'objid/bar.txt', b'bar')
+
+        storage_object = self.create_storage_object(container=False)
+
+        new = TapeStorageBackend().read(storage_object, self.dst)
+
+        self.assertEqual(new, self.dst)
+        self.assertEqual(sorted(os.listdir(self.dst)), ['bar.txt', 'content'])
+        with open(os.path.join(self.dst, 'content', 'foo.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'foo')
+
+    def test_read_not_container_merges_with_dst(self):
+        with tarfile.open(self.device, 'w|') as tar:
+            self.add_bytes(tar, 'objid/content/foo.txt', b'foo')
+
+        os.makedirs(os.path.join(self.dst, 'content'))
+        open(os.path.join(self.dst, 'content', 'baz.txt'), 'w').close()
+        storage_object = self.create_storage_object(container=False)
+
+        TapeStorageBackend().read(storage_object, self.dst)
+
+        self.assertEqual(sorted(os.listdir(self.dst)), ['content'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dst, 'content'))), ['baz.txt', 'foo.txt'])
+
+    def test_read_tape_not_mounted(self):
+        storage_object = self.create_storage_object(container=True)
+
+        with mock.patch('ESSArch_Core.storage.backends.tape.TapeDrive.objects.get',
+                        side_effect=TapeDrive.DoesNotExist):
+            with self.assertRaisesMessage(ValueError, 'Tape not mounted'):
+                TapeStorageBackend().read(storage_object, self.dst)
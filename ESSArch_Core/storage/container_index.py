@@ -0,0 +1,304 @@
+"""
+Indexes of the members of tar and zip containers.
+
+The index of a container maps the name of each regular file in it to the
+offset of its data, its size and its modification time. It is built when a
+container is first accessed and is kept in memory and, if
+CONTAINER_INDEX_PATH is set, in a local SQLite database. Entries are only
+used if the device, inode, size, mtime and ctime of the container are
+unchanged since the index was built.
+
+Members stored uncompressed in uncompressed containers are opened as
+bounded views of the container, without extracting or buffering them.
+"""
+
+import io
+import logging
+import os
+import struct
+import tarfile
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from ESSArch_Core.cache.lru import LRUCache
+from ESSArch_Core.cache.sqlite import LocalSQLiteDatabase
+from ESSArch_Core.fixity.checksum import stat_fingerprint
+
+logger = logging.getLogger('essarch.storage.container_index')
+
+# offset is None for members that can't be read directly from the container,
+# e.g. compressed zip members
+ContainerMember = namedtuple('ContainerMember', 'name offset size mtime')
+
+_ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_ZIP_LOCAL_HEADER_SIGNATURE = b'PK\003\004'
+
+
+class BoundedFile(io.RawIOBase):
+    """
+    Read-only, seekable view of size bytes starting at offset in path
+    """
+
+    def __init__(self, path, offset, size, name=None):
+        self._f = open(path, 'rb', buffering=0)
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self._size - self._pos)
+        if n <= 0:
+            return 0
+
+        self._f.seek(self._offset + self._pos)
+        n = self._f.readinto(memoryview(b)[:n])
+        self._pos += n
+        return n
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            new_pos = pos
+        elif whence == io.SEEK_CUR:
+            new_pos = self._pos + pos
+        elif whence == io.SEEK_END:
+            new_pos = self._size + pos
+        else:
+            raise ValueError('Invalid whence ({})'.format(whence))
+
+        if new_pos < 0:
+            raise OSError('Negative seek position {}'.format(new_pos))
+
+        self._pos = new_pos
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def _get_zip_data_offset(f, info):
+    f.seek(info.header_offset)
+    header = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+    if header[0] != _ZIP_LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipfile('Bad magic number for file header')
+
+    # the local header has its own name and extra field lengths
+    return info.header_offset + _ZIP_LOCAL_HEADER.size + header[-2] + header[-1]
+
+
+def _scan_tar(path):
+    members = OrderedDict()
+    # only uncompressed tar files can be read from directly
+    with tarfile.open(path, 'r:') as tar:
+        for member in tar:
+            if not member.isreg() or member.issparse():
+                # links and sparse files are extracted by tarfile instead
+                members.pop(member.name, None)
+                continue
+
+            members[member.name] = ContainerMember(member.name, member.offset_data, member.size, member.mtime)
+
+    return 'tar', members
+
+
+def _scan_zip(path):
+    members = OrderedDict()
+    with zipfile.ZipFile(path) as zipf, open(path, 'rb') as f:
+        for info in zipf.infolist():
+            if info.is_dir():
+                continue
+
+            offset = None
+            if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                offset = _get_zip_data_offset(f, info)
+
+            members[info.filename] = ContainerMember(info.filename, offset, info.file_size, info.date_time)
+
+    return 'zip', members
+
+
+def scan_container(path):
+    """
+    Reads the members of an uncompressed tar file or a zip file
+
+    Returns:
+        A tuple with the type of container ("tar" or "zip") and an ordered
+        dict of ContainerMember by name
+
+    Raises:
+        tarfile.ReadError: If the container is neither an uncompressed tar
+            file nor a zip file
+    """
+
+    try:
+        return _scan_tar(path)
+    except tarfile.ReadError:
+        if not zipfile.is_zipfile(path):
+            raise
+
+    return _scan_zip(path)
+
+
+class ContainerIndexDatabase(LocalSQLiteDatabase):
+    """
+    Persistent container indexes stored in a local SQLite database
+    """
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS container ('
+        'path TEXT PRIMARY KEY, kind TEXT NOT NULL, '
+        'device INTEGER NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL, '
+        'mtime INTEGER NOT NULL, ctime INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS member ('
+        'container TEXT NOT NULL, position INTEGER NOT NULL, name TEXT NOT NULL, '
+        'offset INTEGER, size INTEGER NOT NULL, mtime TEXT NOT NULL, '
+        'PRIMARY KEY (container, position))',
+    )
+
+    def get(self, path, st):
+        conn = self._get_connection()
+        row = conn.execute(
+            'SELECT kind, device, inode, size, mtime, ctime FROM container WHERE path = ?', (path,),
+        ).fetchone()
+
+        if row is None or tuple(row[1:]) != stat_fingerprint(st):
+            return None
+
+        kind = row[0]
+        members = OrderedDict()
+        for name, offset, size, mtime in conn.execute(
+            'SELECT name, offset, size, mtime FROM member WHERE container = ? ORDER BY position', (path,),
+        ):
+            mtime = float(mtime) if kind == 'tar' else tuple(int(v) for v in mtime.split(','))
+            members[name] = ContainerMember(name, offset, size, mtime)
+
+        return kind, members
+
+    def set(self, path, st, kind, members):
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM member WHERE container = ?', (path,))
+            conn.execute(
+                'INSERT OR REPLACE INTO container VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (path, kind) + stat_fingerprint(st),
+            )
+            conn.executemany('INSERT INTO member VALUES (?, ?, ?, ?, ?, ?)', (
+                (
+                    path, position, m.name, m.offset, m.size,
+                    str(m.mtime) if kind == 'tar' else ','.join(str(v) for v in m.mtime),
+                )
+                for position, m in enumerate(members.values())
+            ))
+
+
+class ContainerIndexCache:
+    """
+    Process-wide LRU cache of container indexes, backed by the database at
+    CONTAINER_INDEX_PATH if set
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self._indexes = LRUCache(self._get_maxsize)
+        self._lock = threading.Lock()
+        self._databases = {}
+
+    def _get_maxsize(self):
+        if self.maxsize is not None:
+            return self.maxsize
+        return getattr(settings, 'CONTAINER_INDEX_CACHE_SIZE', 16)
+
+    def _get_database(self):
+        path = getattr(settings, 'CONTAINER_INDEX_PATH', None)
+        if not path:
+            return None
+
+        with self._lock:
+            try:
+                return self._databases[path]
+            except KeyError:
+                db = self._databases[path] = ContainerIndexDatabase(path)
+                return db
+
+    def get(self, container):
+        """
+        Returns the type and members of the container, building the index
+        if there is no index of the current version of the container
+        """
+
+        path = os.path.abspath(container)
+        st = os.stat(path)
+        key = (path, stat_fingerprint(st))
+
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+
+        db = self._get_database()
+        index = db.get(path, st) if db is not None else None
+
+        if index is None:
+            logger.debug('Indexing members of {}'.format(path))
+            index = scan_container(path)
+            if db is not None and stat_fingerprint(os.stat(path)) == key[1]:
+                db.set(path, st, *index)
+
+        self._indexes.set(key, index)
+        return index
+
+    def clear(self):
+        self._indexes.clear()
+
+
+container_index_cache = ContainerIndexCache()
+
+
+def get_container_members(container):
+    """
+    Returns an ordered dict of ContainerMember by name for the container,
+    or None if it is neither an uncompressed tar file nor a zip file
+    """
+
+    try:
+        return container_index_cache.get(container)[1]
+    except (tarfile.ReadError, zipfile.BadZipfile):
+        return None
+
+
+def open_container_member(container, name):
+    """
+    Opens a member of the container as a bounded, seekable file reading
+    directly from the container
+
+    Returns:
+        A binary file object, or None if the member is not indexed or can't
+        be read directly from the container
+    """
+
+    members = get_container_members(container)
+    if members is None:
+        return None
+
+    try:
+        member = members[name]
+    except KeyError:
+        # links and sparse files are not indexed
+        return None
+
+    if member.offset is None:
+        return None
+
+    return io.BufferedReader(BoundedFile(container, member.offset, member.size, name=name))
@@ -1,26 +1,34 @@
 import errno
+import hashlib
 import logging
 import os
 import shutil
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from os import walk
 
+from django.conf import settings
+from django.core.cache import cache
 from requests import RequestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import InvalidSchema
 from requests_toolbelt import MultipartEncoder
 from tenacity import (
     before_sleep_log,
     retry,
     retry_if_exception_type,
     stop_after_attempt,
+    wait_exponential,
     wait_fixed,
 )
 
-from ESSArch_Core.fixity.checksum import calculate_checksum
+from ESSArch_Core.storage.directory_size import invalidate_directory_size
 from ESSArch_Core.storage.exceptions import NoSpaceLeftError
 from ESSArch_Core.util import get_tree_size_and_count
 
 MB = 1024 * 1024
 DEFAULT_BLOCK_SIZE = 10 * MB
+COPY_DIR_PROGRESS_INTERVAL = 1
 
 logger = logging.getLogger('essarch.storage.copy')
 
@@ -52,18 +60,20 @@ def enough_space_available(dst: str, src: str, raise_exception: bool = False) ->
 
 
 @retry(retry=retry_if_exception_type(RequestException), reraise=True, stop=stop_after_attempt(5),
-       wait=wait_fixed(60), before_sleep=before_sleep_log(logger, logging.DEBUG))
-def copy_chunk_remotely(src, dst, offset, file_size, requests_session, upload_id=None, block_size=DEFAULT_BLOCK_SIZE):
+       wait=wait_exponential(multiplier=2, max=60), before_sleep=before_sleep_log(logger, logging.DEBUG))
+def copy_chunk_remotely(src, dst, offset, file_size, requests_session, upload_id=None, block_size=DEFAULT_BLOCK_SIZE,
+                        chunk=None):
     filename = os.path.basename(src)
 
-    with open(src, 'rb') as srcf:
-        srcf.seek(offset)
-        chunk = srcf.read(block_size)
+    if chunk is None:
+        with open(src, 'rb') as srcf:
+            srcf.seek(offset)
+            chunk = srcf.read(block_size)
 
     start = offset
     end = offset + block_size - 1
 
-    if end > file_size:
+    if end > file_size - 1:
         end = file_size - 1
 
     HTTP_CONTENT_RANGE = 'bytes %s-%s/%s' % (start, end, file_size)
@@ -95,6 +105,71 @@ def copy_chunk_remotely(src, dst, offset, file_size, requests_session, upload_id
     return response.json()['upload_id']
 
 
+ZERO_COPY_UNSUPPORTED_ERRNOS = {
+    errno.EBADF, errno.EINVAL, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EXDEV,
+}
+
+
+def _zero_copy(fsrc, fdst, func):
+    """
+    Copies fsrc to fdst using func, either os.copy_file_range or os.sendfile.
+    Returns False, with both files rewound, if the call is not supported for
+    these files or didn't copy the whole file
+    """
+
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    size = os.fstat(infd).st_size
+    blocksize = min(max(size, 8 * MB), 2 ** 30)
+    copied = 0
+
+    while True:
+        try:
+            if func is os.sendfile:
+                sent = func(outfd, infd, copied, blocksize)
+            else:
+                sent = func(infd, outfd, blocksize)
+        except OSError as e:
+            if copied == 0 and e.errno in ZERO_COPY_UNSUPPORTED_ERRNOS:
+                return False
+            raise
+
+        if sent == 0:
+            break
+        copied += sent
+
+    if copied != size:
+        # some filesystems (e.g. procfs, FUSE and some NFS mounts) report
+        # files as empty or end them early when copied this way
+        logger.debug('Copied {} of {} bytes without buffering, falling back to a buffered copy'.format(copied, size))
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        return False
+
+    return True
+
+
+def copyfile(src, dst):
+    """
+    Copies the content of src to dst, using copy_file_range(2) or sendfile(2)
+    to copy the data without passing it through user space when available.
+    copy_file_range also allows filesystems to use reflinks or server-side
+    copies (e.g. on NFS 4.2)
+    """
+
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError('{!r} and {!r} are the same file'.format(src, dst))
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        for func in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+            if func is not None and _zero_copy(fsrc, fdst, func):
+                return dst
+
+        shutil.copyfileobj(fsrc, fdst)
+
+    return dst
+
+
 def copy_file_locally(src, dst):
     fsize = os.stat(src).st_size
 
@@ -102,7 +177,7 @@ def copy_file_locally(src, dst):
     os.makedirs(directory, exist_ok=True)
 
     time_start = time.time()
-    shutil.copyfile(src, dst)
+    copyfile(src, dst)
     time_end = time.time()
 
     time_elapsed = time_end - time_start
@@ -128,21 +203,128 @@ def _send_completion_request(requests_session, completion_url, data, headers):
     response.raise_for_status()
 
 
-def copy_file_remotely(src, dst, requests_session, block_size=DEFAULT_BLOCK_SIZE):
-    fsize = os.stat(src).st_size
-    idx = 0
+def _get_upload_state_key(src, dst, requests_session, st):
+    key = '|'.join(str(x) for x in (
+        os.path.abspath(src), dst, requests_session.params.get('dst'), st.st_size, st.st_mtime_ns,
+    ))
+    return 'remote_copy_upload_{}'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
 
-    time_start = time.time()
-    upload_id = copy_chunk_remotely(src, dst, idx * block_size, requests_session=requests_session,
-                                    file_size=fsize, block_size=block_size)
-    idx += 1
 
-    while idx * block_size <= fsize:
-        copy_chunk_remotely(src, dst, idx * block_size, requests_session=requests_session,
-                            file_size=fsize, block_size=block_size, upload_id=upload_id)
-        idx += 1
+def _ensure_connection_pool(requests_session, url, size):
+    """
+    Makes sure that the connection pool used for url is large enough to
+    keep size connections alive when uploading chunks concurrently
+    """
+
+    try:
+        adapter = requests_session.get_adapter(url)
+    except InvalidSchema:
+        return
+
+    if isinstance(adapter, HTTPAdapter) and adapter._pool_maxsize < size:
+        prefix = url.split('://', 1)[0] + '://'
+        requests_session.mount(prefix, HTTPAdapter(
+            pool_connections=adapter._pool_connections, pool_maxsize=size,
+            max_retries=adapter.max_retries, pool_block=adapter._pool_block,
+        ))
+
+
+def copy_file_remotely(src, dst, requests_session, block_size=DEFAULT_BLOCK_SIZE, chunks_in_flight=None):
+    """
+    Uploads src to dst in chunks of block_size bytes with up to
+    chunks_in_flight chunks being uploaded concurrently.
+
+    The file is read once, the MD5 checksum sent in the completion request is
+    calculated while reading. The first contiguous offset acknowledged by the
+    server is stored in the cache together with the upload id, allowing a
+    new attempt at copying the same unchanged file to resume from there.
+    """
+
+    if chunks_in_flight is None:
+        chunks_in_flight = getattr(settings, 'REMOTE_COPY_CHUNKS_IN_FLIGHT', 4)
+    chunks_in_flight = max(int(chunks_in_flight), 1)
+    resume_timeout = getattr(settings, 'REMOTE_COPY_RESUME_TIMEOUT', 24 * 60 * 60)
+
+    st = os.stat(src)
+    fsize = st.st_size
+    state_key = _get_upload_state_key(src, dst, requests_session, st)
+    state = cache.get(state_key)
+    md5 = hashlib.md5()
 
-    md5 = calculate_checksum(src, algorithm='MD5', block_size=block_size)
+    _ensure_connection_pool(requests_session, dst, chunks_in_flight)
+
+    time_start = time.time()
+    with open(src, 'rb') as srcf:
+        if state is not None:
+            upload_id, acknowledged = state['upload_id'], state['offset']
+            logger.info('Resuming upload {} of {} to {} from offset {}'.format(upload_id, src, dst, acknowledged))
+
+            # the skipped part is only read to be included in the checksum
+            remaining = acknowledged
+            while remaining > 0:
+                data = srcf.read(min(block_size, remaining))
+                if not data:
+                    break
+                md5.update(data)
+                remaining -= len(data)
+        else:
+            chunk = srcf.read(block_size)
+            md5.update(chunk)
+            upload_id = copy_chunk_remotely(src, dst, 0, requests_session=requests_session,
+                                            file_size=fsize, block_size=block_size, chunk=chunk)
+            acknowledged = len(chunk)
+            cache.set(state_key, {'upload_id': upload_id, 'offset': acknowledged}, resume_timeout)
+
+        # chunks that are done but not yet part of the contiguous acknowledged
+        # range, mapped from start offset to end offset
+        completed = {}
+        pending = {}
+
+        def handle_done(done):
+            nonlocal acknowledged
+
+            for future in done:
+                start, end = pending.pop(future)
+                future.result()
+                completed[start] = end
+
+            advanced = False
+            while acknowledged in completed:
+                acknowledged = completed.pop(acknowledged)
+                advanced = True
+
+            if advanced:
+                cache.set(state_key, {'upload_id': upload_id, 'offset': acknowledged}, resume_timeout)
+
+        with ThreadPoolExecutor(max_workers=chunks_in_flight) as executor:
+            try:
+                offset = srcf.tell()
+                while offset < fsize:
+                    if len(pending) >= chunks_in_flight:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        handle_done(done)
+
+                    chunk = srcf.read(block_size)
+                    if not chunk:
+                        break
+                    md5.update(chunk)
+
+                    future = executor.submit(
+                        copy_chunk_remotely, src, dst, offset, requests_session=requests_session,
+                        file_size=fsize, block_size=block_size, upload_id=upload_id, chunk=chunk,
+                    )
+                    pending[future] = (offset, offset + len(chunk))
+                    offset += len(chunk)
+
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    handle_done(done)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+    md5 = md5.hexdigest()
 
     completion_url = dst.rstrip('/') + '_complete/'
 
@@ -156,7 +338,13 @@ def copy_file_remotely(src, dst, requests_session, block_size=DEFAULT_BLOCK_SIZE
     )
     headers = {'Content-Type': m.content_type}
 
-    _send_completion_request(requests_session, completion_url, m, headers)
+    try:
+        _send_completion_request(requests_session, completion_url, m, headers)
+    finally:
+        # the uploaded file can't be trusted if the completion failed, e.g.
+        # because it was removed or its checksum didn't match, start over on
+        # the next attempt instead of resuming it
+        cache.delete(state_key)
 
     time_end = time.time()
     time_elapsed = time_end - time_start
@@ -202,35 +390,142 @@ def copy_file(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
             os.makedirs(os.path.dirname(dst), exist_ok=True)
             enough_space_available(os.path.dirname(dst), src, True)
         copy_file_locally(src, dst)
+        invalidate_directory_size(dst)
 
     return dst
 
 
-def copy_dir(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE):
+def _list_dir_for_copy(src, dst):
+    files = []
+    dirs = []
+
+    for root, dirnames, filenames in walk(src):
+        for f in filenames:
+            src_filepath = os.path.join(root, f)
+            dst_filepath = os.path.join(dst, os.path.relpath(src_filepath, src))
+            files.append((src_filepath, dst_filepath, os.path.getsize(src_filepath)))
+
+        for d in dirnames:
+            dirs.append(os.path.join(dst, os.path.relpath(os.path.join(root, d), src)))
+
+    return files, dirs
+
+
+def copy_dir(src, dst, requests_session=None, block_size=DEFAULT_BLOCK_SIZE, workers=None, progress_callback=None):
+    """
+    Copies the content of the directory src to dst
+
+    Args:
+        src: The directory to copy
+        dst: Where the content should be copied to
+        requests_session: The request session to be used when copying to a
+            remote server
+        block_size: Size of each block to copy
+        workers: Number of files to copy concurrently, defaults to
+            settings.COPY_DIR_WORKERS
+        progress_callback: Called with the number of bytes copied, the total
+            number of bytes and the average throughput in MB/Sec at most once
+            every COPY_DIR_PROGRESS_INTERVAL seconds and when all files are
+            copied
+    Returns:
+        dst
+    """
+
     if os.path.isfile(dst):
         raise ValueError(f'Cannot overwrite non-directory {dst} with directory {src}')
 
+    if workers is None:
+        workers = getattr(settings, 'COPY_DIR_WORKERS', 1)
+    workers = max(int(workers), 1)
+
     try:
         enough_space_available(dst, src, True)
     except FileNotFoundError:
         os.makedirs(dst, exist_ok=True)
         enough_space_available(dst, src, True)
 
-    for root, dirs, files in walk(src):
-        for f in files:
-            src_filepath = os.path.join(root, f)
-            src_relpath = os.path.relpath(src_filepath, src)
-            dst_filepath = os.path.join(dst, src_relpath)
-
-            os.makedirs(os.path.dirname(dst_filepath), exist_ok=True)
-            copy_file(src_filepath, dst_filepath, requests_session=requests_session, block_size=block_size)
-
-        if requests_session is None:
-            for d in dirs:
-                src_dir = os.path.join(root, d)
-                src_relpath = os.path.relpath(src_dir, src)
-                dst_dir = os.path.join(dst, src_relpath)
-                os.makedirs(dst_dir, exist_ok=True)
+    files, dirs = _list_dir_for_copy(src, dst)
+    total_size = sum(size for _, _, size in files)
+    copied_size = 0
+    last_report = None
+    time_start = time.time()
+
+    def report_progress(force=False):
+        nonlocal last_report
+
+        now = time.time()
+        if progress_callback is None or (not force and last_report is not None and
+                                         now - last_report < COPY_DIR_PROGRESS_INTERVAL):
+            return
+
+        last_report = now
+        try:
+            mb_per_sec = (copied_size / MB) / (now - time_start)
+        except ZeroDivisionError:
+            mb_per_sec = copied_size / MB
+        progress_callback(copied_size, total_size, mb_per_sec)
+
+    def copy_one(src_filepath, dst_filepath):
+        os.makedirs(os.path.dirname(dst_filepath), exist_ok=True)
+
+        # the available space has already been checked for the whole directory
+        logger.info('Copying %s to %s' % (src_filepath, dst_filepath))
+        if requests_session is not None:
+            copy_file_remotely(src_filepath, dst_filepath, requests_session, block_size=block_size)
+        else:
+            copy_file_locally(src_filepath, dst_filepath)
+
+    pending = {}
+
+    def wait_for_copies():
+        nonlocal copied_size
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            future.result()
+            copied_size += pending.pop(future)
+        report_progress()
+
+    if workers == 1:
+        for src_filepath, dst_filepath, size in files:
+            copy_one(src_filepath, dst_filepath)
+            copied_size += size
+            report_progress()
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for src_filepath, dst_filepath, size in files:
+                    if len(pending) >= workers * 2:
+                        wait_for_copies()
+
+                    pending[executor.submit(copy_one, src_filepath, dst_filepath)] = size
+
+                while pending:
+                    wait_for_copies()
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+    if requests_session is None:
+        for dst_dir in dirs:
+            os.makedirs(dst_dir, exist_ok=True)
+        invalidate_directory_size(dst, recursive=True)
+
+    report_progress(force=True)
+
+    time_elapsed = time.time() - time_start
+    total_size_mb = total_size / MB
+    try:
+        mb_per_sec = total_size_mb / time_elapsed
+    except ZeroDivisionError:
+        mb_per_sec = total_size_mb
+
+    logger.info(
+        'Copied {} files ({} MB) from {} to {} at {} MB/Sec ({} sec)'.format(
+            len(files), total_size_mb, src, dst, mb_per_sec, time_elapsed
+        )
+    )
     return dst
 
 
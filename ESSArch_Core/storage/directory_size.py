@@ -0,0 +1,101 @@
+"""
+Cache of the sizes of directories.
+
+The total size and number of files of each directory, including its
+subdirectories, are stored in the default cache, shared by all processes,
+so only directories without cached totals are scanned. Code writing files
+into or removing files from directories calls invalidate_directory_size to
+remove the totals of the changed directories and their parents. Changes made
+elsewhere are picked up when the totals expire after
+DIRECTORY_SIZE_CACHE_TIMEOUT seconds.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('essarch.storage.directory_size')
+
+CACHE_KEY_PREFIX = 'directory_size'
+
+
+def _get_cache_key(path):
+    # paths can be longer than the keys allowed by some cache backends
+    return '{}:{}'.format(CACHE_KEY_PREFIX, hashlib.sha1(os.fsencode(path)).hexdigest())
+
+
+def _get_size_and_count(path, timeout):
+    cache_key = _get_cache_key(path)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    size = 0
+    count = 0
+
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                # symlinks to directories are neither followed nor counted,
+                # like when walking the tree
+                if entry.is_dir(follow_symlinks=False):
+                    subdir_size, subdir_count = _get_size_and_count(entry.path, timeout)
+                    size += subdir_size
+                    count += subdir_count
+                    continue
+
+                if entry.is_dir():
+                    continue
+
+                size += entry.stat().st_size
+                count += 1
+            except OSError as e:
+                # removed since the directory was listed
+                if e.errno != errno.ENOENT:
+                    raise
+
+    logger.debug('Scanned {}'.format(path))
+    cache.set(cache_key, (size, count), timeout)
+    return size, count
+
+
+def get_directory_size_and_count(path):
+    """
+    Returns the total size and number of files in path and its
+    subdirectories
+    """
+
+    path = os.path.abspath(path)
+    if not os.path.isdir(path):
+        return os.path.getsize(path), 1
+
+    timeout = getattr(settings, 'DIRECTORY_SIZE_CACHE_TIMEOUT', 3600)
+    return _get_size_and_count(path, timeout)
+
+
+def invalidate_directory_size(path, recursive=False):
+    """
+    Removes the cached totals of path and its parents after files in path
+    have been added, changed or removed. If recursive, the totals of all
+    directories in path are removed as well
+    """
+
+    path = os.path.abspath(path)
+    cache_keys = []
+
+    if recursive:
+        for dirpath, _dirnames, _filenames in os.walk(path):
+            cache_keys.append(_get_cache_key(dirpath))
+
+    while True:
+        cache_keys.append(_get_cache_key(path))
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+
+    cache.delete_many(cache_keys)
@@ -42,6 +42,7 @@ from ESSArch_Core.db.utils import natural_sort
 from ESSArch_Core.fixity.validation.backends.checksum import ChecksumValidator
 from ESSArch_Core.storage.backends import get_backend
 from ESSArch_Core.storage.copy import copy_file
+from ESSArch_Core.storage.directory_size import invalidate_directory_size
 from ESSArch_Core.storage.tape import read_tape, set_tape_file_number
 
 logger = logging.getLogger('essarch.storage.models')
@@ -881,6 +882,7 @@ class StorageObject(models.Model):
 
             else:
                 storage_backend.read(self, dst, extract=extract)
+                invalidate_directory_size(dst, recursive=True)
 
     def list_files(self, pattern=None, case_sensitive=True):
         backend = self.get_storage_backend()
@@ -1087,6 +1089,11 @@ class RobotQueue(models.Model):
         get_latest_by = 'posted'
 
 
+class IOQueueQueryset(models.QuerySet):
+    def pending(self):
+        return self.filter(status__in=[0, 2])
+
+
 class IOQueue(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     req_type = models.IntegerField(choices=IOReqType_CHOICES)
@@ -1107,6 +1114,8 @@ class IOQueue(models.Model):
     transfer_task_id = models.CharField(max_length=36, blank=True)
     step = models.ForeignKey('WorkflowEngine.ProcessStep', on_delete=models.SET_NULL, null=True)
 
+    objects = IOQueueQueryset.as_manager()
+
     class Meta:
         get_latest_by = 'posted'
         permissions = (
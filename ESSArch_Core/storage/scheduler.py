@@ -0,0 +1,336 @@
+"""
+Scheduling of mount and unmount requests in the robot queue.
+
+Pending requests are coalesced per storage medium so that a medium is only
+mounted or unmounted once regardless of how many requests are waiting for
+it. Requests for media that are already mounted are resolved without using
+the robot, and operations for different robots are run concurrently.
+"""
+
+import logging
+from collections import OrderedDict, namedtuple
+
+from celery.result import allow_join_result
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from ESSArch_Core.storage.exceptions import (
+    TapeMountedError,
+    TapeUnmountedError,
+)
+from ESSArch_Core.storage.models import IOQueue, Robot, RobotQueue, TapeDrive
+from ESSArch_Core.WorkflowEngine.models import ProcessTask
+
+logger = logging.getLogger('essarch.storage.scheduler')
+
+MOUNT = 10
+UNMOUNT = 20
+FORCE_UNMOUNT = 30
+
+PENDING_STATUSES = [0, 2]
+ROBOT_QUEUE_METRICS_CACHE_KEY = 'robot_queue_metrics'
+
+RobotOperation = namedtuple('RobotOperation', 'req_type medium drive robot entries')
+
+
+def coalesce_requests(entries):
+    """
+    Groups pending robot queue entries by storage medium and decides which
+    single request each medium needs.
+
+    A forced unmount always wins. Otherwise a mount requested for reading
+    or writing (i.e. with an IO queue entry) wins over unmounts, and in
+    all other cases the latest request wins. Requests of the winning type
+    are covered by the same operation, older requests of the other type are
+    obsolete.
+
+    Args:
+        entries: Robot queue entries ordered by when they were posted
+
+    Returns:
+        A tuple with an ordered dict mapping each medium to the winning
+        request type and the entries it covers, and a list of obsolete
+        entries
+    """
+
+    per_medium = OrderedDict()
+    for entry in entries:
+        per_medium.setdefault(entry.storage_medium_id, []).append(entry)
+
+    requests = OrderedDict()
+    obsolete = []
+
+    for medium_id, medium_entries in per_medium.items():
+        req_types = {e.req_type for e in medium_entries}
+
+        if FORCE_UNMOUNT in req_types:
+            # mounts requested before the forced unmount are kept until the
+            # medium has been unmounted
+            requests[medium_id] = (FORCE_UNMOUNT, [e for e in medium_entries if e.req_type != MOUNT])
+            continue
+
+        if any(e.req_type == MOUNT and e.io_queue_entry_id is not None for e in medium_entries):
+            req_type = MOUNT
+        else:
+            req_type = medium_entries[-1].req_type
+
+        requests[medium_id] = (req_type, [e for e in medium_entries if e.req_type == req_type])
+        obsolete.extend(e for e in medium_entries if e.req_type != req_type)
+
+    return requests, obsolete
+
+
+def get_pending_io_count_per_medium(media):
+    return dict(
+        IOQueue.objects.pending().filter(storage_medium__in=media).order_by().values(
+            'storage_medium',
+        ).annotate(count=Count('pk')).values_list('storage_medium', 'count')
+    )
+
+
+def _is_drive_available_for(drive, entries):
+    """
+    A mounted medium can be used if its drive is not locked by another IO
+    queue entry than the one the request was made for
+    """
+
+    if drive.io_queue_entry_id is None:
+        return True
+
+    return all(e.io_queue_entry_id in (None, drive.io_queue_entry_id) for e in entries)
+
+
+def plan(entries):
+    """
+    Creates the robot operations needed to handle the pending entries.
+
+    Returns:
+        A tuple with the operations to run, the entries that are already
+        satisfied and the entries that are obsolete
+    """
+
+    requests, obsolete = coalesce_requests(entries)
+    media = {e.storage_medium_id: e.storage_medium for e in entries}
+    satisfied = []
+    operations = []
+
+    busy_robots = set(Robot.objects.filter(robot_queue__isnull=False).values_list('pk', flat=True))
+    reserved_drives = set()
+
+    mounts = []
+    for medium_id, (req_type, medium_entries) in requests.items():
+        medium = media[medium_id]
+        drive = medium.tape_drive
+
+        if req_type == MOUNT:
+            if drive is None:
+                mounts.append((medium, medium_entries))
+            elif _is_drive_available_for(drive, medium_entries):
+                # already mounted, no need for the robot
+                satisfied.extend(medium_entries)
+            else:
+                logger.debug('Tape {} mounted and locked by {}'.format(medium, drive.io_queue_entry_id))
+            continue
+
+        if drive is None:
+            satisfied.extend(medium_entries)
+            continue
+
+        if req_type == UNMOUNT and drive.locked:
+            logger.debug('Tape {} locked, postponing unmount'.format(medium))
+            continue
+
+        if drive.robot_id in busy_robots:
+            continue
+
+        busy_robots.add(drive.robot_id)
+        reserved_drives.add(drive.pk)
+        operations.append(RobotOperation(req_type, medium, drive, drive.robot, medium_entries))
+
+    if not mounts:
+        return operations, satisfied, obsolete
+
+    # media with the most IO waiting for them are mounted first, then the
+    # ones that have waited the longest
+    io_count = get_pending_io_count_per_medium([medium for medium, _ in mounts])
+    mounts.sort(key=lambda m: (-io_count.get(m[0].pk, 0), min(e.posted for e in m[1])))
+
+    free_drives = list(TapeDrive.objects.filter(
+        status=20, storage_medium__isnull=True, io_queue_entry__isnull=True, locked=False,
+    ).select_related('robot').order_by('num_of_mounts'))
+
+    for medium, medium_entries in mounts:
+        requested_drives = {e.tape_drive_id for e in medium_entries if e.tape_drive_id is not None}
+        medium_robot_id = medium.tape_slot.robot_id if medium.tape_slot_id is not None else None
+
+        candidates = [
+            d for d in free_drives
+            if d.pk not in reserved_drives and d.robot_id not in busy_robots and
+            (not requested_drives or d.pk in requested_drives) and
+            (medium_robot_id is None or d.robot_id == medium_robot_id)
+        ]
+
+        if not candidates:
+            continue
+
+        drive = candidates[0]
+        busy_robots.add(drive.robot_id)
+        reserved_drives.add(drive.pk)
+        operations.append(RobotOperation(MOUNT, medium, drive, drive.robot, medium_entries))
+
+    return operations, satisfied, obsolete
+
+
+def _start(operation):
+    primary, *others = operation.entries
+
+    primary.robot = operation.robot
+    primary.status = 5
+    primary.save(update_fields=['robot', 'status'])
+    RobotQueue.objects.filter(pk__in=[e.pk for e in others]).update(status=5)
+
+    if operation.req_type == MOUNT:
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.tasks.MountTape",
+            params={
+                'medium_id': operation.medium.pk,
+                'drive_id': operation.drive.pk,
+            },
+            eager=False,
+        )
+    else:
+        task = ProcessTask.objects.create(
+            name="ESSArch_Core.tasks.UnmountTape",
+            params={
+                'drive_id': operation.drive.pk,
+            },
+            eager=False,
+        )
+
+    return task.run()
+
+
+def run(operations):
+    """
+    Runs the operations concurrently and waits for all of them to finish.
+
+    Returns:
+        A list of the exceptions raised by failed operations
+    """
+
+    started = []
+    for operation in operations:
+        logger.info('Starting {} of {} in {} using {}, covering {} request(s)'.format(
+            'mount' if operation.req_type == MOUNT else 'unmount',
+            operation.medium, operation.drive.device, operation.robot, len(operation.entries),
+        ))
+        started.append((operation, timezone.now(), _start(operation)))
+
+    errors = []
+    with allow_join_result():
+        for operation, start_time, result in started:
+            entry_ids = [e.pk for e in operation.entries]
+            try:
+                result.get()
+            except (TapeMountedError, TapeUnmountedError):
+                RobotQueue.objects.filter(pk__in=entry_ids).delete()
+            except BaseException as e:
+                logger.exception('Robot operation on {} failed'.format(operation.medium))
+                RobotQueue.objects.filter(pk__in=entry_ids).update(status=100, robot=None)
+                errors.append(e)
+            else:
+                RobotQueue.objects.filter(pk__in=entry_ids).delete()
+                record_metrics(operation, start_time)
+
+    return errors
+
+
+def schedule():
+    """
+    Handles the pending entries in the robot queue.
+
+    Returns:
+        False if there were no pending entries, True otherwise
+
+    Raises:
+        The exception of the first failed operation, after all operations
+        have finished
+    """
+
+    entries = list(RobotQueue.objects.filter(
+        status__in=PENDING_STATUSES,
+    ).select_related(
+        'storage_medium__tape_drive__robot', 'storage_medium__tape_slot',
+    ).order_by('posted'))
+
+    if not entries:
+        return False
+
+    operations, satisfied, obsolete = plan(entries)
+
+    if obsolete:
+        logger.info('Removing {} obsolete robot queue entries'.format(len(obsolete)))
+        RobotQueue.objects.filter(pk__in=[e.pk for e in obsolete]).delete()
+
+    if satisfied:
+        logger.debug('Removing {} already satisfied robot queue entries'.format(len(satisfied)))
+        RobotQueue.objects.filter(pk__in=[e.pk for e in satisfied]).delete()
+
+    errors = run(operations)
+    if errors:
+        raise errors[0]
+
+    return True
+
+
+def record_metrics(operation, start_time):
+    now = timezone.now()
+    metrics = cache.get(ROBOT_QUEUE_METRICS_CACHE_KEY) or {}
+    key = 'mount' if operation.req_type == MOUNT else 'unmount'
+    m = metrics.setdefault(key, {
+        'operations': 0, 'requests': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'total_duration': 0.0,
+    })
+
+    m['operations'] += 1
+    for entry in operation.entries:
+        wait = (start_time - entry.posted).total_seconds()
+        m['requests'] += 1
+        m['total_wait'] += wait
+        m['max_wait'] = max(m['max_wait'], wait)
+    m['total_duration'] += (now - start_time).total_seconds()
+
+    cache.set(ROBOT_QUEUE_METRICS_CACHE_KEY, metrics, None)
+
+
+def get_metrics():
+    """
+    Returns latency metrics for the robot queue: the current number of
+    pending requests and the age of the oldest one per request type, and
+    the number of requests, robot operations, average and max time waited
+    before being handled and average time taken for completed operations
+    """
+
+    now = timezone.now()
+    recorded = cache.get(ROBOT_QUEUE_METRICS_CACHE_KEY) or {}
+    metrics = {}
+
+    for key, req_types in (('mount', [MOUNT]), ('unmount', [UNMOUNT, FORCE_UNMOUNT])):
+        pending = RobotQueue.objects.filter(req_type__in=req_types, status__in=PENDING_STATUSES)
+        oldest = pending.order_by('posted').values_list('posted', flat=True).first()
+        m = recorded.get(key, {})
+
+        operations = m.get('operations', 0)
+        requests = m.get('requests', 0)
+        metrics[key] = {
+            'pending': pending.count(),
+            'in_progress': RobotQueue.objects.filter(req_type__in=req_types, status=5).count(),
+            'oldest_pending_wait': (now - oldest).total_seconds() if oldest is not None else None,
+            'completed_requests': requests,
+            'completed_operations': operations,
+            'average_wait': m['total_wait'] / requests if requests else None,
+            'max_wait': m.get('max_wait') if requests else None,
+            'average_duration': m['total_duration'] / operations if operations else None,
+        }
+
+    return metrics
@@ -255,27 +255,114 @@ def read_tape(device, path='.', block_size=DEFAULT_TAPE_BLOCK_SIZE):
             device=device, path=path, size=block_size
         )
     )
+    stream_tape(device, path=path, block_size=block_size)
+
+
+def _is_within_directory(directory, target):
+    abs_directory = os.path.abspath(directory)
+    abs_target = os.path.abspath(target)
+
+    return os.path.commonprefix([abs_directory, abs_target]) == abs_directory
+
+
+def _check_member_path(path, member):
+    member_path = os.path.join(path, member.name)
+    if not _is_within_directory(path, member_path):
+        raise Exception("Attempted Path Traversal in Tar File")
+
+    if member.issym():
+        link_path = os.path.join(os.path.dirname(member_path), member.linkname)
+    elif member.islnk():
+        link_path = os.path.join(path, member.linkname)
+    else:
+        return
+
+    if not _is_within_directory(path, link_path):
+        raise Exception("Attempted Path Traversal in Tar File")
+
+
+def _get_requested_member(member, members):
+    for name in members:
+        if member.name == name or member.name.startswith(name.rstrip('/') + '/'):
+            return name
+
+    return None
+
+
+def _extract_stream(tar, path):
+    """
+    Extracts the members of a tar opened in stream mode one at a time and
+    returns the common prefix of their names
+    """
+
+    root = None
+    for member in tar:
+        _check_member_path(path, member)
+        tar.extract(member, path)
+        root = member.name if root is None else os.path.commonprefix([root, member.name])
+
+    return root or ''
+
+
+def stream_tape(device, path='.', block_size=DEFAULT_TAPE_BLOCK_SIZE, members=None, extract=None):
+    """
+    Reads the tape file at the current position of device and writes its
+    members directly to path, without spooling the whole file to disk first
+
+    Args:
+        device (str): The tape drive we are reading from, e.g. /dev/nst0
+        path (str): The directory the members are written to
+        block_size (int, optional): The block size that will be used
+        members (iterable, optional): Names of the members to read,
+            including the content of directories. Everything is read if not
+            given. Reading stops as soon as all requested members have been
+            read
+        extract (iterable, optional): Names of tar files on the tape that
+            are extracted into path instead of being written as they are
+
+    Returns:
+        A dict with the name of each read member (the top level name if
+        members is not given) mapped to where it was written. For extracted
+        tar files this is the common prefix of their content
+
+    Raises:
+        FileNotFoundError: If any of the requested members are not found
+    """
+
+    members = set(members) if members is not None else None
+    extract = set(extract or [])
+    written = {}
+
+    logger.info(
+        'Streaming content from {device} to {path}, with block size {size}'.format(
+            device=device, path=path, size=block_size
+        )
+    )
     with tarfile.open(device, 'r|', bufsize=block_size) as tar:
-        def is_within_directory(directory, target):
-            
-            abs_directory = os.path.abspath(directory)
-            abs_target = os.path.abspath(target)
-        
-            prefix = os.path.commonprefix([abs_directory, abs_target])
-            
-            return prefix == abs_directory
-        
-        def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-        
-            for member in tar.getmembers():
-                member_path = os.path.join(path, member.name)
-                if not is_within_directory(path, member_path):
-                    raise Exception("Attempted Path Traversal in Tar File")
-        
-            tar.extractall(path, members, numeric_owner=numeric_owner) 
-            
-        
-        safe_extract(tar, path)
+        for member in tar:
+            if members is None:
+                name = member.name.split('/', 1)[0]
+            else:
+                name = _get_requested_member(member, members)
+                if name is None:
+                    if members.issubset(written):
+                        break
+                    continue
+
+            _check_member_path(path, member)
+
+            if member.name in extract and member.isfile():
+                with tarfile.open(fileobj=tar.extractfile(member), mode='r|', bufsize=block_size) as inner:
+                    written[name] = os.path.join(path, _extract_stream(inner, path))
+            else:
+                tar.extract(member, path)
+                written[name] = os.path.join(path, name.rstrip('/'))
+
+    if members is not None and not members.issubset(written):
+        missing = ', '.join(sorted(members.difference(written)))
+        raise FileNotFoundError(errno.ENOENT, 'Members not found on tape: {}'.format(missing), device)
+
+    return written
 
 
 def write_to_tape(device, paths, block_size=DEFAULT_TAPE_BLOCK_SIZE, arcname=None):
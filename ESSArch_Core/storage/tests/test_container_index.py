@@ -0,0 +1,163 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ESSArch_Core.storage.container_index import (
+    BoundedFile,
+    container_index_cache,
+    get_container_members,
+    open_container_member,
+    scan_container,
+)
+from ESSArch_Core.util import open_file
+
+
+class ContainerIndexTestsBase(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        container_index_cache.clear()
+        self.addCleanup(container_index_cache.clear)
+
+        self.content = {
+            'prefix/a.txt': b'a' * 1000,
+            'prefix/b.txt': b'0123456789',
+            'prefix/empty.txt': b'',
+        }
+
+    def create_tar(self, mode='w', name='container.tar'):
+        path = os.path.join(self.datadir, name)
+        with tarfile.open(path, mode) as tar:
+            for member_name, data in self.content.items():
+                info = tarfile.TarInfo(member_name)
+                info.size = len(data)
+                info.mtime = 1000
+                tar.addfile(info, io.BytesIO(data))
+
+            link = tarfile.TarInfo('prefix/link.txt')
+            link.type = tarfile.SYMTYPE
+            link.linkname = 'b.txt'
+            tar.addfile(link)
+        return path
+
+    def create_zip(self, compression=zipfile.ZIP_STORED):
+        path = os.path.join(self.datadir, 'container.zip')
+        with zipfile.ZipFile(path, 'w', compression) as zipf:
+            for member_name, data in self.content.items():
+                zipf.writestr(member_name, data)
+        return path
+
+
+class ScanContainerTests(ContainerIndexTestsBase):
+    def test_tar(self):
+        kind, members = scan_container(self.create_tar())
+        self.assertEqual(kind, 'tar')
+        self.assertEqual(list(members), list(self.content))
+        self.assertEqual(members['prefix/b.txt'].size, 10)
+        self.assertEqual(members['prefix/b.txt'].mtime, 1000)
+
+    def test_zip(self):
+        kind, members = scan_container(self.create_zip())
+        self.assertEqual(kind, 'zip')
+        self.assertEqual(list(members), list(self.content))
+        self.assertIsNotNone(members['prefix/b.txt'].offset)
+
+    def test_compressed_zip_members_have_no_offset(self):
+        _, members = scan_container(self.create_zip(zipfile.ZIP_DEFLATED))
+        self.assertIsNone(members['prefix/a.txt'].offset)
+
+    def test_compressed_tar(self):
+        with self.assertRaises(tarfile.ReadError):
+            scan_container(self.create_tar('w:gz', 'container.tar.gz'))
+        self.assertIsNone(get_container_members(os.path.join(self.datadir, 'container.tar.gz')))
+
+
+class OpenContainerMemberTests(ContainerIndexTestsBase):
+    def test_read_tar_member(self):
+        path = self.create_tar()
+        for name, data in self.content.items():
+            with open_container_member(path, name) as f:
+                self.assertEqual(f.read(), data)
+
+    def test_read_zip_member(self):
+        path = self.create_zip()
+        for name, data in self.content.items():
+            with open_container_member(path, name) as f:
+                self.assertEqual(f.read(), data)
+
+    def test_seek(self):
+        with open_container_member(self.create_tar(), 'prefix/b.txt') as f:
+            f.seek(5)
+            self.assertEqual(f.read(2), b'56')
+            f.seek(-2, io.SEEK_END)
+            self.assertEqual(f.read(), b'89')
+            self.assertEqual(f.tell(), 10)
+            f.seek(100)
+            self.assertEqual(f.read(), b'')
+
+    def test_not_indexed(self):
+        path = self.create_tar()
+        self.assertIsNone(open_container_member(path, 'prefix/link.txt'))
+        self.assertIsNone(open_container_member(path, 'prefix/missing.txt'))
+        self.assertIsNone(open_container_member(self.create_zip(zipfile.ZIP_DEFLATED), 'prefix/a.txt'))
+
+    def test_container_is_scanned_once(self):
+        path = self.create_tar()
+        with mock.patch('ESSArch_Core.storage.container_index.scan_container', wraps=scan_container) as mock_scan:
+            for name in self.content:
+                open_container_member(path, name).close()
+
+        mock_scan.assert_called_once_with(os.path.abspath(path))
+
+    def test_changed_container_is_scanned_again(self):
+        path = self.create_tar()
+        self.assertIn('prefix/b.txt', get_container_members(path))
+
+        self.content = {'prefix/c.txt': b'c'}
+        self.create_tar()
+        os.utime(path, (0, 0))
+
+        self.assertEqual(list(get_container_members(path)), ['prefix/c.txt'])
+
+    def test_persistent_index(self):
+        path = self.create_tar()
+        db_path = os.path.join(self.datadir, 'index', 'containers.db')
+
+        with override_settings(CONTAINER_INDEX_PATH=db_path):
+            members = get_container_members(path)
+            container_index_cache.clear()
+
+            with mock.patch('ESSArch_Core.storage.container_index.scan_container') as mock_scan:
+                self.assertEqual(get_container_members(path), members)
+            mock_scan.assert_not_called()
+
+
+class OpenFileTests(ContainerIndexTestsBase):
+    def test_open_file_reads_directly_from_tar(self):
+        path = self.create_tar()
+        get_container_members(path)
+
+        with mock.patch('ESSArch_Core.util.tarfile.open') as mock_tar_open:
+            with open_file('a.txt', container=path, container_prefix='prefix') as f:
+                self.assertIsInstance(f.raw, BoundedFile)
+                self.assertEqual(f.read(), self.content['prefix/a.txt'])
+        mock_tar_open.assert_not_called()
+
+    def test_open_file_falls_back_to_extracting(self):
+        path = self.create_tar()
+        with open_file('prefix/link.txt', container=path) as f:
+            self.assertEqual(f.read(), self.content['prefix/b.txt'])
+
+        path = self.create_tar('w:gz', 'container.tar.gz')
+        with open_file('prefix/b.txt', container=path) as f:
+            self.assertEqual(f.read(), self.content['prefix/b.txt'])
+
+        with self.assertRaises(OSError):
+            open_file('prefix/missing.txt', container=path)
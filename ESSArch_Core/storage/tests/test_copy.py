@@ -1,4 +1,5 @@
 import errno
+import hashlib
 import os
 import shutil
 import tempfile
@@ -11,7 +12,17 @@ import pyfakefs.fake_filesystem as fake_fs
 import requests
 from django.test import SimpleTestCase
 
-from ESSArch_Core.storage.copy import copy_chunk_remotely, copy_dir, copy_file
+from ESSArch_Core.storage.copy import (
+    copy_chunk_remotely,
+    copy_dir,
+    copy_file,
+    copy_file_remotely,
+    copyfile,
+)
+from ESSArch_Core.storage.directory_size import (
+    get_directory_size_and_count,
+    invalidate_directory_size,
+)
 from ESSArch_Core.storage.exceptions import NoSpaceLeftError
 
 
@@ -108,7 +119,7 @@ class CopyFileTestCase(SimpleTestCase):
 
     @mock.patch('ESSArch_Core.storage.copy._send_completion_request')
     @mock.patch('ESSArch_Core.storage.copy.copy_chunk_remotely', return_value='test_upload_id')
-    def test_copy_file_remotely(self, mock_copy, _mock_req):
+    def test_copy_file_remotely(self, mock_copy, mock_req):
         src = os.path.join(self.datadir, 'foo.txt')
         with open(src, 'w') as f:
             f.write('test')
@@ -117,10 +128,101 @@ class CopyFileTestCase(SimpleTestCase):
 
         copy_file(src, dst, requests_session=session, block_size=1)
         mock_copy.assert_has_calls(
-            [mock.call(src, dst, 0, block_size=1, file_size=4, requests_session=session)] +
-            [mock.call(src, dst, i, block_size=1, file_size=4, requests_session=session, upload_id='test_upload_id')
-             for i in range(1, 5)]
+            [mock.call(src, dst, 0, block_size=1, file_size=4, requests_session=session, chunk=b't')] +
+            [mock.call(src, dst, i, block_size=1, file_size=4, requests_session=session, upload_id='test_upload_id',
+                       chunk=c)
+             for i, c in enumerate([b'e', b's', b't'], start=1)],
+            any_order=True,
         )
+        self.assertEqual(mock_copy.call_count, 4)
+
+        fields = mock_req.call_args[0][2].fields
+        self.assertEqual(fields['upload_id'], 'test_upload_id')
+        self.assertEqual(fields['md5'], hashlib.md5(b'test').hexdigest())
+
+    @mock.patch('ESSArch_Core.storage.copy._send_completion_request')
+    @mock.patch('ESSArch_Core.storage.copy.copy_chunk_remotely', return_value='test_upload_id')
+    def test_copy_file_remotely_resume(self, mock_copy, mock_req):
+        src = os.path.join(self.datadir, 'foo.txt')
+        with open(src, 'w') as f:
+            f.write('test')
+        dst = 'bar'
+        session = requests.Session()
+
+        def fail_on_third_chunk(*args, **kwargs):
+            if args[2] == 2:
+                raise requests.exceptions.ConnectionError
+            return 'test_upload_id'
+
+        mock_copy.side_effect = fail_on_third_chunk
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            copy_file_remotely(src, dst, session, block_size=1, chunks_in_flight=1)
+        mock_req.assert_not_called()
+
+        mock_copy.reset_mock()
+        mock_copy.side_effect = None
+        copy_file_remotely(src, dst, session, block_size=1, chunks_in_flight=2)
+
+        mock_copy.assert_has_calls(
+            [mock.call(src, dst, i, block_size=1, file_size=4, requests_session=session, upload_id='test_upload_id',
+                       chunk=c)
+             for i, c in enumerate([b's', b't'], start=2)],
+            any_order=True,
+        )
+        self.assertEqual(mock_copy.call_count, 2)
+
+        fields = mock_req.call_args[0][2].fields
+        self.assertEqual(fields['md5'], hashlib.md5(b'test').hexdigest())
+
+        # the upload is complete, a new copy starts from the beginning
+        mock_copy.reset_mock()
+        copy_file_remotely(src, dst, session, block_size=1)
+        self.assertEqual(mock_copy.call_count, 4)
+
+    @mock.patch('ESSArch_Core.storage.copy._send_completion_request')
+    @mock.patch('ESSArch_Core.storage.copy.copy_chunk_remotely', return_value='test_upload_id')
+    def test_copy_file_remotely_does_not_resume_after_failed_completion(self, mock_copy, mock_req):
+        src = os.path.join(self.datadir, 'foo.txt')
+        with open(src, 'w') as f:
+            f.write('test')
+        dst = 'bar'
+        session = requests.Session()
+
+        mock_req.side_effect = requests.exceptions.HTTPError
+        with self.assertRaises(requests.exceptions.HTTPError):
+            copy_file_remotely(src, dst, session, block_size=1)
+
+        mock_copy.reset_mock()
+        mock_req.side_effect = None
+        copy_file_remotely(src, dst, session, block_size=1)
+        self.assertEqual(mock_copy.call_count, 4)
+        mock_copy.assert_any_call(src, dst, 0, block_size=1, file_size=4, requests_session=session, chunk=b't')
+
+    @mock.patch('ESSArch_Core.storage.copy._send_completion_request')
+    @mock.patch('ESSArch_Core.storage.copy.copy_chunk_remotely', return_value='test_upload_id')
+    def test_copy_file_remotely_does_not_resume_modified_file(self, mock_copy, mock_req):
+        src = os.path.join(self.datadir, 'foo.txt')
+        with open(src, 'w') as f:
+            f.write('test')
+        dst = 'bar'
+        session = requests.Session()
+
+        mock_copy.side_effect = [
+            'test_upload_id', 'test_upload_id', requests.exceptions.ConnectionError, 'test_upload_id',
+        ]
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            copy_file_remotely(src, dst, session, block_size=1, chunks_in_flight=1)
+
+        with open(src, 'w') as f:
+            f.write('tested')
+
+        mock_copy.reset_mock()
+        mock_copy.side_effect = None
+        copy_file_remotely(src, dst, session, block_size=2)
+        mock_copy.assert_has_calls([
+            mock.call(src, dst, 0, block_size=2, file_size=6, requests_session=session, chunk=b'te'),
+        ])
+        self.assertEqual(mock_copy.call_count, 3)
 
     def test_copy_with_not_enough_space_at_dst(self):
         src = os.path.join(self.datadir, 'foo.txt')
@@ -139,6 +241,73 @@ class CopyFileTestCase(SimpleTestCase):
                 copy_file(src, dst)
 
 
+class CopyfileTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.src = os.path.join(self.datadir, 'foo.txt')
+        self.dst = os.path.join(self.datadir, 'bar.txt')
+        with open(self.src, 'wb') as f:
+            f.write(os.urandom(1024 * 100))
+
+    def test_copyfile(self):
+        copyfile(self.src, self.dst)
+        self.assertTrue(cmp(self.src, self.dst, shallow=False))
+
+    def test_copyfile_empty(self):
+        open(self.src, 'w').close()
+        copyfile(self.src, self.dst)
+        self.assertEqual(os.path.getsize(self.dst), 0)
+
+    def test_copyfile_same_file(self):
+        with self.assertRaises(shutil.SameFileError):
+            copyfile(self.src, self.src)
+
+    @mock.patch('ESSArch_Core.storage.copy.os.copy_file_range', side_effect=OSError(errno.EXDEV, 'cross-device'),
+                create=True)
+    def test_fallback_to_sendfile(self, mock_copy_file_range):
+        copyfile(self.src, self.dst)
+        mock_copy_file_range.assert_called_once()
+        self.assertTrue(cmp(self.src, self.dst, shallow=False))
+
+    @mock.patch('ESSArch_Core.storage.copy.os.sendfile', side_effect=OSError(errno.ENOSYS, 'not supported'),
+                create=True)
+    @mock.patch('ESSArch_Core.storage.copy.os.copy_file_range', side_effect=OSError(errno.ENOSYS, 'not supported'),
+                create=True)
+    def test_fallback_to_read_and_write(self, mock_copy_file_range, mock_sendfile):
+        copyfile(self.src, self.dst)
+        mock_copy_file_range.assert_called_once()
+        mock_sendfile.assert_called_once()
+        self.assertTrue(cmp(self.src, self.dst, shallow=False))
+
+    @mock.patch('ESSArch_Core.storage.copy.os.sendfile', return_value=0, create=True)
+    @mock.patch('ESSArch_Core.storage.copy.os.copy_file_range', return_value=0, create=True)
+    def test_fallback_when_nothing_copied(self, mock_copy_file_range, mock_sendfile):
+        copyfile(self.src, self.dst)
+        mock_copy_file_range.assert_called_once()
+        mock_sendfile.assert_called_once()
+        self.assertTrue(cmp(self.src, self.dst, shallow=False))
+
+    @mock.patch('ESSArch_Core.storage.copy.os.sendfile', return_value=0, create=True)
+    @mock.patch('ESSArch_Core.storage.copy.os.copy_file_range', create=True)
+    def test_fallback_when_partially_copied(self, mock_copy_file_range, mock_sendfile):
+        def copy_file_range(infd, outfd, count):
+            if os.lseek(infd, 0, os.SEEK_CUR):
+                return 0
+            return os.write(outfd, os.read(infd, 10))
+
+        mock_copy_file_range.side_effect = copy_file_range
+        copyfile(self.src, self.dst)
+        self.assertTrue(cmp(self.src, self.dst, shallow=False))
+
+    @mock.patch('ESSArch_Core.storage.copy.os.copy_file_range', side_effect=OSError(errno.ENOSPC, 'no space'),
+                create=True)
+    def test_other_errors_are_raised(self, mock_copy_file_range):
+        with self.assertRaises(OSError):
+            copyfile(self.src, self.dst)
+
+
 class CopyDirTests(SimpleTestCase):
     def setUp(self):
         self.root = tempfile.mkdtemp()
@@ -186,6 +355,23 @@ class CopyDirTests(SimpleTestCase):
         self.assertTrue(os.path.isdir(os.path.join(src, 'a')))
         self.assertTrue(os.path.isdir(os.path.join(src, 'b')))
 
+    def test_copy_invalidates_directory_size(self):
+        src = os.path.join(self.root, 'src')
+        os.makedirs(os.path.join(src, 'a'))
+        with open(os.path.join(src, 'a', 'foo.txt'), 'w') as f:
+            f.write('foo')
+
+        dst = os.path.join(self.root, 'dst')
+        os.makedirs(os.path.join(dst, 'a'))
+        self.addCleanup(invalidate_directory_size, self.root, recursive=True)
+        self.assertEqual(get_directory_size_and_count(self.root), (3, 1))
+        self.assertEqual(get_directory_size_and_count(os.path.join(dst, 'a')), (0, 0))
+
+        copy_dir(src, dst)
+
+        self.assertEqual(get_directory_size_and_count(self.root), (6, 2))
+        self.assertEqual(get_directory_size_and_count(os.path.join(dst, 'a')), (3, 1))
+
     def test_copy_with_not_enough_space_at_dst(self):
         src = tempfile.mkdtemp(dir=self.root)
         with open(os.path.join(src, 'foo.txt'), 'w') as f:
@@ -200,3 +386,42 @@ class CopyDirTests(SimpleTestCase):
         with mock_size, mock_free:
             with self.assertRaises(NoSpaceLeftError):
                 copy_dir(src, dst)
+
+    def test_copy_concurrently(self):
+        src = os.path.join(self.root, 'src')
+        expected_size = 0
+        for d in ['a', 'b', 'c/d']:
+            os.makedirs(os.path.join(src, d))
+            for i in range(5):
+                with open(os.path.join(src, d, '%s.txt' % i), 'w') as f:
+                    f.write(d * (i + 1))
+                expected_size += len(d) * (i + 1)
+        os.makedirs(os.path.join(src, 'empty'))
+
+        dst = os.path.join(self.root, 'dst')
+        progress = mock.Mock()
+
+        with mock.patch('ESSArch_Core.storage.copy.enough_space_available') as mock_space:
+            copy_dir(src, dst, workers=4, progress_callback=progress)
+        mock_space.assert_called_once_with(dst, src, True)
+
+        for d in ['a', 'b', 'c/d']:
+            for i in range(5):
+                self.assertTrue(cmp(os.path.join(src, d, '%s.txt' % i), os.path.join(dst, d, '%s.txt' % i),
+                                    shallow=False))
+        self.assertTrue(os.path.isdir(os.path.join(dst, 'empty')))
+
+        copied, total, _ = progress.call_args[0]
+        self.assertEqual(copied, expected_size)
+        self.assertEqual(total, expected_size)
+
+    def test_copy_concurrently_with_error(self):
+        src = os.path.join(self.root, 'src')
+        os.makedirs(src)
+        for i in range(10):
+            open(os.path.join(src, '%s.txt' % i), 'a').close()
+        dst = os.path.join(self.root, 'dst')
+
+        with mock.patch('ESSArch_Core.storage.copy.copy_file_locally', side_effect=OSError):
+            with self.assertRaises(OSError):
+                copy_dir(src, dst, workers=4)
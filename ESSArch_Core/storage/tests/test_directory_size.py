@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from ESSArch_Core.storage.directory_size import (
+    get_directory_size_and_count,
+    invalidate_directory_size,
+)
+from ESSArch_Core.util import get_tree_size_and_count
+
+
+class DirectorySizeTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.addCleanup(invalidate_directory_size, self.datadir, recursive=True)
+
+        for path, size in [('a.txt', 3), ('sub/b.txt', 10), ('sub/deep/c.txt', 100), ('other/d.txt', 1)]:
+            self.create_file(path, size)
+
+    def create_file(self, path, size):
+        path = os.path.join(self.datadir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_size_and_count(self):
+        self.assertEqual(get_directory_size_and_count(self.datadir), (114, 4))
+        self.assertEqual(get_directory_size_and_count(os.path.join(self.datadir, 'sub')), (110, 2))
+        self.assertEqual(get_directory_size_and_count(os.path.join(self.datadir, 'a.txt')), (3, 1))
+        self.assertEqual(get_directory_size_and_count(self.datadir), get_tree_size_and_count(self.datadir))
+
+    def test_symlinked_directories_are_not_followed(self):
+        os.symlink(os.path.join(self.datadir, 'sub'), os.path.join(self.datadir, 'link'))
+        self.assertEqual(get_directory_size_and_count(self.datadir), get_tree_size_and_count(self.datadir))
+
+    def test_cached_directories_are_not_scanned_again(self):
+        get_directory_size_and_count(self.datadir)
+
+        with mock.patch('ESSArch_Core.storage.directory_size.os.scandir') as mock_scandir:
+            self.assertEqual(get_directory_size_and_count(self.datadir), (114, 4))
+            self.assertEqual(get_directory_size_and_count(os.path.join(self.datadir, 'sub')), (110, 2))
+            mock_scandir.assert_not_called()
+
+    def test_subdirectory_totals_are_cached(self):
+        get_directory_size_and_count(self.datadir)
+        invalidate_directory_size(os.path.join(self.datadir, 'a.txt'))
+
+        with mock.patch('ESSArch_Core.storage.directory_size.os.scandir', wraps=os.scandir) as mock_scandir:
+            self.assertEqual(get_directory_size_and_count(self.datadir), (114, 4))
+
+        mock_scandir.assert_called_once_with(self.datadir)
+
+    def test_invalidate_file(self):
+        get_directory_size_and_count(self.datadir)
+
+        path = self.create_file('sub/deep/e.txt', 1000)
+        self.assertEqual(get_directory_size_and_count(self.datadir), (114, 4))
+
+        invalidate_directory_size(path)
+        self.assertEqual(get_directory_size_and_count(self.datadir), (1114, 5))
+        self.assertEqual(get_directory_size_and_count(os.path.join(self.datadir, 'sub')), (1110, 3))
+        self.assertEqual(get_directory_size_and_count(os.path.join(self.datadir, 'other')), (1, 1))
+
+    def test_invalidate_removed_directory(self):
+        get_directory_size_and_count(self.datadir)
+
+        path = os.path.join(self.datadir, 'sub')
+        shutil.rmtree(path)
+        invalidate_directory_size(path)
+        self.assertEqual(get_directory_size_and_count(self.datadir), (4, 2))
+
+    def test_invalidate_recursive(self):
+        get_directory_size_and_count(self.datadir)
+
+        self.create_file('sub/deep/e.txt', 1000)
+        invalidate_directory_size(os.path.join(self.datadir, 'sub'), recursive=True)
+        self.assertEqual(get_directory_size_and_count(os.path.join(self.datadir, 'sub', 'deep')), (1100, 2))
+
+    @mock.patch('ESSArch_Core.storage.directory_size.cache.set', wraps=cache.set)
+    def test_timeout(self, mock_set):
+        with self.settings(DIRECTORY_SIZE_CACHE_TIMEOUT=10):
+            get_directory_size_and_count(self.datadir)
+
+        for call in mock_set.call_args_list:
+            self.assertEqual(call.args[2], 10)
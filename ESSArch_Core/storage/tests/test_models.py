@@ -220,14 +220,6 @@ class StorageTargetGetStorageBackendTests(TestCase):
 
         self.assertEqual(type(storage_target_disk.get_storage_backend()).__name__, 'DiskStorageBackend')
         self.assertEqual(type(storage_target_tape.get_storage_backend()).__name__, 'TapeStorageBackend')
-
-        # TODO: Currently we need to set the AWS configurations before importing the s3 package.
-        from django.conf import settings
-        settings.AWS = {
-            'ACCESS_KEY_ID': 'some_access_key_id',
-            'SECRET_ACCESS_KEY': 'some_access_key_secret',
-            'ENDPOINT_URL': 'https://some.aws.endpoint/'
-        }
         self.assertEqual(type(storage_target_cas.get_storage_backend()).__name__, 'S3StorageBackend')
 
 
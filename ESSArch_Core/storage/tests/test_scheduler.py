@@ -0,0 +1,276 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ESSArch_Core.storage import scheduler
+from ESSArch_Core.storage.models import (
+    IOQueue,
+    Robot,
+    RobotQueue,
+    StorageMedium,
+    StorageTarget,
+    TapeDrive,
+    TapeSlot,
+)
+from ESSArch_Core.storage.tests.helpers import add_storage_method_rel
+
+User = get_user_model()
+
+
+class RobotSchedulerTestsBase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.target = StorageTarget.objects.create(name='tape target')
+        self.robots = [Robot.objects.create(device='/dev/sg{}'.format(i)) for i in range(2)]
+        self.drives = [
+            TapeDrive.objects.create(drive_id=i, device='/dev/nst{}'.format(i), robot=self.robots[i // 2])
+            for i in range(4)
+        ]
+        self.addCleanup(cache.delete, scheduler.ROBOT_QUEUE_METRICS_CACHE_KEY)
+
+    def create_medium(self, medium_id, robot=None, drive=None):
+        robot = robot or self.robots[0]
+        slot = TapeSlot.objects.create(slot_id=TapeSlot.objects.count(), medium_id=medium_id, robot=robot)
+        return StorageMedium.objects.create(
+            medium_id=medium_id, storage_target=self.target, status=20, location_status=50,
+            block_size=1024, format=103, tape_slot=slot, tape_drive=drive,
+        )
+
+    def create_entry(self, medium, req_type, posted=None, **kwargs):
+        return RobotQueue.objects.create(
+            user=self.user, storage_medium=medium, req_type=req_type,
+            posted=posted or timezone.now(), **kwargs
+        )
+
+    def get_entries(self):
+        return list(RobotQueue.objects.filter(status__in=[0, 2]).select_related(
+            'storage_medium__tape_drive__robot', 'storage_medium__tape_slot',
+        ).order_by('posted'))
+
+
+class CoalesceRequestsTests(RobotSchedulerTestsBase):
+    def test_requests_for_same_medium_are_coalesced(self):
+        medium = self.create_medium('A')
+        entries = [self.create_entry(medium, scheduler.MOUNT) for _ in range(3)]
+
+        requests, obsolete = scheduler.coalesce_requests(self.get_entries())
+
+        self.assertEqual(list(requests), [medium.pk])
+        req_type, covered = requests[medium.pk]
+        self.assertEqual(req_type, scheduler.MOUNT)
+        self.assertEqual(covered, entries)
+        self.assertEqual(obsolete, [])
+
+    def test_latest_request_wins(self):
+        medium = self.create_medium('A')
+        now = timezone.now()
+        mount = self.create_entry(medium, scheduler.MOUNT, posted=now - timedelta(seconds=10))
+        unmount = self.create_entry(medium, scheduler.UNMOUNT, posted=now)
+
+        requests, obsolete = scheduler.coalesce_requests(self.get_entries())
+
+        self.assertEqual(requests[medium.pk], (scheduler.UNMOUNT, [unmount]))
+        self.assertEqual(obsolete, [mount])
+
+    def test_mount_for_io_wins_over_unmount(self):
+        medium = self.create_medium('A')
+        rel = add_storage_method_rel(300, 'tape method', 2)
+        io_entry = IOQueue.objects.create(req_type=20, user=self.user, storage_method_target=rel)
+
+        now = timezone.now()
+        mount = self.create_entry(medium, scheduler.MOUNT, posted=now - timedelta(seconds=10), io_queue_entry=io_entry)
+        unmount = self.create_entry(medium, scheduler.UNMOUNT, posted=now)
+
+        requests, obsolete = scheduler.coalesce_requests(self.get_entries())
+
+        self.assertEqual(requests[medium.pk], (scheduler.MOUNT, [mount]))
+        self.assertEqual(obsolete, [unmount])
+
+    def test_forced_unmount_wins(self):
+        medium = self.create_medium('A')
+        now = timezone.now()
+        mount = self.create_entry(medium, scheduler.MOUNT, posted=now)
+        unmount = self.create_entry(medium, scheduler.UNMOUNT, posted=now - timedelta(seconds=20))
+        force = self.create_entry(medium, scheduler.FORCE_UNMOUNT, posted=now - timedelta(seconds=10))
+
+        requests, obsolete = scheduler.coalesce_requests(self.get_entries())
+
+        self.assertEqual(requests[medium.pk], (scheduler.FORCE_UNMOUNT, [unmount, force]))
+        self.assertEqual(obsolete, [])
+        self.assertNotIn(mount, requests[medium.pk][1])
+
+
+class PlanTests(RobotSchedulerTestsBase):
+    def test_already_mounted(self):
+        medium = self.create_medium('A', drive=self.drives[0])
+        entry = self.create_entry(medium, scheduler.MOUNT)
+
+        operations, satisfied, obsolete = scheduler.plan(self.get_entries())
+
+        self.assertEqual(operations, [])
+        self.assertEqual(satisfied, [entry])
+
+    def test_already_unmounted(self):
+        medium = self.create_medium('A')
+        entry = self.create_entry(medium, scheduler.UNMOUNT)
+
+        operations, satisfied, obsolete = scheduler.plan(self.get_entries())
+
+        self.assertEqual(operations, [])
+        self.assertEqual(satisfied, [entry])
+
+    def test_mount_uses_drive_in_robot_of_medium(self):
+        medium = self.create_medium('A', robot=self.robots[1])
+        self.create_entry(medium, scheduler.MOUNT)
+
+        operations, _, _ = scheduler.plan(self.get_entries())
+
+        self.assertEqual(len(operations), 1)
+        self.assertEqual(operations[0].robot, self.robots[1])
+        self.assertIn(operations[0].drive, self.drives[2:])
+
+    def test_mount_uses_requested_drive(self):
+        medium = self.create_medium('A')
+        self.create_entry(medium, scheduler.MOUNT, tape_drive=self.drives[1])
+
+        operations, _, _ = scheduler.plan(self.get_entries())
+
+        self.assertEqual(operations[0].drive, self.drives[1])
+
+    def test_one_operation_per_robot(self):
+        media = [self.create_medium(str(i), robot=self.robots[i % 2]) for i in range(4)]
+        for medium in media:
+            self.create_entry(medium, scheduler.MOUNT)
+
+        operations, _, _ = scheduler.plan(self.get_entries())
+
+        self.assertEqual(len(operations), 2)
+        self.assertEqual({op.robot for op in operations}, set(self.robots))
+        self.assertEqual(len({op.drive for op in operations}), 2)
+
+    def test_busy_robot_is_not_used(self):
+        busy_medium = self.create_medium('busy', robot=self.robots[0])
+        self.create_entry(busy_medium, scheduler.MOUNT, robot=self.robots[0], status=5)
+
+        medium = self.create_medium('A', robot=self.robots[0])
+        self.create_entry(medium, scheduler.MOUNT)
+
+        operations, _, _ = scheduler.plan(self.get_entries())
+        self.assertEqual(operations, [])
+
+    def test_media_with_most_pending_io_is_mounted_first(self):
+        now = timezone.now()
+        first = self.create_medium('first')
+        second = self.create_medium('second')
+        self.create_entry(first, scheduler.MOUNT, posted=now - timedelta(minutes=1))
+        self.create_entry(second, scheduler.MOUNT, posted=now)
+
+        rel = add_storage_method_rel(300, 'tape method', 2)
+        for _ in range(2):
+            IOQueue.objects.create(req_type=20, user=self.user, storage_method_target=rel, storage_medium=second)
+
+        operations, _, _ = scheduler.plan(self.get_entries())
+
+        self.assertEqual(len(operations), 1)
+        self.assertEqual(operations[0].medium, second)
+
+    def test_locked_drive_is_not_unmounted(self):
+        self.drives[0].locked = True
+        self.drives[0].save()
+        medium = self.create_medium('A', drive=self.drives[0])
+        self.create_entry(medium, scheduler.UNMOUNT)
+
+        operations, satisfied, _ = scheduler.plan(self.get_entries())
+        self.assertEqual(operations, [])
+        self.assertEqual(satisfied, [])
+
+        RobotQueue.objects.all().delete()
+        force = self.create_entry(medium, scheduler.FORCE_UNMOUNT)
+
+        operations, _, _ = scheduler.plan(self.get_entries())
+        self.assertEqual(operations, [
+            scheduler.RobotOperation(scheduler.FORCE_UNMOUNT, medium, self.drives[0], self.robots[0], [force]),
+        ])
+
+
+class ScheduleTests(RobotSchedulerTestsBase):
+    def test_empty_queue(self):
+        self.assertFalse(scheduler.schedule())
+
+    def test_obsolete_and_satisfied_entries_are_removed(self):
+        mounted = self.create_medium('A', drive=self.drives[0])
+        self.create_entry(mounted, scheduler.MOUNT)
+
+        medium = self.create_medium('B')
+        now = timezone.now()
+        self.create_entry(medium, scheduler.MOUNT, posted=now - timedelta(seconds=10))
+        self.create_entry(medium, scheduler.UNMOUNT, posted=now)
+
+        self.assertTrue(scheduler.schedule())
+        self.assertFalse(RobotQueue.objects.exists())
+
+    @mock.patch('ESSArch_Core.storage.scheduler.ProcessTask.run')
+    def test_mounts_are_run_concurrently(self, mock_run):
+        a = self.create_medium('A', robot=self.robots[0])
+        b = self.create_medium('B', robot=self.robots[1])
+        for medium in [a, a, b]:
+            self.create_entry(medium, scheduler.MOUNT)
+
+        results = [mock.Mock(), mock.Mock()]
+        mock_run.side_effect = results
+
+        self.assertTrue(scheduler.schedule())
+
+        # both operations are started before waiting for any of them
+        self.assertEqual(mock_run.call_count, 2)
+        for result in results:
+            result.get.assert_called_once_with()
+
+        self.assertFalse(RobotQueue.objects.exists())
+
+        metrics = scheduler.get_metrics()
+        self.assertEqual(metrics['mount']['completed_requests'], 3)
+        self.assertEqual(metrics['mount']['completed_operations'], 2)
+        self.assertEqual(metrics['mount']['pending'], 0)
+
+    @mock.patch('ESSArch_Core.storage.scheduler.ProcessTask.run')
+    def test_failed_operation(self, mock_run):
+        a = self.create_medium('A', robot=self.robots[0])
+        b = self.create_medium('B', robot=self.robots[1])
+        entry_a = self.create_entry(a, scheduler.MOUNT)
+        self.create_entry(b, scheduler.MOUNT)
+
+        failed = mock.Mock(**{'get.side_effect': ValueError('mount failed')})
+        mock_run.side_effect = [failed, mock.Mock()]
+
+        with self.assertRaisesMessage(ValueError, 'mount failed'):
+            self.assertTrue(scheduler.schedule())
+
+        entry_a.refresh_from_db()
+        self.assertEqual(entry_a.status, 100)
+        self.assertIsNone(entry_a.robot)
+        self.assertEqual(RobotQueue.objects.count(), 1)
+
+
+class RobotQueueMetricsViewTests(RobotSchedulerTestsBase):
+    def test_metrics(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        medium = self.create_medium('A')
+        self.create_entry(medium, scheduler.MOUNT, posted=timezone.now() - timedelta(minutes=1))
+
+        response = client.get(reverse('robotqueue-metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['mount']['pending'], 1)
+        self.assertGreaterEqual(response.data['mount']['oldest_pending_wait'], 60)
+        self.assertEqual(response.data['unmount']['pending'], 0)
+        self.assertIsNone(response.data['unmount']['average_wait'])
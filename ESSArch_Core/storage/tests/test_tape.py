@@ -1,4 +1,5 @@
 import errno
+import io
 import os
 import shutil
 import tarfile
@@ -25,8 +26,10 @@ from ESSArch_Core.storage.tape import (
     get_tape_op_and_count,
     is_tape_drive_online,
     mount_tape,
+    read_tape,
     rewind_tape,
     set_tape_file_number,
+    stream_tape,
     tape_empty,
     unmount_tape,
     verify_tape_label,
@@ -358,6 +361,100 @@ class TapeTests(SimpleTestCase):
         self.assertEqual(get_tape_op_and_count(52, 52), (1, 'bsfm'))
 
 
+class StreamTapeTests(SimpleTestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_dir)
+
+        self.device = os.path.join(self.root_dir, 'nst0')
+        self.dst = os.path.join(self.root_dir, 'dst')
+        os.makedirs(self.dst)
+
+    @staticmethod
+    def add_bytes(tar, name, content):
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+
+    def create_tape(self):
+        inner = io.BytesIO()
+        with tarfile.open(fileobj=inner, mode='w') as tar:
+            self.add_bytes(tar, 'objid/foo.txt', b'foo')
+
+        with tarfile.open(self.device, 'w|') as tar:
+            self.add_bytes(tar, 'objid.tar', inner.getvalue())
+            self.add_bytes(tar, 'objid.xml', b'<xml/>')
+            self.add_bytes(tar, 'other/bar.txt', b'bar')
+
+    def test_read_everything(self):
+        self.create_tape()
+
+        written = stream_tape(self.device, self.dst)
+
+        self.assertEqual(written, {
+            'objid.tar': os.path.join(self.dst, 'objid.tar'),
+            'objid.xml': os.path.join(self.dst, 'objid.xml'),
+            'other': os.path.join(self.dst, 'other'),
+        })
+        self.assertTrue(os.path.isfile(os.path.join(self.dst, 'other', 'bar.txt')))
+
+    def test_read_tape(self):
+        self.create_tape()
+
+        read_tape(self.device, self.dst)
+        self.assertEqual(sorted(os.listdir(self.dst)), ['objid.tar', 'objid.xml', 'other'])
+
+    def test_extract(self):
+        self.create_tape()
+
+        written = stream_tape(self.device, self.dst, members=['objid.tar'], extract=['objid.tar'])
+
+        self.assertEqual(written, {'objid.tar': os.path.join(self.dst, 'objid/foo.txt')})
+        self.assertEqual(os.listdir(self.dst), ['objid'])
+
+    def test_stops_when_requested_members_have_been_read(self):
+        self.create_tape()
+
+        with mock.patch('ESSArch_Core.storage.tape._check_member_path') as mock_check:
+            written = stream_tape(self.device, self.dst, members=['objid.tar'])
+
+        self.assertEqual(list(written), ['objid.tar'])
+        self.assertEqual(os.listdir(self.dst), ['objid.tar'])
+        mock_check.assert_called_once()
+
+    def test_read_directory_member(self):
+        self.create_tape()
+
+        written = stream_tape(self.device, self.dst, members=['other'])
+
+        self.assertEqual(written, {'other': os.path.join(self.dst, 'other')})
+        self.assertEqual(os.listdir(self.dst), ['other'])
+
+    def test_missing_member(self):
+        self.create_tape()
+
+        with self.assertRaises(FileNotFoundError):
+            stream_tape(self.device, self.dst, members=['objid.xml', 'missing.xml'])
+
+    def test_path_traversal(self):
+        with tarfile.open(self.device, 'w|') as tar:
+            self.add_bytes(tar, '../foo.txt', b'foo')
+
+        with self.assertRaisesMessage(Exception, 'Attempted Path Traversal in Tar File'):
+            stream_tape(self.device, self.dst)
+        self.assertFalse(os.path.exists(os.path.join(self.root_dir, 'foo.txt')))
+
+    def test_symlink_traversal(self):
+        with tarfile.open(self.device, 'w|') as tar:
+            info = tarfile.TarInfo('link')
+            info.type = tarfile.SYMTYPE
+            info.linkname = '../../etc/passwd'
+            tar.addfile(info)
+
+        with self.assertRaisesMessage(Exception, 'Attempted Path Traversal in Tar File'):
+            stream_tape(self.device, self.dst)
+
+
 class TapeLabelTest(SimpleTestCase):
 
     def setUp(self):
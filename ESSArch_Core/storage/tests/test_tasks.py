@@ -0,0 +1,152 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from ESSArch_Core.configuration.models import Path, StoragePolicy
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.profiles.models import SubmissionAgreement
+from ESSArch_Core.storage.models import (
+    STORAGE_TARGET_STATUS_ENABLED,
+    TAPE,
+    Robot,
+    StorageMedium,
+    StorageMethod,
+    StorageMethodTargetRelation,
+    StorageObject,
+    StorageTarget,
+    TapeDrive,
+)
+from ESSArch_Core.testing.runner import TaskRunner
+from ESSArch_Core.WorkflowEngine.models import ProcessTask
+
+User = get_user_model()
+
+
+class StorageMigrationFromTapeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create()
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+
+        self.temp_path = Path.objects.create(entity='temp', value=os.path.join(self.datadir, 'temp')).value
+        os.makedirs(self.temp_path)
+        self.device = os.path.join(self.datadir, 'nst0')
+
+        policy = StoragePolicy.objects.create(
+            cache_storage=StorageMethod.objects.create(),
+            ingest_path=Path.objects.create(entity='ingest', value=tempfile.mkdtemp(dir=self.datadir)),
+        )
+        aic = InformationPackage.objects.create(package_type=InformationPackage.AIC)
+        self.ip = InformationPackage.objects.create(
+            object_identifier_value='objid', package_type=InformationPackage.AIP, aic=aic,
+            submission_agreement=SubmissionAgreement.objects.create(policy=policy),
+        )
+
+        robot = Robot.objects.create(device='/dev/sg0')
+        drive = TapeDrive.objects.create(drive_id=0, device=self.device, robot=robot)
+        self.medium = StorageMedium.objects.create(
+            storage_target=StorageTarget.objects.create(name='tape', type=TAPE),
+            medium_id='AAA001', status=20, location_status=50, block_size=20, format=103,
+            tape_drive=drive,
+        )
+
+        patcher = mock.patch('ESSArch_Core.storage.backends.tape.set_tape_file_number')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def add_bytes(tar, name, content):
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+
+    def create_container_tape(self):
+        inner = io.BytesIO()
+        with tarfile.open(fileobj=inner, mode='w') as tar:
+            self.add_bytes(tar, 'objid/content/foo.txt', b'foo')
+
+        with tarfile.open(self.device, 'w|') as tar:
+            self.add_bytes(tar, 'objid.tar', inner.getvalue())
+            self.add_bytes(tar, 'objid.xml', b'<xml/>')
+            self.add_bytes(tar, '{}.xml'.format(self.ip.aic.pk), b'<aic/>')
+
+        return StorageObject.objects.create(
+            ip=self.ip, storage_medium=self.medium, container=True,
+            content_location_type=TAPE, content_location_value='1',
+        )
+
+    def migrate(self, storage_object, containers):
+        storage_method = StorageMethod.objects.create(containers=containers)
+        StorageMethodTargetRelation.objects.create(
+            storage_method=storage_method,
+            storage_target=StorageTarget.objects.create(name='new'),
+            status=STORAGE_TARGET_STATUS_ENABLED,
+        )
+
+        with mock.patch(
+            'ESSArch_Core.ip.models.InformationPackage.get_fastest_readable_storage_object',
+            return_value=storage_object,
+        ), mock.patch(
+            'ESSArch_Core.ip.models.InformationPackage.preserve', return_value='new_obj',
+        ) as mock_preserve:
+            with TaskRunner():
+                ProcessTask.objects.create(
+                    name='ESSArch_Core.storage.tasks.StorageMigration',
+                    information_package=self.ip,
+                    responsible=self.user,
+                    args=[str(storage_method.pk), self.temp_path],
+                ).run().get()
+
+        return mock_preserve.call_args[0][0]
+
+    def test_container_to_container(self):
+        storage_object = self.create_container_tape()
+
+        src = self.migrate(storage_object, containers=True)
+
+        container_path = os.path.join(self.temp_path, 'objid.tar')
+        self.assertEqual(src, [
+            container_path,
+            os.path.join(self.temp_path, 'objid.xml'),
+            os.path.join(self.temp_path, '{}.xml'.format(self.ip.aic.pk)),
+        ])
+        self.assertTrue(os.path.isfile(container_path))
+        with tarfile.open(container_path) as tar:
+            self.assertEqual(tar.getnames(), ['objid/content/foo.txt'])
+        for path in src[1:]:
+            self.assertTrue(os.path.isfile(path))
+
+    def test_container_to_non_container(self):
+        storage_object = self.create_container_tape()
+
+        src = self.migrate(storage_object, containers=False)
+
+        self.assertEqual(src, [os.path.join(self.temp_path, 'objid')])
+        with open(os.path.join(self.temp_path, 'objid', 'content', 'foo.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'foo')
+
+    def test_non_container_to_non_container(self):
+        with tarfile.open(self.device, 'w|') as tar:
+            self.add_bytes(tar, 'objid/content/foo.txt', b'foo')
+
+        storage_object = StorageObject.objects.create(
+            ip=self.ip, storage_medium=self.medium, container=False,
+            content_location_type=TAPE, content_location_value='1',
+        )
+
+        src = self.migrate(storage_object, containers=False)
+
+        dir_path = os.path.join(self.temp_path, 'objid')
+        self.assertEqual(src, [dir_path])
+        self.assertEqual(os.listdir(dir_path), ['content'])
+        with open(os.path.join(dir_path, 'content', 'foo.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'foo')
@@ -50,6 +50,7 @@ from ESSArch_Core.configuration.serializers import (
 from ESSArch_Core.exceptions import Conflict
 from ESSArch_Core.ip.models import InformationPackage
 from ESSArch_Core.mixins import PaginatedViewMixin
+from ESSArch_Core.storage import scheduler as robot_scheduler
 from ESSArch_Core.storage.filters import (
     StorageMediumFilter,
     StorageMethodFilter,
@@ -84,7 +85,7 @@ from ESSArch_Core.storage.serializers import (
     TapeDriveSerializer,
     TapeSlotSerializer,
 )
-from ESSArch_Core.util import parse_content_range_header
+from ESSArch_Core.util import parse_content_range_header, write_file_chunk
 from ESSArch_Core.WorkflowEngine.models import ProcessTask
 from ESSArch_Core.WorkflowEngine.serializers import (
     ProcessTaskDetailSerializer,
@@ -234,13 +235,7 @@ class IOQueueViewSet(viewsets.ModelViewSet):
         if f.size != end - start + 1:
             raise exceptions.ParseError("File size doesn't match headers")
 
-        if start == 0:
-            with open(filename, 'wb') as dstf:
-                dstf.write(f.read())
-        else:
-            with open(filename, 'ab') as dstf:
-                dstf.seek(start)
-                dstf.write(f.read())
+        write_file_chunk(filename, f, start)
 
         upload_id = request.data.get('upload_id', uuid.uuid4().hex)
         return Response({'upload_id': upload_id})
@@ -459,6 +454,10 @@ class RobotQueueViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         'storage_medium__medium_id', 'req_type', 'status',
     )
 
+    @action(detail=False, methods=['get'])
+    def metrics(self, request, *args, **kwargs):
+        return Response(robot_scheduler.get_metrics())
+
 
 class TapeDriveViewSet(viewsets.ModelViewSet):
     """
@@ -1,4 +1,3 @@
-import base64
 import os
 
 from django.conf import settings
@@ -21,6 +20,8 @@ from elasticsearch_dsl import (
     tokenizer,
 )
 
+from ESSArch_Core.auth.util import get_object_acl_tokens
+from ESSArch_Core.search.attachment import add_attachment
 from ESSArch_Core.search.documents import DocumentBase
 from ESSArch_Core.tags.models import StructureUnit, TagVersion
 
@@ -37,6 +38,22 @@ autocomplete_analyzer = analyzer(
 )
 
 
+def get_ip_fields(ip):
+    """
+    Returns the fields identifying ip, and who may see it, in the documents
+    of the files and directories in it
+    """
+
+    if ip is None:
+        return {'ip': None, 'ip_acl': [], 'ip_responsible': None}
+
+    return {
+        'ip': str(ip.pk),
+        'ip_acl': get_object_acl_tokens(ip),
+        'ip_responsible': str(ip.responsible_id) if ip.responsible_id is not None else None,
+    }
+
+
 class Node(InnerDoc):
     id = Keyword()
     index = Keyword()
@@ -65,6 +82,8 @@ class VersionedDocType(DocumentBase):
     personal_identification_numbers = Keyword()
     restrictions = Nested(Restriction)
     ip = Keyword()
+    ip_acl = Keyword()
+    ip_responsible = Keyword()
     agents = Keyword()
     task_id = Keyword()
     appraisal_date = Date()
@@ -120,6 +139,8 @@ class InnerArchiveDocument(InnerDoc):
         fields={'keyword': {'type': 'keyword'}}
     )
     reference_code = Keyword()
+    acl = Keyword()
+    security_level = Integer()
 
     @classmethod
     def from_obj(cls, obj):
@@ -127,6 +148,8 @@ class InnerArchiveDocument(InnerDoc):
             id=str(obj.pk),
             name=obj.name,
             reference_code=obj.reference_code,
+            acl=get_object_acl_tokens(obj),
+            security_level=obj.security_level,
         )
         return doc
 
@@ -194,6 +217,9 @@ class Component(VersionedDocType):
     organization = Keyword()
     security_level = Integer()
 
+    index_select_related = ('tag__task', 'tag__current_version', 'tag__information_package', 'type')
+    index_prefetch_related = ('agents',)
+
     @classmethod
     def get_model(cls):
         return TagVersion
@@ -234,7 +260,7 @@ class Component(VersionedDocType):
             desc=obj.description,
             reference_code=obj.reference_code,
             type=obj.type.name,
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)] + archive_agents,
+            agents=[str(agent.pk) for agent in obj.agents.all()] + archive_agents,
             security_level=obj.security_level,
             **obj.custom_fields,
         )
@@ -260,6 +286,9 @@ class Archive(VersionedDocType):
     organization_group = Integer()
     security_level = Integer()
 
+    index_select_related = ('tag__task', 'tag__current_version', 'tag__information_package', 'type')
+    index_prefetch_related = ('agents',)
+
     @classmethod
     def get_model(cls):
         return TagVersion
@@ -284,7 +313,7 @@ class Archive(VersionedDocType):
             name=obj.name,
             type=obj.type.name,
             reference_code=obj.reference_code,
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)],
+            agents=[str(agent.pk) for agent in obj.agents.all()],
             security_level=obj.security_level,
             **obj.custom_fields,
         )
@@ -370,9 +399,6 @@ class File(Component):
             task_id = None
         else:
             task_id = str(obj.tag.task.pk)
-        ip_id = getattr(obj.tag.information_package, 'pk', None)
-        ip_id = str(ip_id) if ip_id is not None else None
-
         current_version = getattr(obj.tag, 'current_version', None)
 
         if index_file_content:
@@ -387,9 +413,6 @@ class File(Component):
 
                 if format_registry_key not in exclude_file_format_from_indexing_content:
                     ip_file_path = os.path.join(obj.custom_fields['href'], obj.custom_fields['filename'])
-                    with obj.tag.information_package.open_file(ip_file_path, 'rb') as f:
-                        content = f.read()
-                    encoded_content = base64.b64encode(content).decode("ascii")
                 else:
                     index_file_content = False
                     attachment = {}
@@ -416,17 +439,18 @@ class File(Component):
             desc=obj.description,
             reference_code=obj.reference_code,
             type=obj.type.name,
-            ip=ip_id,
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)],
+            agents=[str(agent.pk) for agent in obj.agents.all()],
             start_date=getattr(current_version, 'start_date', None),
             end_date=getattr(current_version, 'end_date', None),
             date_render_format=obj.type.date_render_format,
             security_level=getattr(current_version, 'security_level', None),
+            **get_ip_fields(obj.tag.information_package),
             **obj.custom_fields,
         )
 
         if index_file_content:
-            doc.data = encoded_content
+            with obj.tag.information_package.open_file(ip_file_path, 'rb') as f:
+                add_attachment(doc, f, obj.name, obj.custom_fields.get('size'))
         else:
             doc.attachment = attachment
 
@@ -478,8 +502,8 @@ class Directory(Component):
             desc=obj.description,
             reference_code=obj.reference_code,
             type=obj.type.name,
-            ip=str(obj.tag.information_package.pk),
-            agents=[str(pk) for pk in obj.agents.values_list('pk', flat=True)],
+            agents=[str(agent.pk) for agent in obj.agents.all()],
+            **get_ip_fields(obj.tag.information_package),
             **obj.custom_fields,
         )
         return doc
@@ -509,6 +533,8 @@ class StructureUnitDocument(DocumentBase):
     end_date = Date()
     date_render_format = Keyword()
 
+    index_select_related = ('task', 'type', 'structure')
+
     @classmethod
     def get_model(cls):
         return StructureUnit
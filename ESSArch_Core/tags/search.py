@@ -1,7 +1,9 @@
+import base64
 import copy
 import csv
 import datetime
 import io
+import itertools
 import json
 import logging
 import math
@@ -35,12 +37,13 @@ from weasyprint import HTML
 from ESSArch_Core.agents.models import AgentTagLink
 from ESSArch_Core.auth.models import GroupGenericObjects
 from ESSArch_Core.auth.serializers import ChangeOrganizationSerializer
-from ESSArch_Core.auth.util import get_objects_for_user
+from ESSArch_Core.auth.util import get_objects_for_user, get_user_acl_tokens
 from ESSArch_Core.configuration.decorators import feature_enabled_or_404
 from ESSArch_Core.ip.models import InformationPackage
 from ESSArch_Core.maintenance.models import AppraisalJob
 from ESSArch_Core.mixins import PaginatedViewMixin
 from ESSArch_Core.search import DEFAULT_MAX_RESULT_WINDOW
+from ESSArch_Core.search.acl import has_documents_without_acl
 from ESSArch_Core.tags.documents import Archive, VersionedDocType
 from ESSArch_Core.tags.models import Structure, Tag, TagStructure, TagVersion
 from ESSArch_Core.tags.permissions import SearchPermissions
@@ -59,6 +62,10 @@ from ESSArch_Core.util import (
 
 logger = logging.getLogger('essarch.search')
 EXPORT_FORMATS = ('csv', 'pdf')
+# how long a point in time is kept open between requests for pages of results
+POINT_IN_TIME_KEEP_ALIVE = '5m'
+# number of hits fetched at a time when iterating over all results
+ITERATE_HITS_SIZE = 1000
 SORTABLE_FIELDS = (
     {'name.keyword': {'unmapped_type': 'keyword'}},
     {'reference_code.keyword': {'unmapped_type': 'keyword'}}
@@ -117,10 +124,21 @@ class ComponentSearch(FacetedSearch):
         We have to manually filter archives since we want to filter against a
         script field representing the archive which is the `archive` field on
         components and `_id` on archives.
+
+        Access to archives and IPs is checked against the ACL tokens indexed
+        with each document, see get_object_acl_tokens. Documents indexed
+        before the tokens were added are checked against the ids of the
+        archives and IPs available to the user until the indices are rebuilt
         """
 
-        organization_archives = TagVersion.objects.filter(elastic_index='archive').for_user(self.user, [])
-        organization_archives = [str(x) for x in list(organization_archives.values_list('pk', flat=True))]
+        acl_tokens = get_user_acl_tokens(self.user)
+        check_ids = acl_tokens is not None and has_documents_without_acl()
+
+        user_security_level_perms = list(filter(
+            lambda x: x.startswith('tags.security_level_'),
+            self.user.get_all_permissions(),
+        ))
+        user_security_levels = list(map(lambda x: int(x[-1]), user_security_level_perms))
 
         s = super().search()
         s = s.source(excludes=["attachment.content"])
@@ -134,8 +152,33 @@ class ComponentSearch(FacetedSearch):
             ])),
         ])
 
+        # the same security levels as TagVersion.objects.for_user are
+        # required for archives
+        if len(user_security_levels) > 0:
+            archive_security_level = Q('bool', minimum_should_match=1, should=[
+                Q('terms', archive__security_level=user_security_levels),
+                Q('bool', must_not=Q('exists', field='archive.security_level')),
+            ])
+        else:
+            archive_security_level = Q('bool', minimum_should_match=1, should=[
+                Q('term', archive__security_level=0),
+                Q('bool', must_not=Q('exists', field='archive.security_level')),
+            ])
+
+        archive_filter = [archive_security_level]
+        if acl_tokens is not None:
+            organization_archives = Q('terms', archive__acl=acl_tokens)
+            if check_ids:
+                archive_ids = TagVersion.objects.filter(elastic_index='archive').for_user(self.user, [])
+                archive_ids = [str(x) for x in archive_ids.values_list('pk', flat=True)]
+                organization_archives = Q('bool', minimum_should_match=1, should=[
+                    organization_archives,
+                    Q('bool', filter=Q('terms', archive__id=archive_ids), must_not=Q('exists', field='archive.acl')),
+                ])
+            archive_filter.append(organization_archives)
+
         s = s.filter(Q('bool', minimum_should_match=1, should=[
-            Q('nested', path='archive', ignore_unmapped=True, query=Q('terms', archive__id=organization_archives)),
+            Q('nested', path='archive', ignore_unmapped=True, query=Q('bool', filter=archive_filter)),
             Q('bool', must_not=[
                 Q('nested', path='archive', ignore_unmapped=True, query=Q('bool', filter=Q('exists', field='archive')))
             ]),
@@ -148,34 +191,43 @@ class ComponentSearch(FacetedSearch):
         #   permission to see files in other user's IPs. Otherwise, only get documents
         #   from IPs that the user is responsible for
 
-        organization_ips = InformationPackage.objects.for_user(self.user, []).values_list('pk', flat=True)
+        if acl_tokens is None:
+            organization_ips = Q('exists', field='ip')
+        else:
+            organization_ips = Q('terms', ip_acl=acl_tokens)
+            if check_ids:
+                ip_ids = InformationPackage.objects.for_user(self.user, []).values_list('pk', flat=True)
+                organization_ips = Q('bool', minimum_should_match=1, should=[
+                    organization_ips,
+                    Q('bool', filter=Q('terms', ip=[str(x) for x in ip_ids]), must_not=Q('exists', field='ip_acl')),
+                ])
 
         if self.user.has_perm('ip.see_other_user_ip_files'):
             document_ips = organization_ips
         else:
-            document_ips = self.user.information_packages.values_list('pk', flat=True)
+            document_ips = Q('term', ip_responsible=str(self.user.pk))
+            if check_ids:
+                ip_ids = self.user.information_packages.values_list('pk', flat=True)
+                document_ips = Q('bool', minimum_should_match=1, should=[
+                    document_ips,
+                    Q('bool', filter=Q('terms', ip=[str(x) for x in ip_ids]), must_not=Q('exists', field='ip_acl')),
+                ])
 
         s = s.filter(Q('bool', minimum_should_match=1, should=[
             Q('bool', must=[
                 Q('bool', minimum_should_match=1, should=[
                     ~Q('exists', field='ip'),
-                    Q('terms', ip=list(organization_ips))
+                    organization_ips,
                 ]),
                 Q('bool', **{'must_not': {'terms': {'_index': ['document-*']}}}),
             ]),
             Q('bool', must=[
                 Q('terms', _index=['document-*']),
-                Q('bool', minimum_should_match=1, should=[~Q('exists', field='ip'), Q('terms', ip=list(document_ips))])
+                Q('bool', minimum_should_match=1, should=[~Q('exists', field='ip'), document_ips])
             ]),
         ]))
 
-        user_security_level_perms = list(filter(
-            lambda x: x.startswith('tags.security_level_'),
-            self.user.get_all_permissions(),
-        ))
-
-        if len(user_security_level_perms) > 0:
-            user_security_levels = list(map(lambda x: int(x[-1]), user_security_level_perms))
+        if len(user_security_levels) > 0:
             s = s.filter(Q('bool', minimum_should_match=1, should=[
                 Q('terms', security_level=user_security_levels),
                 Q('bool', must_not=Q('exists', field='security_level')),
@@ -262,6 +314,80 @@ class ComponentSearch(FacetedSearch):
             return search.query('bool', minimum_should_match=1, should=queries)
         return search
 
+    def _get_point_in_time_body(self, size, pit_id, search_after, keep_alive):
+        body = self._s.to_dict()
+        body.pop('from', None)
+        body['size'] = size
+        body['pit'] = {'id': pit_id, 'keep_alive': keep_alive}
+
+        # a tiebreaker is needed to page through hits with equal sort values,
+        # _doc is interpreted as the shard and position of each hit in the
+        # point in time
+        body['sort'] = list(body.get('sort', ['_score'])) + ['_doc']
+
+        if search_after is not None:
+            body['search_after'] = search_after
+
+        return body
+
+    def open_point_in_time(self, keep_alive=POINT_IN_TIME_KEEP_ALIVE):
+        client = get_connection(self.using)
+        return client.open_point_in_time(index=','.join(self.index), keep_alive=keep_alive)['id']
+
+    def close_point_in_time(self, pit_id):
+        client = get_connection(self.using)
+        try:
+            client.close_point_in_time(body={'id': pit_id})
+        except NotFoundError:
+            # already expired
+            pass
+
+    def execute_after(self, size, pit_id, search_after=None, keep_alive=POINT_IN_TIME_KEEP_ALIVE):
+        """
+        Executes the search for the page of size hits following the hit with
+        the sort values search_after in the point in time pit_id, the page
+        can be arbitrarily deep
+
+        Returns:
+            The response as a dict, the sort values of the last hit of each
+            page are in hits.hits[-1].sort and the (possibly updated) id of
+            the point in time is in pit_id
+        """
+
+        client = get_connection(self.using)
+        body = self._get_point_in_time_body(size, pit_id, search_after, keep_alive)
+        results = client.search(body=body)
+        results.setdefault('pit_id', pit_id)
+        return results
+
+    def iterate_hits(self, size=ITERATE_HITS_SIZE, keep_alive=POINT_IN_TIME_KEEP_ALIVE):
+        """
+        Yields every hit of the search, without aggregations and highlights,
+        fetching size hits at a time from a point in time
+        """
+
+        client = get_connection(self.using)
+        pit_id = self.open_point_in_time(keep_alive)
+        search_after = None
+
+        try:
+            while True:
+                body = self._get_point_in_time_body(size, pit_id, search_after, keep_alive)
+                body.pop('aggs', None)
+                body.pop('highlight', None)
+
+                results = client.search(body=body)
+                pit_id = results.get('pit_id', pit_id)
+                hits = results['hits']['hits']
+                yield from hits
+
+                if len(hits) < size:
+                    return
+
+                search_after = hits[-1]['sort']
+        finally:
+            self.close_point_in_time(pit_id)
+
     def highlight(self, search):
         """
         We override this to set the highlighting options
@@ -275,6 +401,27 @@ class ComponentSearch(FacetedSearch):
         return super().highlight(search)
 
 
+def encode_cursor(pit_id, search_after):
+    data = json.dumps({'pit': pit_id, 'search_after': search_after}).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the point in time and sort values encoded in cursor, or (None,
+    None) for an empty cursor starting from the first hit
+    """
+
+    if not cursor:
+        return None, None
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return data['pit'], data['search_after']
+    except (ValueError, TypeError, KeyError):
+        raise exceptions.ParseError('Invalid cursor')
+
+
 def get_archive(id):
     # try to get from cache first
     cache_key = 'archive_%s' % id
@@ -460,6 +607,7 @@ class ComponentSearchViewSet(ViewSet, PaginatedViewMixin):
         query = params.pop('q', '')
         export = params.pop('export', None)
         add_to_appraisal = params.pop('add_to_appraisal', None)
+        cursor = params.pop('cursor', None)
         params.pop('pager', None)
 
         logger.info(f"User '{request.user}' queried for '{query}'")
@@ -505,6 +653,25 @@ class ComponentSearchViewSet(ViewSet, PaginatedViewMixin):
             exclude_indices=exclude_indices,
         )
 
+        if export is not None:
+            return self.generate_report(s.iterate_hits(), export, request.user)
+
+        if appraisal_job is not None:
+            hits = s.iterate_hits()
+            while True:
+                ids = [hit['_id'] for hit in itertools.islice(hits, ITERATE_HITS_SIZE)]
+                if not ids:
+                    break
+
+                tags = Tag.objects.filter(versions__in=ids).values_list('pk', flat=True)
+                appraisal_job.tags.add(*tags)
+            return Response()
+
+        if cursor is not None and self.paginator is not None:
+            # Paginate using a point in time, without the limit of the max
+            # result window
+            return self.get_cursor_page(s, cursor, params)
+
         if self.paginator is not None:
             # Paginate in search engine
             number = params.get(self.paginator.pager.page_query_param, 1)
@@ -529,7 +696,9 @@ class ComponentSearchViewSet(ViewSet, PaginatedViewMixin):
             if self.paginator is not None:
                 if offset + size > DEFAULT_MAX_RESULT_WINDOW:
                     raise exceptions.ParseError(
-                        "Can't show more than {max} results".format(max=DEFAULT_MAX_RESULT_WINDOW)
+                        "Can't show more than {max} results, use cursor to page beyond it".format(
+                            max=DEFAULT_MAX_RESULT_WINDOW,
+                        )
                     )
 
             raise
@@ -548,30 +717,77 @@ class ComponentSearchViewSet(ViewSet, PaginatedViewMixin):
             'aggregations': results_dict['aggregations'],
         }
 
-        if export is not None:
-            return self.generate_report(results_dict['hits']['hits'], export, request.user)
+        return Response(r, headers={'Count': results.hits.total['value']})
 
-        if appraisal_job is not None:
-            ids = [hit['_id'] for hit in results_dict['hits']['hits']]
-            tags = Tag.objects.filter(versions__in=ids)
-            appraisal_job.tags.add(*tags)
-            return Response()
+    def get_cursor_page(self, s, cursor, params):
+        """
+        Returns the page of hits following cursor, together with the cursor
+        of the next page or None if there are no more hits. An empty cursor
+        starts from the first hit
+        """
 
-        return Response(r, headers={'Count': results.hits.total['value']})
+        size = params.get(self.paginator.pager.page_size_query_param, 10)
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise exceptions.ParseError('Invalid page size.')
+
+        pit_id, search_after = decode_cursor(cursor)
+        if pit_id is None:
+            pit_id = s.open_point_in_time()
 
-    def generate_report(self, hits, format, user):
         try:
-            tag_versions = [hit.get('_source').get('name') for hit in hits]
-        except Exception:
-            tag_versions = hits
-        logger.info(f"User '{user}' generating a {format} report, with tag versions: '{tag_versions}'")
+            results_dict = s.execute_after(size, pit_id, search_after)
+        except NotFoundError:
+            raise exceptions.ParseError('Cursor has expired')
+
+        if len(results_dict['_shards'].get('failures', [])):
+            return Response(results_dict['_shards']['failures'], status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        hits = results_dict['hits']['hits']
+        if len(hits) < size or size == 0:
+            s.close_point_in_time(results_dict['pit_id'])
+            next_cursor = None
+        else:
+            next_cursor = encode_cursor(results_dict['pit_id'], hits[-1]['sort'])
+
+        r = {
+            'hits': hits,
+            'aggregations': results_dict.get('aggregations', {}),
+            'cursor': next_cursor,
+        }
+
+        return Response(r, headers={'Count': results_dict['hits']['total']['value']})
+
+    def generate_report(self, hits, format, user):
+        """
+        Writes the hits, which may be an iterator over all results, to a
+        temporary file. CSV rows are written one hit at a time, PDF reports
+        are rendered in memory and limited to SEARCH_PDF_EXPORT_MAX_HITS hits
+        """
+
+        logger.info(f"User '{user}' generating a {format} report")
         template = 'tags/search_results.html'.format()
 
-        hits = [hit['_source'] for hit in hits]
+        if format == 'pdf':
+            max_hits = getattr(settings, 'SEARCH_PDF_EXPORT_MAX_HITS', 1000)
+            pdf_hits = list(itertools.islice(hits, max_hits + 1))
+            if len(pdf_hits) > max_hits:
+                if hasattr(hits, 'close'):
+                    hits.close()
+                raise exceptions.ParseError(
+                    'Too many results to export as PDF, the limit is {}. Export as CSV instead'.format(max_hits)
+                )
+            hits = pdf_hits
+
+        hits = (hit['_source'] for hit in hits)
         f = tempfile.TemporaryFile(mode='w+b')
+        count = 0
 
         if format == 'pdf':
             ctype = 'application/pdf'
+            hits = list(hits)
+            count = len(hits)
             render = render_to_string(template, {'hits': hits, 'user': user, 'timestamp': timezone.now()})
             HTML(string=render).write_pdf(f)
         elif format == 'csv':
@@ -584,11 +800,14 @@ class ComponentSearchViewSet(ViewSet, PaginatedViewMixin):
                 writer.writerow(
                     [hit.get('archive', {}).get('name'), hit.get('name'), hit.get('reference_code'), hit.get('name'),
                      hit.get('unit_dates', {}).get('date'), hit.get('desc')])
+                count += 1
 
             text_file.detach()
         else:
             raise ValueError('Unsupported format {}'.format(format))
 
+        logger.info(f"User '{user}' generated a {format} report with {count} hits")
+
         f.seek(0)
         name = 'search_results_{time}_{user}.{format}'.format(time=timezone.localtime(), user=user.username,
                                                               format=format)
@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from ESSArch_Core.auth.models import Group, GroupType
+from ESSArch_Core.auth.util import get_organization_acl_token
+from ESSArch_Core.ip.models import InformationPackage
+from ESSArch_Core.tags.documents import Directory
+from ESSArch_Core.tags.models import Tag, TagVersion, TagVersionType
+
+User = get_user_model()
+
+
+class DirectoryFromObjTests(TestCase):
+    def test_ip_fields(self):
+        user = User.objects.create(username='user')
+        ip = InformationPackage.objects.create(responsible=user)
+        org = Group.objects.create(name='organization', group_type=GroupType.objects.create(label='organization'))
+        org.add_object(ip)
+
+        tag_version = TagVersion.objects.create(
+            tag=Tag.objects.create(information_package=ip), name='dir', elastic_index='directory',
+            type=TagVersionType.objects.create(name='directory', archive_type=False),
+        )
+
+        doc = Directory.from_obj(tag_version)
+        self.assertEqual(doc.ip, str(ip.pk))
+        self.assertEqual(list(doc.ip_acl), [get_organization_acl_token(org.pk)])
+        self.assertEqual(doc.ip_responsible, str(user.pk))
@@ -1,13 +1,14 @@
 import time
 from datetime import datetime
 from pydoc import locate
-from unittest import SkipTest
+from unittest import SkipTest, mock
 
 from countries_plus.models import Country
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
-from django.test import override_settings, tag
+from django.core.cache import cache
+from django.test import TestCase, override_settings, tag
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.timezone import make_aware
@@ -19,6 +20,7 @@ from elasticsearch_dsl.connections import (
 )
 from languages_plus.models import Language
 from rest_framework import status
+from rest_framework.exceptions import ParseError
 from rest_framework.test import APITestCase, APITransactionTestCase
 
 from ESSArch_Core.agents.models import (
@@ -34,6 +36,7 @@ from ESSArch_Core.configuration.models import Feature
 from ESSArch_Core.ip.models import InformationPackage
 from ESSArch_Core.maintenance.models import AppraisalJob
 from ESSArch_Core.search import alias_migration
+from ESSArch_Core.search.acl import DOCUMENTS_WITHOUT_ACL_CACHE_KEY
 from ESSArch_Core.tags.documents import (
     Archive,
     Component,
@@ -50,6 +53,12 @@ from ESSArch_Core.tags.models import (
     TagVersion,
     TagVersionType,
 )
+from ESSArch_Core.tags.search import (
+    ComponentSearch,
+    ComponentSearchViewSet,
+    decode_cursor,
+    encode_cursor,
+)
 
 User = get_user_model()
 
@@ -384,6 +393,49 @@ class ComponentSearchTestCase(ESSArchSearchBaseTestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertCountEqual(appraisal_job.tags.all(), [component_tag, component_tag2])
 
+    def create_components(self, count):
+        for i in range(count):
+            tag_version = TagVersion.objects.create(
+                name='component {}'.format(i),
+                tag=Tag.objects.create(),
+                type=self.component_type,
+                elastic_index="component",
+            )
+            Component.from_obj(tag_version).save()
+        self.es_client.indices.refresh(index='component')
+
+    def test_cursor_pagination(self):
+        self.create_components(25)
+
+        ids = []
+        cursor = ''
+        pages = 0
+        while cursor is not None:
+            res = self.client.get(self.url, data={'cursor': cursor, 'page_size': 10})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res['Count'], '25')
+            ids.extend(hit['_id'] for hit in res.data['hits'])
+            cursor = res.data['cursor']
+            pages += 1
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_invalid_cursor(self):
+        res = self.client.get(self.url, data={'cursor': 'foo'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_all_results(self):
+        self.create_components(25)
+
+        with mock.patch('ESSArch_Core.tags.search.ITERATE_HITS_SIZE', 10):
+            res = self.client.get(self.url, data={'export': 'csv', 'page_size': 5})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rows = b''.join(res.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(rows), 25)
+
 
 class DocumentSearchTestCase(ESSArchSearchBaseTestCase):
     fixtures = ['countries_data', 'languages_data']
@@ -407,6 +459,7 @@ class DocumentSearchTestCase(ESSArchSearchBaseTestCase):
         self.group.add_member(self.user.essauth_member)
 
         self.client.force_authenticate(user=self.user)
+        cache.delete(DOCUMENTS_WITHOUT_ACL_CACHE_KEY)
 
     def test_search_document_in_ip_with_other_user_responsible_without_permission_to_see_it(self):
         other_user = User.objects.create(username='other')
@@ -449,6 +502,39 @@ class DocumentSearchTestCase(ESSArchSearchBaseTestCase):
         self.assertEqual(len(res.data['hits']), 1)
         self.assertEqual(res.data['hits'][0]['_id'], str(document_tag_version.pk))
 
+    def create_document_without_acl(self, ip):
+        document_tag_version = TagVersion.objects.create(
+            tag=Tag.objects.create(information_package=ip),
+            type=self.component_type,
+            elastic_index="document",
+        )
+
+        # documents indexed before ACL tokens were added only have the id of the IP
+        doc = File.from_obj(document_tag_version)
+        doc.ip_acl = []
+        doc.save(refresh='true')
+        return document_tag_version
+
+    def test_search_document_without_acl_in_ip_of_organization(self):
+        ip = InformationPackage.objects.create(responsible=self.user)
+        self.group.add_object(ip)
+        document_tag_version = self.create_document_without_acl(ip)
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['hits']), 1)
+        self.assertEqual(res.data['hits'][0]['_id'], str(document_tag_version.pk))
+
+    def test_search_document_without_acl_in_ip_of_other_organization(self):
+        other_group = Group.objects.create(group_type=self.group.group_type)
+        ip = InformationPackage.objects.create(responsible=self.user)
+        other_group.add_object(ip)
+        self.create_document_without_acl(ip)
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['hits']), 0)
+
 
 class SecurityLevelTestCase(ESSArchSearchBaseTestCase):
     fixtures = ['countries_data', 'languages_data']
@@ -566,3 +652,99 @@ class SecurityLevelTestCase(ESSArchSearchBaseTestCase):
                     res = self.client.get(self.url)
                     self.assertEqual(res.status_code, status.HTTP_200_OK)
                     self.assertEqual(len(res.data['hits']), 0)
+
+
+class CursorTests(TestCase):
+    def test_encode_and_decode(self):
+        cursor = encode_cursor('pit', [1.5, 'foo', 3])
+        self.assertEqual(decode_cursor(cursor), ('pit', [1.5, 'foo', 3]))
+
+    def test_empty_cursor(self):
+        self.assertEqual(decode_cursor(''), (None, None))
+
+    def test_invalid_cursor(self):
+        for cursor in ['foo', encode_cursor('pit', None)[:-4], 'e30=']:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ParseError):
+                    decode_cursor(cursor)
+
+
+class ComponentSearchIterateHitsTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('ESSArch_Core.tags.search.has_documents_without_acl', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('ESSArch_Core.tags.search.get_connection')
+    def test_iterate_hits(self, mock_get_connection):
+        client = mock_get_connection.return_value
+        client.open_point_in_time.return_value = {'id': 'pit1'}
+
+        pages = [
+            [{'_id': '1', 'sort': [1, 0]}, {'_id': '2', 'sort': [1, 1]}],
+            [{'_id': '3', 'sort': [2, 0]}, {'_id': '4', 'sort': [3, 0]}],
+            [{'_id': '5', 'sort': [4, 0]}],
+        ]
+        client.search.side_effect = [
+            {'pit_id': 'pit{}'.format(i + 2), 'hits': {'hits': hits}} for i, hits in enumerate(pages)
+        ]
+
+        s = ComponentSearch('', user=User.objects.create())
+        self.assertEqual([hit['_id'] for hit in s.iterate_hits(size=2)], ['1', '2', '3', '4', '5'])
+
+        bodies = [c.kwargs['body'] for c in client.search.call_args_list]
+        self.assertEqual([b['pit']['id'] for b in bodies], ['pit1', 'pit2', 'pit3'])
+        self.assertEqual([b.get('search_after') for b in bodies], [None, [1, 1], [3, 0]])
+        for body in bodies:
+            self.assertEqual(body['size'], 2)
+            self.assertEqual(body['sort'][-1], '_doc')
+            self.assertNotIn('aggs', body)
+            self.assertNotIn('from', body)
+
+        client.close_point_in_time.assert_called_once_with(body={'id': 'pit4'})
+
+    @mock.patch('ESSArch_Core.tags.search.get_connection')
+    def test_point_in_time_is_closed_on_error(self, mock_get_connection):
+        client = mock_get_connection.return_value
+        client.open_point_in_time.return_value = {'id': 'pit'}
+        client.search.side_effect = ValueError
+
+        s = ComponentSearch('', user=User.objects.create())
+        with self.assertRaises(ValueError):
+            list(s.iterate_hits())
+
+        client.close_point_in_time.assert_called_once_with(body={'id': 'pit'})
+
+
+class GenerateReportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.view = ComponentSearchViewSet()
+
+    def get_hits(self, n):
+        return ({'_id': str(i), '_source': {'name': 'component {}'.format(i)}} for i in range(n))
+
+    @override_settings(SEARCH_PDF_EXPORT_MAX_HITS=2)
+    @mock.patch('ESSArch_Core.tags.search.HTML')
+    def test_pdf(self, mock_html):
+        res = self.view.generate_report(self.get_hits(2), 'pdf', self.user)
+
+        self.assertTrue(res['Content-Type'].startswith('application/pdf'))
+        mock_html.return_value.write_pdf.assert_called_once()
+
+    @override_settings(SEARCH_PDF_EXPORT_MAX_HITS=2)
+    @mock.patch('ESSArch_Core.tags.search.HTML')
+    def test_pdf_with_too_many_hits(self, mock_html):
+        hits = self.get_hits(3)
+        with self.assertRaises(ParseError):
+            self.view.generate_report(hits, 'pdf', self.user)
+
+        mock_html.assert_not_called()
+        self.assertEqual(list(hits), [])
+
+    @override_settings(SEARCH_PDF_EXPORT_MAX_HITS=2)
+    def test_csv_is_not_limited(self):
+        res = self.view.generate_report(self.get_hits(3), 'csv', self.user)
+
+        rows = b''.join(res.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(rows), 3)
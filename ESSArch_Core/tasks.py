@@ -511,7 +511,11 @@ def CopyDir(self, src, dst, remote_credentials=None, block_size=DEFAULT_BLOCK_SI
         requests_session.verify = settings.REQUESTS_VERIFY
         requests_session.auth = (user, passw)
 
-    copy_dir(src, dst, requests_session=requests_session, block_size=block_size)
+    def report_progress(copied, total, mb_per_sec):
+        if total:
+            self.set_progress(copied, total=total, mb_per_sec=mb_per_sec)
+
+    copy_dir(src, dst, requests_session=requests_session, block_size=block_size, progress_callback=report_progress)
 
     msg = "Copied %s to %s" % (src, dst)
     self.create_success_event(msg)
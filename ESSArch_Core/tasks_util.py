@@ -20,6 +20,7 @@ from ESSArch_Core.fixity.format import FormatIdentifier
 from ESSArch_Core.fixity.validation.backends.checksum import ChecksumValidator
 from ESSArch_Core.fixity.validation.backends.format import FormatValidator
 from ESSArch_Core.ip.models import EventIP, InformationPackage
+from ESSArch_Core.log.dbhandler import flush_events
 from ESSArch_Core.storage.exceptions import TapeDriveLockedError
 from ESSArch_Core.storage.models import StorageMedium, TapeDrive, TapeSlot
 from ESSArch_Core.storage.tape import (
@@ -230,6 +231,9 @@ def append_events(ip, events, filename):
     generator = XMLGenerator(filepath=filename)
     template = get_event_element_spec()
 
+    # include the events logged by the current task
+    flush_events()
+
     if not events:
         events = EventIP.objects.filter(linkingObjectIdentifierValue=ip)
     id_types = {}
@@ -3,6 +3,7 @@ import os
 import shutil
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import PIPE
 from unittest import mock
 
@@ -13,6 +14,7 @@ from lxml import etree, objectify
 from rest_framework.exceptions import NotFound, ValidationError
 
 from ESSArch_Core.util import (
+    bounded_map,
     convert_file,
     delete_path,
     find_destination,
@@ -26,6 +28,7 @@ from ESSArch_Core.util import (
     nested_lookup,
     normalize_path,
     parse_content_range_header,
+    write_file_chunk,
 )
 
 
@@ -132,6 +135,30 @@ class ParseContentRangeHeaderTest(SimpleTestCase):
             parse_content_range_header(header)
 
 
+class WriteFileChunkTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.filename = os.path.join(self.datadir, 'foo.txt')
+
+    def test_chunks_out_of_order(self):
+        write_file_chunk(self.filename, ContentFile(b'ab'), 0)
+        write_file_chunk(self.filename, ContentFile(b'ef'), 4)
+        write_file_chunk(self.filename, ContentFile(b'cd'), 2)
+
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdef')
+
+    def test_first_chunk_truncates(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'old content')
+
+        write_file_chunk(self.filename, ContentFile(b'new'), 0)
+
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+
+
 class FlattenTest(SimpleTestCase):
 
     def test_flatten_list_of_lists(self):
@@ -144,6 +171,34 @@ class FlattenTest(SimpleTestCase):
         self.assertEqual(result_list, flatten(my_list))
 
 
+class BoundedMapTests(SimpleTestCase):
+    def test_results_in_order(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = bounded_map(pool, pow, ((i, 2) for i in range(20)), 3)
+            self.assertEqual(list(results), [i ** 2 for i in range(20)])
+
+    def test_bounded_number_of_pending_calls(self):
+        args_list = iter([(i,) for i in range(10)])
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = bounded_map(pool, str, args_list, 3)
+            self.assertEqual(next(results), '0')
+            self.assertEqual(len(list(args_list)), 7)
+            results.close()
+
+    def test_pending_calls_cancelled_on_error(self):
+        pool = mock.Mock()
+        futures = [mock.Mock() for _ in range(3)]
+        futures[0].result.side_effect = ValueError
+        pool.submit.side_effect = futures
+
+        with self.assertRaises(ValueError):
+            list(bounded_map(pool, str, [(i,) for i in range(3)], 3))
+
+        futures[1].cancel.assert_called_once_with()
+        futures[2].cancel.assert_called_once_with()
+
+
 class GetSchemasTest(SimpleTestCase):
 
     def setUp(self):
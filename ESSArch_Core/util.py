@@ -22,6 +22,7 @@
     Email - essarch@essolutions.se
 """
 
+import collections
 import errno
 import glob
 import io
@@ -54,6 +55,11 @@ from rest_framework.response import Response
 
 from ESSArch_Core.exceptions import NoFileChunksFound
 from ESSArch_Core.fixity.format import FormatIdentifier
+from ESSArch_Core.storage.container_index import (
+    get_container_members,
+    open_container_member,
+)
+from ESSArch_Core.storage.directory_size import get_directory_size_and_count
 
 XSD_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
 XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
@@ -433,12 +439,50 @@ def parse_content_range_header(header):
         raise ValidationError(detail="Invalid Content-Range header")
 
 
+def write_file_chunk(filename, chunk, start):
+    """
+    Writes the uploaded chunk at offset start in filename. The file is
+    truncated when the first chunk is written, all other chunks are written
+    in place allowing them to arrive in any order.
+    """
+
+    mode = 'wb' if start == 0 or not os.path.exists(filename) else 'r+b'
+
+    with open(filename, mode) as dstf:
+        dstf.seek(start)
+        for data in chunk.chunks():
+            dstf.write(data)
+
+
 def chunks(chunks, n):
     """Yield successive n-sized chunks from l."""
     for i in range(0, len(chunks), n):
         yield chunks[i:i + n]
 
 
+def bounded_map(executor, func, args_list, max_pending):
+    """
+    Calls func with each tuple of arguments in args_list using executor,
+    submitting at most max_pending calls ahead of the results consumed to
+    keep memory flat for long inputs. The results are yielded in the order
+    of args_list and calls still pending when the generator is closed, or
+    when a call fails, are cancelled
+    """
+
+    pending = collections.deque()
+    try:
+        for args in args_list:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
 def flatten(flatten_list):
     """Flattens a list of lists"""
     return list(itertools.chain(*flatten_list))
@@ -586,7 +630,20 @@ def generate_file_response(file_obj, content_type, force_download=False, name=No
     return response
 
 
-def list_files(path, force_download=False, request=None, paginator=None):
+def get_directory_size_response(path):
+    if not os.path.isdir(path):
+        raise NotFound
+
+    size, count = get_directory_size_and_count(path)
+    return Response({
+        "name": os.path.basename(path),
+        "type": "dir",
+        "size": size,
+        "count": count,
+    })
+
+
+def list_files(path, force_download=False, request=None, paginator=None, sizes=True):
     if isinstance(path, list):
         if paginator is not None:
             paginated = paginator.paginate_queryset(path, request)
@@ -597,6 +654,22 @@ def list_files(path, force_download=False, request=None, paginator=None):
     path = path.rstrip('/ ')
 
     if os.path.isfile(path):
+        members = get_container_members(path) if tarfile.is_tarfile(path) else None
+        if members is not None:
+            entries = [
+                {
+                    "name": member.name,
+                    "type": 'file',
+                    "size": member.size,
+                    "modified": timestamp_to_datetime(member.mtime),
+                }
+                for member in members.values()
+            ]
+            if paginator is not None:
+                paginated = paginator.paginate_queryset(entries, request)
+                return paginator.get_paginated_response(paginated)
+            return Response(entries)
+
         if tarfile.is_tarfile(path):
             with tarfile.open(path) as tar:
                 entries = []
@@ -640,14 +713,21 @@ def list_files(path, force_download=False, request=None, paginator=None):
         entries = []
         for entry in sorted(get_files_and_dirs(path), key=lambda x: x.name):
             entry_type = "dir" if entry.is_dir() else "file"
-            size, _ = get_tree_size_and_count(entry.path)
+            st = entry.stat()
+            if entry_type == "file":
+                size = st.st_size
+            elif sizes:
+                size, _ = get_directory_size_and_count(entry.path)
+            else:
+                # deferred to a separate request for the directory
+                size = None
 
             entries.append(
                 {
                     "name": os.path.basename(entry.path),
                     "type": entry_type,
                     "size": size,
-                    "modified": timestamp_to_datetime(entry.stat().st_mtime),
+                    "modified": timestamp_to_datetime(st.st_mtime),
                 }
             )
 
@@ -659,6 +739,11 @@ def list_files(path, force_download=False, request=None, paginator=None):
         tar_path, tar_subpath = path.split('.tar/')
         tar_path += '.tar'
 
+        f = open_container_member(tar_path, tar_subpath)
+        if f is not None:
+            content_type = fid.get_mimetype(tar_subpath)
+            return generate_file_response(f, content_type, force_download, name=tar_subpath)
+
         with tarfile.open(tar_path) as tar:
             try:
                 f = io.BytesIO(tar.extractfile(tar_subpath).read())
@@ -671,6 +756,11 @@ def list_files(path, force_download=False, request=None, paginator=None):
         zip_path, zip_subpath = path.split('.zip/')
         zip_path += '.zip'
 
+        f = open_container_member(zip_path, zip_subpath)
+        if f is not None:
+            content_type = fid.get_mimetype(zip_subpath)
+            return generate_file_response(f, content_type, force_download, name=zip_subpath)
+
         with zipfile.ZipFile(zip_path) as zipf:
             try:
                 f = io.BytesIO(zipf.read(zip_subpath))
@@ -690,7 +780,7 @@ def merge_file_chunks(chunks_path, filepath):
     with open(filepath, 'wb') as f:
         for chunk in chunks:
             with open(chunk, 'rb') as cf:
-                f.write(cf.read())
+                shutil.copyfileobj(cf, f)
             os.remove(chunk)
 
 
@@ -768,6 +858,12 @@ def open_file(path='', *args, container=None, container_prefix='', **kwargs):
         return open(path, *args, **kwargs)
 
     if container is not None and path:
+        # members stored uncompressed are read directly from the container
+        for name in (path, normalize_path(os.path.join(container_prefix, path))):
+            f = open_container_member(container, name)
+            if f is not None:
+                return f
+
         try:
             with tarfile.open(container) as tar:
                 try:
@@ -30,7 +30,6 @@ import tempfile
 import zipfile
 
 from celery.exceptions import Ignore
-from celery.result import allow_join_result
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
@@ -48,18 +47,8 @@ from ESSArch_Core.ip.models import (
     InformationPackage,
     Workarea,
 )
-from ESSArch_Core.storage.exceptions import (
-    TapeDriveLockedError,
-    TapeMountedAndLockedByOtherError,
-    TapeMountedError,
-    TapeUnmountedError,
-)
-from ESSArch_Core.storage.models import (
-    Robot,
-    RobotQueue,
-    StorageObject,
-    TapeDrive,
-)
+from ESSArch_Core.storage import scheduler as robot_scheduler
+from ESSArch_Core.storage.models import RobotQueue, StorageObject, TapeDrive
 from ESSArch_Core.util import (
     creation_date,
     delete_path,
@@ -67,7 +56,6 @@ from ESSArch_Core.util import (
     run_shell_command,
     timestamp_to_datetime,
 )
-from ESSArch_Core.WorkflowEngine.models import ProcessTask
 
 User = get_user_model()
 logger = logging.getLogger('essarch')
@@ -259,122 +247,9 @@ def AccessAIP(self, aip, storage_object=None, tar=True, extracted=False, new=Fal
 
 @app.task(bind=True, track=False)
 def PollRobotQueue(self):
-    force_entries = RobotQueue.objects.filter(
-        req_type=30, status__in=[0, 2]
-    ).select_related('storage_medium').order_by('-status', 'posted')
-
-    non_force_entries = RobotQueue.objects.filter(
-        status__in=[0, 2]
-    ).exclude(req_type=30).select_related('storage_medium').order_by('-status', '-req_type', 'posted')[:5]
-
-    entries = list(force_entries) + list(non_force_entries)
-
-    if not len(entries):
+    if not robot_scheduler.schedule():
         raise Ignore()
 
-    for entry in entries:
-        entry.status = 2
-        entry.save(update_fields=['status'])
-
-        medium = entry.storage_medium
-
-        if entry.req_type == 10:  # mount
-            if medium.tape_drive is not None:  # already mounted
-                if hasattr(entry, 'io_queue_entry'):  # mounting for read or write
-                    if medium.tape_drive.io_queue_entry != entry.io_queue_entry:
-                        raise TapeMountedAndLockedByOtherError(
-                            "Tape already mounted and locked by '%s'" % medium.tape_drive.io_queue_entry
-                        )
-
-                    entry.delete()
-
-                raise TapeMountedError("Tape already mounted")
-
-            drive = entry.tape_drive
-
-            if drive is None:
-                free_drive = TapeDrive.objects.filter(
-                    status=20, storage_medium__isnull=True, io_queue_entry__isnull=True, locked=False,
-                ).order_by('num_of_mounts').first()
-
-                if free_drive is None:
-                    raise ValueError('No tape drive available')
-
-                drive = free_drive
-
-            free_robot = Robot.objects.filter(robot_queue__isnull=True).first()
-
-            if free_robot is None:
-                raise ValueError('No robot available')
-
-            entry.robot = free_robot
-            entry.status = 5
-            entry.save(update_fields=['robot', 'status'])
-
-            with allow_join_result():
-
-                try:
-                    ProcessTask.objects.create(
-                        name="ESSArch_Core.tasks.MountTape",
-                        params={
-                            'medium': medium.pk,
-                            'drive': drive.pk,
-                        }
-                    ).run().get()
-                except TapeMountedError:
-                    entry.delete()
-                    raise
-                except BaseException:
-                    entry.status = 100
-                    raise
-                else:
-                    medium.tape_drive = drive
-                    medium.save(update_fields=['tape_drive'])
-                    entry.delete()
-                finally:
-                    entry.robot = None
-                    entry.save(update_fields=['robot', 'status'])
-
-        elif entry.req_type in [20, 30]:  # unmount
-            if medium.tape_drive is None:  # already unmounted
-                entry.delete()
-                raise TapeUnmountedError("Tape already unmounted")
-
-            if medium.tape_drive.locked:
-                if entry.req_type == 20:
-                    raise TapeDriveLockedError("Tape locked")
-
-            free_robot = Robot.objects.filter(robot_queue__isnull=True).first()
-
-            if free_robot is None:
-                raise ValueError('No robot available')
-
-            entry.robot = free_robot
-            entry.status = 5
-            entry.save(update_fields=['robot', 'status'])
-
-            with allow_join_result():
-                try:
-                    ProcessTask.objects.create(
-                        name="ESSArch_Core.tasks.UnmountTape",
-                        params={
-                            'drive': medium.tape_drive.pk,
-                        }
-                    ).run().get()
-                except TapeUnmountedError:
-                    entry.delete()
-                    raise
-                except BaseException:
-                    entry.status = 100
-                    raise
-                else:
-                    medium.tape_drive = None
-                    medium.save(update_fields=['tape_drive'])
-                    entry.delete()
-                finally:
-                    entry.robot = None
-                    entry.save(update_fields=['robot', 'status'])
-
 
 @app.task(bind=True, track=False)
 def UnmountIdleDrives(self):